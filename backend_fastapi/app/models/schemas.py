@@ -1,13 +1,29 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from enum import Enum
+from uuid import UUID
 
 class ExperimentStatus(str, Enum):
     ACTIVE = "active"
     INACTIVE = "inactive"
     PAUSED = "paused"
 
+class AllocationMode(str, Enum):
+    STATIC = "static"
+    BANDIT = "bandit"
+
+class AttributeOperator(str, Enum):
+    EQ = "eq"
+    NE = "ne"
+    IN = "in"
+    NOT_IN = "not_in"
+    GT = "gt"
+    GTE = "gte"
+    LT = "lt"
+    LTE = "lte"
+    EXISTS = "exists"
+
 class DeviceType(str, Enum):
     MOBILE = "mobile"
     DESKTOP = "desktop"
@@ -19,14 +35,40 @@ class EventType(str, Enum):
     CONVERSION = "conversion"
     CUSTOM = "custom"
 
+class Resolution(str, Enum):
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+
+class RollupDimension(str, Enum):
+    VARIANT = "variant"
+    EVENT_TYPE = "event_type"
+    DEVICE_TYPE = "device_type"
+    GEO_LOCATION = "geo_location"
+
 # Request Models
 class AssignmentRequest(BaseModel):
     user_id: str = Field(..., description="Unique user identifier")
     experiment_id: str = Field(..., description="Experiment identifier")
     device_type: Optional[DeviceType] = Field(None, description="User's device type")
     geo_location: Optional[str] = Field(None, description="User's geographic location")
+    attributes: Optional[Dict[str, Any]] = Field(None, description="User attributes for targeting rules")
+
+class MultiAssignmentRequest(BaseModel):
+    experiment_ids: Optional[List[str]] = Field(None, description="Experiments to assign; every active experiment the user is targeted by when omitted")
+    device_type: Optional[DeviceType] = Field(None, description="User's device type")
+    geo_location: Optional[str] = Field(None, description="User's geographic location")
+    attributes: Optional[Dict[str, Any]] = Field(None, description="User attributes for targeting rules")
+
+class BulkAssignmentRequest(BaseModel):
+    experiment_id: str = Field(..., description="Experiment identifier")
+    user_ids: List[str] = Field(..., description="User identifiers to assign")
+    device_type: Optional[DeviceType] = Field(None, description="Device type shared by the whole cohort, for targeting")
+    geo_location: Optional[str] = Field(None, description="Location shared by the whole cohort, for targeting")
+    attributes: Optional[Dict[str, Any]] = Field(None, description="Attributes shared by the whole cohort, for targeting")
 
 class EventRequest(BaseModel):
+    event_id: Optional[UUID] = Field(None, description="Client-generated event id; resending an id already stored within the dedup window is a no-op")
     user_id: str = Field(..., description="Unique user identifier")
     experiment_id: str = Field(..., description="Experiment identifier")
     variant: str = Field(..., description="Assigned variant")
@@ -37,6 +79,18 @@ class EventRequest(BaseModel):
     geo_location: Optional[str] = Field(None, description="User's geographic location")
     metadata: Optional[Dict[str, Any]] = Field(None, description="Additional event metadata")
 
+class AttributeRule(BaseModel):
+    attribute: str = Field(..., description="User attribute name")
+    operator: AttributeOperator = Field(..., description="Comparison; a user without the attribute matches only 'ne' and 'not_in'")
+    value: Any = Field(None, description="Value to compare with (a list for in/not_in, a number for gt/gte/lt/lte, unused for exists)")
+
+class TargetingRules(BaseModel):
+    device_types: Optional[List[DeviceType]] = Field(None, description="Only users on one of these devices")
+    geo_locations: Optional[List[str]] = Field(None, description="Only users in one of these locations (exact match)")
+    geo_prefixes: Optional[List[str]] = Field(None, description="Only users whose location starts with one of these, e.g. \"US-\"")
+    attributes: List[AttributeRule] = Field(default_factory=list, description="Predicates on user attributes, all of which must hold")
+    rollout: Optional[float] = Field(None, ge=0, le=100, description="Percentage of matching users admitted, chosen by a hash of the user id")
+
 class ExperimentConfig(BaseModel):
     experiment_id: str = Field(..., description="Unique experiment identifier")
     name: str = Field(..., description="Human-readable experiment name")
@@ -45,6 +99,11 @@ class ExperimentConfig(BaseModel):
     variants: Dict[str, float] = Field(..., description="Variant allocation percentages")
     start_date: Optional[datetime] = Field(None, description="Experiment start date")
     end_date: Optional[datetime] = Field(None, description="Experiment end date")
+    allocation_mode: AllocationMode = Field(AllocationMode.STATIC, description="Static split, or bandit (weights updated by Thompson sampling)")
+    exploration_floor: Optional[float] = Field(None, description="Minimum allocation percentage per variant for bandit experiments")
+    layer: Optional[str] = Field(None, description="Layer whose experiments are mutually exclusive: a user is in at most one of them")
+    layer_range: Optional[List[float]] = Field(None, description="[start, end) percentage of the layer's traffic this experiment owns")
+    targeting: Optional[TargetingRules] = Field(None, description="Audience the experiment is limited to; every rule must match")
 
 # Response Models
 class AssignmentResponse(BaseModel):
@@ -54,6 +113,17 @@ class AssignmentResponse(BaseModel):
     assigned_at: datetime
     is_control: bool = Field(..., description="Whether this is the control group")
 
+class ExperimentAssignment(BaseModel):
+    variant: Optional[str] = Field(None, description="Null when the user is outside the experiment's targeting, or its layer placed them in another experiment")
+    layer: Optional[str] = None
+    assigned_at: Optional[datetime] = None
+    is_control: bool = False
+
+class MultiAssignmentResponse(BaseModel):
+    user_id: str
+    assignments: Dict[str, ExperimentAssignment] = Field(..., description="Assignment per experiment id")
+    unavailable: List[str] = Field(default_factory=list, description="Requested experiments that do not exist or are not active")
+
 class EventResponse(BaseModel):
     event_id: str
     user_id: str
@@ -62,13 +132,82 @@ class EventResponse(BaseModel):
     event_type: EventType
     recorded_at: datetime
     metadata: Optional[Dict[str, Any]] = None
+    duplicate: bool = Field(False, description="The event id was already stored, so nothing was written")
+
+class BatchEventResult(BaseModel):
+    index: int = Field(..., description="Position of the event in the submitted batch")
+    accepted: bool
+    event_id: Optional[str] = None
+    error: Optional[str] = None
+    duplicate: bool = Field(False, description="Accepted, but the event id was already stored so nothing was written")
+
+class BatchEventResponse(BaseModel):
+    accepted: int = Field(..., description="Events stored, or already stored under their event_id")
+    rejected: int
+    duplicates: int = Field(0, description="Accepted events that were duplicates")
+    results: List[BatchEventResult]
 
 class ExperimentStatsResponse(BaseModel):
     experiment_id: str
     total_users: int
     variant_distribution: Dict[str, int]
     events_by_type: Dict[str, int]
+    events_by_variant: Dict[str, Dict[str, int]] = Field(default_factory=dict, description="Event counts by variant and type")
     conversion_rate: Optional[float] = None
+    unique_users_by_variant: Optional[Dict[str, Dict[str, int]]] = Field(
+        None, description="Estimated distinct users by variant and event type (HyperLogLog, about 0.8% standard error)"
+    )
+    active_users_by_variant: Optional[Dict[str, int]] = Field(
+        None, description="Estimated distinct users with any event, by variant"
+    )
+    conversion_rate_by_variant: Optional[Dict[str, float]] = Field(
+        None, description="Distinct converting users per distinct active user, in percent, by variant"
+    )
+    segments: Optional[List[str]] = Field(None, description="Segment filters the counts are restricted to (any of them matching)")
+
+class VariantAnalysis(BaseModel):
+    variant: str
+    is_control: bool
+    users: int = Field(..., description="Distinct users with any event, or assigned users when distinct_users is false")
+    conversions: int = Field(..., description="Distinct converting users, or conversion events when distinct_users is false")
+    conversion_rate: Optional[float] = Field(None, description="Conversions per user (0-1)")
+    conversion_rate_ci: Optional[List[float]] = Field(None, description="Wilson score interval for the conversion rate")
+    impressions: int
+    clicks: int
+    ctr: Optional[float] = Field(None, description="Clicks per impression (0-1)")
+    absolute_difference: Optional[float] = Field(None, description="Conversion rate minus the control's")
+    difference_ci: Optional[List[float]] = Field(None, description="Confidence interval for the absolute difference")
+    lift: Optional[float] = Field(None, description="Relative change in conversion rate against control")
+    z_score: Optional[float] = Field(None, description="Two-proportion z statistic against control")
+    p_value: Optional[float] = Field(None, description="Two-sided p-value against control")
+    significant: Optional[bool] = None
+
+class ExperimentAnalysisResponse(BaseModel):
+    experiment_id: str
+    control_variant: Optional[str]
+    confidence_level: float
+    distinct_users: bool = Field(
+        False, description="Whether users and conversions are HyperLogLog distinct-user estimates (not for segments)"
+    )
+    variants: List[VariantAnalysis]
+    segments: Optional[List[str]] = Field(None, description="Segment filters the counts are restricted to (any of them matching)")
+
+class TimeSeriesPoint(BaseModel):
+    bucket_start: datetime
+    bucket_seconds: int = Field(..., description="Bucket width; wider than the requested resolution where old buckets were compacted")
+    variant: Optional[str] = None
+    event_type: Optional[str] = None
+    device_type: Optional[str] = None
+    geo_location: Optional[str] = None
+    events: int
+
+class TimeSeriesResponse(BaseModel):
+    experiment_id: str
+    resolution: Resolution
+    since: datetime
+    until: datetime
+    group_by: List[RollupDimension]
+    points: List[TimeSeriesPoint]
 
 class HealthResponse(BaseModel):
     status: str
@@ -1,86 +1,372 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from typing import List, Dict, Any, Optional
 from datetime import datetime
+import json
+import os
+from uuid import UUID
 
-from app.models.schemas import EventRequest, EventResponse
+from app.models.schemas import EventRequest, EventResponse, EventType, BatchEventResponse
 from app.utils.database import get_database
+from app.utils.dedup import dedup_key, get_event_deduplicator
+from app.utils.event_buffer import EventBufferFull, get_event_buffer
+from app.utils.event_ids import generate_event_ids
+from app.utils.event_record import EventRecord
+from app.utils.experiment_registry import get_experiment_registry
+from app.utils.export import MEDIA_TYPES, serialize_events
+from app.utils.fast_response import fast_response, negotiate_format
+from app.utils.metrics import events_tracked
 
 router = APIRouter()
 
+# Upper bound on events accepted in a single batch request
+MAX_BATCH_SIZE = int(os.getenv("EVENT_BATCH_MAX_SIZE", 10000))
+
+def build_event_data(
+    request: EventRequest,
+    event_id: Optional[str] = None,
+    recorded_at: Optional[datetime] = None
+) -> EventRecord:
+    """
+    Convert a validated event request into the record that is stored, stamped with its id and time.
+
+    A client-supplied event id is kept; otherwise the record takes event_id
+    (or a newly generated id). recorded_at defaults to now.
+    """
+    return EventRecord(
+        user_id=request.user_id,
+        experiment_id=request.experiment_id,
+        variant=request.variant,
+        event_type=request.event_type.value,
+        campaign_id=request.campaign_id,
+        ad_id=request.ad_id,
+        device_type=request.device_type.value if request.device_type else None,
+        geo_location=request.geo_location,
+        metadata=request.metadata or {},
+        id=str(request.event_id) if request.event_id is not None else event_id
+    ).stamp(recorded_at)
+
+def batch_result(
+    index: int,
+    accepted: bool,
+    event_id: Optional[str] = None,
+    error: Optional[str] = None,
+    duplicate: bool = False
+) -> Dict[str, Any]:
+    """One per-item batch result, shaped like BatchEventResult."""
+    return {"index": index, "accepted": accepted, "event_id": event_id, "error": error, "duplicate": duplicate}
+
+def format_validation_error(error: ValidationError) -> str:
+    """Summarise a pydantic validation error as 'field: message'."""
+    details = error.errors()[0]
+    field = ".".join(str(part) for part in details["loc"])
+    return f"{field}: {details['msg']}" if field else details["msg"]
+
 @router.post("/events", response_model=EventResponse)
 async def track_event(
     request: EventRequest,
-    db = Depends(get_database)
+    db = Depends(get_database),
+    buffer = Depends(get_event_buffer),
+    response_format: Optional[str] = Depends(negotiate_format),
+    deduplicator = Depends(get_event_deduplicator),
+    registry = Depends(get_experiment_registry)
 ):
     """
     Track an event for A/B testing analytics.
     
     Records user interactions, conversions, and other events for experiment analysis.
+    With write-behind enabled the event is queued and written in the background;
+    a full queue answers 429 when the overflow policy is 'reject'. With
+    FAST_PATH_RESPONSES the response is encoded directly with orjson, or as
+    MessagePack for `Accept: application/msgpack`. An event whose `event_id`
+    was already stored (within the dedup window, or at any time on the SQL
+    backends) is answered with `duplicate: true` and not written again. The response reports the id and
+    recorded_at the event is stored with.
     """
     try:
         # Validate that experiment exists
-        experiment = await db.get_experiment(request.experiment_id)
-        if not experiment:
+        if registry.get(request.experiment_id) is None:
             raise HTTPException(status_code=404, detail="Experiment not found")
         
-        # Prepare event data
-        event_data = {
-            "user_id": request.user_id,
-            "experiment_id": request.experiment_id,
-            "variant": request.variant,
-            "event_type": request.event_type.value,
-            "campaign_id": request.campaign_id,
-            "ad_id": request.ad_id,
-            "device_type": request.device_type.value if request.device_type else None,
-            "geo_location": request.geo_location,
-            "metadata": request.metadata or {}
-        }
-        
-        # Insert event
-        event_id = await db.insert_event(event_data)
+        # Check a client-supplied id against the dedup filter, then insert the
+        # event or queue it for the background flusher
+        key = None
+        duplicate = False
+        if deduplicator is not None and request.event_id is not None:
+            key = dedup_key(request.experiment_id, str(request.event_id))
+            duplicate = not deduplicator.claim([key])[0]
+        if duplicate:
+            event_id = str(request.event_id)
+            recorded_at = datetime.now()
+        else:
+            record = build_event_data(request)
+            recorded_at = record.recorded_at
+            stored = False
+            try:
+                if buffer is not None:
+                    event_id = await buffer.put(record)
+                else:
+                    # The database skips an id it already holds (e.g. resent after a
+                    # restart, or to another worker) and returns None
+                    event_id = await db.insert_event(record)
+                    if event_id is None:
+                        event_id = record.id
+                        duplicate = True
+                stored = True
+            finally:
+                if key is not None:
+                    deduplicator.settle([key], [stored])
+            if not duplicate:
+                events_tracked.inc(request.event_type.value)
         
+        if response_format is not None:
+            return fast_response({
+                "event_id": event_id,
+                "user_id": request.user_id,
+                "experiment_id": request.experiment_id,
+                "variant": request.variant,
+                "event_type": request.event_type.value,
+                "recorded_at": recorded_at,
+                "metadata": request.metadata,
+                "duplicate": duplicate,
+            }, response_format)
         return EventResponse(
             event_id=event_id,
             user_id=request.user_id,
             experiment_id=request.experiment_id,
             variant=request.variant,
             event_type=request.event_type,
-            recorded_at=datetime.now(),
-            metadata=request.metadata
+            recorded_at=recorded_at,
+            metadata=request.metadata,
+            duplicate=duplicate
         )
         
+    except EventBufferFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post(
+    "/events/batch",
+    response_model=BatchEventResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"$ref": "#/components/schemas/EventRequest"}}
+                },
+                "application/x-ndjson": {
+                    "schema": {"type": "string", "description": "One EventRequest JSON object per line"}
+                },
+            },
+        }
+    },
+)
+async def track_events_batch(
+    http_request: Request,
+    db = Depends(get_database),
+    buffer = Depends(get_event_buffer),
+    response_format: Optional[str] = Depends(negotiate_format),
+    deduplicator = Depends(get_event_deduplicator),
+    registry = Depends(get_experiment_registry)
+):
+    """
+    Track a batch of events in one request.
+    
+    Accepts a JSON array or an NDJSON body (`Content-Type: application/x-ndjson`).
+    Each event is validated independently; valid events are written with a single
+    bulk insert and the response reports acceptance or rejection per item.
+    Events whose `event_id` was already stored (within the dedup window, or
+    at any time on the SQL backends), or repeats one earlier in the batch,
+    are accepted as duplicates without being written.
+    """
+    body = await http_request.body()
+    content_type = http_request.headers.get("content-type", "")
+    
+    # Parse the body into raw items; NDJSON lines that fail to parse are rejected individually
+    raw_items: List[Any] = []
+    parse_errors: Dict[int, str] = {}
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                raw_items.append(json.loads(line))
+            except ValueError:
+                parse_errors[len(raw_items)] = "Malformed JSON line"
+                raw_items.append(None)
+    else:
+        try:
+            raw_items = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Malformed JSON body")
+        if not isinstance(raw_items, list):
+            raise HTTPException(status_code=400, detail="Batch body must be a JSON array")
+    
+    if len(raw_items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_SIZE} events")
+    
+    # Validate every item in one pass
+    results: List[Dict[str, Any]] = []
+    valid: List[tuple] = []
+    for index, item in enumerate(raw_items):
+        if index in parse_errors:
+            results.append(batch_result(index, False, error=parse_errors[index]))
+            continue
+        try:
+            valid.append((index, EventRequest.model_validate(item)))
+        except ValidationError as e:
+            results.append(batch_result(index, False, error=format_validation_error(e)))
+    
+    # Check every item against one registry snapshot
+    snapshot = registry.snapshot
+    to_insert = []
+    for index, request in valid:
+        if snapshot.get(request.experiment_id) is not None:
+            to_insert.append((index, request))
+        else:
+            results.append(batch_result(index, False, error="Experiment not found"))
+    
+    # Claim client-supplied ids in one filter probe; duplicates are answered without a write
+    keys: Dict[int, str] = {}
+    duplicates = 0
+    if deduplicator is not None:
+        keyed = [(index, request) for index, request in to_insert if request.event_id is not None]
+        claimed = deduplicator.claim([dedup_key(request.experiment_id, str(request.event_id)) for _, request in keyed])
+        skipped = set()
+        for (index, request), new in zip(keyed, claimed):
+            if new:
+                keys[index] = dedup_key(request.experiment_id, str(request.event_id))
+            else:
+                results.append(batch_result(index, True, event_id=str(request.event_id), duplicate=True))
+                skipped.add(index)
+        duplicates = len(skipped)
+        to_insert = [(index, request) for index, request in to_insert if index not in skipped]
+    
+    event_ids: List[Optional[str]] = []
+    stored_duplicates = set()
+    try:
+        # One bulk id reservation and one timestamp for the batch
+        recorded_at = datetime.now()
+        new_ids = generate_event_ids(len(to_insert))
+        event_data = [
+            build_event_data(request, event_id, recorded_at)
+            for (_, request), event_id in zip(to_insert, new_ids)
+        ]
+        if buffer is not None:
+            event_ids = await buffer.put_many(event_data)
+        else:
+            # The database skips ids it already holds and returns None for them
+            stored_ids = await db.insert_events(event_data)
+            stored_duplicates = {index for (index, _), event_id in zip(to_insert, stored_ids) if event_id is None}
+            event_ids = [record.id for record in event_data]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if keys:
+            stored = {index for (index, _), event_id in zip(to_insert, event_ids) if event_id is not None}
+            deduplicator.settle(list(keys.values()), [index in stored for index in keys])
+    
+    accepted = duplicates
+    to_insert_types = {index: request.event_type.value for index, request in to_insert}
+    for (index, _), event_id in zip(to_insert, event_ids):
+        if event_id is None:
+            results.append(batch_result(index, False, error="Event buffer is full"))
+        elif index in stored_duplicates:
+            results.append(batch_result(index, True, event_id=event_id, duplicate=True))
+            duplicates += 1
+            accepted += 1
+        else:
+            results.append(batch_result(index, True, event_id=event_id))
+            events_tracked.inc(to_insert_types[index])
+            accepted += 1
+    results.sort(key=lambda result: result["index"])
+    
+    if response_format is not None:
+        return fast_response({
+            "accepted": accepted,
+            "rejected": len(results) - accepted,
+            "duplicates": duplicates,
+            "results": results
+        }, response_format)
+    return BatchEventResponse(
+        accepted=accepted,
+        rejected=len(results) - accepted,
+        duplicates=duplicates,
+        results=results
+    )
+
 @router.get("/events/{experiment_id}")
 async def get_experiment_events(
     experiment_id: str,
-    limit: int = 100,
-    db = Depends(get_database)
+    limit: int = Query(100, ge=1, le=10000),
+    since: Optional[datetime] = Query(None, description="Only events recorded at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only events recorded before this time"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db = Depends(get_database),
+    registry = Depends(get_experiment_registry)
 ):
-    """Get events for a specific experiment."""
-    experiment = await db.get_experiment(experiment_id)
-    if not experiment:
-        raise HTTPException(status_code=404, detail="Experiment not found")
+    """
+    Get events for a specific experiment, newest first.
     
-    # Filter events for this experiment
-    experiment_events = [
-        event for event in db.events 
-        if event["experiment_id"] == experiment_id
-    ]
+    Pages through the experiment's time index: pass the returned `next_cursor`
+    to fetch the next page (it is null on the last page).
+    """
+    if registry.get(experiment_id) is None:
+        raise HTTPException(status_code=404, detail="Experiment not found")
     
-    # Sort by recorded_at and limit
-    experiment_events.sort(key=lambda x: x["recorded_at"], reverse=True)
-    experiment_events = experiment_events[:limit]
+    try:
+        page = await db.query_experiment_events(experiment_id, limit, since, until, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "experiment_id": experiment_id,
-        "events": experiment_events,
-        "total_count": len(experiment_events)
+        "events": page["events"],
+        "total_count": len(page["events"]),
+        "next_cursor": page["next_cursor"]
     }
 
+@router.get("/events/{experiment_id}/export")
+async def export_experiment_events(
+    experiment_id: str,
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="ndjson or csv"),
+    since: Optional[datetime] = Query(None, description="Only events recorded at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only events recorded before this time"),
+    event_type: Optional[List[EventType]] = Query(None, description="Only these event types (repeatable)"),
+    gzip: bool = Query(False, description="Gzip the response (Content-Encoding: gzip)"),
+    db = Depends(get_database),
+    registry = Depends(get_experiment_registry)
+):
+    """
+    Stream all of an experiment's events, oldest first, as NDJSON or CSV.
+    
+    Events are read from the time index (or a server-side cursor on PostgreSQL)
+    and serialized in small chunks, so memory stays flat regardless of how many
+    events the experiment has.
+    """
+    if registry.get(experiment_id) is None:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    
+    events = db.iter_experiment_events(
+        experiment_id,
+        since=since,
+        until=until,
+        event_types=[t.value for t in event_type] if event_type else None
+    )
+    headers = {"Content-Disposition": f'attachment; filename="{experiment_id}_events.{export_format}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        serialize_events(events, export_format, compress=gzip),
+        media_type=MEDIA_TYPES[export_format],
+        headers=headers
+    )
+
 @router.post("/events/impression")
 async def track_impression(
     user_id: str,
@@ -88,7 +374,12 @@ async def track_impression(
     variant: str,
     campaign_id: str = None,
     ad_id: str = None,
-    db = Depends(get_database)
+    event_id: Optional[UUID] = None,
+    db = Depends(get_database),
+    buffer = Depends(get_event_buffer),
+    response_format: Optional[str] = Depends(negotiate_format),
+    deduplicator = Depends(get_event_deduplicator),
+    registry = Depends(get_experiment_registry)
 ):
     """Convenience endpoint for tracking ad impressions."""
     request = EventRequest(
@@ -97,9 +388,10 @@ async def track_impression(
         variant=variant,
         event_type="impression",
         campaign_id=campaign_id,
-        ad_id=ad_id
+        ad_id=ad_id,
+        event_id=event_id
     )
-    return await track_event(request, db)
+    return await track_event(request, db, buffer, response_format, deduplicator, registry)
 
 @router.post("/events/click")
 async def track_click(
@@ -108,7 +400,12 @@ async def track_click(
     variant: str,
     campaign_id: str = None,
     ad_id: str = None,
-    db = Depends(get_database)
+    event_id: Optional[UUID] = None,
+    db = Depends(get_database),
+    buffer = Depends(get_event_buffer),
+    response_format: Optional[str] = Depends(negotiate_format),
+    deduplicator = Depends(get_event_deduplicator),
+    registry = Depends(get_experiment_registry)
 ):
     """Convenience endpoint for tracking ad clicks."""
     request = EventRequest(
@@ -117,9 +414,10 @@ async def track_click(
         variant=variant,
         event_type="click",
         campaign_id=campaign_id,
-        ad_id=ad_id
+        ad_id=ad_id,
+        event_id=event_id
     )
-    return await track_event(request, db)
+    return await track_event(request, db, buffer, response_format, deduplicator, registry)
 
 @router.post("/events/conversion")
 async def track_conversion(
@@ -129,7 +427,12 @@ async def track_conversion(
     campaign_id: str = None,
     ad_id: str = None,
     metadata: dict = None,
-    db = Depends(get_database)
+    event_id: Optional[UUID] = None,
+    db = Depends(get_database),
+    buffer = Depends(get_event_buffer),
+    response_format: Optional[str] = Depends(negotiate_format),
+    deduplicator = Depends(get_event_deduplicator),
+    registry = Depends(get_experiment_registry)
 ):
     """Convenience endpoint for tracking conversions."""
     request = EventRequest(
@@ -139,6 +442,7 @@ async def track_conversion(
         event_type="conversion",
         campaign_id=campaign_id,
         ad_id=ad_id,
-        metadata=metadata
+        metadata=metadata,
+        event_id=event_id
     )
-    return await track_event(request, db)
+    return await track_event(request, db, buffer, response_format, deduplicator, registry)
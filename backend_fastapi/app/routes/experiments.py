@@ -1,56 +1,149 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import Dict, Any
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Request, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timezone
+import json
+import os
+import time
 
 from app.models.schemas import (
     AssignmentRequest, 
     AssignmentResponse, 
+    BulkAssignmentRequest,
+    DeviceType,
+    EventType,
+    ExperimentAnalysisResponse,
     ExperimentConfig,
-    ExperimentStatsResponse
+    ExperimentStatsResponse,
+    MultiAssignmentRequest,
+    MultiAssignmentResponse,
+    Resolution,
+    RollupDimension,
+    TimeSeriesResponse
 )
-from app.utils.hash import get_variant_assignment, is_control_variant
+from app.utils.hash import is_control_variant
+from app.utils.analysis import analyze_experiment
+from app.utils.bandit import is_bandit
+from app.utils.bulk_assignment import bulk_assignment_pool, iter_bulk_assignments
+from app.utils.cache import assignment_cache
 from app.utils.database import get_database
+from app.utils.experiment_registry import get_experiment_registry
+from app.utils.fast_response import fast_response, negotiate_format
+from app.utils.metrics import assignment_hash_duration, assignments, serialization_duration
+from app.utils.rollups import RESOLUTIONS, build_timeseries, bucket_start, epoch_seconds
+from app.utils.segments import Segment, parse_segment
 
 router = APIRouter()
 
+# Serve assignment cache misses from the hash and persist in the background,
+# skipping the database lookup for users already assigned
+ASSIGNMENT_ASYNC_PERSIST = os.getenv("ASSIGNMENT_ASYNC_PERSIST", "false").lower() in ("1", "true", "yes")
+
+# Most buckets one timeseries request may span
+TIMESERIES_MAX_BUCKETS = int(os.getenv("TIMESERIES_MAX_BUCKETS", 10000))
+
+async def persist_assignment(db, assignment_data: Dict[str, Any]) -> None:
+    """Save an assignment computed without a database lookup, unless one already exists."""
+    existing = await db.get_assignment(assignment_data["user_id"], assignment_data["experiment_id"])
+    if not existing:
+        await db.save_assignment(assignment_data)
+
+async def persist_assignments(db, user_id: str, assignments_data: List[Dict[str, Any]]) -> None:
+    """Save assignments computed without a database lookup, skipping those that already exist."""
+    existing = await db.get_assignments(user_id, [assignment["experiment_id"] for assignment in assignments_data])
+    new = [assignment for assignment in assignments_data if assignment["experiment_id"] not in existing]
+    if new:
+        await db.save_assignments(new)
+
+def assignment_response(assignment: Dict[str, Any], response_format: Optional[str] = None):
+    """Build the assignment response, as a model or (fast path) an encoded dict."""
+    if response_format is not None:
+        return fast_response({
+            "user_id": assignment["user_id"],
+            "experiment_id": assignment["experiment_id"],
+            "variant": assignment["variant"],
+            "assigned_at": assignment["assigned_at"],
+            "is_control": is_control_variant(assignment["variant"]),
+        }, response_format)
+    return AssignmentResponse(
+        user_id=assignment["user_id"],
+        experiment_id=assignment["experiment_id"],
+        variant=assignment["variant"],
+        assigned_at=assignment["assigned_at"],
+        is_control=is_control_variant(assignment["variant"])
+    )
+
 @router.post("/assignment", response_model=AssignmentResponse)
 async def get_assignment(
     request: AssignmentRequest,
-    db = Depends(get_database)
+    background_tasks: BackgroundTasks,
+    db = Depends(get_database),
+    registry = Depends(get_experiment_registry),
+    response_format: Optional[str] = Depends(negotiate_format)
 ):
     """
     Assign a user to an experiment variant.
     
     Returns the assigned variant for the user. If the user was previously assigned,
-    returns the same variant to ensure consistency.
+    returns the same variant to ensure consistency. New users outside the
+    experiment's targeting (device, location, attributes, rollout) get a
+    400. With FAST_PATH_RESPONSES the response is encoded directly with
+    orjson, or as MessagePack for `Accept: application/msgpack`.
     """
     try:
-        # Check if user already has an assignment
-        existing_assignment = await db.get_assignment(request.user_id, request.experiment_id)
+        cache_key = (request.user_id, request.experiment_id)
         
-        if existing_assignment:
-            return AssignmentResponse(
-                user_id=request.user_id,
-                experiment_id=request.experiment_id,
-                variant=existing_assignment["variant"],
-                assigned_at=existing_assignment["assigned_at"],
-                is_control=is_control_variant(existing_assignment["variant"])
-            )
+        # Check if user already has an assignment, in the cache first
+        existing_assignment = assignment_cache.get(cache_key)
+        if existing_assignment is not None:
+            assignments.inc("cache")
+            return assignment_response(existing_assignment, response_format)
+        if not ASSIGNMENT_ASYNC_PERSIST:
+            existing_assignment = await db.get_assignment(request.user_id, request.experiment_id)
+            if existing_assignment:
+                assignment_cache.set(cache_key, existing_assignment)
+                assignments.inc("database")
+                return assignment_response(existing_assignment, response_format)
         
         # Get experiment configuration
-        experiment = await db.get_experiment(request.experiment_id)
-        if not experiment:
+        experiment = registry.get(request.experiment_id)
+        if experiment is None:
             raise HTTPException(status_code=404, detail="Experiment not found")
         
-        if experiment["status"] != "active":
+        if not experiment.is_active():
             raise HTTPException(status_code=400, detail="Experiment is not active")
         
-        # Assign variant
-        variant = get_variant_assignment(
-            request.user_id, 
-            request.experiment_id, 
-            experiment["variants"]
-        )
+        # Bandit weights change over time, so the hash alone cannot reproduce an
+        # earlier assignment; always read the stored one first
+        if ASSIGNMENT_ASYNC_PERSIST and is_bandit(experiment.config):
+            existing_assignment = await db.get_assignment(request.user_id, request.experiment_id)
+            if existing_assignment:
+                assignment_cache.set(cache_key, existing_assignment)
+                assignments.inc("database")
+                return assignment_response(existing_assignment, response_format)
+        
+        device_type = request.device_type.value if request.device_type else None
+        if not experiment.admits(request.user_id, device_type, request.geo_location, request.attributes):
+            # Targeting only gates new users: someone assigned before (whose cache
+            # entry is gone) keeps their variant even if their device, location or
+            # the rollout changed since. Without ASYNC_PERSIST this was read above
+            if ASSIGNMENT_ASYNC_PERSIST and not is_bandit(experiment.config):
+                existing_assignment = await db.get_assignment(request.user_id, request.experiment_id)
+                if existing_assignment:
+                    assignment_cache.set(cache_key, existing_assignment)
+                    assignments.inc("database")
+                    return assignment_response(existing_assignment, response_format)
+            raise HTTPException(status_code=400, detail="User is not in this experiment's targeted audience")
+        
+        # Assign variant (through the experiment's layer, if it has one)
+        with assignment_hash_duration.time():
+            variant = experiment.assign(request.user_id)
+        if variant is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"User is not in this experiment: layer '{experiment.layer}' placed them in another experiment"
+            )
         
         # Save assignment
         assignment_data = {
@@ -58,47 +151,425 @@ async def get_assignment(
             "experiment_id": request.experiment_id,
             "variant": variant,
             "device_type": request.device_type,
-            "geo_location": request.geo_location
+            "geo_location": request.geo_location,
+            "assigned_at": datetime.now()
         }
-        await db.save_assignment(assignment_data)
+        if ASSIGNMENT_ASYNC_PERSIST and not is_bandit(experiment.config):
+            # Assignment is deterministic, so answer now and persist after the response
+            background_tasks.add_task(persist_assignment, db, assignment_data)
+        else:
+            await db.save_assignment(assignment_data)
+        assignment_cache.set(cache_key, assignment_data)
+        assignments.inc("new")
         
-        return AssignmentResponse(
-            user_id=request.user_id,
-            experiment_id=request.experiment_id,
-            variant=variant,
-            assigned_at=datetime.now(),
-            is_control=is_control_variant(variant)
-        )
+        return assignment_response(assignment_data, response_format)
         
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=str(e))
 
+async def assign_experiments(
+    user_id: str,
+    experiment_ids: Optional[List[str]],
+    device_type: Optional[DeviceType],
+    geo_location: Optional[str],
+    attributes: Optional[Dict[str, Any]],
+    db,
+    registry,
+    background_tasks: BackgroundTasks
+) -> Dict[str, Any]:
+    """
+    Assign a user to many experiments at once, shaped like MultiAssignmentResponse.
+    
+    Every experiment is read from one registry snapshot, whose layers were
+    checked for overlaps when it was loaded. Without experiment ids, the
+    snapshot's targeting index picks the experiments the user is targeted
+    by; requested experiments outside the user's targeting come back with a
+    null variant unless the user was assigned before. Assignments come from
+    the cache, then from one batched database read, and the rest are
+    hashed: once per layer for layered experiments (the layer hash picks at
+    most one of them), once per experiment otherwise. New assignments are
+    saved with one batched write (after the response with
+    ASSIGNMENT_ASYNC_PERSIST, except for bandit experiments).
+    """
+    snapshot = registry.snapshot
+    device = device_type.value if device_type else None
+    now = time.time()
+    experiments = {}
+    unavailable: List[str] = []
+    excluded = set()
+    if experiment_ids is None:
+        for experiment in snapshot.targeting.matching(user_id, device, geo_location, attributes):
+            if experiment.is_active(now):
+                experiments[experiment.experiment_id] = experiment
+    else:
+        for experiment_id in dict.fromkeys(experiment_ids):
+            experiment = snapshot.get(experiment_id)
+            if experiment is None or not experiment.is_active(now):
+                unavailable.append(experiment_id)
+                continue
+            experiments[experiment_id] = experiment
+            if not experiment.admits(user_id, device, geo_location, attributes):
+                excluded.add(experiment_id)
+    
+    # Cached assignments first, then one read for the rest; like /assignment, the
+    # read is skipped with ASSIGNMENT_ASYNC_PERSIST except for bandit experiments
+    # and experiments the user is no longer targeted by (an earlier assignment still holds)
+    found: Dict[str, Dict[str, Any]] = {}
+    for experiment_id in experiments:
+        cached = assignment_cache.get((user_id, experiment_id))
+        if cached is not None:
+            found[experiment_id] = cached
+            assignments.inc("cache")
+    lookup = [
+        experiment_id for experiment_id, experiment in experiments.items()
+        if experiment_id not in found
+        and (not ASSIGNMENT_ASYNC_PERSIST or is_bandit(experiment.config) or experiment_id in excluded)
+    ]
+    if lookup:
+        for experiment_id, assignment in (await db.get_assignments(user_id, lookup)).items():
+            assignment_cache.set((user_id, experiment_id), assignment)
+            found[experiment_id] = assignment
+            assignments.inc("database")
+    
+    # Hash the rest, once per layer
+    layer_buckets: Dict[str, tuple] = {}
+    to_save: List[Dict[str, Any]] = []
+    to_persist_later: List[Dict[str, Any]] = []
+    for experiment_id, experiment in experiments.items():
+        if experiment_id in found or experiment_id in excluded:
+            continue
+        layer = experiment.layer
+        if layer:
+            if layer not in layer_buckets:
+                layer_buckets[layer] = experiment.layer_hasher.buckets(user_id)
+            variant = experiment.variant_in_layer(layer_buckets[layer])
+            if variant is None:
+                continue
+        else:
+            variant = experiment.allocation.assign(user_id)
+        assignment_data = {
+            "user_id": user_id,
+            "experiment_id": experiment_id,
+            "variant": variant,
+            "device_type": device_type,
+            "geo_location": geo_location,
+            "assigned_at": datetime.now()
+        }
+        if ASSIGNMENT_ASYNC_PERSIST and not is_bandit(experiment.config):
+            to_persist_later.append(assignment_data)
+        else:
+            to_save.append(assignment_data)
+        found[experiment_id] = assignment_data
+    
+    if to_save:
+        await db.save_assignments(to_save)
+    if to_persist_later:
+        background_tasks.add_task(persist_assignments, db, user_id, to_persist_later)
+    for assignment_data in to_save + to_persist_later:
+        assignment_cache.set((user_id, assignment_data["experiment_id"]), assignment_data)
+        assignments.inc("new")
+    
+    return {
+        "user_id": user_id,
+        "assignments": {
+            experiment_id: {
+                "variant": found[experiment_id]["variant"] if experiment_id in found else None,
+                "layer": experiment.layer,
+                "assigned_at": found[experiment_id]["assigned_at"] if experiment_id in found else None,
+                "is_control": experiment_id in found and is_control_variant(found[experiment_id]["variant"]),
+            }
+            for experiment_id, experiment in experiments.items()
+        },
+        "unavailable": unavailable
+    }
+
+@router.get("/assignments/{user_id}", response_model=MultiAssignmentResponse)
+async def get_user_assignments(
+    user_id: str,
+    background_tasks: BackgroundTasks,
+    experiment_id: Optional[List[str]] = Query(None, description="Experiments to assign (repeatable); every active experiment when omitted"),
+    device_type: Optional[DeviceType] = Query(None, description="User's device type"),
+    geo_location: Optional[str] = Query(None, description="User's geographic location"),
+    db = Depends(get_database),
+    registry = Depends(get_experiment_registry),
+    response_format: Optional[str] = Depends(negotiate_format)
+):
+    """
+    Assign a user to every active experiment they are targeted by, or to the given ones, in one call.
+    
+    Returns the same variants as `/assignment` would, keyed by experiment id.
+    Experiments in a layer are mutually exclusive: the user gets a variant in
+    at most one of them, and a null variant in the others. Experiments that
+    target user attributes need the POST form, which carries `attributes`.
+    """
+    result = await assign_experiments(user_id, experiment_id, device_type, geo_location, None, db, registry, background_tasks)
+    if response_format is not None:
+        return fast_response(result, response_format)
+    return MultiAssignmentResponse(**result)
+
+@router.post("/assignments/{user_id}", response_model=MultiAssignmentResponse)
+async def post_user_assignments(
+    user_id: str,
+    request: MultiAssignmentRequest,
+    background_tasks: BackgroundTasks,
+    db = Depends(get_database),
+    registry = Depends(get_experiment_registry),
+    response_format: Optional[str] = Depends(negotiate_format)
+):
+    """Same as GET /assignments/{user_id}, with the experiment list, device, location and user attributes in the body."""
+    result = await assign_experiments(
+        user_id, request.experiment_ids, request.device_type, request.geo_location, request.attributes,
+        db, registry, background_tasks
+    )
+    if response_format is not None:
+        return fast_response(result, response_format)
+    return MultiAssignmentResponse(**result)
+
+@router.post(
+    "/assignment/bulk",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": "#/components/schemas/BulkAssignmentRequest"}
+                },
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["experiment_id", "file"],
+                        "properties": {
+                            "experiment_id": {"type": "string"},
+                            "file": {"type": "string", "format": "binary", "description": "One user_id per line"},
+                            "device_type": {"type": "string", "enum": [device.value for device in DeviceType]},
+                            "geo_location": {"type": "string"},
+                        },
+                    }
+                },
+            },
+        }
+    },
+)
+async def get_bulk_assignments(
+    http_request: Request,
+    registry = Depends(get_experiment_registry)
+):
+    """
+    Compute variant assignments for many users at once.
+    
+    Takes either a JSON body with `experiment_id` and `user_ids`, or a multipart
+    upload with an `experiment_id` field and a `file` of user ids (one per line).
+    Results are streamed back as NDJSON in input order and match `/assignment`
+    exactly; users outside the experiment's targeting, or placed in another
+    experiment by its layer, get a null variant. The optional
+    `device_type`, `geo_location` and `attributes` describe the whole cohort
+    and are checked once; a rollout percentage is applied per user.
+    Assignments are computed, not persisted.
+    """
+    content_type = http_request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await http_request.form()
+        experiment_id = form.get("experiment_id")
+        upload = form.get("file")
+        if not experiment_id or upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="experiment_id and file are required")
+        device_type = form.get("device_type") or None
+        if device_type is not None and device_type not in {device.value for device in DeviceType}:
+            raise HTTPException(status_code=400, detail=f"Unknown device_type: {device_type}")
+        geo_location = form.get("geo_location") or None
+        attributes = None
+        content = (await upload.read()).decode("utf-8")
+        user_ids: List[str] = [line.strip() for line in content.splitlines() if line.strip()]
+    else:
+        try:
+            request = BulkAssignmentRequest.model_validate_json(await http_request.body())
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors())
+        experiment_id = request.experiment_id
+        user_ids = request.user_ids
+        device_type = request.device_type.value if request.device_type else None
+        geo_location = request.geo_location
+        attributes = request.attributes
+    
+    experiment = registry.get(experiment_id)
+    if experiment is None:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    targeting = experiment.targeting
+    admitted = targeting is None or (
+        targeting.matches_audience(device_type, geo_location) and targeting.matches_attributes(attributes or {})
+    )
+    
+    def generate():
+        if not admitted:
+            chunks = [[(user_id, None) for user_id in user_ids]]
+        else:
+            # Hash on the app's shared pool; without one, hash in-process
+            pool = bulk_assignment_pool.executor
+            chunks = iter_bulk_assignments(
+                experiment_id,
+                experiment.config["variants"],
+                user_ids,
+                workers=bulk_assignment_pool.workers if pool is not None else 1,
+                pool=pool,
+                layer=experiment.layer,
+                layer_range=experiment.config.get("layer_range"),
+                rollout=targeting.rollout_allocation if targeting is not None else None,
+                rollout_buckets=targeting.rollout_buckets if targeting is not None else None
+            )
+        for chunk in chunks:
+            with serialization_duration.time("bulk_ndjson"):
+                lines = "".join(
+                    json.dumps({
+                        "user_id": user_id,
+                        "variant": variant,
+                        "is_control": variant is not None and is_control_variant(variant)
+                    }) + "\n"
+                    for user_id, variant in chunk
+                )
+            yield lines
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @router.get("/experiments/{experiment_id}", response_model=ExperimentConfig)
 async def get_experiment(
     experiment_id: str,
-    db = Depends(get_database)
+    registry = Depends(get_experiment_registry)
 ):
-    """Get experiment configuration by ID."""
-    experiment = await db.get_experiment(experiment_id)
-    if not experiment:
+    """Get experiment configuration by ID, as of the registry's current snapshot."""
+    experiment = registry.get(experiment_id)
+    if experiment is None:
         raise HTTPException(status_code=404, detail="Experiment not found")
     
-    return ExperimentConfig(**experiment)
+    return ExperimentConfig(**experiment.config)
+
+SEGMENT_QUERY_DESCRIPTION = (
+    "Only count users and events in this segment, e.g. device_type:mobile,geo_location:DE|AT "
+    "(terms ANDed, |-separated values ORed); repeat to count any of several segments"
+)
+
+def parse_segments(segment: Optional[List[str]]) -> Optional[List[Segment]]:
+    """Parse the `segment` query parameters, answering 400 for malformed ones."""
+    if not segment:
+        return None
+    try:
+        return [parse_segment(text) for text in segment]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/experiments/{experiment_id}/stats", response_model=ExperimentStatsResponse)
 async def get_experiment_stats(
     experiment_id: str,
-    db = Depends(get_database)
+    segment: Optional[List[str]] = Query(None, description=SEGMENT_QUERY_DESCRIPTION),
+    db = Depends(get_database),
+    registry = Depends(get_experiment_registry)
+):
+    """
+    Get experiment statistics including user distribution and conversion rates.
+    
+    With `segment`, users are counted by the device and location they were
+    assigned with, and events by their own.
+    """
+    if registry.get(experiment_id) is None:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    
+    segments = parse_segments(segment)
+    stats = await db.get_experiment_stats(experiment_id, segments)
+    return ExperimentStatsResponse(**stats, segments=segment or None)
+
+@router.get("/experiments/{experiment_id}/analysis", response_model=ExperimentAnalysisResponse)
+async def get_experiment_analysis(
+    experiment_id: str,
+    confidence: float = Query(0.95, gt=0, lt=1, description="Confidence level for intervals and significance"),
+    segment: Optional[List[str]] = Query(None, description=SEGMENT_QUERY_DESCRIPTION),
+    db = Depends(get_database),
+    registry = Depends(get_experiment_registry)
 ):
-    """Get experiment statistics including user distribution and conversion rates."""
-    experiment = await db.get_experiment(experiment_id)
-    if not experiment:
+    """
+    Compare each variant against the control group.
+    
+    Reports conversion rate and CTR per variant with Wilson confidence intervals,
+    and for each treatment the lift, absolute difference (with interval) and a
+    two-proportion z-test against control, optionally within segments (e.g.
+    the lift on mobile in DE).
+    """
+    experiment = registry.get(experiment_id)
+    if experiment is None:
         raise HTTPException(status_code=404, detail="Experiment not found")
     
-    stats = await db.get_experiment_stats(experiment_id)
-    return ExperimentStatsResponse(**stats)
+    segments = parse_segments(segment)
+    stats = await db.get_experiment_stats(experiment_id, segments)
+    return ExperimentAnalysisResponse(**analyze_experiment(experiment.config, stats, confidence), segments=segment or None)
+
+@router.get("/experiments/{experiment_id}/timeseries", response_model=TimeSeriesResponse)
+async def get_experiment_timeseries(
+    experiment_id: str,
+    resolution: Resolution = Query(Resolution.HOUR, description="Bucket width"),
+    since: Optional[datetime] = Query(None, description="Start of the range (default: experiment start)"),
+    until: Optional[datetime] = Query(None, description="End of the range, exclusive (default: now)"),
+    group_by: List[RollupDimension] = Query(
+        [RollupDimension.VARIANT, RollupDimension.EVENT_TYPE],
+        description="Dimensions to break the counts down by (repeatable)"
+    ),
+    variant: Optional[str] = Query(None, description="Only count this variant"),
+    event_type: Optional[EventType] = Query(None, description="Only count this event type"),
+    device_type: Optional[DeviceType] = Query(None, description="Only count this device type"),
+    geo_location: Optional[str] = Query(None, description="Only count this location"),
+    db = Depends(get_database),
+    registry = Depends(get_experiment_registry)
+):
+    """
+    Event counts per time bucket, e.g. conversions per variant per hour.
+    
+    Served from the rollups maintained on ingestion, so the cost is proportional
+    to the number of buckets in the range rather than the number of events.
+    The range is widened to whole buckets of the requested resolution. Minute
+    buckets are merged into hours (and hours into days) once they age past
+    the compaction retention; such points come back with a wider bucket_seconds.
+    """
+    experiment = registry.get(experiment_id)
+    if experiment is None:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    
+    width = RESOLUTIONS[resolution.value]
+    end = epoch_seconds(until) if until is not None else time.time()
+    if since is not None:
+        start = epoch_seconds(since)
+    elif experiment.starts_at is not None:
+        start = experiment.starts_at
+    else:
+        start = end - width * TIMESERIES_MAX_BUCKETS
+    start = bucket_start(start, width)
+    end = bucket_start(end, width) + (width if end % width else 0)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="until must be after since")
+    if (end - start) // width > TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range spans more than {TIMESERIES_MAX_BUCKETS} {resolution.value} buckets; narrow it or use a coarser resolution"
+        )
+    
+    dimensions = list(dict.fromkeys(dimension.value for dimension in group_by))
+    filters = {
+        name: getattr(value, "value", value)
+        for name, value in (
+            ("variant", variant), ("event_type", event_type),
+            ("device_type", device_type), ("geo_location", geo_location)
+        )
+        if value is not None
+    }
+    rows = await db.get_event_rollups(experiment_id, start, end, width)
+    return TimeSeriesResponse(
+        experiment_id=experiment_id,
+        resolution=resolution,
+        since=datetime.fromtimestamp(start, timezone.utc),
+        until=datetime.fromtimestamp(end, timezone.utc),
+        group_by=dimensions,
+        points=build_timeseries(rows, width, dimensions, filters)
+    )
 
 @router.get("/experiments")
-async def list_experiments(db = Depends(get_database)):
+async def list_experiments(registry = Depends(get_experiment_registry)):
     """List all available experiments."""
-    return {"experiments": list(db.experiments.keys())}
+    return {"experiments": list(registry.snapshot.experiments)}
@@ -0,0 +1,188 @@
+import math
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.utils.hash import is_control_variant
+
+# Chebyshev fit of erfc (Numerical Recipes' erfcc), fractional error below 1.2e-7
+_ERFC_COEFFICIENTS = (
+    0.17087277, -0.82215223, 1.48851587, -1.13520398, 0.27886807,
+    -0.18628806, 0.09678418, 0.37409196, 1.00002368, -1.26551223
+)
+
+def _erfc(x: np.ndarray) -> np.ndarray:
+    """
+    Complementary error function over a whole array.
+
+    NumPy has no erfc and SciPy is not a dependency; this stays in float64
+    array operations instead of calling math.erfc once per element.
+    """
+    z = np.abs(x)
+    t = 1 / (1 + 0.5 * z)
+    poly = np.zeros_like(t)
+    for coefficient in _ERFC_COEFFICIENTS:
+        poly = poly * t + coefficient
+    result = t * np.exp(-z * z + poly)
+    return np.where(x < 0, 2 - result, result)
+
+def variant_counts(experiment: Dict[str, Any], stats: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Collect per-variant counts for analysis from an experiment config and its stats.
+
+    Variants follow the config order; variants that only appear in the data are appended.
+    When the stats carry distinct-user sketches, `users` are the distinct users
+    with any event and `conversions` the distinct converting users (HyperLogLog
+    estimates). Segment-filtered stats have no sketches, so there `users` are
+    assigned users and `conversions` conversion events.
+    """
+    names = list(experiment["variants"].keys())
+    seen = set(names)
+    for name in list(stats["variant_distribution"]) + list(stats.get("events_by_variant", {})):
+        if name not in seen:
+            names.append(name)
+            seen.add(name)
+
+    events = stats.get("events_by_variant", {})
+    control = next((name for name in names if is_control_variant(name)), names[0] if names else None)
+    unique_users = stats.get("unique_users_by_variant")
+    active_users = stats.get("active_users_by_variant")
+    distinct = unique_users is not None and active_users is not None
+    if distinct:
+        users = [active_users.get(name, 0) for name in names]
+        conversions = [unique_users.get(name, {}).get("conversion", 0) for name in names]
+    else:
+        users = [stats["variant_distribution"].get(name, 0) for name in names]
+        conversions = [events.get(name, {}).get("conversion", 0) for name in names]
+    return {
+        "experiment_id": experiment["experiment_id"],
+        "variants": names,
+        "control": control,
+        "distinct_users": distinct,
+        "users": users,
+        "conversions": conversions,
+        "clicks": [events.get(name, {}).get("click", 0) for name in names],
+        "impressions": [events.get(name, {}).get("impression", 0) for name in names],
+    }
+
+def _optional(value: float) -> Optional[float]:
+    # Undefined results (no users, zero control rate) are reported as null
+    return float(value) if math.isfinite(value) else None
+
+def _interval(low: float, high: float) -> Optional[List[float]]:
+    if not (math.isfinite(low) and math.isfinite(high)):
+        return None
+    return [float(low), float(high)]
+
+def analyze_experiments(experiments: List[Dict[str, Any]], confidence: float = 0.95) -> List[Dict[str, Any]]:
+    """
+    Compare every variant with its experiment's control, for many experiments at once.
+
+    All variants of all experiments are flattened into one set of arrays, so the
+    rates, Wilson intervals, two-proportion z-tests and lifts are computed in a
+    single vectorised pass. Conversions are capped at the number of users. With
+    `distinct_users` they are distinct converting users over distinct active
+    users; otherwise (segment-filtered stats) they are conversion events over
+    assigned users, and a user who converts twice counts twice.
+
+    Args:
+        experiments: Items built by variant_counts
+        confidence: Confidence level for intervals and the significance flag
+
+    Returns:
+        One dictionary per experiment matching ExperimentAnalysisResponse
+    """
+    experiments = [experiment for experiment in experiments if experiment["variants"]]
+    if not experiments:
+        return []
+
+    sizes = np.array([len(experiment["variants"]) for experiment in experiments])
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    control_rows = offsets + np.array([
+        experiment["variants"].index(experiment["control"]) for experiment in experiments
+    ])
+    control = np.repeat(control_rows, sizes)
+
+    def column(name: str) -> np.ndarray:
+        return np.array([value for experiment in experiments for value in experiment[name]], dtype=np.float64)
+
+    users = column("users")
+    conversions = column("conversions")
+    clicks = column("clicks")
+    impressions = column("impressions")
+    successes = np.minimum(conversions, users)
+    z_critical = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = successes / users
+        ctr = clicks / impressions
+
+        # Wilson score interval per variant
+        z2 = z_critical ** 2
+        centre = (rate + z2 / (2 * users)) / (1 + z2 / users)
+        half_width = z_critical * np.sqrt(rate * (1 - rate) / users + z2 / (4 * users ** 2)) / (1 + z2 / users)
+
+        control_rate = rate[control]
+        control_users = users[control]
+        difference = rate - control_rate
+        lift = difference / control_rate
+
+        # Pooled two-proportion z-test against control
+        pooled = (successes + successes[control]) / (users + control_users)
+        pooled_se = np.sqrt(pooled * (1 - pooled) * (1 / users + 1 / control_users))
+        z_score = difference / pooled_se
+        z_score = np.where((pooled_se == 0) & (difference == 0), 0.0, z_score)
+        p_value = _erfc(np.abs(z_score) / math.sqrt(2))
+
+        # Unpooled standard error for the interval on the difference
+        difference_se = np.sqrt(rate * (1 - rate) / users + control_rate * (1 - control_rate) / control_users)
+
+    results = []
+    for experiment, offset in zip(experiments, offsets.tolist()):
+        variants = []
+        for local, name in enumerate(experiment["variants"]):
+            row = offset + local
+            is_control = bool(row == control[row])
+            variants.append({
+                "variant": name,
+                "is_control": is_control,
+                "users": int(users[row]),
+                "conversions": int(conversions[row]),
+                "conversion_rate": _optional(rate[row]),
+                "conversion_rate_ci": _interval(centre[row] - half_width[row], centre[row] + half_width[row]),
+                "impressions": int(impressions[row]),
+                "clicks": int(clicks[row]),
+                "ctr": _optional(ctr[row]),
+                "absolute_difference": None if is_control else _optional(difference[row]),
+                "difference_ci": None if is_control else _interval(
+                    difference[row] - z_critical * difference_se[row],
+                    difference[row] + z_critical * difference_se[row]
+                ),
+                "lift": None if is_control else _optional(lift[row]),
+                "z_score": None if is_control else _optional(z_score[row]),
+                "p_value": None if is_control else _optional(p_value[row]),
+                "significant": None if is_control or math.isnan(p_value[row]) else bool(p_value[row] < 1 - confidence),
+            })
+        results.append({
+            "experiment_id": experiment["experiment_id"],
+            "control_variant": experiment["control"],
+            "confidence_level": confidence,
+            "distinct_users": experiment.get("distinct_users", False),
+            "variants": variants,
+        })
+    return results
+
+def analyze_experiment(experiment: Dict[str, Any], stats: Dict[str, Any], confidence: float = 0.95) -> Dict[str, Any]:
+    """Analyse a single experiment from its config and stats."""
+    counts = variant_counts(experiment, stats)
+    results = analyze_experiments([counts], confidence)
+    if results:
+        return results[0]
+    return {
+        "experiment_id": experiment["experiment_id"],
+        "control_variant": None,
+        "confidence_level": confidence,
+        "distinct_users": False,
+        "variants": [],
+    }
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.utils.analysis import variant_counts
+from app.utils.database import db
+from app.utils.experiment_registry import experiment_registry
+
+logger = logging.getLogger(__name__)
+
+# Exploration floor (percent per variant) for bandit experiments that do not set one
+DEFAULT_EXPLORATION_FLOOR = 5.0
+
+def is_bandit(experiment: Dict[str, Any]) -> bool:
+    """Check whether an experiment's split is managed by the bandit updater."""
+    return experiment.get("allocation_mode") == "bandit"
+
+def thompson_weights(
+    successes: np.ndarray,
+    trials: np.ndarray,
+    floor: float = DEFAULT_EXPLORATION_FLOOR,
+    draws: int = 10000,
+    rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
+    """
+    Allocation percentages from Beta-posterior Thompson sampling.
+
+    Each variant's conversion rate has a Beta(1 + successes, 1 + failures)
+    posterior. All posteriors are sampled `draws` times in one call and a
+    variant's weight is the share of draws in which it had the highest rate,
+    i.e. the probability that Thompson sampling would pick it for a user.
+    Every variant keeps at least `floor` percent so losing arms are still explored.
+
+    Args:
+        successes: Converting users per variant
+        trials: Assigned users per variant
+        floor: Minimum percentage per variant (capped at an equal split)
+        draws: Posterior samples per variant
+        rng: Random generator (a fresh one when omitted)
+
+    Returns:
+        Percentages per variant, rounded to the 0.01% bucket size and summing to 100
+    """
+    rng = rng or np.random.default_rng()
+    successes = np.asarray(successes, dtype=np.float64)
+    trials = np.asarray(trials, dtype=np.float64)
+    successes = np.clip(successes, 0, trials)
+    count = len(trials)
+    if count == 0:
+        return np.empty(0)
+
+    samples = rng.beta(1 + successes[:, None], 1 + (trials - successes)[:, None], size=(count, draws))
+    p_best = np.bincount(samples.argmax(axis=0), minlength=count) / draws
+
+    floor = min(max(floor, 0.0), 100.0 / count)
+    weights = np.round(floor + (100.0 - count * floor) * p_best, 2)
+    # Put the rounding remainder on the leading arm so the split covers every bucket
+    weights[weights.argmax()] += round(100.0 - weights.sum(), 2)
+    return weights
+
+class BanditUpdater:
+    """
+    Background task that re-weights bandit experiments.
+
+    Every `interval` seconds it reads each active bandit experiment's distinct
+    active and converting users (variant_counts), recomputes the split with thompson_weights and saves
+    it through the experiment registry. Only new users see the new split:
+    assignments are persisted, and the assignment route reads them back before
+    hashing for bandit experiments.
+
+    Every worker process runs an updater, but only the one holding the
+    database's "bandit" role (db.try_lead) updates; the others skip their
+    turn and load the weights it saves from the registry's source. When the
+    leader exits, the next updater to ask takes the role over.
+    """
+
+    def __init__(self, db, registry, interval: float = 60.0, draws: int = 10000, seed: Optional[int] = None):
+        self.db = db
+        self.registry = registry
+        self.interval = interval
+        self.draws = draws
+        self.rng = np.random.default_rng(seed)
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+
+        # Metrics
+        self.leader = False
+        self.updates = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_update_latency = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        """Start the periodic updater on the running event loop."""
+        if self._task is not None:
+            return
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the updater, letting an update in progress finish."""
+        if self._task is None:
+            return
+        self._stop.set()
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await self.update_all()
+            except Exception:
+                self.failures += 1
+                logger.exception("Bandit weight update failed")
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def update_all(self) -> Dict[str, Dict[str, float]]:
+        """
+        Recompute and save the split of every active bandit experiment.
+
+        Returns:
+            New variant weights by experiment id (empty when another process
+            holds the bandit role)
+        """
+        start = time.perf_counter()
+        updated: Dict[str, Dict[str, float]] = {}
+        self.leader = await self.db.try_lead("bandit")
+        if not self.leader:
+            self.skipped += 1
+            return updated
+        if self.registry.snapshot is None:
+            await self.registry.reload()
+        now = time.time()
+        for experiment in list(self.registry.snapshot.experiments.values()):
+            if not is_bandit(experiment.config) or not experiment.is_active(now):
+                continue
+            variants = await self.update_experiment(experiment.config)
+            if variants is not None:
+                updated[experiment.experiment_id] = variants
+        self.updates += 1
+        self.last_update_latency = time.perf_counter() - start
+        return updated
+
+    async def update_experiment(self, experiment: Dict[str, Any]) -> Optional[Dict[str, float]]:
+        """Recompute one experiment's split; returns None when it is unchanged."""
+        stats = await self.db.get_experiment_stats(experiment["experiment_id"])
+        counts = variant_counts(experiment, stats)
+        # Only configured variants can receive traffic
+        names: List[str] = list(experiment["variants"])
+        size = len(names)
+        floor = experiment.get("exploration_floor")
+        weights = thompson_weights(
+            counts["conversions"][:size],
+            counts["users"][:size],
+            floor=DEFAULT_EXPLORATION_FLOOR if floor is None else floor,
+            draws=self.draws,
+            rng=self.rng
+        )
+        variants = {name: float(weight) for name, weight in zip(names, weights)}
+        if variants == experiment["variants"]:
+            return None
+
+        # Published as a new registry snapshot; bandit fingerprints ignore weights,
+        # so cached assignments survive the update
+        await self.registry.set_variants(experiment["experiment_id"], variants)
+        return variants
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "leader": self.leader,
+            "interval_seconds": self.interval,
+            "updates": self.updates,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_update_latency_ms": self.last_update_latency * 1000,
+        }
+
+def create_bandit_updater(db, registry) -> Optional[BanditUpdater]:
+    """Create the bandit updater unless BANDIT_UPDATE_INTERVAL is 0."""
+    interval = float(os.getenv("BANDIT_UPDATE_INTERVAL", 60))
+    if interval <= 0:
+        return None
+    return BanditUpdater(db, registry, interval=interval, draws=int(os.getenv("BANDIT_POSTERIOR_DRAWS", 10000)))
+
+# Global bandit updater (None when disabled)
+bandit_updater = create_bandit_updater(db, experiment_registry)
@@ -0,0 +1,251 @@
+import copy
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# A container holds the low 16 bits of the values sharing their high 16 bits
+CONTAINER_VALUES = 1 << 16
+
+# Containers with more values than this are 8 KiB bitsets; smaller ones are sorted uint16 arrays
+ARRAY_LIMIT = 4096
+
+# Set bits per byte value (np.bitwise_count needs NumPy 2)
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+def _popcount(words: np.ndarray) -> int:
+    return int(_POPCOUNT[words.view(np.uint8)].sum(dtype=np.int64))
+
+def _is_array(container: array) -> bool:
+    return container.typecode == "H"
+
+def _values(container: array) -> np.ndarray:
+    """Sorted uint16 values of a container."""
+    if _is_array(container):
+        return np.frombuffer(container, dtype=np.uint16)
+    bits = np.unpackbits(np.frombuffer(container, dtype=np.uint8), bitorder="little")
+    return np.flatnonzero(bits).astype(np.uint16)
+
+def _words(container: array) -> np.ndarray:
+    """A container as 1024 uint64 words, bit v of the container being bit v % 64 of word v // 64."""
+    if not _is_array(container):
+        return np.frombuffer(container, dtype=np.uint64)
+    bits = np.zeros(CONTAINER_VALUES, dtype=np.uint8)
+    bits[np.frombuffer(container, dtype=np.uint16)] = 1
+    return np.packbits(bits, bitorder="little").view(np.uint64)
+
+def _contains(words: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Mask of the values whose bit is set in words."""
+    return (words.view(np.uint8)[values >> 3] >> (values & 7)) & 1 != 0
+
+def _from_values(values: np.ndarray) -> Optional[array]:
+    """Container for sorted unique uint16 values, or None if there are none."""
+    if not len(values):
+        return None
+    if len(values) > ARRAY_LIMIT:
+        bits = np.zeros(CONTAINER_VALUES, dtype=np.uint8)
+        bits[values] = 1
+        container = array("Q")
+        container.frombytes(np.packbits(bits, bitorder="little").tobytes())
+        return container
+    container = array("H")
+    container.frombytes(values.astype(np.uint16).tobytes())
+    return container
+
+def _from_words(words: np.ndarray) -> Optional[array]:
+    """Container for a bitset, as an array if it is sparse enough, or None if it is empty."""
+    count = _popcount(words)
+    if count == 0:
+        return None
+    if count <= ARRAY_LIMIT:
+        return _from_values(np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder="little")))
+    container = array("Q")
+    container.frombytes(words.tobytes())
+    return container
+
+def _cardinality(container: array) -> int:
+    return len(container) if _is_array(container) else _popcount(np.frombuffer(container, dtype=np.uint64))
+
+def _intersect(first: array, second: array) -> Optional[array]:
+    if _is_array(first) and _is_array(second):
+        return _from_values(np.intersect1d(_values(first), _values(second), assume_unique=True))
+    if _is_array(first) or _is_array(second):
+        sparse, dense = (first, second) if _is_array(first) else (second, first)
+        values = _values(sparse)
+        return _from_values(values[_contains(_words(dense), values)])
+    return _from_words(_words(first) & _words(second))
+
+def _intersection_cardinality(first: array, second: array) -> int:
+    if _is_array(first) and _is_array(second):
+        return len(np.intersect1d(_values(first), _values(second), assume_unique=True))
+    if _is_array(first) or _is_array(second):
+        sparse, dense = (first, second) if _is_array(first) else (second, first)
+        return int(np.count_nonzero(_contains(_words(dense), _values(sparse))))
+    return _popcount(_words(first) & _words(second))
+
+def _union(containers: List[array]) -> array:
+    if len(containers) == 1:
+        return copy.copy(containers[0])
+    if all(_is_array(container) for container in containers) and sum(map(len, containers)) <= ARRAY_LIMIT:
+        merged = np.sort(np.concatenate([_values(container) for container in containers]))
+        return _from_values(merged[np.concatenate(([True], merged[1:] != merged[:-1]))])
+    words = np.zeros(CONTAINER_VALUES // 64, dtype=np.uint64)
+    for container in containers:
+        words |= _words(container)
+    return _from_words(words)
+
+class RoaringBitmap:
+    """
+    Compressed set of integers in [0, 2**32), in the style of Roaring bitmaps.
+
+    Values are split by their high 16 bits into containers, kept sorted by
+    key. A container with up to ARRAY_LIMIT values is a sorted array of
+    their low 16 bits (2 bytes per value); a fuller one is a 65536-bit
+    bitset (8 KiB). Adding increasing values, as ordinals are handed out,
+    appends to the last container. Intersections and unions work container
+    by container with NumPy: array/array by merging sorted values,
+    array/bitset by testing bits and bitset/bitset by word-wise AND/OR;
+    intersection_cardinality counts without building the result.
+    """
+    __slots__ = ("keys", "containers", "cardinality")
+
+    def __init__(self):
+        self.keys: List[int] = []
+        self.containers: List[array] = []
+        self.cardinality = 0
+
+    @classmethod
+    def from_sorted(cls, values: np.ndarray) -> "RoaringBitmap":
+        """Build a bitmap from sorted, unique values."""
+        bitmap = cls()
+        values = np.asarray(values, dtype=np.int64)
+        if not len(values):
+            return bitmap
+        boundaries = np.flatnonzero(np.diff(values >> 16)) + 1
+        for chunk in np.split(values, boundaries):
+            bitmap._append(int(chunk[0]) >> 16, _from_values((chunk & 0xFFFF).astype(np.uint16)))
+        return bitmap
+
+    @classmethod
+    def union_all(cls, bitmaps: Iterable["RoaringBitmap"]) -> "RoaringBitmap":
+        """Union of any number of bitmaps, merging each key's containers once."""
+        by_key: Dict[int, List[array]] = {}
+        for bitmap in bitmaps:
+            for key, container in zip(bitmap.keys, bitmap.containers):
+                by_key.setdefault(key, []).append(container)
+        result = cls()
+        for key in sorted(by_key):
+            result._append(key, _union(by_key[key]))
+        return result
+
+    def _append(self, key: int, container: Optional[array]) -> None:
+        if container is not None:
+            self.keys.append(key)
+            self.containers.append(container)
+            self.cardinality += _cardinality(container)
+
+    def _find(self, key: int) -> int:
+        keys = self.keys
+        if keys and keys[-1] == key:
+            return len(keys) - 1
+        index = bisect_left(keys, key)
+        return index if index < len(keys) and keys[index] == key else -1
+
+    def add(self, value: int) -> None:
+        key, low = value >> 16, value & 0xFFFF
+        index = self._find(key)
+        if index < 0:
+            index = bisect_left(self.keys, key)
+            self.keys.insert(index, key)
+            self.containers.insert(index, array("H"))
+        container = self.containers[index]
+        if _is_array(container):
+            if not container or low > container[-1]:
+                container.append(low)
+            else:
+                position = bisect_left(container, low)
+                if position < len(container) and container[position] == low:
+                    return
+                container.insert(position, low)
+            if len(container) > ARRAY_LIMIT:
+                self.containers[index] = _from_values(np.frombuffer(container, dtype=np.uint16))
+        else:
+            word, bit = low >> 6, 1 << (low & 63)
+            if container[word] & bit:
+                return
+            container[word] |= bit
+        self.cardinality += 1
+
+    def discard(self, value: int) -> None:
+        key, low = value >> 16, value & 0xFFFF
+        index = self._find(key)
+        if index < 0:
+            return
+        container = self.containers[index]
+        if _is_array(container):
+            position = bisect_left(container, low)
+            if position == len(container) or container[position] != low:
+                return
+            del container[position]
+            if not container:
+                del self.keys[index]
+                del self.containers[index]
+        else:
+            word, bit = low >> 6, 1 << (low & 63)
+            if not container[word] & bit:
+                return
+            container[word] &= ~bit & 0xFFFFFFFFFFFFFFFF
+        self.cardinality -= 1
+
+    def __contains__(self, value: int) -> bool:
+        index = self._find(value >> 16)
+        if index < 0:
+            return False
+        container, low = self.containers[index], value & 0xFFFF
+        if _is_array(container):
+            position = bisect_left(container, low)
+            return position < len(container) and container[position] == low
+        return bool(container[low >> 6] & (1 << (low & 63)))
+
+    def __len__(self) -> int:
+        return self.cardinality
+
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        others = dict(zip(other.keys, other.containers))
+        result = RoaringBitmap()
+        for key, container in zip(self.keys, self.containers):
+            match = others.get(key)
+            if match is not None:
+                result._append(key, _intersect(container, match))
+        return result
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return RoaringBitmap.union_all((self, other))
+
+    def intersection_cardinality(self, other: "RoaringBitmap") -> int:
+        """Size of the intersection, without building it."""
+        others = dict(zip(other.keys, other.containers))
+        total = 0
+        for key, container in zip(self.keys, self.containers):
+            match = others.get(key)
+            if match is not None:
+                total += _intersection_cardinality(container, match)
+        return total
+
+    def to_array(self) -> np.ndarray:
+        """The values in ascending order."""
+        if not self.keys:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([
+            (key << 16) + _values(container).astype(np.int64)
+            for key, container in zip(self.keys, self.containers)
+        ])
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the bitmap, in bytes."""
+        return (
+            sys.getsizeof(self.keys) + sys.getsizeof(self.containers)
+            + sum(sys.getsizeof(container) for container in self.containers)
+        )
@@ -0,0 +1,223 @@
+import hashlib
+import hmac
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from itertools import chain, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.hash import BUCKET_COUNT, VariantAllocation, get_allocation, get_layer_hasher, layer_bucket_range
+
+# User ids hashed per worker task
+DEFAULT_CHUNK_SIZE = int(os.getenv("BULK_ASSIGNMENT_CHUNK_SIZE", 50000))
+
+# Process pool size for bulk assignment (0 means one worker per CPU)
+BULK_ASSIGNMENT_WORKERS = int(os.getenv("BULK_ASSIGNMENT_WORKERS", 0))
+
+def _hash_chunk(key: bytes, message_suffix: bytes, user_ids: List[str], words: int = 1) -> np.ndarray:
+    """
+    Hash a chunk of user ids into buckets.
+
+    Runs inside pool workers, so it only takes picklable arguments. The first
+    four digest bytes of each user (eight, as two buckets, with words=2 for
+    layers) are packed together and decoded in one NumPy view instead of
+    converting every digest separately.
+    """
+    base = hmac.new(key, digestmod=hashlib.sha256)
+    prefixes = bytearray()
+    size = 4 * words
+    for user_id in user_ids:
+        mac = base.copy()
+        mac.update(user_id.encode('utf-8'))
+        mac.update(message_suffix)
+        prefixes += mac.digest()[:size]
+    buckets = np.frombuffer(bytes(prefixes), dtype='>u4') % BUCKET_COUNT
+    return buckets if words == 1 else buckets.reshape(-1, words)
+
+def _map_buckets(allocation: VariantAllocation, buckets: np.ndarray) -> np.ndarray:
+    """Vectorised equivalent of VariantAllocation.variant_for_bucket."""
+    names = np.array(allocation.variant_names + [allocation.fallback_variant], dtype=object)
+    boundaries = np.asarray(allocation.boundaries, dtype=np.int64)
+    indices = np.searchsorted(boundaries, buckets, side='left')
+    return names[indices]
+
+def _map_layer_buckets(allocation: VariantAllocation, buckets: np.ndarray, bucket_range: Tuple[int, int]) -> np.ndarray:
+    """Vectorised equivalent of assign_in_layer: None where the layer bucket is outside the range."""
+    variants = _map_buckets(allocation, buckets[:, 1])
+    variants[(buckets[:, 0] < bucket_range[0]) | (buckets[:, 0] >= bucket_range[1])] = None
+    return variants
+
+def _mask_rollout(map_buckets, rollout_buckets: int, buckets: np.ndarray, rollout_hashes: np.ndarray) -> np.ndarray:
+    """Map buckets to variants, with None for users whose rollout bucket is not below the threshold."""
+    variants = map_buckets(buckets)
+    variants[rollout_hashes >= rollout_buckets] = None
+    return variants
+
+def _results(futures) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    return tuple(future.result() if future is not None else None for future in futures)
+
+def _chunks(user_ids: Iterable[str], chunk_size: int) -> Iterator[List[str]]:
+    iterator = iter(user_ids)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+class BulkAssignmentPool:
+    """
+    The long-lived process pool bulk assignment requests share.
+
+    Started with the app and shut down with it, so requests do not pay for
+    starting worker processes, and concurrent requests queue their chunks on
+    the same `workers` processes instead of each forking a pool of their own.
+    With one worker there is no pool and requests hash in-process.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> Optional[ProcessPoolExecutor]:
+        """The running pool, or None (not started, or a single worker)."""
+        return self._executor
+
+    def start(self) -> None:
+        if self._executor is None and self.workers > 1:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+# Global bulk assignment pool, started by the app
+bulk_assignment_pool = BulkAssignmentPool(BULK_ASSIGNMENT_WORKERS or os.cpu_count() or 1)
+
+def iter_bulk_assignments(
+    experiment_id: str,
+    variants: Dict[str, float],
+    user_ids: Iterable[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: Optional[int] = None,
+    layer: Optional[str] = None,
+    layer_range: Optional[Sequence[float]] = None,
+    rollout: Optional[VariantAllocation] = None,
+    rollout_buckets: Optional[int] = None,
+    pool: Optional[Executor] = None,
+) -> Iterator[List[Tuple[str, Optional[str]]]]:
+    """
+    Assign many users to variants, yielding results chunk by chunk in input order.
+
+    Args:
+        experiment_id: Experiment identifier
+        variants: Dictionary of variant names to allocation percentages (0-100)
+        user_ids: User identifiers to assign
+        chunk_size: Number of users hashed per worker task
+        workers: Size of the process pool (defaults to the CPU count; 1 hashes
+            in-process); a pool of this size is created for the call unless
+            `pool` is given
+        layer: Layer of the experiment, if it has one
+        layer_range: The experiment's [start, end) percentage of the layer
+        rollout: Allocation hashing users for the experiment's targeting rollout, if it has one
+        rollout_buckets: Users with a rollout bucket below this are admitted
+        pool: Running executor to hash on (e.g. bulk_assignment_pool.executor),
+            with `workers` processes
+
+    Returns:
+        Iterator of lists of (user_id, variant) pairs, identical to calling
+        get_experiment_assignment for each user (variant None for users the
+        layer placed in another experiment or outside the rollout)
+    """
+    allocation = get_allocation(experiment_id, variants)
+    if layer:
+        hasher = get_layer_hasher(layer)
+        key, message_suffix, words = hasher.key, hasher.message_suffix, 2
+        map_buckets = partial(_map_layer_buckets, allocation, bucket_range=layer_bucket_range(layer_range))
+    else:
+        key, message_suffix, words = allocation.key, allocation.message_suffix, 1
+        map_buckets = partial(_map_buckets, allocation)
+    if rollout is not None:
+        map_variants = partial(_mask_rollout, map_buckets, rollout_buckets)
+    else:
+        def map_variants(buckets: np.ndarray, _: None) -> np.ndarray:
+            return map_buckets(buckets)
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(user_ids, chunk_size)
+
+    # Input that fits in one chunk is hashed in-process: a pool would only add
+    # the round trip to a worker
+    first = next(chunks, None)
+    if first is None:
+        return
+    second = next(chunks, None)
+    chunks = chain([first], [second] if second is not None else [], chunks)
+
+    if workers == 1 or second is None:
+        for chunk in chunks:
+            buckets = _hash_chunk(key, message_suffix, chunk, words)
+            rollout_hashes = _hash_chunk(rollout.key, rollout.message_suffix, chunk) if rollout is not None else None
+            yield list(zip(chunk, map_variants(buckets, rollout_hashes)))
+        return
+
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=workers) as call_pool:
+            yield from _iter_pooled(call_pool, workers, chunks, key, message_suffix, words, rollout, map_variants)
+        return
+    yield from _iter_pooled(pool, workers, chunks, key, message_suffix, words, rollout, map_variants)
+
+def _iter_pooled(
+    pool: Executor,
+    workers: int,
+    chunks: Iterator[List[str]],
+    key: bytes,
+    message_suffix: bytes,
+    words: int,
+    rollout: Optional[VariantAllocation],
+    map_variants: Callable
+) -> Iterator[List[Tuple[str, Optional[str]]]]:
+    # Keep a bounded window of chunks in flight so huge inputs are not all queued at once
+    pending = []
+    try:
+        for chunk in chunks:
+            futures = (
+                pool.submit(_hash_chunk, key, message_suffix, chunk, words),
+                pool.submit(_hash_chunk, rollout.key, rollout.message_suffix, chunk) if rollout is not None else None,
+            )
+            pending.append((chunk, futures))
+            if len(pending) >= workers * 2:
+                done_chunk, futures = pending.pop(0)
+                yield list(zip(done_chunk, map_variants(*_results(futures))))
+        while pending:
+            done_chunk, futures = pending.pop(0)
+            yield list(zip(done_chunk, map_variants(*_results(futures))))
+    finally:
+        # A client that disconnects mid-stream leaves chunks queued on a shared
+        # pool; drop the ones that have not started
+        for _, futures in pending:
+            for future in futures:
+                if future is not None:
+                    future.cancel()
+
+def bulk_variant_assignment(
+    experiment_id: str,
+    variants: Dict[str, float],
+    user_ids: List[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: Optional[int] = None,
+    layer: Optional[str] = None,
+    layer_range: Optional[Sequence[float]] = None,
+    rollout: Optional[VariantAllocation] = None,
+    rollout_buckets: Optional[int] = None,
+) -> List[Optional[str]]:
+    """Assign many users to variants, returning the variant names in input order."""
+    assigned: List[str] = []
+    chunks = iter_bulk_assignments(
+        experiment_id, variants, user_ids, chunk_size, workers, layer, layer_range, rollout, rollout_buckets
+    )
+    for chunk in chunks:
+        assigned.extend(variant for _, variant in chunk)
+    return assigned
@@ -1,39 +1,216 @@
 import os
 import asyncio
-from typing import Dict, List, Any, Optional
+import base64
+import json
+from itertools import islice
+from typing import AsyncIterator, Dict, List, Any, Optional
 from datetime import datetime
 
+import numpy as np
+
+from app.utils.event_record import stamped
+from app.utils.event_store import ColumnarEventStore, from_micros
+from app.utils.hyperloglog import UserSketches, VariantSketches, unique_user_stats
+from app.utils.metrics import InstrumentedDatabase
+from app.utils.rollups import DAY, DIMENSIONS, HOUR, MINUTE, RollupRow, RollupStore, bucket_start
+from app.utils.segments import Segment, SegmentIndex
+
+def default_experiments() -> Dict[str, Dict[str, Any]]:
+    """Experiments every backend starts with for the demo."""
+    return {
+        "homepage_banner": {
+            "experiment_id": "homepage_banner",
+            "name": "Homepage Banner Test",
+            "description": "Testing different banner designs",
+            "status": "active",
+            "variants": {"control": 50.0, "variant_a": 30.0, "variant_b": 20.0},
+            "start_date": datetime.now(),
+            "end_date": None,
+            "allocation_mode": "static"
+        },
+        "cta_button_bandit": {
+            "experiment_id": "cta_button_bandit",
+            "name": "Call-to-Action Button Bandit",
+            "description": "Thompson-sampling bandit over button copy",
+            "status": "active",
+            "variants": {"control": 34.0, "buy_now": 33.0, "get_started": 33.0},
+            "start_date": datetime.now(),
+            "end_date": None,
+            "allocation_mode": "bandit",
+            "exploration_floor": 5.0
+        },
+        # Two mutually exclusive experiments splitting the "checkout" layer's traffic
+        "checkout_layout": {
+            "experiment_id": "checkout_layout",
+            "name": "Checkout Layout Test",
+            "description": "Single-page vs multi-step checkout",
+            "status": "active",
+            "variants": {"control": 50.0, "single_page": 50.0},
+            "start_date": datetime.now(),
+            "end_date": None,
+            "allocation_mode": "static",
+            "layer": "checkout",
+            "layer_range": [0.0, 50.0]
+        },
+        "checkout_shipping_copy": {
+            "experiment_id": "checkout_shipping_copy",
+            "name": "Checkout Shipping Copy Test",
+            "description": "Wording of the free shipping notice",
+            "status": "active",
+            "variants": {"control": 50.0, "free_shipping_banner": 50.0},
+            "start_date": datetime.now(),
+            "end_date": None,
+            "allocation_mode": "static",
+            "layer": "checkout",
+            "layer_range": [50.0, 100.0]
+        },
+        # Targeted: half of new mobile and tablet users in the US and Canada
+        "mobile_onboarding": {
+            "experiment_id": "mobile_onboarding",
+            "name": "Mobile Onboarding Flow",
+            "description": "Guided tour for new mobile users in North America",
+            "status": "active",
+            "variants": {"control": 50.0, "guided_tour": 50.0},
+            "start_date": datetime.now(),
+            "end_date": None,
+            "allocation_mode": "static",
+            "targeting": {
+                "device_types": ["mobile", "tablet"],
+                "geo_prefixes": ["US", "CA"],
+                "attributes": [{"attribute": "account_age_days", "operator": "lt", "value": 30}],
+                "rollout": 50.0
+            }
+        }
+    }
+
+def summarize_stats(
+    experiment_id: str,
+    variant_distribution: Dict[str, int],
+    event_counts: Dict[str, Dict[str, int]],
+    user_sketches: Optional[VariantSketches] = None
+) -> Dict[str, Any]:
+    """
+    Build the stats payload from per-variant counts.
+    
+    Args:
+        experiment_id: Experiment identifier
+        variant_distribution: Variant name to assigned users
+        event_counts: Variant name to event type to event count
+        user_sketches: (variant, event_type) to HyperLogLog sketch of the users
+            with such events; without them the distinct-user fields are None
+    
+    Returns:
+        Dictionary matching ExperimentStatsResponse
+    """
+    total_users = sum(variant_distribution.values())
+    
+    # Roll per-variant event counts up by type
+    events_by_type = {}
+    for by_type in event_counts.values():
+        for event_type, count in by_type.items():
+            events_by_type[event_type] = events_by_type.get(event_type, 0) + count
+    
+    # Calculate conversion rate
+    conversions = events_by_type.get("conversion", 0)
+    conversion_rate = (conversions / total_users * 100) if total_users > 0 else 0
+    
+    unique_users = dict.fromkeys(("unique_users_by_variant", "active_users_by_variant", "conversion_rate_by_variant"))
+    if user_sketches is not None:
+        unique_users = unique_user_stats(user_sketches)
+    
+    return {
+        "experiment_id": experiment_id,
+        "total_users": total_users,
+        "variant_distribution": variant_distribution,
+        "events_by_type": events_by_type,
+        "events_by_variant": {variant: dict(by_type) for variant, by_type in event_counts.items()},
+        "conversion_rate": conversion_rate,
+        **unique_users
+    }
+
+def encode_cursor(*parts: Any) -> str:
+    """Encode a pagination position as an opaque URL-safe string."""
+    return base64.urlsafe_b64encode(json.dumps(parts).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """
+    Decode a cursor produced by encode_cursor.
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        parts = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(parts, list):
+        raise ValueError("Invalid cursor")
+    return parts
+
 # Mock database for demo purposes
-# In production, replace with actual PostgreSQL connection
+# Set DATABASE_URL to a postgres:// URL to use PostgresDatabase instead
 class MockDatabase:
     def __init__(self):
-        self.events: List[Dict[str, Any]] = []
+        self.events = ColumnarEventStore()
         self.assignments: Dict[str, Dict[str, Any]] = {}
-        self.experiments: Dict[str, Dict[str, Any]] = {
-            # Default experiment for demo
-            "homepage_banner": {
-                "experiment_id": "homepage_banner",
-                "name": "Homepage Banner Test",
-                "description": "Testing different banner designs",
-                "status": "active",
-                "variants": {"control": 50.0, "variant_a": 30.0, "variant_b": 20.0},
-                "start_date": datetime.now(),
-                "end_date": None
-            }
-        }
+        self.experiments: Dict[str, Dict[str, Any]] = default_experiments()
+        # Running counters so stats reads never rescan the raw logs
+        # experiment_id -> variant -> assigned users
+        self._variant_counts: Dict[str, Dict[str, int]] = {}
+        # experiment_id -> variant -> event_type -> event count
+        self._event_counts: Dict[str, Dict[str, Dict[str, int]]] = {}
+        # Time-bucketed event counts for the timeseries endpoint
+        self.rollups = RollupStore()
+        # Bitmaps of events and users by device type and location, for segment-filtered stats
+        self.segment_index = SegmentIndex()
+        # HyperLogLog sketches of the distinct users per variant and event type
+        self.user_sketches = UserSketches()
+    
+    async def connect(self) -> None:
+        """Nothing to set up for the in-memory store."""
+    
+    async def close(self) -> None:
+        """Nothing to tear down for the in-memory store."""
+    
+    def _count_assignment(self, counts: Dict[str, Dict[str, int]], experiment_id: str, variant: str, delta: int = 1) -> None:
+        variants = counts.setdefault(experiment_id, {})
+        variants[variant] = variants.get(variant, 0) + delta
+        if variants[variant] <= 0:
+            del variants[variant]
+    
+    def _count_event(self, counts: Dict[str, Dict[str, Dict[str, int]]], event: Dict[str, Any]) -> None:
+        by_type = counts.setdefault(event["experiment_id"], {}).setdefault(event["variant"], {})
+        event_type = event["event_type"]
+        by_type[event_type] = by_type.get(event_type, 0) + 1
     
     async def insert_event(self, event_data: Dict[str, Any]) -> str:
-        """Insert an event record."""
-        from app.utils.hash import generate_event_id
-        
-        event_id = generate_event_id()
-        event_record = {
-            "id": event_id,
-            "recorded_at": datetime.now(),
-            **event_data
-        }
+        """Insert an event record (an EventRecord is stored as is, without copying)."""
+        event_record = stamped(event_data, datetime.now())
         self.events.append(event_record)
-        return event_id
+        self._count_event(self._event_counts, event_record)
+        self.rollups.add(event_record)
+        self.segment_index.add_event(event_record)
+        self.user_sketches.add(event_record)
+        return event_record["id"]
+    
+    async def insert_events(self, events: List[Dict[str, Any]]) -> List[str]:
+        """
+        Insert a batch of event records, returning their ids in order.
+        
+        Events that already carry an "id" or "recorded_at" (e.g. stamped by the
+        route or the write-behind buffer when they were accepted) keep them.
+        """
+        recorded_at = datetime.now()
+        event_ids = []
+        for event_data in events:
+            event_record = stamped(event_data, recorded_at)
+            self.events.append(event_record)
+            self._count_event(self._event_counts, event_record)
+            self.rollups.add(event_record)
+            self.segment_index.add_event(event_record)
+            self.user_sketches.add(event_record)
+            event_ids.append(event_record["id"])
+        return event_ids
     
     async def get_assignment(self, user_id: str, experiment_id: str) -> Optional[Dict[str, Any]]:
         """Get existing assignment for user and experiment."""
@@ -42,49 +219,258 @@ class MockDatabase:
     
     async def save_assignment(self, assignment_data: Dict[str, Any]) -> None:
         """Save a new assignment."""
+        self._store_assignment(assignment_data)
+    
+    def _store_assignment(self, assignment_data: Dict[str, Any]) -> None:
         key = f"{assignment_data['user_id']}:{assignment_data['experiment_id']}"
+        previous = self.assignments.get(key)
+        if previous:
+            self._count_assignment(self._variant_counts, previous["experiment_id"], previous["variant"], -1)
+        self._count_assignment(self._variant_counts, assignment_data["experiment_id"], assignment_data["variant"])
         self.assignments[key] = {
             "assigned_at": datetime.now(),
             **assignment_data
         }
+        self.segment_index.add_assignment(assignment_data, previous)
+    
+    async def get_assignments(self, user_id: str, experiment_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get a user's existing assignments for several experiments, keyed by experiment id."""
+        found = {}
+        for experiment_id in experiment_ids:
+            assignment = self.assignments.get(f"{user_id}:{experiment_id}")
+            if assignment:
+                found[experiment_id] = assignment
+        return found
+    
+    async def save_assignments(self, assignments: List[Dict[str, Any]]) -> None:
+        """Save several new assignments at once."""
+        for assignment_data in assignments:
+            self._store_assignment(assignment_data)
     
     async def get_experiment(self, experiment_id: str) -> Optional[Dict[str, Any]]:
         """Get experiment configuration."""
         return self.experiments.get(experiment_id)
     
-    async def get_experiment_stats(self, experiment_id: str) -> Dict[str, Any]:
-        """Get experiment statistics."""
-        # Count assignments
-        assignments = [a for a in self.assignments.values() if a["experiment_id"] == experiment_id]
-        total_users = len(assignments)
+    async def list_experiments(self) -> List[str]:
+        """List experiment ids."""
+        return list(self.experiments.keys())
+    
+    async def get_experiments(self) -> List[Dict[str, Any]]:
+        """Get every experiment configuration."""
+        return list(self.experiments.values())
+    
+    async def update_experiment_variants(self, experiment_id: str, variants: Dict[str, float]) -> None:
+        """Replace an experiment's variant allocation."""
+        experiment = self.experiments[experiment_id]
+        self.experiments[experiment_id] = {**experiment, "variants": dict(variants)}
+
+    async def try_lead(self, role: str) -> bool:
+        """Claim a role that one process runs at a time; the in-memory store has only this process."""
+        return True
+    
+    async def get_experiment_events(self, experiment_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get the most recent events for an experiment, newest first."""
+        page = await self.query_experiment_events(experiment_id, limit)
+        return page["events"]
+    
+    async def query_experiment_events(
+        self,
+        experiment_id: str,
+        limit: int = 100,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get a page of an experiment's events, newest first.
+        
+        Args:
+            experiment_id: Experiment identifier
+            limit: Maximum number of events to return
+            since: Only events recorded at or after this time
+            until: Only events recorded before this time
+            cursor: next_cursor from the previous page
+        
+        Returns:
+            Dictionary with "events" and "next_cursor" (None on the last page)
+        
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        after = None
+        if cursor:
+            parts = decode_cursor(cursor)
+            if len(parts) != 2 or not all(isinstance(part, int) for part in parts):
+                raise ValueError("Invalid cursor")
+            after = (parts[0], parts[1])
+        
+        # Fetch one extra entry to know whether another page exists
+        entries = list(islice(self.events.iter_experiment(experiment_id, since, until, after), limit + 1))
+        page = entries[:limit]
+        next_cursor = encode_cursor(*page[-1]) if len(entries) > limit and page else None
+        return {
+            "events": [self.events.row(row) for _, row in page],
+            "next_cursor": next_cursor
+        }
+    
+    async def iter_experiment_events(
+        self,
+        experiment_id: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        event_types: Optional[List[str]] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream an experiment's events oldest first, one row at a time.
         
-        # Count by variant
-        variant_distribution = {}
-        for assignment in assignments:
-            variant = assignment["variant"]
-            variant_distribution[variant] = variant_distribution.get(variant, 0) + 1
+        Walks the experiment's time index, so memory stays constant however
+        many events match. Yields control to the event loop every batch_size events.
+        """
+        type_codes = None
+        if event_types is not None:
+            type_codes = {self.events.lookup("event_type", event_type) for event_type in event_types}
+        type_column = self.events.columns["event_type"]
         
-        # Count events by type
-        experiment_events = [e for e in self.events if e["experiment_id"] == experiment_id]
-        events_by_type = {}
-        for event in experiment_events:
-            event_type = event["event_type"]
-            events_by_type[event_type] = events_by_type.get(event_type, 0) + 1
+        scanned = 0
+        for _, row in self.events.iter_experiment(experiment_id, since, until, descending=False):
+            scanned += 1
+            if scanned % batch_size == 0:
+                await asyncio.sleep(0)
+            if type_codes is not None and type_column.get(row) not in type_codes:
+                continue
+            yield self.events.row(row)
+    
+    async def get_experiment_stats(self, experiment_id: str, segments: Optional[List[Segment]] = None) -> Dict[str, Any]:
+        """
+        Get experiment statistics from the running counters and user sketches.
         
-        # Calculate conversion rate
-        conversions = events_by_type.get("conversion", 0)
-        conversion_rate = (conversions / total_users * 100) if total_users > 0 else 0
+        With segments, users and events are restricted to those matching any
+        of the segments, counted by intersecting the segment bitmaps; the
+        sketches cover whole variants, so distinct-user counts are left out.
+        """
+        if segments:
+            variant_distribution, event_counts = self.segment_index.counts(experiment_id, segments)
+            return summarize_stats(experiment_id, variant_distribution, event_counts)
+        return summarize_stats(
+            experiment_id,
+            dict(self._variant_counts.get(experiment_id, {})),
+            self._event_counts.get(experiment_id, {}),
+            self.user_sketches.experiment(experiment_id)
+        )
+    
+    async def get_event_rollups(self, experiment_id: str, since: int, until: int, resolution: int) -> List[RollupRow]:
+        """Rollup rows for an experiment overlapping [since, until) (epoch seconds aligned to resolution)."""
+        return self.rollups.rows(experiment_id, since, until, resolution)
+    
+    async def compact_rollups(self, minute_before: int, hour_before: int) -> Dict[str, int]:
+        """
+        Merge minute buckets older than minute_before into hours, and hour buckets
+        older than hour_before into days (epoch seconds).
         
+        Returns:
+            Number of minute and hour rollup rows merged
+        """
         return {
-            "experiment_id": experiment_id,
-            "total_users": total_users,
-            "variant_distribution": variant_distribution,
-            "events_by_type": events_by_type,
-            "conversion_rate": conversion_rate
+            "minute": self.rollups.compact(MINUTE, HOUR, minute_before),
+            "hour": self.rollups.compact(HOUR, DAY, hour_before)
         }
+    
+    async def rebuild_stats(self) -> bool:
+        """
+        Recompute the stats counters, rollups, segment bitmaps and user sketches from the raw assignment and event logs.
+        
+        Rollups are rebuilt at minute resolution; the next compaction merges
+        the old buckets again.
+        
+        Returns:
+            True if the incrementally maintained counters matched the raw logs
+        """
+        variant_counts: Dict[str, Dict[str, int]] = {}
+        for assignment in self.assignments.values():
+            self._count_assignment(variant_counts, assignment["experiment_id"], assignment["variant"])
+        
+        # Group the event columns by (experiment, variant, event_type) codes in one pass
+        event_counts: Dict[str, Dict[str, Dict[str, int]]] = {}
+        if len(self.events):
+            keys = np.stack([
+                self.events.codes("experiment_id"),
+                self.events.codes("variant"),
+                self.events.codes("event_type")
+            ], axis=1)
+            groups, counts = np.unique(keys, axis=0, return_counts=True)
+            for (experiment_code, variant_code, type_code), count in zip(groups.tolist(), counts.tolist()):
+                by_variant = event_counts.setdefault(self.events.decode("experiment_id", experiment_code), {})
+                by_type = by_variant.setdefault(self.events.decode("variant", variant_code), {})
+                by_type[self.events.decode("event_type", type_code)] = count
+        self.rollups = self._rebuild_rollups()
+        self.segment_index = SegmentIndex.rebuild(self.events, self.assignments.values())
+        
+        # Sketches do not depend on insertion order, so rebuilt ones match register for register
+        user_sketches = UserSketches.rebuild(self.events)
+        consistent = (
+            {k: v for k, v in self._variant_counts.items() if v} == variant_counts
+            and self._event_counts == event_counts
+            and self.user_sketches.sketches == user_sketches.sketches
+        )
+        self.user_sketches = user_sketches
+        self._variant_counts = variant_counts
+        self._event_counts = event_counts
+        return consistent
+    
+    def _rebuild_rollups(self) -> RollupStore:
+        """Minute rollups of the event log, grouped in one pass over the columns."""
+        rollups = RollupStore()
+        if not len(self.events):
+            return rollups
+        
+        # recorded_at is stored as local wall-clock micros; group by wall-clock
+        # minute, then convert each distinct minute to epoch seconds
+        keys = np.stack([
+            self.events.codes("experiment_id").astype(np.int64),
+            self.events.codes("recorded_at") // 60_000_000,
+            *(self.events.codes(name).astype(np.int64) for name in DIMENSIONS)
+        ], axis=1)
+        groups, counts = np.unique(keys, axis=0, return_counts=True)
+        for (experiment_code, minute, *codes), count in zip(groups.tolist(), counts.tolist()):
+            start = bucket_start(from_micros(minute * 60_000_000).timestamp(), MINUTE)
+            key = tuple(self.events.decode(name, code) for name, code in zip(DIMENSIONS, codes))
+            rollups.add_count(self.events.decode("experiment_id", experiment_code), MINUTE, start, key, count)
+        return rollups
+
+def create_database(database_url: Optional[str] = None):
+    """
+    Create the database backend selected by DATABASE_URL.
+    
+    postgres:// and postgresql:// URLs select PostgresDatabase, sqlite:///path
+    selects SqliteDatabase (a file shared by all worker processes on the host)
+    and eventlog:///directory selects EventLogDatabase (durable segment files
+    for a single process); anything else (including demo-mode) uses the
+    in-memory MockDatabase, which is private to each process.
+    """
+    database_url = database_url if database_url is not None else os.getenv("DATABASE_URL", "demo-mode")
+    if database_url.startswith(("postgres://", "postgresql://")):
+        from app.utils.postgres_database import PostgresDatabase
+        return PostgresDatabase(database_url)
+    if database_url.startswith("sqlite:///"):
+        from app.utils.sqlite_database import SqliteDatabase
+        return SqliteDatabase(database_url[len("sqlite:///"):])
+    if database_url.startswith("eventlog:///"):
+        from app.utils.log_database import EventLogDatabase
+        from app.utils.segment_log import DEFAULT_SEGMENT_RECORDS
+        return EventLogDatabase(
+            database_url[len("eventlog:///"):],
+            segment_records=int(os.getenv("EVENT_LOG_SEGMENT_RECORDS", DEFAULT_SEGMENT_RECORDS)),
+            commit_delay=float(os.getenv("EVENT_LOG_COMMIT_DELAY", 0))
+        )
+    return MockDatabase()
+
+def is_shared_database_url(database_url: str) -> bool:
+    """Check whether a DATABASE_URL names a store every worker process can share."""
+    return database_url.startswith(("postgres://", "postgresql://", "sqlite:///"))
 
-# Global database instance
-db = MockDatabase()
+# Global database instance; coroutine calls are timed into db_call_duration_seconds
+db = InstrumentedDatabase(create_database())
 
 async def get_database():
     """Dependency to get database instance."""
@@ -0,0 +1,216 @@
+import hashlib
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Positions are derived from two 64-bit hashes as h1 + i * h2, wrapping at 64 bits
+# (the same arithmetic as the uint64 NumPy path used for batches)
+MASK64 = (1 << 64) - 1
+
+# Each filter byte holds one bit per time slice
+MAX_SLICES = 8
+
+def _hashes(key: str) -> tuple:
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+class TimeSlicedBloomFilter:
+    """
+    Bloom filter over a sliding time window, in a fixed amount of memory.
+
+    The window is split into `slices` time slices that share one byte array:
+    bit s of a byte belongs to slice s, so a key is added by setting the
+    current slice's bit at its k positions and looked up by AND-ing the k
+    bytes (non-zero means every position is set in some live slice). When
+    the clock moves into a new slice, the oldest slice's bit is cleared in
+    one vectorised pass. A key is remembered for at least `window` seconds
+    and at most window * slices / (slices - 1).
+
+    The array is sized for `capacity` keys per window at a false-positive
+    rate of `error_rate`; the rate actually reached is estimated from the
+    fill of each slice (see false_positive_rate()). Keys are never missed:
+    a filter only errs towards reporting an unseen key as seen.
+    """
+
+    def __init__(self, window: float, capacity: int, error_rate: float = 1e-6, slices: int = MAX_SLICES):
+        if not 2 <= slices <= MAX_SLICES:
+            raise ValueError(f"slices must be between 2 and {MAX_SLICES}")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.window = window
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.slices = slices
+        self.slice_seconds = window / (slices - 1)
+
+        # Size each slice for its share of the window's keys and error budget
+        per_slice = max(1, math.ceil(capacity / (slices - 1)))
+        self.size = max(64, math.ceil(-per_slice * math.log(error_rate / slices) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / per_slice * math.log(2)))
+
+        self.bits = bytearray(self.size)
+        self._view = np.frombuffer(self.bits, dtype=np.uint8)
+        self._offsets = np.arange(self.hash_count, dtype=np.uint64)
+        # Bits set per slice, for the false-positive estimate
+        self.fill = [0] * slices
+        self._slice: Optional[int] = None
+
+    @property
+    def nbytes(self) -> int:
+        return self.size
+
+    def _advance(self, now: float) -> int:
+        """Rotate to the slice containing `now`, clearing slices that expired; returns its bit."""
+        current = int(now // self.slice_seconds)
+        if self._slice is None:
+            self._slice = current
+        elif current > self._slice:
+            for index in range(self._slice + 1, min(current, self._slice + self.slices) + 1):
+                slot = index % self.slices
+                self._view &= np.uint8(~(1 << slot) & 0xFF)
+                self.fill[slot] = 0
+            self._slice = current
+        return 1 << (self._slice % self.slices)
+
+    def _positions(self, key: str) -> List[int]:
+        h1, h2 = _hashes(key)
+        return [((h1 + i * h2) & MASK64) % self.size for i in range(self.hash_count)]
+
+    def _position_matrix(self, keys: Sequence[str]) -> np.ndarray:
+        hashes = np.array([_hashes(key) for key in keys], dtype=np.uint64).reshape(-1, 2)
+        with np.errstate(over="ignore"):
+            return (hashes[:, :1] + self._offsets * hashes[:, 1:]) % np.uint64(self.size)
+
+    def contains(self, key: str, now: Optional[float] = None) -> bool:
+        """Whether the key was (probably) added within the window."""
+        self._advance(time.time() if now is None else now)
+        bits = self.bits
+        live = 0xFF
+        for position in self._positions(key):
+            live &= bits[position]
+            if not live:
+                return False
+        return True
+
+    def add(self, key: str, now: Optional[float] = None) -> None:
+        """Add a key to the current slice."""
+        bit = self._advance(time.time() if now is None else now)
+        bits = self.bits
+        slot = bit.bit_length() - 1
+        for position in self._positions(key):
+            if not bits[position] & bit:
+                bits[position] |= bit
+                self.fill[slot] += 1
+
+    def contains_many(self, keys: Sequence[str], now: Optional[float] = None) -> List[bool]:
+        """contains() for a batch of keys, hashing and probing them together."""
+        self._advance(time.time() if now is None else now)
+        if not keys:
+            return []
+        probes = self._view[self._position_matrix(keys)]
+        return (np.bitwise_and.reduce(probes, axis=1) != 0).tolist()
+
+    def add_many(self, keys: Sequence[str], now: Optional[float] = None) -> None:
+        """add() for a batch of keys."""
+        bit = self._advance(time.time() if now is None else now)
+        if not keys:
+            return
+        positions = np.unique(self._position_matrix(keys))
+        unset = positions[(self._view[positions] & bit) == 0]
+        self._view[unset] |= np.uint8(bit)
+        self.fill[bit.bit_length() - 1] += len(unset)
+
+    def false_positive_rate(self) -> float:
+        """Estimated chance that a key never added is reported as seen, from the current fill."""
+        missed = 1.0
+        for bits_set in self.fill:
+            missed *= 1.0 - (bits_set / self.size) ** self.hash_count
+        return 1.0 - missed
+
+class EventDeduplicator:
+    """
+    Drops events whose client-supplied id was already stored within the window.
+
+    Sits in front of the database: claim() checks a batch of keys against the
+    filter and against keys still being written, without a storage round
+    trip, and settle() adds the keys that were stored. A key whose write
+    failed is released instead, so the client's retry goes through.
+    """
+
+    def __init__(self, bloom: TimeSlicedBloomFilter):
+        self.bloom = bloom
+        # Keys claimed by writes that have not finished yet
+        self._pending = set()
+
+        # Metrics
+        self.checked = 0
+        self.duplicates = 0
+        self.stored = 0
+
+    def claim(self, keys: Sequence[str]) -> List[bool]:
+        """
+        Claim keys for writing.
+
+        Returns:
+            For each key, True if the event should be written, or False if it
+            is a duplicate (seen in the window, in flight, or earlier in `keys`)
+        """
+        seen = self.bloom.contains_many(keys) if len(keys) > 1 else [self.bloom.contains(key) for key in keys]
+        claimed = []
+        for key, duplicate in zip(keys, seen):
+            if duplicate or key in self._pending:
+                claimed.append(False)
+            else:
+                self._pending.add(key)
+                claimed.append(True)
+        self.checked += len(keys)
+        self.duplicates += claimed.count(False)
+        return claimed
+
+    def settle(self, keys: Sequence[str], stored: Sequence[bool]) -> None:
+        """Release claimed keys, remembering the ones whose events were stored."""
+        kept = [key for key, ok in zip(keys, stored) if ok]
+        if len(kept) > 1:
+            self.bloom.add_many(kept)
+        elif kept:
+            self.bloom.add(kept[0])
+        self.stored += len(kept)
+        self._pending.difference_update(keys)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.bloom.window,
+            "capacity": self.bloom.capacity,
+            "memory_bytes": self.bloom.nbytes,
+            "hash_count": self.bloom.hash_count,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "stored": self.stored,
+            "in_flight": len(self._pending),
+            "target_false_positive_rate": self.bloom.error_rate,
+            "estimated_false_positive_rate": self.bloom.false_positive_rate(),
+        }
+
+def dedup_key(experiment_id: str, event_id: str) -> str:
+    return f"{experiment_id}:{event_id}"
+
+def create_event_deduplicator() -> Optional[EventDeduplicator]:
+    """Create the event deduplicator unless EVENT_DEDUP_WINDOW is 0."""
+    window = float(os.getenv("EVENT_DEDUP_WINDOW", 3600))
+    if window <= 0:
+        return None
+    return EventDeduplicator(TimeSlicedBloomFilter(
+        window,
+        capacity=int(os.getenv("EVENT_DEDUP_CAPACITY", 1_000_000)),
+        error_rate=float(os.getenv("EVENT_DEDUP_ERROR_RATE", 1e-6))
+    ))
+
+# Global event deduplicator (None when disabled)
+event_deduplicator = create_event_deduplicator()
+
+async def get_event_deduplicator() -> Optional[EventDeduplicator]:
+    """Dependency to get the event deduplicator, if enabled."""
+    return event_deduplicator
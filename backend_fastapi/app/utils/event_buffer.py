@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from app.utils.database import db
+from app.utils.event_record import stamped
+
+logger = logging.getLogger(__name__)
+
+class EventBufferFull(Exception):
+    """Raised when the buffer is full and the overflow policy is 'reject'."""
+
+class EventBuffer:
+    """
+    Write-behind buffer between the event routes and the database.
+
+    Events are stamped with their id and recorded_at when accepted, queued in a
+    bounded asyncio.Queue and written by a background task with insert_events,
+    either when flush_size events are waiting or every flush_interval seconds.
+    When the queue is full, put() either raises EventBufferFull ('reject') or
+    waits for space ('block'). A flush that fails is retried flush_retries
+    times with backoff; if it still fails the batch is split in halves until
+    the events that fail on their own are found, and only those are dropped.
+    """
+
+    def __init__(
+        self,
+        db,
+        max_size: int = 10000,
+        flush_size: int = 500,
+        flush_interval: float = 0.5,
+        overflow: str = "reject",
+        flush_retries: int = 3,
+        retry_delay: float = 0.1
+    ):
+        if overflow not in ("reject", "block"):
+            raise ValueError("overflow must be 'reject' or 'block'")
+        self.db = db
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.flush_retries = flush_retries
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._flush_ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Metrics
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.failed = 0
+        self.retried = 0
+        self.flushes = 0
+        self.last_flush_size = 0
+        self.max_flush_size = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        """Start the background flusher on the running event loop."""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._flush_ready = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop accepting events and flush everything still queued."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._flush_ready.set()
+        await self._task
+        self._task = None
+
+    async def put(self, event_data: Dict[str, Any]) -> str:
+        """
+        Queue an event for writing. An EventRecord is queued as is, keeping the
+        id and recorded_at it was stamped with; a dict is stamped now.
+
+        Returns:
+            The event id the event will be stored under
+
+        Raises:
+            EventBufferFull: If the queue is full and the overflow policy is 'reject'
+        """
+        if self._stopping or self._task is None:
+            raise EventBufferFull("Event buffer is not accepting events")
+        event = stamped(event_data, datetime.now())
+        if self.overflow == "block":
+            await self._queue.put(event)
+        else:
+            try:
+                self._queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.rejected += 1
+                raise EventBufferFull("Event buffer is full")
+        self.enqueued += 1
+        if self._queue.qsize() >= self.flush_size:
+            self._flush_ready.set()
+        return event["id"]
+
+    async def put_many(self, events: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Queue a batch of events.
+
+        Returns:
+            Event ids in order; None for events rejected because the buffer was full
+        """
+        event_ids: List[Optional[str]] = []
+        for event_data in events:
+            try:
+                event_ids.append(await self.put(event_data))
+            except EventBufferFull:
+                event_ids.append(None)
+        return event_ids
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_ready.clear()
+
+            # Flush whatever is queued in flush_size chunks
+            while not self._queue.empty():
+                batch = []
+                while len(batch) < self.flush_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                await self._flush(batch)
+
+            if self._stopping and self._queue.empty():
+                return
+
+    async def _insert(self, batch: List[Dict[str, Any]], attempts: int) -> Optional[Exception]:
+        """Insert a batch, retrying with backoff; returns the last error, or None once it is written."""
+        error = None
+        for attempt in range(attempts):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                await self.db.insert_events(batch)
+                return None
+            except Exception as e:
+                error = e
+        return error
+
+    async def _write(self, batch: List[Dict[str, Any]], attempts: int) -> int:
+        """Write a batch, splitting it while it fails; returns the number of events dropped."""
+        error = await self._insert(batch, attempts)
+        if error is None:
+            return 0
+        if len(batch) == 1:
+            # The event was already acknowledged; record the loss rather than stall the flusher
+            logger.error("Dropped buffered event %s", batch[0].get("id"), exc_info=error)
+            return 1
+        if attempts > 1:
+            logger.warning("Failed to flush %d buffered events, splitting the batch: %s", len(batch), error)
+        # The whole batch was retried already, so the halves get one attempt each
+        middle = len(batch) // 2
+        return await self._write(batch[:middle], 1) + await self._write(batch[middle:], 1)
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        start = time.perf_counter()
+        dropped = await self._write(batch, self.flush_retries + 1)
+        latency = time.perf_counter() - start
+
+        self.failed += dropped
+        self.flushed += len(batch) - dropped
+        self.flushes += 1
+        self.last_flush_size = len(batch)
+        self.max_flush_size = max(self.max_flush_size, len(batch))
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self.total_flush_latency += latency
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, flush size and flush latency counters."""
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "capacity": self.max_size,
+            "overflow": self.overflow,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "flushes": self.flushes,
+            "last_flush_size": self.last_flush_size,
+            "max_flush_size": self.max_flush_size,
+            "avg_flush_size": self.flushed / self.flushes if self.flushes else 0,
+            "last_flush_latency_ms": self.last_flush_latency * 1000,
+            "max_flush_latency_ms": self.max_flush_latency * 1000,
+            "avg_flush_latency_ms": self.total_flush_latency / self.flushes * 1000 if self.flushes else 0,
+        }
+
+def create_event_buffer(db) -> Optional[EventBuffer]:
+    """Create the write-behind buffer if EVENT_WRITE_BEHIND is enabled."""
+    if os.getenv("EVENT_WRITE_BEHIND", "false").lower() not in ("1", "true", "yes"):
+        return None
+    return EventBuffer(
+        db,
+        max_size=int(os.getenv("EVENT_BUFFER_MAX_SIZE", 10000)),
+        flush_size=int(os.getenv("EVENT_BUFFER_FLUSH_SIZE", 500)),
+        flush_interval=float(os.getenv("EVENT_BUFFER_FLUSH_INTERVAL", 0.5)),
+        overflow=os.getenv("EVENT_BUFFER_OVERFLOW", "reject"),
+        flush_retries=int(os.getenv("EVENT_BUFFER_FLUSH_RETRIES", 3)),
+    )
+
+# Global write-behind buffer (None when events are written synchronously)
+event_buffer = create_event_buffer(db)
+
+async def get_event_buffer() -> Optional[EventBuffer]:
+    """Dependency to get the write-behind buffer, if enabled."""
+    return event_buffer
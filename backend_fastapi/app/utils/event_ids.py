@@ -0,0 +1,102 @@
+import os
+import struct
+import threading
+import time
+from typing import List, Tuple
+
+# UUIDv7 (RFC 9562) layout: 48-bit Unix milliseconds, version 7, a 12-bit
+# counter (the "fixed-length dedicated counter" of RFC 9562 method 1), the
+# RFC 4122 variant and 62 random bits
+COUNTER_LIMIT = 1 << 12
+VARIANT_BITS = 0b10 << 14
+RANDOM_HIGH_MASK = (1 << 14) - 1
+RANDOM_LOW_MASK = (1 << 48) - 1
+
+# Random words drawn from os.urandom at a time
+RANDOM_POOL_SIZE = 1024
+
+class EventIdGenerator:
+    """
+    Monotonic, time-ordered event ids in UUIDv7 format.
+
+    Ids sort (as strings or as UUIDs) in the order they were generated, so
+    new rows land at the right edge of the SQL primary key index instead of
+    at random pages, and they stay valid UUIDs for the PostgreSQL uuid
+    column and the columnar stores. Within one millisecond a 12-bit counter
+    orders the ids; past 4096 ids in a millisecond, or if the clock steps
+    back, the timestamp is carried forward so ids never go backwards. The
+    random bits come from os.urandom in pools; call reset() in a forked
+    child (done for the default generator) so it does not reuse the parent's pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._millis = 0
+        self._counter = 0
+        self._pool: List[int] = []
+        # The id text up to the version digit only changes with the millisecond
+        self._prefix_millis = -1
+        self._prefix = ""
+
+    def reset(self) -> None:
+        """Drop the random pool, e.g. after os.fork()."""
+        self._pool = []
+
+    def _refill(self, count: int) -> None:
+        words = max(RANDOM_POOL_SIZE, count - len(self._pool))
+        self._pool.extend(struct.unpack(f"<{words}Q", os.urandom(8 * words)))
+
+    def _reserve(self, count: int) -> Tuple[int, int]:
+        """Reserve count consecutive (millisecond, counter) slots; returns the first one."""
+        now = time.time_ns() // 1_000_000
+        if now > self._millis:
+            self._millis, self._counter = now, 0
+        millis, counter = self._millis, self._counter
+        counter_end = counter + count
+        self._millis += counter_end // COUNTER_LIMIT
+        self._counter = counter_end % COUNTER_LIMIT
+        return millis, counter
+
+    def _format(self, millis: int, counter: int, random_bits: int) -> str:
+        if millis != self._prefix_millis:
+            self._prefix_millis = millis
+            self._prefix = "%08x-%04x-7" % (millis >> 16, millis & 0xFFFF)
+        return "%s%03x-%04x-%012x" % (
+            self._prefix, counter, VARIANT_BITS | ((random_bits >> 48) & RANDOM_HIGH_MASK), random_bits & RANDOM_LOW_MASK
+        )
+
+    def new_id(self) -> str:
+        """One new event id."""
+        with self._lock:
+            millis, counter = self._reserve(1)
+            if not self._pool:
+                self._refill(1)
+            return self._format(millis, counter, self._pool.pop())
+
+    def new_ids(self, count: int) -> List[str]:
+        """count new event ids in ascending order, reserved under one lock acquisition."""
+        if count <= 0:
+            return []
+        with self._lock:
+            millis, counter = self._reserve(count)
+            if len(self._pool) < count:
+                self._refill(count)
+            ids = []
+            for _ in range(count):
+                ids.append(self._format(millis, counter, self._pool.pop()))
+                counter += 1
+                if counter == COUNTER_LIMIT:
+                    millis, counter = millis + 1, 0
+            return ids
+
+_generator = EventIdGenerator()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_generator.reset)
+
+def generate_event_id() -> str:
+    """Generate a unique, time-ordered event ID."""
+    return _generator.new_id()
+
+def generate_event_ids(count: int) -> List[str]:
+    """Generate count unique event IDs in ascending order."""
+    return _generator.new_ids(count)
@@ -0,0 +1,94 @@
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+from app.utils.event_ids import generate_event_id
+
+# Fields of a stored event, in the order the SQL backends' columns list them
+EVENT_FIELDS = (
+    "id", "recorded_at", "user_id", "experiment_id", "variant", "event_type",
+    "campaign_id", "ad_id", "device_type", "geo_location", "metadata"
+)
+
+_FIELD_SET = frozenset(EVENT_FIELDS)
+
+class EventRecord(Mapping):
+    """
+    One event, built once from the request and stored as is.
+
+    A slotted object rather than a dict: the route stamps its id and
+    recorded_at when it is accepted, the write-behind buffer queues it and
+    the backends, rollups, segment bitmaps and user sketches read it without
+    copying it into a merged dict, and the response reports the same id and
+    recorded_at that were stored. It is a read-only Mapping over
+    EVENT_FIELDS, so code reading events as dicts (event["variant"],
+    event.get("device_type"), dict(event)) takes records unchanged.
+    """
+    __slots__ = EVENT_FIELDS
+
+    def __init__(
+        self,
+        user_id: str,
+        experiment_id: str,
+        variant: str,
+        event_type: str,
+        campaign_id: Optional[str] = None,
+        ad_id: Optional[str] = None,
+        device_type: Optional[str] = None,
+        geo_location: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        id: Optional[str] = None,
+        recorded_at: Optional[datetime] = None
+    ):
+        self.id = id
+        self.recorded_at = recorded_at
+        self.user_id = user_id
+        self.experiment_id = experiment_id
+        self.variant = variant
+        self.event_type = event_type
+        self.campaign_id = campaign_id
+        self.ad_id = ad_id
+        self.device_type = device_type
+        self.geo_location = geo_location
+        self.metadata = metadata
+
+    def stamp(self, recorded_at: Optional[datetime] = None) -> "EventRecord":
+        """Give the record an id and recorded_at if it has none yet, and return it."""
+        if self.id is None:
+            self.id = generate_event_id()
+        if self.recorded_at is None:
+            self.recorded_at = recorded_at or datetime.now()
+        return self
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in _FIELD_SET:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        if name not in _FIELD_SET:
+            return default
+        return getattr(self, name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(EVENT_FIELDS)
+
+    def __len__(self) -> int:
+        return len(EVENT_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"EventRecord({', '.join(f'{name}={getattr(self, name)!r}' for name in EVENT_FIELDS)})"
+
+def stamped(event: Mapping, recorded_at: datetime) -> Mapping:
+    """
+    An event ready to store: a record stamped in place, or for a plain dict a
+    copy with a generated "id" and recorded_at unless it already carries them.
+    """
+    if type(event) is EventRecord:
+        return event.stamp(recorded_at)
+    # The computed fields go last so an explicit None in the dict cannot overwrite them
+    return {
+        **event,
+        "id": event.get("id") or generate_event_id(),
+        "recorded_at": event.get("recorded_at") or recorded_at
+    }
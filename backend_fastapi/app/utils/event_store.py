@@ -0,0 +1,328 @@
+import sys
+import uuid
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from operator import attrgetter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.event_record import EventRecord
+
+# Rows per column chunk; columns grow one preallocated chunk at a time so
+# existing chunks never move and NumPy views over them stay valid
+CHUNK_SIZE = 65536
+
+EPOCH = datetime(1970, 1, 1)
+
+# Dictionary-encoded string columns, in the order event records list them
+STRING_COLUMNS = [
+    "user_id", "experiment_id", "variant", "event_type",
+    "campaign_id", "ad_id", "device_type", "geo_location"
+]
+
+# Fields with a fixed place in the layout; anything else goes to the sparse extras table
+KNOWN_FIELDS = set(STRING_COLUMNS) | {"id", "recorded_at", "metadata"}
+
+_record_strings = attrgetter(*STRING_COLUMNS)
+
+def string_values(event: Dict[str, Any]) -> Tuple[Optional[str], ...]:
+    """An event's STRING_COLUMNS values, None where missing; one attribute fetch for an EventRecord."""
+    if type(event) is EventRecord:
+        return _record_strings(event)
+    return tuple([event.get(name) for name in STRING_COLUMNS])
+
+def extra_fields(event: Dict[str, Any]) -> Dict[str, Any]:
+    """An event's fields outside the layout (an EventRecord has none)."""
+    if type(event) is EventRecord:
+        return {}
+    return {name: value for name, value in event.items() if name not in KNOWN_FIELDS}
+
+def to_micros(value: datetime) -> int:
+    """Convert a datetime to int64 microseconds; aware datetimes are stored as local wall time."""
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=int(value))
+
+class StringDictionary:
+    """Interns strings to dense int32 codes; code 0 is reserved for None."""
+
+    def __init__(self):
+        self.values: List[Optional[str]] = [None]
+        self.codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: Optional[str]) -> Optional[int]:
+        """Code for a value without interning it (None if never seen)."""
+        if value is None:
+            return 0
+        return self.codes.get(value)
+
+    def decode(self, code: int) -> Optional[str]:
+        return self.values[code]
+
+    def nbytes(self) -> int:
+        return (
+            sys.getsizeof(self.values) + sys.getsizeof(self.codes)
+            + sum(sys.getsizeof(value) for value in self.values if value is not None)
+        )
+
+class Column:
+    """Fixed-width column stored in preallocated array chunks."""
+
+    __slots__ = ("typecode", "dtype", "chunks")
+
+    def __init__(self, typecode: str, dtype: str):
+        self.typecode = typecode
+        self.dtype = dtype
+        self.chunks: List[array] = []
+
+    def set(self, row: int, value: int) -> None:
+        chunk_index, offset = divmod(row, CHUNK_SIZE)
+        if chunk_index == len(self.chunks):
+            self.chunks.append(array(self.typecode, bytes(array(self.typecode).itemsize * CHUNK_SIZE)))
+        self.chunks[chunk_index][offset] = value
+
+    def get(self, row: int) -> int:
+        chunk_index, offset = divmod(row, CHUNK_SIZE)
+        return self.chunks[chunk_index][offset]
+
+    def numpy(self, length: int) -> np.ndarray:
+        """NumPy copy of the first `length` values."""
+        if not self.chunks:
+            return np.empty(0, dtype=self.dtype)
+        views = [np.frombuffer(chunk, dtype=self.dtype) for chunk in self.chunks]
+        return np.concatenate(views)[:length]
+
+    def nbytes(self) -> int:
+        return sum(chunk.buffer_info()[1] * chunk.itemsize for chunk in self.chunks)
+
+class TimeIndex:
+    """
+    Rows of one experiment ordered by (recorded_at, row).
+
+    Events normally arrive in time order and are appended; the occasional
+    late event (e.g. stamped earlier by the write-behind buffer) is inserted
+    in place. Range lookups are binary searches over the timestamps.
+    """
+
+    __slots__ = ("timestamps", "rows")
+
+    def __init__(self):
+        self.timestamps = array("q")
+        self.rows = array("q")
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, timestamp: int, row: int) -> None:
+        if not self.timestamps or timestamp >= self.timestamps[-1]:
+            self.timestamps.append(timestamp)
+            self.rows.append(row)
+            return
+        # Rows only grow, so inserting after equal timestamps keeps (timestamp, row) order
+        position = bisect_left(self.timestamps, timestamp + 1)
+        self.timestamps.insert(position, timestamp)
+        self.rows.insert(position, row)
+
+    def _position(self, timestamp: int, row: int) -> int:
+        """Index of the first entry >= (timestamp, row)."""
+        position = bisect_left(self.timestamps, timestamp)
+        while (
+            position < len(self.rows)
+            and self.timestamps[position] == timestamp
+            and self.rows[position] < row
+        ):
+            position += 1
+        return position
+
+    def iter_rows(
+        self,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        after: Optional[Tuple[int, int]] = None,
+        descending: bool = True
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        Yield (timestamp, row) pairs with since <= timestamp < until.
+
+        Args:
+            since: Inclusive lower bound in microseconds
+            until: Exclusive upper bound in microseconds
+            after: (timestamp, row) of the last entry already returned; iteration resumes past it
+            descending: Newest first when True
+        """
+        start = bisect_left(self.timestamps, since) if since is not None else 0
+        end = bisect_left(self.timestamps, until) if until is not None else len(self.rows)
+        timestamps, rows = self.timestamps, self.rows
+        if descending:
+            if after is not None:
+                end = min(end, self._position(*after))
+            for position in range(end - 1, start - 1, -1):
+                yield timestamps[position], rows[position]
+        else:
+            if after is not None:
+                start = max(start, self._position(after[0], after[1] + 1))
+            for position in range(start, end):
+                yield timestamps[position], rows[position]
+
+class ColumnarEventStore:
+    """
+    Append-only, memory-compact event log.
+
+    String fields are dictionary-encoded into int32 columns, recorded_at is
+    stored as int64 microseconds and UUID event ids as two uint64 halves.
+    Metadata (and any fields outside the fixed layout) is kept in a sparse
+    side table only for the events that have it. Indexing and iteration
+    materialise the same dicts MockDatabase used to keep in a list.
+    """
+
+    def __init__(self):
+        self.length = 0
+        self.dictionaries: Dict[str, StringDictionary] = {name: StringDictionary() for name in STRING_COLUMNS}
+        self.columns: Dict[str, Column] = {name: Column("i", "int32") for name in STRING_COLUMNS}
+        self.columns["recorded_at"] = Column("q", "int64")
+        self.columns["id_high"] = Column("Q", "uint64")
+        self.columns["id_low"] = Column("Q", "uint64")
+        # row -> metadata dict, only for events with non-empty metadata
+        self.metadata: Dict[int, Dict[str, Any]] = {}
+        # row -> fields that do not fit the layout (e.g. non-UUID ids)
+        self.extras: Dict[int, Dict[str, Any]] = {}
+        # experiment code -> time-ordered rows
+        self.experiment_index: Dict[int, TimeIndex] = {}
+
+    def __len__(self) -> int:
+        return self.length
+
+    def append(self, event: Dict[str, Any]) -> int:
+        """Append an event record (with "id" and "recorded_at") and return its row number."""
+        row = self.length
+        columns = self.columns
+        for name, value in zip(STRING_COLUMNS, string_values(event)):
+            columns[name].set(row, self.dictionaries[name].encode(value))
+
+        recorded_at = event.get("recorded_at")
+        timestamp = to_micros(recorded_at) if recorded_at is not None else 0
+        columns["recorded_at"].set(row, timestamp)
+
+        extra = extra_fields(event)
+        event_id = event.get("id")
+        id_int = 0
+        if event_id is not None:
+            try:
+                id_int = uuid.UUID(event_id).int
+            except (TypeError, ValueError):
+                extra["id"] = event_id
+        columns["id_high"].set(row, id_int >> 64)
+        columns["id_low"].set(row, id_int & 0xFFFFFFFFFFFFFFFF)
+
+        if event.get("metadata"):
+            self.metadata[row] = event["metadata"]
+        if extra:
+            self.extras[row] = extra
+
+        experiment_code = columns["experiment_id"].get(row)
+        index = self.experiment_index.get(experiment_code)
+        if index is None:
+            index = self.experiment_index[experiment_code] = TimeIndex()
+        index.add(timestamp, row)
+        self.length += 1
+        return row
+
+    def get(self, row: int, name: str) -> Any:
+        """Decode a single field of a row."""
+        if name in self.dictionaries:
+            return self.dictionaries[name].decode(self.columns[name].get(row))
+        if name == "recorded_at":
+            return from_micros(self.columns["recorded_at"].get(row))
+        if name == "metadata":
+            return self.metadata.get(row, {})
+        if name == "id":
+            extra = self.extras.get(row)
+            if extra and "id" in extra:
+                return extra["id"]
+            return str(uuid.UUID(int=(self.columns["id_high"].get(row) << 64) | self.columns["id_low"].get(row)))
+        return self.extras.get(row, {}).get(name)
+
+    def row(self, row: int) -> Dict[str, Any]:
+        """Materialise a row as an event dict."""
+        record = {"id": self.get(row, "id"), "recorded_at": self.get(row, "recorded_at")}
+        for name in STRING_COLUMNS:
+            record[name] = self.dictionaries[name].decode(self.columns[name].get(row))
+        record["metadata"] = self.metadata.get(row, {})
+        extra = self.extras.get(row)
+        if extra:
+            record.update((k, v) for k, v in extra.items() if k != "id")
+        return record
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        if row < 0:
+            row += self.length
+        if not 0 <= row < self.length:
+            raise IndexError("event index out of range")
+        return self.row(row)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in range(self.length):
+            yield self.row(row)
+
+    def iter_experiment(
+        self,
+        experiment_id: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        after: Optional[Tuple[int, int]] = None,
+        descending: bool = True
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        Yield (recorded_at micros, row) for an experiment's events in time order.
+
+        Costs O(log N) to position plus O(1) per event yielded.
+        """
+        code = self.lookup("experiment_id", experiment_id)
+        index = self.experiment_index.get(code) if code else None
+        if index is None:
+            return iter(())
+        return index.iter_rows(
+            to_micros(since) if since is not None else None,
+            to_micros(until) if until is not None else None,
+            after,
+            descending
+        )
+
+    def codes(self, name: str) -> np.ndarray:
+        """NumPy array of a column's raw values (dictionary codes, int64 micros, ...)."""
+        return self.columns[name].numpy(self.length)
+
+    def lookup(self, name: str, value: Optional[str]) -> Optional[int]:
+        """Dictionary code of a string value, or None if it never occurred."""
+        return self.dictionaries[name].lookup(value)
+
+    def decode(self, name: str, code: int) -> Optional[str]:
+        return self.dictionaries[name].decode(code)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the store, in bytes."""
+        total = sum(column.nbytes() for column in self.columns.values())
+        total += sum(dictionary.nbytes() for dictionary in self.dictionaries.values())
+        total += sum(index.rows.itemsize * len(index) * 2 for index in self.experiment_index.values())
+        for side_table in (self.metadata, self.extras):
+            total += sys.getsizeof(side_table)
+            total += sum(sys.getsizeof(value) for value in side_table.values())
+        return total
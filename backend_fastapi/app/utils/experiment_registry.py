@@ -0,0 +1,354 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from enum import Enum
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.models.schemas import ExperimentConfig
+from app.utils.cache import invalidate_experiment
+from app.utils.database import db
+from app.utils.hash import (
+    check_layers,
+    compile_allocation,
+    get_layer_hasher,
+    layer_bucket_range,
+    validate_experiment_config
+)
+from app.utils.rollups import epoch_seconds
+from app.utils.targeting import TargetingIndex, compile_targeting
+
+logger = logging.getLogger(__name__)
+
+def assignment_fingerprint(config: Dict[str, Any]) -> Tuple[Any, ...]:
+    """The parts of a config that, when changed, make cached assignments stale."""
+    if config.get("allocation_mode") == "bandit":
+        # Bandit weights move on every update but existing assignments stay sticky,
+        # so only a change to the set of variants invalidates them
+        variants = tuple(config["variants"])
+    else:
+        variants = tuple(config["variants"].items())
+    layer_range = tuple(config["layer_range"]) if config.get("layer_range") else None
+    return (config["status"], variants, config.get("layer"), layer_range)
+
+class CompiledExperiment:
+    """
+    One experiment config with what assignment needs worked out up front.
+
+    The variant split is validated and compiled into its allocation table,
+    targeting rules into CompiledTargeting, the layer hasher and bucket
+    range are resolved and the date window is kept as epoch seconds. Never
+    modified after construction: a changed config compiles a new instance. `config` is the plain dict the routes
+    and the database use, and must be treated as read-only.
+    """
+    __slots__ = (
+        "experiment_id", "config", "allocation", "status", "starts_at", "ends_at",
+        "layer", "layer_hasher", "layer_buckets", "targeting", "fingerprint"
+    )
+
+    def __init__(self, config: Dict[str, Any]):
+        experiment_id = config["experiment_id"]
+        if not validate_experiment_config(config["variants"]):
+            raise ValueError(f"Experiment {experiment_id} has variant allocations that do not sum to 100")
+        self.experiment_id = experiment_id
+        self.config = config
+        self.allocation = compile_allocation(experiment_id, config["variants"])
+        self.status = config["status"]
+        self.starts_at = epoch_seconds(config["start_date"]) if config.get("start_date") else None
+        self.ends_at = epoch_seconds(config["end_date"]) if config.get("end_date") else None
+        self.layer: Optional[str] = config.get("layer")
+        if self.layer:
+            if not config.get("layer_range"):
+                raise ValueError(f"Experiment {experiment_id} is in layer {self.layer} without a layer_range")
+            self.layer_hasher = get_layer_hasher(self.layer)
+            self.layer_buckets = layer_bucket_range(config["layer_range"])
+        else:
+            self.layer_hasher = None
+            self.layer_buckets = None
+        self.targeting = compile_targeting(experiment_id, config.get("targeting"))
+        self.fingerprint = assignment_fingerprint(config)
+
+    def is_active(self, now: Optional[float] = None) -> bool:
+        """Whether the experiment is active and `now` (epoch seconds, default the current time) is in its date window."""
+        if self.status != "active":
+            return False
+        if self.starts_at is None and self.ends_at is None:
+            return True
+        now = time.time() if now is None else now
+        return (self.starts_at is None or self.starts_at <= now) and (self.ends_at is None or now < self.ends_at)
+
+    def admits(
+        self,
+        user_id: str,
+        device_type: Optional[str] = None,
+        geo_location: Optional[str] = None,
+        attributes: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """Whether the experiment's targeting rules (if any) admit the user."""
+        return self.targeting is None or self.targeting.matches(user_id, device_type, geo_location, attributes)
+
+    def variant_in_layer(self, buckets: Tuple[int, int]) -> Optional[str]:
+        """Variant for a user with the given layer buckets, or None if their slot belongs to another experiment."""
+        layer_bucket, variant_bucket = buckets
+        start, end = self.layer_buckets
+        if not start <= layer_bucket < end:
+            return None
+        return self.allocation.variant_for_bucket(variant_bucket)
+
+    def assign(self, user_id: str) -> Optional[str]:
+        """Same result as hash.get_experiment_assignment, without recompiling or re-checking the config."""
+        if self.layer_hasher is not None:
+            return self.variant_in_layer(self.layer_hasher.buckets(user_id))
+        return self.allocation.assign(user_id)
+
+class RegistrySnapshot:
+    """
+    Every experiment at one registry version; never modified once published.
+
+    `targeting` indexes the active experiments' targeting rules, for finding
+    all the experiments one user is targeted by.
+    """
+    __slots__ = ("version", "loaded_at", "experiments", "targeting")
+
+    def __init__(self, version: int, experiments: Dict[str, CompiledExperiment]):
+        active = [experiment for experiment in experiments.values() if experiment.status == "active"]
+        # Overlapping ranges only matter between experiments that can be live together
+        check_layers(experiment.config for experiment in active)
+        self.version = version
+        self.loaded_at = time.time()
+        self.experiments = MappingProxyType(experiments)
+        self.targeting = TargetingIndex(active)
+
+    def get(self, experiment_id: str) -> Optional[CompiledExperiment]:
+        return self.experiments.get(experiment_id)
+
+class DatabaseExperimentSource:
+    """Experiment configs read from the database (the experiments table, or MockDatabase.experiments)."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def describe(self) -> str:
+        return "database"
+
+    async def load(self) -> Optional[List[Dict[str, Any]]]:
+        """Read every experiment config in one query."""
+        return await self.db.get_experiments()
+
+    async def save_variants(self, experiment_id: str, variants: Dict[str, float]) -> None:
+        await self.db.update_experiment_variants(experiment_id, variants)
+
+class FileExperimentSource:
+    """
+    Experiment configs read from a JSON file.
+
+    The file holds a list of ExperimentConfig objects, or an object with an
+    "experiments" list, and is re-read when its modification time or size
+    changes. Bandit weights are written back to the file, so every process
+    watching it picks them up.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._stamp: Optional[Tuple[int, int, int]] = None
+
+    def describe(self) -> str:
+        return f"file:{self.path}"
+
+    async def load(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Parse the file if it changed since the last call.
+
+        Returns:
+            Configs, or None if the file is unchanged
+
+        Raises:
+            ValueError: If the file is not valid JSON or a config fails validation
+        """
+        stat = os.stat(self.path)
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return None
+        # Record the stamp first so a broken file is reported once, not on every poll
+        self._stamp = stamp
+        with open(self.path, encoding="utf-8") as f:
+            document = json.load(f)
+        items = document.get("experiments", []) if isinstance(document, dict) else document
+        configs = []
+        for item in items:
+            model = ExperimentConfig.model_validate(item)
+            config = {key: value.value if isinstance(value, Enum) else value for key, value in model.model_dump().items()}
+            if model.targeting is not None:
+                config["targeting"] = model.targeting.model_dump(mode="json", exclude_none=True)
+            configs.append(config)
+        return configs
+
+    async def save_variants(self, experiment_id: str, variants: Dict[str, float]) -> None:
+        """Rewrite the experiment's variants in the file, replacing it in one rename."""
+        with open(self.path, encoding="utf-8") as f:
+            document = json.load(f)
+        items = document.get("experiments", []) if isinstance(document, dict) else document
+        for item in items:
+            if item.get("experiment_id") == experiment_id:
+                item["variants"] = dict(variants)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+        os.replace(temporary, self.path)
+
+class ExperimentRegistry:
+    """
+    Versioned experiment configs, replaced as a whole on every change.
+
+    Readers use get() or hold `snapshot` for the length of a request: either
+    is one attribute read of an immutable RegistrySnapshot, so the assignment
+    path never locks or awaits, and a request reading several experiments
+    sees them all at the same version. reload() fetches the configs from the
+    source, builds the next snapshot to one side (reusing experiments whose
+    config is unchanged) and publishes it with a single reference
+    assignment. If any config is invalid, or two active experiments overlap
+    in a layer, the reload fails and the current snapshot stays. A
+    background task reloads every `interval` seconds, so edits to the file
+    or the experiments table apply without a restart.
+    """
+
+    def __init__(self, source, interval: float = 5.0):
+        self.source = source
+        self.interval = interval
+        self.snapshot: Optional[RegistrySnapshot] = None
+        # Serialises writers; readers never take it
+        self._write_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+
+        # Metrics
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_reload_latency = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def get(self, experiment_id: str) -> Optional[CompiledExperiment]:
+        """Look up an experiment in the current snapshot."""
+        return self.snapshot.get(experiment_id)
+
+    def install(self, configs: Iterable[Dict[str, Any]]) -> RegistrySnapshot:
+        """
+        Compile configs into a new snapshot and publish it.
+
+        Returns:
+            The published snapshot, or the current one when nothing changed
+
+        Raises:
+            ValueError: If a config is invalid; the current snapshot stays
+        """
+        with self._write_lock:
+            previous = self.snapshot
+            experiments: Dict[str, CompiledExperiment] = {}
+            for config in configs:
+                current = previous.get(config["experiment_id"]) if previous is not None else None
+                if current is None or current.config != config:
+                    # Copied so later changes to the source's dicts cannot reach a published snapshot
+                    current = CompiledExperiment(copy.deepcopy(config))
+                experiments[config["experiment_id"]] = current
+            if previous is not None and list(experiments.items()) == list(previous.experiments.items()):
+                return previous
+
+            snapshot = RegistrySnapshot(previous.version + 1 if previous is not None else 1, experiments)
+            self.snapshot = snapshot
+            if previous is not None:
+                for experiment_id, experiment in previous.experiments.items():
+                    current = experiments.get(experiment_id)
+                    if current is None or current.fingerprint != experiment.fingerprint:
+                        invalidate_experiment(experiment_id)
+            return snapshot
+
+    async def reload(self) -> RegistrySnapshot:
+        """Load the source and publish its configs if they changed."""
+        start = time.perf_counter()
+        try:
+            configs = await self.source.load()
+            if configs is not None:
+                self.install(configs)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            raise
+        self.reloads += 1
+        self.last_reload_latency = time.perf_counter() - start
+        return self.snapshot
+
+    async def set_variants(self, experiment_id: str, variants: Dict[str, float]) -> RegistrySnapshot:
+        """
+        Replace a bandit experiment's split.
+
+        The split is saved to the source, which stays the only record of it:
+        this process reloads at once and every other process picks it up on
+        its next poll.
+        """
+        await self.source.save_variants(experiment_id, variants)
+        return await self.reload()
+
+    async def start(self) -> None:
+        """Start reloading every `interval` seconds (no-op when the interval is 0)."""
+        if self._task is not None or self.interval <= 0:
+            return
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stop.is_set():
+                break
+            try:
+                await self.reload()
+            except Exception:
+                logger.exception("Experiment registry reload from %s failed", self.source.describe())
+
+    def metrics(self) -> Dict[str, Any]:
+        snapshot = self.snapshot
+        return {
+            "source": self.source.describe(),
+            "version": snapshot.version if snapshot is not None else 0,
+            "experiments": len(snapshot.experiments) if snapshot is not None else 0,
+            "loaded_at": snapshot.loaded_at if snapshot is not None else None,
+            "running": self.running,
+            "reload_interval_seconds": self.interval,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_reload_latency_ms": self.last_reload_latency * 1000,
+        }
+
+def create_experiment_registry(db) -> ExperimentRegistry:
+    """Create the registry over EXPERIMENTS_FILE if set, else over the database."""
+    path = os.getenv("EXPERIMENTS_FILE")
+    source = FileExperimentSource(path) if path else DatabaseExperimentSource(db)
+    return ExperimentRegistry(source, interval=float(os.getenv("EXPERIMENT_RELOAD_INTERVAL", 5)))
+
+# Global experiment registry
+experiment_registry = create_experiment_registry(db)
+
+async def get_experiment_registry() -> ExperimentRegistry:
+    """Dependency to get the experiment registry, loading it on first use."""
+    if experiment_registry.snapshot is None:
+        await experiment_registry.reload()
+    return experiment_registry
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+import time
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict
+
+from app.utils.metrics import serialization_duration
+
+# Column order for CSV exports
+EXPORT_COLUMNS = [
+    "id", "recorded_at", "user_id", "experiment_id", "variant", "event_type",
+    "campaign_id", "ad_id", "device_type", "geo_location", "metadata"
+]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+async def serialize_events(
+    events: AsyncIterator[Dict[str, Any]],
+    export_format: str = "ndjson",
+    compress: bool = False,
+    chunk_events: int = 1000
+) -> AsyncIterator[bytes]:
+    """
+    Serialize a stream of events as NDJSON or CSV, optionally gzip-compressed.
+
+    Output is emitted every chunk_events events, so memory use depends on the
+    chunk size rather than on how many events are exported.
+
+    Args:
+        events: Async iterator of event dicts
+        export_format: "ndjson" or "csv"
+        compress: Gzip the output stream
+        chunk_events: Events serialized per emitted chunk
+    """
+    if export_format not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip container
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == "csv" else None
+
+    def emit() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    if writer is not None:
+        writer.writerow(EXPORT_COLUMNS)
+
+    pending = 0
+    # Serialization time per emitted chunk, excluding time spent waiting on the event source
+    elapsed = 0.0
+    async for event in events:
+        started = time.perf_counter()
+        if writer is not None:
+            row = [event.get(column) for column in EXPORT_COLUMNS]
+            row[1] = event["recorded_at"].isoformat()
+            row[-1] = json.dumps(event.get("metadata") or {})
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(event, default=_json_default))
+            buffer.write("\n")
+        pending += 1
+        if pending >= chunk_events:
+            pending = 0
+            chunk = emit()
+            serialization_duration.observe(elapsed + time.perf_counter() - started, export_format)
+            elapsed = 0.0
+            if chunk:
+                yield chunk
+        else:
+            elapsed += time.perf_counter() - started
+
+    started = time.perf_counter()
+    tail = emit()
+    if pending:
+        serialization_duration.observe(elapsed + time.perf_counter() - started, export_format)
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,50 @@
+import os
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, Response
+
+# Answer the assignment and event routes with pre-built dicts encoded by orjson
+# (or MessagePack), instead of validating a response model and serializing it again
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+class MsgPackResponse(Response):
+    """Compact binary response for SDKs that send `Accept: application/msgpack`."""
+
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        # Imported lazily so msgpack is only needed when a client asks for it
+        import msgpack
+        return msgpack.packb(content, default=_msgpack_default)
+
+async def negotiate_format(request: Request) -> Optional[str]:
+    """
+    Dependency choosing the fast-path response format.
+
+    Returns None when the fast path is disabled (the route builds its response
+    model as usual), "msgpack" for clients accepting application/msgpack and
+    "json" otherwise.
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    if MSGPACK_MEDIA_TYPE in request.headers.get("accept", ""):
+        return "msgpack"
+    return "json"
+
+def fast_response(content: Dict[str, Any], response_format: str) -> Response:
+    """Encode a response dict without going through response_model validation."""
+    if response_format == "msgpack":
+        return MsgPackResponse(content)
+    return ORJSONResponse(content)
@@ -1,7 +1,111 @@
 import hashlib
 import hmac
+import math
 import os
-from typing import Dict
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Number of hash buckets; a bucket maps to a percentage as bucket / 100
+BUCKET_COUNT = 10000
+
+def _last_bucket_within(cumulative: float) -> int:
+    """Return the highest bucket whose percentage (bucket / 100) is <= cumulative."""
+    if math.isnan(cumulative) or cumulative == -math.inf:
+        return -1
+    if cumulative == math.inf:
+        return BUCKET_COUNT
+    bucket = math.floor(cumulative * 100)
+    # Correct for float rounding so the comparison matches the percentage walk exactly
+    while (bucket + 1) / 100.0 <= cumulative:
+        bucket += 1
+    while bucket / 100.0 > cumulative:
+        bucket -= 1
+    return bucket
+
+class VariantAllocation:
+    """
+    Allocation table for one experiment configuration.
+    
+    Holds integer bucket boundaries over the 10000-bucket space and an HMAC
+    object pre-keyed with the salt, so assigning a user costs one HMAC copy,
+    one digest and one binary search.
+    """
+    __slots__ = ("experiment_id", "variants", "variant_names", "boundaries", "key", "message_suffix", "_hmac")
+    
+    def __init__(self, experiment_id: str, variants: Dict[str, float], salt: str, seed: str):
+        self.experiment_id = experiment_id
+        self.variants: Dict[str, float] = dict(variants)
+        self.variant_names: List[str] = list(variants.keys())
+        
+        # boundaries[i] is the last bucket assigned to variant i or earlier; the running
+        # max keeps the list sorted so bisect finds the first variant covering a bucket
+        self.boundaries: List[int] = []
+        cumulative = 0.0
+        highest = -1
+        for allocation in variants.values():
+            cumulative += allocation
+            highest = max(highest, _last_bucket_within(cumulative))
+            self.boundaries.append(highest)
+        
+        # The hashed message is f"{user_id}:{experiment_id}:{seed}"; everything after the user id is fixed
+        self.key = salt.encode('utf-8')
+        self.message_suffix = f":{experiment_id}:{seed}".encode('utf-8')
+        self._hmac = hmac.new(self.key, digestmod=hashlib.sha256)
+    
+    def bucket(self, user_id: str) -> int:
+        """Hash a user into one of the 10000 buckets."""
+        mac = self._hmac.copy()
+        mac.update(user_id.encode('utf-8'))
+        mac.update(self.message_suffix)
+        # First 8 hex chars of the digest == first 4 bytes
+        return int.from_bytes(mac.digest()[:4], 'big') % BUCKET_COUNT
+    
+    @property
+    def fallback_variant(self) -> str:
+        """Variant used for buckets past the last boundary (allocations short of 100)."""
+        return self.variant_names[-1] if self.variant_names else "control"
+    
+    def variant_for_bucket(self, bucket: int) -> str:
+        """Map a bucket to its variant name."""
+        index = bisect_left(self.boundaries, bucket)
+        if index < len(self.variant_names):
+            return self.variant_names[index]
+        # Fallback to last variant if percentages don't add up to 100
+        return self.fallback_variant
+    
+    def matches(self, variants: Dict[str, float]) -> bool:
+        """Check whether this table was compiled from the given allocation (including order)."""
+        return self.variants == variants and self.variant_names == list(variants)
+    
+    def assign(self, user_id: str) -> str:
+        """Deterministically assign a user to a variant."""
+        return self.variant_for_bucket(self.bucket(user_id))
+
+def compile_allocation(experiment_id: str, variants: Dict[str, float]) -> VariantAllocation:
+    """
+    Build an allocation table for an experiment using the configured HMAC salt and seed.
+    
+    Args:
+        experiment_id: Experiment identifier
+        variants: Dictionary of variant names to allocation percentages (0-100)
+    
+    Returns:
+        Compiled VariantAllocation
+    """
+    salt = os.getenv("HMAC_SALT", "default-salt")
+    seed = os.getenv("HASH_SEED", "default-seed")
+    return VariantAllocation(experiment_id, variants, salt, seed)
+
+# Compiled allocations by experiment id, recompiled when the variant config changes
+_allocations: Dict[str, VariantAllocation] = {}
+
+def get_allocation(experiment_id: str, variants: Dict[str, float]) -> VariantAllocation:
+    """Return the compiled allocation for an experiment config, compiling it on first use."""
+    allocation = _allocations.get(experiment_id)
+    if allocation is None or not allocation.matches(variants):
+        allocation = compile_allocation(experiment_id, variants)
+        _allocations[experiment_id] = allocation
+    return allocation
 
 def get_variant_assignment(user_id: str, experiment_id: str, variants: Dict[str, float]) -> str:
     """
@@ -15,47 +119,106 @@ def get_variant_assignment(user_id: str, experiment_id: str, variants: Dict[str,
     Returns:
         Assigned variant name
     """
-    # Get salt and seed from environment
-    salt = os.getenv("HMAC_SALT", "default-salt")
-    seed = os.getenv("HASH_SEED", "default-seed")
+    return get_allocation(experiment_id, variants).assign(user_id)
+
+class LayerHasher:
+    """
+    Hashes users for one layer: experiments in a layer are mutually exclusive.
     
-    # Create hash input
-    hash_input = f"{user_id}:{experiment_id}:{seed}"
+    One HMAC of f"{user_id}:layer:{layer}:{seed}" gives two buckets: the
+    first 4 digest bytes pick the user's slot in the layer, and so at most one
+    experiment (each owns a bucket range), and the next 4 bytes pick the
+    variant within that experiment. A user is hashed once per layer however
+    many experiments it holds.
+    """
+    __slots__ = ("layer", "key", "message_suffix", "_hmac")
     
-    # Generate HMAC hash
-    hash_value = hmac.new(
-        salt.encode('utf-8'),
-        hash_input.encode('utf-8'),
-        hashlib.sha256
-    ).hexdigest()
+    def __init__(self, layer: str, salt: str, seed: str):
+        self.layer = layer
+        self.key = salt.encode('utf-8')
+        self.message_suffix = f":layer:{layer}:{seed}".encode('utf-8')
+        self._hmac = hmac.new(self.key, digestmod=hashlib.sha256)
     
-    # Convert hash to integer (use first 8 hex chars for consistency)
-    hash_int = int(hash_value[:8], 16)
+    def buckets(self, user_id: str) -> Tuple[int, int]:
+        """Hash a user into (layer bucket, variant bucket)."""
+        mac = self._hmac.copy()
+        mac.update(user_id.encode('utf-8'))
+        mac.update(self.message_suffix)
+        digest = mac.digest()
+        return int.from_bytes(digest[:4], 'big') % BUCKET_COUNT, int.from_bytes(digest[4:8], 'big') % BUCKET_COUNT
+
+# Layer hashers by layer name
+_layer_hashers: Dict[str, LayerHasher] = {}
+
+def get_layer_hasher(layer: str) -> LayerHasher:
+    """Return the hasher for a layer, creating it with the configured salt and seed on first use."""
+    hasher = _layer_hashers.get(layer)
+    if hasher is None:
+        hasher = LayerHasher(layer, os.getenv("HMAC_SALT", "default-salt"), os.getenv("HASH_SEED", "default-seed"))
+        _layer_hashers[layer] = hasher
+    return hasher
+
+def layer_bucket_range(layer_range: Sequence[float]) -> Tuple[int, int]:
+    """Convert a [start, end) percentage range of a layer's traffic into buckets."""
+    start, end = layer_range
+    return round(start * 100), round(end * 100)
+
+def assign_in_layer(buckets: Tuple[int, int], experiment: Dict[str, Any]) -> Optional[str]:
+    """
+    Variant for a user in a layered experiment, given the user's layer buckets.
     
-    # Convert to percentage (0-100)
-    percentage = (hash_int % 10000) / 100.0
+    Returns:
+        Variant name, or None if the user's layer slot is outside the experiment's range
+    """
+    start, end = layer_bucket_range(experiment["layer_range"])
+    layer_bucket, variant_bucket = buckets
+    if not start <= layer_bucket < end:
+        return None
+    return get_allocation(experiment["experiment_id"], experiment["variants"]).variant_for_bucket(variant_bucket)
+
+def get_experiment_assignment(user_id: str, experiment: Dict[str, Any]) -> Optional[str]:
+    """
+    Assign a user to a variant of an experiment config, honouring its layer.
     
-    # Assign variant based on cumulative percentages
-    cumulative = 0.0
-    variant_names = list(variants.keys())
+    Returns:
+        Variant name, or None if the experiment is in a layer and the user's
+        slot belongs to another experiment
+    """
+    if experiment.get("layer"):
+        return assign_in_layer(get_layer_hasher(experiment["layer"]).buckets(user_id), experiment)
+    return get_variant_assignment(user_id, experiment["experiment_id"], experiment["variants"])
+
+def check_layers(experiments: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Group layered experiments by layer, checking that their ranges do not overlap.
     
-    for variant, allocation in variants.items():
-        cumulative += allocation
-        if percentage <= cumulative:
-            return variant
+    Returns:
+        Layer name to its experiments, ordered by range start
     
-    # Fallback to last variant if percentages don't add up to 100
-    return variant_names[-1] if variant_names else "control"
+    Raises:
+        ValueError: If a layer range is invalid or two experiments in a layer overlap
+    """
+    layers: Dict[str, List[Dict[str, Any]]] = {}
+    for experiment in experiments:
+        if experiment.get("layer"):
+            layers.setdefault(experiment["layer"], []).append(experiment)
+    for layer, members in layers.items():
+        members.sort(key=lambda experiment: layer_bucket_range(experiment["layer_range"]))
+        previous_end = 0
+        previous_id = None
+        for experiment in members:
+            start, end = layer_bucket_range(experiment["layer_range"])
+            if not 0 <= start < end <= BUCKET_COUNT:
+                raise ValueError(f"Experiment {experiment['experiment_id']} has an invalid layer_range")
+            if start < previous_end:
+                raise ValueError(f"Experiments {previous_id} and {experiment['experiment_id']} overlap in layer {layer}")
+            previous_end, previous_id = end, experiment["experiment_id"]
+    return layers
 
 def is_control_variant(variant: str) -> bool:
     """Check if a variant is the control group."""
     return variant.lower() in ["control", "original", "baseline"]
 
-def generate_event_id() -> str:
-    """Generate a unique event ID."""
-    import uuid
-    return str(uuid.uuid4())
-
 def validate_experiment_config(variants: Dict[str, float]) -> bool:
     """
     Validate that variant allocations are valid.
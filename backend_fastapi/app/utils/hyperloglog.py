@@ -0,0 +1,296 @@
+import hashlib
+import math
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 2**14 registers: 16 KiB per sketch, about 0.8% standard error
+DEFAULT_PRECISION = 14
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+# Serialized sketches start with a format byte and the precision. Dense is one
+# byte per register; sparse lists the non-zero registers as uint32 (index << 8 | rank),
+# which is smaller while fewer than a quarter of the registers are set
+DENSE = 0
+SPARSE = 1
+
+def user_hash(value: str) -> int:
+    """64-bit hash of a user id, the same in every process (unlike hash())."""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+def user_hashes(values: Iterable[str]) -> np.ndarray:
+    return np.fromiter((user_hash(value) for value in values), dtype=np.uint64)
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """int.bit_length() of uint64 values, from the exact float64 exponents of their 32-bit halves."""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
+
+def _sigma(x: float) -> float:
+    if x == 1.0:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+def _tau(x: float) -> float:
+    if x == 0.0 or x == 1.0:
+        return 0.0
+    y, z = 1.0, 1.0 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1.0 - x) ** 2 * y
+        if z == previous:
+            return z / 3.0
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch of a set of strings, for approximate distinct counts.
+
+    A value's 64-bit hash picks a register by its top `precision` bits; the
+    register keeps the largest rank (leading zeros + 1) seen in the
+    remaining bits. Sketches of the same precision merge by register-wise
+    max, so sketches kept by different processes (or for different variants)
+    combine into the sketch of the union, and adding a value twice changes
+    nothing. count() uses Ertl's improved estimator ("New cardinality
+    estimation algorithms for HyperLogLog sketches", 2017), which needs no
+    bias tables and holds its standard error of about 1.04 / sqrt(2**precision)
+    from tiny to very large sets.
+    """
+    __slots__ = ("precision", "registers", "_view")
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[bytearray] = None):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}")
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+        if len(self.registers) != 1 << precision:
+            raise ValueError("register count does not match the precision")
+        self._view = np.frombuffer(self.registers, dtype=np.uint8)
+
+    @property
+    def standard_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.registers)
+
+    def add(self, value: str) -> None:
+        self.add_hash(user_hash(value))
+
+    def add_hash(self, hashed: int) -> None:
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        """add_hash() for an array of uint64 hashes."""
+        if not len(hashes):
+            return
+        bits = 64 - self.precision
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        indexes = (hashes >> np.uint64(bits)).astype(np.intp)
+        ranks = (bits + 1 - _bit_length(hashes & np.uint64((1 << bits) - 1))).astype(np.uint8)
+        np.maximum.at(self._view, indexes, ranks)
+
+    def add_many(self, values: Iterable[str]) -> None:
+        self.add_hashes(user_hashes(values))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Fold another sketch into this one (register-wise max) and return this one."""
+        if other.precision != self.precision:
+            raise ValueError(f"cannot merge sketches of precision {self.precision} and {other.precision}")
+        np.maximum(self._view, other._view, out=self._view)
+        return self
+
+    def copy(self) -> "HyperLogLog":
+        return HyperLogLog(self.precision, bytearray(self.registers))
+
+    @classmethod
+    def union(cls, sketches: Iterable["HyperLogLog"], precision: int = DEFAULT_PRECISION) -> "HyperLogLog":
+        """A new sketch of the union of the sketches' sets."""
+        result = None
+        for sketch in sketches:
+            result = sketch.copy() if result is None else result.merge(sketch)
+        return result if result is not None else cls(precision)
+
+    def count(self) -> int:
+        """Estimated number of distinct values added."""
+        m = len(self.registers)
+        q = 64 - self.precision
+        histogram = np.bincount(self._view, minlength=q + 2).tolist()
+        z = m * _tau(1.0 - histogram[q + 1] / m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + histogram[k])
+        z += m * _sigma(histogram[0] / m)
+        return round(m * m / (2 * math.log(2) * z))
+
+    def to_bytes(self) -> bytes:
+        """Serialize the sketch, sparse while that is smaller."""
+        indexes = np.flatnonzero(self._view)
+        if len(indexes) * 4 < len(self.registers):
+            entries = (indexes.astype(np.uint32) << np.uint32(8)) | self._view[indexes].astype(np.uint32)
+            return bytes((SPARSE, self.precision)) + entries.astype("<u4").tobytes()
+        return bytes((DENSE, self.precision)) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        """
+        Load a sketch serialized by to_bytes().
+
+        Raises:
+            ValueError: If the data is not a serialized sketch
+        """
+        if len(data) < 2 or data[0] not in (DENSE, SPARSE):
+            raise ValueError("not a serialized HyperLogLog sketch")
+        sketch = cls(data[1])
+        if data[0] == DENSE:
+            if len(data) - 2 != len(sketch.registers):
+                raise ValueError("dense sketch has the wrong number of registers")
+            sketch.registers[:] = data[2:]
+            return sketch
+        if (len(data) - 2) % 4:
+            raise ValueError("sparse sketch is truncated")
+        entries = np.frombuffer(data, dtype="<u4", offset=2)
+        indexes = entries >> np.uint32(8)
+        if len(indexes) and int(indexes.max()) >= len(sketch.registers):
+            raise ValueError("sparse sketch register out of range")
+        sketch._view[indexes] = (entries & np.uint32(0xFF)).astype(np.uint8)
+        return sketch
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, HyperLogLog) and self.precision == other.precision and self.registers == other.registers
+
+def merge_serialized(first: Optional[bytes], second: Optional[bytes]) -> Optional[bytes]:
+    """Merge two serialized sketches into a serialized sketch (SQLite's hll_merge function)."""
+    if first is None or second is None:
+        return first if second is None else second
+    return HyperLogLog.from_bytes(first).merge(HyperLogLog.from_bytes(second)).to_bytes()
+
+# (variant, event_type) -> sketch of the users with such events
+VariantSketches = Dict[Tuple[str, str], HyperLogLog]
+
+def unique_user_stats(sketches: VariantSketches) -> Dict[str, Dict[str, Any]]:
+    """
+    Distinct-user counts for the stats payload from an experiment's sketches.
+
+    Returns:
+        unique_users_by_variant (variant -> event_type -> users),
+        active_users_by_variant (variant -> users with any event, from the
+        merged sketches) and conversion_rate_by_variant (distinct converting
+        users over active users, in percent)
+    """
+    by_variant: Dict[str, Dict[str, HyperLogLog]] = {}
+    for (variant, event_type), sketch in sketches.items():
+        by_variant.setdefault(variant, {})[event_type] = sketch
+    unique_users = {
+        variant: {event_type: sketch.count() for event_type, sketch in by_type.items()}
+        for variant, by_type in by_variant.items()
+    }
+    active_users = {
+        variant: HyperLogLog.union(by_type.values()).count()
+        for variant, by_type in by_variant.items()
+    }
+    # Both counts are estimates, so converting users are capped at the active users
+    conversion_rates = {
+        variant: min(unique_users[variant].get("conversion", 0), active) / active * 100 if active else 0
+        for variant, active in active_users.items()
+    }
+    return {
+        "unique_users_by_variant": unique_users,
+        "active_users_by_variant": active_users,
+        "conversion_rate_by_variant": conversion_rates
+    }
+
+class UserSketches:
+    """
+    HyperLogLog sketches of the users behind each (experiment, variant, event_type).
+
+    Used by MockDatabase, updated on every insert; the SQL backends keep the
+    same sketches serialized in a table and use this class to build a batch's
+    sketches before merging them in.
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION):
+        self.precision = precision
+        # experiment_id -> (variant, event_type) -> sketch
+        self.sketches: Dict[str, VariantSketches] = {}
+
+    def _sketch(self, experiment_id: str, variant: str, event_type: str) -> HyperLogLog:
+        by_key = self.sketches.setdefault(experiment_id, {})
+        sketch = by_key.get((variant, event_type))
+        if sketch is None:
+            sketch = by_key[(variant, event_type)] = HyperLogLog(self.precision)
+        return sketch
+
+    def add_user(self, experiment_id: str, variant: str, event_type: str, user_id: str) -> None:
+        self._sketch(experiment_id, variant, event_type).add(user_id)
+
+    def add(self, event: Dict[str, Any]) -> None:
+        """Count an event record's user."""
+        self.add_user(event["experiment_id"], event["variant"], event["event_type"], event["user_id"])
+
+    def experiment(self, experiment_id: str) -> VariantSketches:
+        return self.sketches.get(experiment_id, {})
+
+    def items(self) -> Iterable[Tuple[Tuple[str, str, str], HyperLogLog]]:
+        """((experiment_id, variant, event_type), sketch) pairs."""
+        for experiment_id, by_key in self.sketches.items():
+            for (variant, event_type), sketch in by_key.items():
+                yield (experiment_id, variant, event_type), sketch
+
+    def nbytes(self) -> int:
+        return sum(sketch.nbytes for _, sketch in self.items())
+
+    @classmethod
+    def rebuild(cls, events, precision: int = DEFAULT_PRECISION) -> "UserSketches":
+        """
+        Build the sketches from an event store's columns (ColumnarEventStore or SegmentEventLog).
+
+        Each distinct user id is hashed once; the rows of each
+        (experiment, variant, event_type) then go into their sketch as one array.
+        """
+        store = cls(precision)
+        if not len(events):
+            return store
+        user_codes = events.codes("user_id")
+        distinct = np.unique(user_codes)
+        hashes = np.zeros(int(distinct[-1]) + 1, dtype=np.uint64)
+        hashes[distinct] = user_hashes(events.decode("user_id", int(code)) for code in distinct)
+        keys = np.stack([events.codes("experiment_id"), events.codes("variant"), events.codes("event_type")], axis=1)
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind="stable")
+        boundaries = np.flatnonzero(np.diff(inverse[order])) + 1
+        for (experiment_code, variant_code, type_code), rows in zip(groups.tolist(), np.split(order, boundaries)):
+            sketch = store._sketch(
+                events.decode("experiment_id", experiment_code),
+                events.decode("variant", variant_code),
+                events.decode("event_type", type_code)
+            )
+            sketch.add_hashes(hashes[user_codes[rows]])
+        return store
+
+def sketch_rows(batch: Sequence[Tuple[str, str, str, str]], precision: int = DEFAULT_PRECISION) -> list:
+    """
+    Serialized sketches of a batch of (experiment_id, variant, event_type, user_id), for the SQL backends.
+
+    Returns:
+        (experiment_id, variant, event_type, sketch bytes) rows in key order
+    """
+    store = UserSketches(precision)
+    for experiment_id, variant, event_type, user_id in batch:
+        store.add_user(experiment_id, variant, event_type, user_id)
+    return [(*key, sketch.to_bytes()) for key, sketch in sorted(store.items(), key=lambda item: item[0])]
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: nothing stops a second process opening the log
+    fcntl = None
+
+import numpy as np
+
+from app.utils.database import MockDatabase
+from app.utils.event_record import stamped
+from app.utils.segment_log import DEFAULT_SEGMENT_RECORDS, GroupCommit, SegmentEventLog
+
+class EventLogDatabase(MockDatabase):
+    """
+    Single-node backend that keeps events and assignments on local disk.
+
+    Events go to a SegmentEventLog and assignments to an append-only JSON
+    lines journal, both in `directory`. Reads are served exactly as by
+    MockDatabase (the log has the same interface as its in-memory store),
+    and on connect the assignments are replayed and the stats counters
+    rebuilt from the mapped segments. A write returns once it is fsynced;
+    concurrent writers share fsyncs through a GroupCommit.
+
+    Experiments are the built-in defaults, as with MockDatabase; bandit
+    allocations are recomputed by the updater after a restart. The
+    directory is locked, so only one process can use it at a time.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_records: int = DEFAULT_SEGMENT_RECORDS,
+        commit_delay: float = 0.0
+    ):
+        super().__init__()
+        self.directory = directory
+        self.events = SegmentEventLog(directory, segment_records)
+        self.commit = GroupCommit(self._fsync, commit_delay)
+        self._journal_fd: Optional[int] = None
+        self._lock_file = None
+
+    async def connect(self) -> None:
+        """Lock the directory, recover the log and replay the assignment journal."""
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = open(os.path.join(self.directory, "LOCK"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._lock_file.close()
+                raise RuntimeError(f"{self.directory} is in use by another process")
+
+        self.events.open()
+        journal_path = os.path.join(self.directory, "assignments.log")
+        self._replay_assignments(journal_path)
+        self._journal_fd = os.open(journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        await self.rebuild_stats()
+
+    async def close(self) -> None:
+        """Flush and close the files and release the directory lock."""
+        if self._journal_fd is None:
+            return
+        self._fsync()
+        self.events.close()
+        os.close(self._journal_fd)
+        self._journal_fd = None
+        self._lock_file.close()
+
+    def _replay_assignments(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as file:
+            data = file.read()
+        position = 0
+        while True:
+            end = data.find(b"\n", position)
+            if end < 0:
+                break
+            try:
+                assignment = json.loads(data[position:end])
+            except ValueError:
+                break
+            assignment["assigned_at"] = datetime.fromisoformat(assignment["assigned_at"])
+            self.assignments[f"{assignment['user_id']}:{assignment['experiment_id']}"] = assignment
+            position = end + 1
+        if position < len(data):
+            # Torn last line from a crash mid-write
+            os.truncate(path, position)
+
+    def _fsync(self) -> None:
+        self.events.fsync()
+        os.fsync(self._journal_fd)
+
+    async def insert_event(self, event_data: Dict[str, Any]) -> str:
+        """Insert an event record (an EventRecord is stored as is, without copying)."""
+        event_ids = await self.insert_events([event_data])
+        return event_ids[0]
+
+    async def insert_events(self, events: List[Dict[str, Any]]) -> List[str]:
+        """
+        Insert a batch of event records with one write, returning their ids once they are durable.
+
+        Events that already carry an "id" or "recorded_at" keep them.
+        """
+        recorded_at = datetime.now()
+        records = [stamped(event_data, recorded_at) for event_data in events]
+        self.events.append_many(records)
+        for record in records:
+            self._count_event(self._event_counts, record)
+            self.rollups.add(record)
+            self.segment_index.add_event(record)
+            self.user_sketches.add(record)
+        await self.commit.commit()
+        return [record["id"] for record in records]
+
+    async def save_assignment(self, assignment_data: Dict[str, Any]) -> None:
+        """Save a new assignment and journal it."""
+        await self.save_assignments([assignment_data])
+
+    async def save_assignments(self, assignments: List[Dict[str, Any]]) -> None:
+        """Save several new assignments, journaling them with one write and one fsync."""
+        lines = []
+        for assignment_data in assignments:
+            self._store_assignment(assignment_data)
+            key = f"{assignment_data['user_id']}:{assignment_data['experiment_id']}"
+            lines.append(json.dumps(self.assignments[key], default=datetime.isoformat) + "\n")
+        if lines:
+            os.write(self._journal_fd, "".join(lines).encode("utf-8"))
+            await self.commit.commit()
+
+    async def iter_experiment_events(
+        self,
+        experiment_id: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        event_types: Optional[List[str]] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream an experiment's events oldest first.
+
+        Rows are taken from the time index batch_size at a time and their
+        records gathered from the mapped segments in one go.
+        """
+        type_codes = None
+        if event_types is not None:
+            type_codes = [self.events.lookup("event_type", event_type) for event_type in event_types]
+
+        batch = []
+        for _, row in self.events.iter_experiment(experiment_id, since, until, descending=False):
+            batch.append(row)
+            if len(batch) == batch_size:
+                for record in self._gather(batch, type_codes):
+                    yield record
+                batch = []
+                await asyncio.sleep(0)
+        for record in self._gather(batch, type_codes):
+            yield record
+
+    def _gather(self, rows: List[int], type_codes: Optional[List[Optional[int]]]) -> List[Dict[str, Any]]:
+        records = self.events.take(rows)
+        if type_codes is not None:
+            records = records[np.isin(records["event_type"], [code for code in type_codes if code is not None])]
+        return self.events.materialise(records)
@@ -0,0 +1,687 @@
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Any, Optional
+
+import asyncpg
+
+from app.utils.database import decode_cursor, default_experiments, encode_cursor, summarize_stats
+from app.utils.event_ids import generate_event_id
+from app.utils.hyperloglog import HyperLogLog, UserSketches, merge_serialized, sketch_rows
+from app.utils.rollups import DAY, HOUR, MINUTE, RollupRow, bucket_start
+from app.utils.segments import Segment, segment_where
+
+# Schema shipped with the repo, applied on connect (every statement is IF NOT EXISTS)
+SCHEMA_PATH = Path(__file__).resolve().parents[3] / "db" / "experiments_schema.sql"
+
+EVENT_COLUMNS = [
+    "id", "recorded_at", "user_id", "experiment_id", "variant", "event_type",
+    "campaign_id", "ad_id", "device_type", "geo_location", "metadata"
+]
+
+ROLLUP_KEY = "experiment_id, bucket_seconds, bucket_start, variant, event_type, device_type, geo_location"
+
+# SQL is kept in module-level constants so asyncpg's per-connection statement
+# cache prepares each statement once and reuses it for every call.
+# The primary key is the final duplicate check: a resent event id inserts
+# nothing, so nothing is counted, and the statement returns 0
+INSERT_EVENT_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO experiment_events (
+            id, recorded_at, user_id, experiment_id, variant, event_type,
+            campaign_id, ad_id, device_type, geo_location, metadata
+        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+        ON CONFLICT (id) DO NOTHING
+        RETURNING experiment_id, variant, event_type, device_type, geo_location, recorded_at
+    ), counted AS (
+        INSERT INTO experiment_event_counts (experiment_id, variant, event_type, events)
+        SELECT experiment_id, variant, event_type, 1 FROM inserted
+        ON CONFLICT (experiment_id, variant, event_type)
+        DO UPDATE SET events = experiment_event_counts.events + 1
+    ), rolled_up AS (
+        INSERT INTO experiment_event_rollups ({ROLLUP_KEY}, events)
+        SELECT experiment_id, {MINUTE}, date_trunc('minute', recorded_at), variant, event_type,
+               coalesce(device_type, ''), coalesce(geo_location, ''), 1
+        FROM inserted
+        ON CONFLICT ({ROLLUP_KEY})
+        DO UPDATE SET events = experiment_event_rollups.events + 1
+    )
+    SELECT count(*) FROM inserted
+"""
+
+# Batches are COPYed into a per-connection staging table (emptied at commit)
+# and moved over with ON CONFLICT, since COPY itself cannot skip conflicts
+CREATE_EVENT_STAGING_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS experiment_events_staging
+    (LIKE experiment_events) ON COMMIT DELETE ROWS
+"""
+
+MERGE_STAGED_EVENTS_SQL = f"""
+    INSERT INTO experiment_events ({", ".join(EVENT_COLUMNS)})
+    SELECT {", ".join(EVENT_COLUMNS)} FROM experiment_events_staging
+    ON CONFLICT (id) DO NOTHING
+    RETURNING id
+"""
+
+ADD_EVENT_COUNTS_SQL = """
+    INSERT INTO experiment_event_counts (experiment_id, variant, event_type, events)
+    VALUES ($1, $2, $3, $4)
+    ON CONFLICT (experiment_id, variant, event_type)
+    DO UPDATE SET events = experiment_event_counts.events + EXCLUDED.events
+"""
+
+# User sketches are merged in the app: missing rows are created empty, then the
+# batch's rows are locked in key order, merged and written back
+EMPTY_SKETCH = HyperLogLog().to_bytes()
+
+ENSURE_USER_SKETCH_SQL = """
+    INSERT INTO experiment_user_sketches (experiment_id, variant, event_type, sketch)
+    VALUES ($1, $2, $3, $4)
+    ON CONFLICT (experiment_id, variant, event_type) DO NOTHING
+"""
+
+LOCK_USER_SKETCHES_SQL = """
+    SELECT experiment_id, variant, event_type, sketch FROM experiment_user_sketches
+    WHERE (experiment_id, variant, event_type) IN (SELECT * FROM unnest($1::text[], $2::text[], $3::text[]))
+    ORDER BY experiment_id, variant, event_type
+    FOR UPDATE
+"""
+
+UPDATE_USER_SKETCH_SQL = """
+    UPDATE experiment_user_sketches SET sketch = $4
+    WHERE experiment_id = $1 AND variant = $2 AND event_type = $3
+"""
+
+ADD_ROLLUP_SQL = f"""
+    INSERT INTO experiment_event_rollups ({ROLLUP_KEY}, events)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+    ON CONFLICT ({ROLLUP_KEY})
+    DO UPDATE SET events = experiment_event_rollups.events + EXCLUDED.events
+"""
+
+ROLLUPS_SQL = """
+    SELECT bucket_seconds, extract(epoch FROM bucket_start)::bigint AS bucket_start,
+           variant, event_type, device_type, geo_location, events
+    FROM experiment_event_rollups
+    WHERE experiment_id = $1 AND bucket_seconds = $2
+      AND bucket_start >= to_timestamp($3::bigint) AND bucket_start < to_timestamp($4::bigint)
+"""
+
+# Move one width's buckets older than a cutoff into the next width, in one statement
+COMPACT_ROLLUPS_SQL = f"""
+    WITH merged AS (
+        DELETE FROM experiment_event_rollups
+        WHERE bucket_seconds = $1::integer AND bucket_start < to_timestamp($3::bigint)
+        RETURNING experiment_id, bucket_start, variant, event_type, device_type, geo_location, events
+    ), added AS (
+        INSERT INTO experiment_event_rollups ({ROLLUP_KEY}, events)
+        SELECT experiment_id, $2::integer,
+               to_timestamp(extract(epoch FROM bucket_start)::bigint / $2::integer * $2::integer),
+               variant, event_type, device_type, geo_location, sum(events)
+        FROM merged
+        GROUP BY 1, 3, 4, 5, 6, 7
+        ON CONFLICT ({ROLLUP_KEY})
+        DO UPDATE SET events = experiment_event_rollups.events + EXCLUDED.events
+    )
+    SELECT count(*) FROM merged
+"""
+
+RAW_ROLLUPS_SQL = f"""
+    SELECT experiment_id, {MINUTE}, date_trunc('minute', recorded_at), variant, event_type,
+           coalesce(device_type, ''), coalesce(geo_location, ''), count(*)
+    FROM experiment_events
+    GROUP BY 1, 3, 4, 5, 6, 7
+"""
+
+GET_ASSIGNMENT_SQL = """
+    SELECT user_id, experiment_id, variant, device_type, geo_location, assigned_at
+    FROM assignments WHERE experiment_id = $1 AND user_id = $2
+"""
+
+GET_ASSIGNMENTS_SQL = """
+    SELECT user_id, experiment_id, variant, device_type, geo_location, assigned_at
+    FROM assignments WHERE user_id = $1 AND experiment_id = ANY($2::text[])
+"""
+
+SAVE_ASSIGNMENT_SQL = """
+    WITH inserted AS (
+        INSERT INTO assignments (experiment_id, user_id, variant, device_type, geo_location, assigned_at)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        ON CONFLICT (experiment_id, user_id) DO NOTHING
+        RETURNING experiment_id, variant
+    )
+    INSERT INTO experiment_variant_counts (experiment_id, variant, users)
+    SELECT experiment_id, variant, 1 FROM inserted
+    ON CONFLICT (experiment_id, variant)
+    DO UPDATE SET users = experiment_variant_counts.users + 1
+"""
+
+# Several assignments as parallel arrays in one statement, counting only the inserted ones
+SAVE_ASSIGNMENTS_SQL = """
+    WITH inserted AS (
+        INSERT INTO assignments (experiment_id, user_id, variant, device_type, geo_location, assigned_at)
+        SELECT * FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::text[], $6::timestamptz[])
+        ON CONFLICT (experiment_id, user_id) DO NOTHING
+        RETURNING experiment_id, variant
+    )
+    INSERT INTO experiment_variant_counts (experiment_id, variant, users)
+    SELECT experiment_id, variant, count(*) FROM inserted GROUP BY experiment_id, variant
+    ON CONFLICT (experiment_id, variant)
+    DO UPDATE SET users = experiment_variant_counts.users + EXCLUDED.users
+"""
+
+GET_EXPERIMENT_SQL = """
+    SELECT experiment_id, name, description, status, variants, start_date, end_date,
+           allocation_mode, exploration_floor, layer, layer_range, targeting
+    FROM experiments WHERE experiment_id = $1
+"""
+
+GET_EXPERIMENTS_SQL = """
+    SELECT experiment_id, name, description, status, variants, start_date, end_date,
+           allocation_mode, exploration_floor, layer, layer_range, targeting
+    FROM experiments ORDER BY experiment_id
+"""
+
+SEED_EXPERIMENT_SQL = """
+    INSERT INTO experiments (
+        experiment_id, name, description, status, variants, start_date, end_date,
+        allocation_mode, exploration_floor, layer, layer_range, targeting
+    )
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+    ON CONFLICT (experiment_id) DO NOTHING
+"""
+
+UPDATE_EXPERIMENT_VARIANTS_SQL = "UPDATE experiments SET variants = $2 WHERE experiment_id = $1"
+
+LIST_EXPERIMENTS_SQL = "SELECT experiment_id FROM experiments ORDER BY experiment_id"
+
+# Session-level advisory lock, held by the connection that took it until it closes
+TRY_LEAD_SQL = "SELECT pg_try_advisory_lock(hashtext($1))"
+
+EVENT_SELECT_SQL = """
+    SELECT id, recorded_at, user_id, experiment_id, variant, event_type,
+           campaign_id, ad_id, device_type, geo_location, metadata
+    FROM experiment_events
+"""
+
+VARIANT_COUNTS_SQL = "SELECT variant, users FROM experiment_variant_counts WHERE experiment_id = $1"
+
+EVENT_COUNTS_SQL = "SELECT variant, event_type, events FROM experiment_event_counts WHERE experiment_id = $1"
+
+# Segment-filtered stats: users from the assignments (keyed by experiment first),
+# events from the rollups, which carry device_type and geo_location, instead of the raw events
+SEGMENT_VARIANT_COUNTS_SQL = """
+    SELECT variant, count(*) AS users FROM assignments
+    WHERE experiment_id = $1 AND {segments} GROUP BY variant
+"""
+
+SEGMENT_EVENT_COUNTS_SQL = """
+    SELECT variant, event_type, sum(events)::bigint AS events FROM experiment_event_rollups
+    WHERE experiment_id = $1 AND {segments} GROUP BY variant, event_type
+"""
+
+USER_SKETCHES_SQL = "SELECT variant, event_type, sketch FROM experiment_user_sketches WHERE experiment_id = $1"
+
+RAW_USERS_SQL = "SELECT experiment_id, variant, event_type, user_id FROM experiment_events"
+
+RAW_VARIANT_COUNTS_SQL = """
+    SELECT experiment_id, variant, count(*) AS users FROM assignments GROUP BY experiment_id, variant
+"""
+
+RAW_EVENT_COUNTS_SQL = """
+    SELECT experiment_id, variant, event_type, count(*) AS events
+    FROM experiment_events GROUP BY experiment_id, variant, event_type
+"""
+
+class PostgresDatabase:
+    """
+    PostgreSQL backend with the same interface as MockDatabase.
+
+    Uses an asyncpg connection pool opened in app startup. Single events and
+    assignments update the stats counter tables in the same statement; event
+    batches are written with COPY.
+    """
+
+    def __init__(self, database_url: str):
+        self.database_url = database_url
+        self.pool: Optional[asyncpg.Pool] = None
+        # Connections kept out of the pool to hold role locks, by role
+        self._role_connections: Dict[str, asyncpg.Connection] = {}
+
+    async def connect(self) -> None:
+        """Open the connection pool, apply the schema and seed the demo experiments."""
+        self.pool = await asyncpg.create_pool(
+            self.database_url,
+            min_size=int(os.getenv("DATABASE_POOL_MIN_SIZE", 2)),
+            max_size=int(os.getenv("DATABASE_POOL_MAX_SIZE", 10)),
+        )
+        async with self.pool.acquire() as conn:
+            await conn.execute(SCHEMA_PATH.read_text())
+            for experiment in default_experiments().values():
+                await conn.execute(
+                    SEED_EXPERIMENT_SQL,
+                    experiment["experiment_id"],
+                    experiment["name"],
+                    experiment["description"],
+                    experiment["status"],
+                    json.dumps(experiment["variants"]),
+                    experiment["start_date"].astimezone(timezone.utc) if experiment["start_date"] else None,
+                    experiment["end_date"],
+                    experiment.get("allocation_mode", "static"),
+                    experiment.get("exploration_floor"),
+                    experiment.get("layer"),
+                    json.dumps(experiment["layer_range"]) if experiment.get("layer_range") else None,
+                    json.dumps(experiment["targeting"]) if experiment.get("targeting") else None,
+                )
+
+    async def close(self) -> None:
+        """Close the connection pool."""
+        for conn in self._role_connections.values():
+            await self.pool.release(conn)
+        self._role_connections = {}
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def _event_row(self, event_data: Dict[str, Any], recorded_at: datetime) -> tuple:
+        # Events stamped before reaching the database (by the route or the write-behind buffer) keep their id and time
+        stamped_at = event_data.get("recorded_at")
+        if stamped_at is not None:
+            recorded_at = stamped_at.astimezone(timezone.utc)
+        return (
+            uuid.UUID(event_data.get("id") or generate_event_id()),
+            recorded_at,
+            event_data["user_id"],
+            event_data["experiment_id"],
+            event_data["variant"],
+            event_data["event_type"],
+            event_data.get("campaign_id"),
+            event_data.get("ad_id"),
+            event_data.get("device_type"),
+            event_data.get("geo_location"),
+            json.dumps(event_data.get("metadata") or {}),
+        )
+
+    async def _add_user_sketches(self, conn: asyncpg.Connection, rows: List[tuple]) -> None:
+        batch = sketch_rows([(row[3], row[4], row[5], row[2]) for row in rows])
+        await conn.executemany(ENSURE_USER_SKETCH_SQL, [(*key, EMPTY_SKETCH) for *key, _ in batch])
+        columns = [list(column) for column in zip(*(key for *key, _ in batch))]
+        stored = {tuple(row[:3]): row["sketch"] for row in await conn.fetch(LOCK_USER_SKETCHES_SQL, *columns)}
+        await conn.executemany(
+            UPDATE_USER_SKETCH_SQL,
+            [(*key, merge_serialized(stored[tuple(key)], sketch)) for *key, sketch in batch]
+        )
+
+    async def insert_event(self, event_data: Dict[str, Any]) -> Optional[str]:
+        """Insert an event record, returning its id, or None if its id is already stored."""
+        row = self._event_row(event_data, datetime.now(timezone.utc))
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if not await conn.fetchval(INSERT_EVENT_SQL, *row):
+                    return None
+                await self._add_user_sketches(conn, [row])
+        return str(row[0])
+
+    async def insert_events(self, events: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Insert a batch of event records with COPY, returning their ids in order.
+
+        Events that already carry an "id" or "recorded_at" keep them. An event
+        whose id is already stored, or repeats one earlier in the batch, is
+        not written again and gets None.
+        """
+        if not events:
+            return []
+        recorded_at = datetime.now(timezone.utc)
+        rows = [self._event_row(event_data, recorded_at) for event_data in events]
+        # Only the first of a repeated id is staged, so the merge decides each id once
+        staged = []
+        seen = set()
+        for row in rows:
+            if row[0] not in seen:
+                seen.add(row[0])
+                staged.append(row)
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(CREATE_EVENT_STAGING_SQL)
+                await conn.copy_records_to_table("experiment_events_staging", records=staged, columns=EVENT_COLUMNS)
+                inserted = {str(record["id"]) for record in await conn.fetch(MERGE_STAGED_EVENTS_SQL)}
+                new_rows = [row for row in staged if str(row[0]) in inserted]
+
+                # Aggregate the new events so the counters and rollups take one upsert per key
+                counts: Dict[tuple, int] = {}
+                rollups: Dict[tuple, int] = {}
+                for row in new_rows:
+                    key = (row[3], row[4], row[5])
+                    counts[key] = counts.get(key, 0) + 1
+                    key = (row[3], MINUTE, row[1].replace(second=0, microsecond=0), row[4], row[5], row[8] or "", row[9] or "")
+                    rollups[key] = rollups.get(key, 0) + 1
+                # Upserted in key order, like the sketches, so concurrent batches lock
+                # shared counter and rollup rows in the same order and cannot deadlock
+                await conn.executemany(ADD_EVENT_COUNTS_SQL, [(*key, count) for key, count in sorted(counts.items())])
+                await conn.executemany(ADD_ROLLUP_SQL, [(*key, count) for key, count in sorted(rollups.items())])
+                if new_rows:
+                    await self._add_user_sketches(conn, new_rows)
+
+        event_ids: List[Optional[str]] = []
+        for row in rows:
+            # The first occurrence of a newly inserted id claims it; repeats are duplicates
+            event_id = str(row[0])
+            if event_id in inserted:
+                inserted.discard(event_id)
+                event_ids.append(event_id)
+            else:
+                event_ids.append(None)
+        return event_ids
+
+    async def get_assignment(self, user_id: str, experiment_id: str) -> Optional[Dict[str, Any]]:
+        """Get existing assignment for user and experiment."""
+        row = await self.pool.fetchrow(GET_ASSIGNMENT_SQL, experiment_id, user_id)
+        return dict(row) if row else None
+
+    async def save_assignment(self, assignment_data: Dict[str, Any]) -> None:
+        """Save a new assignment; an existing assignment for the user is kept."""
+        device_type = assignment_data.get("device_type")
+        assigned_at = assignment_data.get("assigned_at")
+        await self.pool.execute(
+            SAVE_ASSIGNMENT_SQL,
+            assignment_data["experiment_id"],
+            assignment_data["user_id"],
+            assignment_data["variant"],
+            getattr(device_type, "value", device_type),
+            assignment_data.get("geo_location"),
+            assigned_at.astimezone(timezone.utc) if assigned_at else datetime.now(timezone.utc),
+        )
+
+    async def get_assignments(self, user_id: str, experiment_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get a user's existing assignments for several experiments in one query, keyed by experiment id."""
+        rows = await self.pool.fetch(GET_ASSIGNMENTS_SQL, user_id, experiment_ids)
+        return {row["experiment_id"]: dict(row) for row in rows}
+
+    async def save_assignments(self, assignments: List[Dict[str, Any]]) -> None:
+        """Save several new assignments with one statement; existing assignments are kept."""
+        if not assignments:
+            return
+        now = datetime.now(timezone.utc)
+        columns = ([], [], [], [], [], [])
+        for assignment_data in assignments:
+            device_type = assignment_data.get("device_type")
+            assigned_at = assignment_data.get("assigned_at")
+            row = (
+                assignment_data["experiment_id"],
+                assignment_data["user_id"],
+                assignment_data["variant"],
+                getattr(device_type, "value", device_type),
+                assignment_data.get("geo_location"),
+                assigned_at.astimezone(timezone.utc) if assigned_at else now,
+            )
+            for column, value in zip(columns, row):
+                column.append(value)
+        await self.pool.execute(SAVE_ASSIGNMENTS_SQL, *columns)
+
+    async def get_experiment(self, experiment_id: str) -> Optional[Dict[str, Any]]:
+        """Get experiment configuration."""
+        row = await self.pool.fetchrow(GET_EXPERIMENT_SQL, experiment_id)
+        return self._experiment_from_row(row) if row else None
+
+    async def get_experiments(self) -> List[Dict[str, Any]]:
+        """Get every experiment configuration."""
+        return [self._experiment_from_row(row) for row in await self.pool.fetch(GET_EXPERIMENTS_SQL)]
+
+    def _experiment_from_row(self, row: asyncpg.Record) -> Dict[str, Any]:
+        experiment = dict(row)
+        experiment["variants"] = json.loads(experiment["variants"])
+        experiment["layer_range"] = json.loads(experiment["layer_range"]) if experiment["layer_range"] else None
+        experiment["targeting"] = json.loads(experiment["targeting"]) if experiment["targeting"] else None
+        return experiment
+
+    async def list_experiments(self) -> List[str]:
+        """List experiment ids."""
+        rows = await self.pool.fetch(LIST_EXPERIMENTS_SQL)
+        return [row["experiment_id"] for row in rows]
+
+    async def update_experiment_variants(self, experiment_id: str, variants: Dict[str, float]) -> None:
+        """Replace an experiment's variant allocation."""
+        await self.pool.execute(UPDATE_EXPERIMENT_VARIANTS_SQL, experiment_id, json.dumps(variants))
+
+    async def try_lead(self, role: str) -> bool:
+        """
+        Claim a role that one process runs at a time, across every app server.
+
+        The claim is an advisory lock held by a connection kept out of the
+        pool, so the server releases it when the holding process exits or its
+        connection drops and the next process to ask takes over.
+
+        Returns:
+            True if this process holds the role
+        """
+        conn = self._role_connections.get(role)
+        if conn is not None:
+            if not conn.is_closed():
+                return True
+            del self._role_connections[role]
+            await self.pool.release(conn)
+        conn = await self.pool.acquire()
+        if not await conn.fetchval(TRY_LEAD_SQL, role):
+            await self.pool.release(conn)
+            return False
+        self._role_connections[role] = conn
+        return True
+
+    def _event_from_row(self, row: asyncpg.Record) -> Dict[str, Any]:
+        event = dict(row)
+        event["id"] = str(event["id"])
+        event["metadata"] = json.loads(event["metadata"]) if event["metadata"] else {}
+        return event
+
+    async def get_experiment_events(self, experiment_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get the most recent events for an experiment, newest first."""
+        page = await self.query_experiment_events(experiment_id, limit)
+        return page["events"]
+
+    async def query_experiment_events(
+        self,
+        experiment_id: str,
+        limit: int = 100,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get a page of an experiment's events, newest first.
+
+        Keyset pagination on (recorded_at, id), served by the
+        (experiment_id, recorded_at DESC, id DESC) index. Only the filters in
+        use are added to the statement, so each combination gets its own
+        cached plan instead of a generic one full of "IS NULL OR" branches.
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        conditions = ["experiment_id = $1"]
+        args: List[Any] = [experiment_id]
+        if since is not None:
+            args.append(since)
+            conditions.append(f"recorded_at >= ${len(args)}")
+        if until is not None:
+            args.append(until)
+            conditions.append(f"recorded_at < ${len(args)}")
+        if cursor:
+            parts = decode_cursor(cursor)
+            try:
+                after_time, after_id = datetime.fromisoformat(parts[0]), uuid.UUID(parts[1])
+            except (IndexError, TypeError, ValueError):
+                raise ValueError("Invalid cursor")
+            args.extend([after_time, after_id])
+            conditions.append(f"(recorded_at, id) < (${len(args) - 1}, ${len(args)})")
+        args.append(limit + 1)
+
+        sql = (
+            EVENT_SELECT_SQL
+            + " WHERE " + " AND ".join(conditions)
+            + f" ORDER BY recorded_at DESC, id DESC LIMIT ${len(args)}"
+        )
+        rows = await self.pool.fetch(sql, *args)
+        page = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit and page:
+            next_cursor = encode_cursor(page[-1]["recorded_at"].isoformat(), str(page[-1]["id"]))
+        return {
+            "events": [self._event_from_row(row) for row in page],
+            "next_cursor": next_cursor
+        }
+
+    async def iter_experiment_events(
+        self,
+        experiment_id: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        event_types: Optional[List[str]] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream an experiment's events oldest first through a server-side cursor.
+
+        Holds one pooled connection for the duration of the stream and fetches
+        batch_size rows per round trip.
+        """
+        conditions = ["experiment_id = $1"]
+        args: List[Any] = [experiment_id]
+        if since is not None:
+            args.append(since)
+            conditions.append(f"recorded_at >= ${len(args)}")
+        if until is not None:
+            args.append(until)
+            conditions.append(f"recorded_at < ${len(args)}")
+        if event_types is not None:
+            args.append(list(event_types))
+            conditions.append(f"event_type = ANY(${len(args)}::text[])")
+        sql = EVENT_SELECT_SQL + " WHERE " + " AND ".join(conditions) + " ORDER BY recorded_at, id"
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(sql, *args, prefetch=batch_size):
+                    yield self._event_from_row(row)
+
+    async def get_experiment_stats(self, experiment_id: str, segments: Optional[List[Segment]] = None) -> Dict[str, Any]:
+        """
+        Get experiment statistics from the counter tables and user sketches.
+
+        With segments, users are counted from the assignments and events
+        summed from the rollups, both restricted to the segments; the
+        sketches cover whole variants, so distinct-user counts are left out.
+        """
+        variant_sql, event_sql, args = VARIANT_COUNTS_SQL, EVENT_COUNTS_SQL, [experiment_id]
+        if segments:
+            def condition(dimension: str, values: List[str]) -> str:
+                args.append(values)
+                return f"{dimension} = ANY(${len(args)}::text[])"
+
+            where = segment_where(segments, condition)
+            variant_sql = SEGMENT_VARIANT_COUNTS_SQL.format(segments=where)
+            event_sql = SEGMENT_EVENT_COUNTS_SQL.format(segments=where)
+
+        async with self.pool.acquire() as conn:
+            variant_rows = await conn.fetch(variant_sql, *args)
+            event_rows = await conn.fetch(event_sql, *args)
+            stored_sketches = None if segments else await conn.fetch(USER_SKETCHES_SQL, experiment_id)
+
+        event_counts: Dict[str, Dict[str, int]] = {}
+        for row in event_rows:
+            event_counts.setdefault(row["variant"], {})[row["event_type"]] = row["events"]
+        user_sketches = None
+        if stored_sketches is not None:
+            user_sketches = {(row["variant"], row["event_type"]): HyperLogLog.from_bytes(row["sketch"]) for row in stored_sketches}
+        return summarize_stats(
+            experiment_id,
+            {row["variant"]: row["users"] for row in variant_rows if row["users"]},
+            event_counts,
+            user_sketches
+        )
+
+    async def get_event_rollups(self, experiment_id: str, since: int, until: int, resolution: int) -> List[RollupRow]:
+        """Rollup rows for an experiment overlapping [since, until) (epoch seconds aligned to resolution)."""
+        rows = []
+        async with self.pool.acquire() as conn:
+            for width in (MINUTE, HOUR, DAY):
+                low = bucket_start(since, max(width, resolution))
+                for row in await conn.fetch(ROLLUPS_SQL, experiment_id, width, low, until):
+                    rows.append((
+                        row["bucket_seconds"], row["bucket_start"], row["variant"], row["event_type"],
+                        row["device_type"] or None, row["geo_location"] or None, row["events"]
+                    ))
+        return rows
+
+    async def compact_rollups(self, minute_before: int, hour_before: int) -> Dict[str, int]:
+        """
+        Merge minute buckets older than minute_before into hours, and hour buckets
+        older than hour_before into days (epoch seconds).
+
+        Returns:
+            Number of minute and hour rollup rows merged
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                return {
+                    "minute": await conn.fetchval(COMPACT_ROLLUPS_SQL, MINUTE, HOUR, minute_before),
+                    "hour": await conn.fetchval(COMPACT_ROLLUPS_SQL, HOUR, DAY, hour_before)
+                }
+
+    async def rebuild_stats(self) -> bool:
+        """
+        Recompute the counter tables, rollups and user sketches from the raw assignments and events.
+
+        Rollups are rebuilt at minute resolution; the next compaction merges
+        the old buckets again.
+
+        Returns:
+            True if the incrementally maintained counters matched the raw tables
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Block concurrent writers so the comparison and rebuild see one state
+                await conn.execute(
+                    "LOCK TABLE assignments, experiment_events, experiment_variant_counts, "
+                    "experiment_event_counts, experiment_event_rollups, experiment_user_sketches IN SHARE ROW EXCLUSIVE MODE"
+                )
+                raw_variants = {tuple(row[:2]): row["users"] for row in await conn.fetch(RAW_VARIANT_COUNTS_SQL)}
+                raw_events = {tuple(row[:3]): row["events"] for row in await conn.fetch(RAW_EVENT_COUNTS_SQL)}
+                counted_variants = {
+                    tuple(row[:2]): row["users"]
+                    for row in await conn.fetch("SELECT experiment_id, variant, users FROM experiment_variant_counts WHERE users > 0")
+                }
+                counted_events = {
+                    tuple(row[:3]): row["events"]
+                    for row in await conn.fetch("SELECT experiment_id, variant, event_type, events FROM experiment_event_counts")
+                }
+
+                await conn.execute("DELETE FROM experiment_variant_counts")
+                await conn.execute("DELETE FROM experiment_event_counts")
+                await conn.execute(
+                    "INSERT INTO experiment_variant_counts (experiment_id, variant, users) " + RAW_VARIANT_COUNTS_SQL
+                )
+                await conn.execute(
+                    "INSERT INTO experiment_event_counts (experiment_id, variant, event_type, events) " + RAW_EVENT_COUNTS_SQL
+                )
+                await conn.execute("DELETE FROM experiment_event_rollups")
+                await conn.execute(f"INSERT INTO experiment_event_rollups ({ROLLUP_KEY}, events) " + RAW_ROLLUPS_SQL)
+
+                raw_sketches = UserSketches()
+                async for row in conn.cursor(RAW_USERS_SQL, prefetch=10_000):
+                    raw_sketches.add_user(*row)
+                stored_sketches = {
+                    tuple(row[:3]): HyperLogLog.from_bytes(row["sketch"])
+                    for row in await conn.fetch("SELECT experiment_id, variant, event_type, sketch FROM experiment_user_sketches")
+                }
+                await conn.execute("DELETE FROM experiment_user_sketches")
+                await conn.executemany(
+                    "INSERT INTO experiment_user_sketches (experiment_id, variant, event_type, sketch) VALUES ($1, $2, $3, $4)",
+                    [(*key, sketch.to_bytes()) for key, sketch in raw_sketches.items()]
+                )
+        return (
+            raw_variants == counted_variants and raw_events == counted_events
+            and dict(raw_sketches.items()) == stored_sketches
+        )
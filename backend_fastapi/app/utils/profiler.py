@@ -0,0 +1,113 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, Optional
+
+# Requests carrying this header are profiled when PROFILING_ENABLED is set
+PROFILE_HEADER = b"x-profile"
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread from a background thread.
+
+    Every `interval` seconds the target thread's current frame is walked and
+    the stack is counted in collapsed form ("outer;inner;leaf"), the input
+    format of flamegraph tools. The target thread runs at full speed between
+    samples; the only cost is the sampler briefly holding the GIL.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        """Sampled stacks in collapsed format, most frequent first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware that profiles requests sent with an `X-Profile: 1` header.
+
+    The event loop thread is sampled while the request is handled, so other
+    requests running concurrently on the same loop appear in the profile too.
+    The response carries `X-Profile-Id`; the collapsed stacks are kept for
+    the last `keep` profiled requests and served by GET /debug/profiles/{id}.
+    """
+
+    def __init__(self, app, interval: float = 0.001, keep: int = 20):
+        self.app = app
+        self.interval = interval
+        self.keep = keep
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or dict(scope["headers"]).get(PROFILE_HEADER) not in (b"1", b"true"):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        profiler = SamplingProfiler(threading.get_ident(), self.interval)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode("ascii"))
+                ]}
+            await send(message)
+
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            store_profile(profile_id, {
+                "path": scope["path"],
+                "method": scope["method"],
+                "duration_seconds": time.perf_counter() - started,
+                "samples": profiler.samples,
+                "interval_seconds": self.interval,
+                "collapsed": profiler.collapsed(),
+            }, self.keep)
+
+# Most recent profiles by id
+_profiles: "OrderedDict[str, Dict]" = OrderedDict()
+
+def store_profile(profile_id: str, profile: Dict, keep: int) -> None:
+    _profiles[profile_id] = profile
+    while len(_profiles) > keep:
+        _profiles.popitem(last=False)
+
+def get_profile(profile_id: str) -> Optional[Dict]:
+    return _profiles.get(profile_id)
+
+def profiling_enabled() -> bool:
+    """Profiling by header is opt-in, since anyone who can send the header can trigger it."""
+    return os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
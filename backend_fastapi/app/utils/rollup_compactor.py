@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from app.utils.database import db
+from app.utils.rollups import DAY, HOUR, bucket_start
+
+logger = logging.getLogger(__name__)
+
+class RollupCompactor:
+    """
+    Background task that merges old rollup buckets into coarser ones.
+
+    Every `interval` seconds, minute buckets older than `minute_retention`
+    seconds are merged into hour buckets and hour buckets older than
+    `hour_retention` into day buckets. Cutoffs are aligned to the coarser
+    width, so a coarse bucket is always built from whole fine buckets, and
+    the number of stored buckets grows with the experiment's lifetime in days
+    rather than in minutes.
+    """
+
+    def __init__(self, db, interval: float = 300.0, minute_retention: float = 2 * DAY, hour_retention: float = 90 * DAY):
+        self.db = db
+        self.interval = interval
+        self.minute_retention = minute_retention
+        self.hour_retention = hour_retention
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+
+        # Metrics
+        self.compactions = 0
+        self.failures = 0
+        self.merged = {"minute": 0, "hour": 0}
+        self.last_compaction_latency = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        """Start the periodic compaction on the running event loop."""
+        if self._task is not None:
+            return
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop compacting, letting a compaction in progress finish."""
+        if self._task is None:
+            return
+        self._stop.set()
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await self.compact()
+            except Exception:
+                self.failures += 1
+                logger.exception("Rollup compaction failed")
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def compact(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Run one compaction pass.
+
+        Args:
+            now: Current time in epoch seconds (defaults to the clock)
+
+        Returns:
+            Number of minute and hour rollup rows merged
+        """
+        now = time.time() if now is None else now
+        start = time.perf_counter()
+        merged = await self.db.compact_rollups(
+            bucket_start(now - self.minute_retention, HOUR),
+            bucket_start(now - self.hour_retention, DAY)
+        )
+        self.last_compaction_latency = time.perf_counter() - start
+        self.compactions += 1
+        for name, count in merged.items():
+            self.merged[name] += count
+        return merged
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "minute_retention_seconds": self.minute_retention,
+            "hour_retention_seconds": self.hour_retention,
+            "compactions": self.compactions,
+            "failures": self.failures,
+            "merged": dict(self.merged),
+            "last_compaction_latency_ms": self.last_compaction_latency * 1000,
+        }
+
+def create_rollup_compactor(db) -> Optional[RollupCompactor]:
+    """Create the rollup compactor unless ROLLUP_COMPACT_INTERVAL is 0."""
+    interval = float(os.getenv("ROLLUP_COMPACT_INTERVAL", 300))
+    if interval <= 0:
+        return None
+    return RollupCompactor(
+        db,
+        interval=interval,
+        minute_retention=float(os.getenv("ROLLUP_MINUTE_RETENTION", 2 * DAY)),
+        hour_retention=float(os.getenv("ROLLUP_HOUR_RETENTION", 90 * DAY))
+    )
+
+# Global rollup compactor (None when disabled)
+rollup_compactor = create_rollup_compactor(db)
@@ -0,0 +1,137 @@
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Bucket widths in seconds. Ingestion counts events into minute buckets;
+# compaction later merges old minute buckets into hours and old hours into days
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+RESOLUTIONS = {"minute": MINUTE, "hour": HOUR, "day": DAY}
+
+# Dimensions rollups are keyed by, after experiment and bucket
+DIMENSIONS = ("variant", "event_type", "device_type", "geo_location")
+
+# A stored rollup row: (bucket width, bucket start, variant, event_type, device_type, geo_location, events)
+RollupRow = Tuple[int, int, Optional[str], Optional[str], Optional[str], Optional[str], int]
+
+def bucket_start(timestamp: float, width: int) -> int:
+    """Start (epoch seconds) of the bucket of `width` seconds containing `timestamp`."""
+    return int(timestamp // width) * width
+
+def epoch_seconds(value: datetime) -> float:
+    """Seconds since the epoch; naive datetimes are local time."""
+    return value.timestamp()
+
+def rollup_key(event: Dict[str, Any]) -> Tuple[Optional[str], ...]:
+    return tuple(event.get(name) for name in DIMENSIONS)
+
+class RollupStore:
+    """
+    Event counts per (experiment, bucket, variant, event_type, device_type, geo_location).
+
+    Used by MockDatabase. Buckets of each width are kept in a dict by start
+    time alongside a sorted list of starts, so a range query is a binary
+    search plus a walk over the buckets in range.
+    """
+
+    def __init__(self):
+        # experiment_id -> width -> bucket start -> dimension values -> events
+        self.buckets: Dict[str, Dict[int, Dict[int, Dict[Tuple, int]]]] = {}
+        # experiment_id -> width -> sorted bucket starts
+        self.starts: Dict[str, Dict[int, List[int]]] = {}
+
+    def add(self, event: Dict[str, Any]) -> None:
+        """Count an event record (with "recorded_at") into its minute bucket."""
+        start = bucket_start(epoch_seconds(event["recorded_at"]), MINUTE)
+        self.add_count(event["experiment_id"], MINUTE, start, rollup_key(event), 1)
+
+    def add_count(self, experiment_id: str, width: int, start: int, key: Tuple, count: int) -> None:
+        by_start = self.buckets.setdefault(experiment_id, {}).setdefault(width, {})
+        bucket = by_start.get(start)
+        if bucket is None:
+            bucket = by_start[start] = {}
+            starts = self.starts.setdefault(experiment_id, {}).setdefault(width, [])
+            # Events mostly arrive in time order, so new buckets are usually appended
+            if not starts or start > starts[-1]:
+                starts.append(start)
+            else:
+                insort(starts, start)
+        bucket[key] = bucket.get(key, 0) + count
+
+    def compact(self, fine: int, coarse: int, before: int) -> int:
+        """
+        Merge `fine` buckets starting before `before` into `coarse` buckets.
+
+        Returns:
+            Number of rollup rows (bucket and dimension values) merged
+        """
+        merged = 0
+        for experiment_id, starts_by_width in self.starts.items():
+            starts = starts_by_width.get(fine)
+            if not starts:
+                continue
+            cut = bisect_left(starts, before)
+            by_start = self.buckets[experiment_id][fine]
+            for start in starts[:cut]:
+                bucket = by_start.pop(start)
+                for key, count in bucket.items():
+                    self.add_count(experiment_id, coarse, bucket_start(start, coarse), key, count)
+                merged += len(bucket)
+            del starts[:cut]
+        return merged
+
+    def rows(self, experiment_id: str, since: int, until: int, resolution: int) -> List[RollupRow]:
+        """Stored rows for an experiment overlapping [since, until), which are aligned to `resolution`."""
+        rows = []
+        for width, starts in self.starts.get(experiment_id, {}).items():
+            by_start = self.buckets[experiment_id][width]
+            low = bucket_start(since, max(width, resolution))
+            for position in range(bisect_left(starts, low), bisect_left(starts, until)):
+                start = starts[position]
+                for key, count in by_start[start].items():
+                    rows.append((width, start, *key, count))
+        return rows
+
+def build_timeseries(
+    rows: Iterable[RollupRow],
+    resolution: int,
+    group_by: Sequence[str],
+    filters: Optional[Dict[str, str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Sum rollup rows into points of `resolution` seconds, grouped by some dimensions.
+
+    Rows finer than the resolution are added into the bucket containing them.
+    Rows coarser than it (ranges already compacted past the requested
+    resolution) are returned at their own width, so each point carries its
+    bucket_seconds.
+
+    Args:
+        rows: Stored rollup rows from the database backend
+        resolution: Bucket width in seconds (MINUTE, HOUR or DAY)
+        group_by: Dimensions to keep; the others are summed over
+        filters: Dimension name to the only value to count
+
+    Returns:
+        Points sorted by bucket start, each with bucket_start, bucket_seconds,
+        the group_by dimensions and events
+    """
+    positions = [DIMENSIONS.index(name) for name in group_by]
+    conditions = [(DIMENSIONS.index(name), value) for name, value in (filters or {}).items()]
+    points: Dict[Tuple, int] = {}
+    for width, start, *values, events in rows:
+        if any(values[position] != value for position, value in conditions):
+            continue
+        width = max(width, resolution)
+        key = (bucket_start(start, width), width, *(values[position] for position in positions))
+        points[key] = points.get(key, 0) + events
+    return [
+        {
+            "bucket_start": datetime.fromtimestamp(key[0], timezone.utc),
+            "bucket_seconds": key[1],
+            **dict(zip(group_by, key[2:])),
+            "events": events
+        }
+        for key, events in sorted(points.items(), key=lambda item: (item[0][:2], tuple(value or "" for value in item[0][2:])))
+    ]
@@ -0,0 +1,453 @@
+import asyncio
+import json
+import mmap
+import os
+import struct
+import uuid
+import zlib
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.event_store import (
+    STRING_COLUMNS, StringDictionary, TimeIndex, extra_fields, from_micros, string_values, to_micros
+)
+
+# Records per segment file (64 MiB of records); a full segment is fsynced and
+# never written again, and a new one is started
+DEFAULT_SEGMENT_RECORDS = 1 << 20
+
+# Metadata and fields outside the fixed layout, JSON-encoded into one more dictionary column
+ATTRIBUTES_COLUMN = "attributes"
+DICTIONARY_COLUMNS = STRING_COLUMNS + [ATTRIBUTES_COLUMN]
+
+# One event: UUID halves, recorded_at micros, a code per dictionary column and
+# a CRC32 of the preceding bytes, 64 bytes in all
+RECORD_DTYPE = np.dtype(
+    [("id_high", "<u8"), ("id_low", "<u8"), ("recorded_at", "<i8")]
+    + [(name, "<i4") for name in DICTIONARY_COLUMNS]
+    + [("checksum", "<u4")]
+)
+RECORD_SIZE = RECORD_DTYPE.itemsize
+RECORD_BODY = struct.Struct("<QQq" + "i" * len(DICTIONARY_COLUMNS))
+
+# Segment header, padded to one record: magic, format version, record size, first row
+SEGMENT_MAGIC = b"ABEVSEG1"
+SEGMENT_HEADER = struct.Struct("<8sIIQ")
+HEADER_SIZE = RECORD_SIZE
+
+# Dictionary log entry: column index, value length, CRC32 of the value, then the UTF-8 value
+DICTIONARY_ENTRY = struct.Struct("<BII")
+
+class Segment:
+    """
+    One segment file and a read-only memory map over its records.
+
+    The map covers the records present when it was made; reads past it
+    remap the (grown) file. Old maps are left to the garbage collector,
+    since NumPy views handed out earlier may still point into them.
+    """
+
+    __slots__ = ("path", "first_row", "count", "_records")
+
+    def __init__(self, path: str, first_row: int, count: int):
+        self.path = path
+        self.first_row = first_row
+        self.count = count
+        self._records: Optional[np.ndarray] = None
+
+    def records(self) -> np.ndarray:
+        """Structured NumPy view of the segment's records."""
+        if self._records is None or len(self._records) < self.count:
+            with open(self.path, "rb") as file:
+                mapped = mmap.mmap(file.fileno(), HEADER_SIZE + self.count * RECORD_SIZE, access=mmap.ACCESS_READ)
+            self._records = np.frombuffer(mapped, dtype=RECORD_DTYPE, count=self.count, offset=HEADER_SIZE)
+        return self._records[:self.count]
+
+class SegmentEventLog:
+    """
+    Durable, append-only event log in a directory of fixed-layout segment files.
+
+    Events are stored as 64-byte records (see RECORD_DTYPE): string fields
+    are dictionary-encoded, with every new dictionary value appended to
+    dictionary.log before a record can refer to it. Appends are plain
+    writes; fsync() makes them durable, and callers share one fsync per
+    commit through GroupCommit.
+
+    Reads go through memory-mapped NumPy views of the segments, so stats
+    rebuilds are column scans and exports gather batches of records without
+    parsing them one by one. The per-experiment time index is rebuilt from
+    those views on open. The interface matches ColumnarEventStore, so
+    MockDatabase's query code works over either.
+
+    Opening the log recovers from a crash: torn or corrupt entries at the end
+    of the dictionary log and of the last segment (anything written after
+    the last completed fsync) are truncated away.
+    """
+
+    def __init__(self, directory: str, segment_records: int = DEFAULT_SEGMENT_RECORDS):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.length = 0
+        self.dictionaries: Dict[str, StringDictionary] = {name: StringDictionary() for name in DICTIONARY_COLUMNS}
+        self.segments: List[Segment] = []
+        self._first_rows: List[int] = []
+        self.experiment_index: Dict[int, TimeIndex] = {}
+        # Bytes and records dropped by recovery on open
+        self.recovered: Dict[str, int] = {"dictionary_bytes": 0, "records": 0}
+        self._dictionary_fd: Optional[int] = None
+        self._segment_fd: Optional[int] = None
+        # Descriptors of full segments, already fsynced, closed by the next fsync()
+        self._retired_fds: List[int] = []
+
+    def __len__(self) -> int:
+        return self.length
+
+    def open(self) -> None:
+        """Load (and if needed repair) the log, creating the directory on first use."""
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_dictionaries()
+        self._load_segments()
+        self._build_index()
+        self._dictionary_fd = os.open(self._path("dictionary.log"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if not self.segments or self.segments[-1].count >= self.segment_records:
+            self._start_segment()
+        else:
+            self._segment_fd = os.open(self.segments[-1].path, os.O_WRONLY | os.O_APPEND)
+
+    def close(self) -> None:
+        """fsync and close the files; the log can be reopened afterwards."""
+        if self._segment_fd is None:
+            return
+        self.fsync()
+        os.close(self._dictionary_fd)
+        os.close(self._segment_fd)
+        self._dictionary_fd = self._segment_fd = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_dictionaries(self) -> None:
+        path = self._path("dictionary.log")
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as file:
+            data = file.read()
+        position = 0
+        while position + DICTIONARY_ENTRY.size <= len(data):
+            column, length, checksum = DICTIONARY_ENTRY.unpack_from(data, position)
+            end = position + DICTIONARY_ENTRY.size + length
+            value = data[position + DICTIONARY_ENTRY.size:end]
+            if column >= len(DICTIONARY_COLUMNS) or end > len(data) or zlib.crc32(value) != checksum:
+                break
+            self.dictionaries[DICTIONARY_COLUMNS[column]].encode(value.decode("utf-8"))
+            position = end
+        if position < len(data):
+            self.recovered["dictionary_bytes"] = len(data) - position
+            os.truncate(path, position)
+
+    def _load_segments(self) -> None:
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".seg"))
+        for number, name in enumerate(names):
+            path = self._path(name)
+            with open(path, "rb") as file:
+                header = file.read(HEADER_SIZE)
+            magic, version, record_size, first_row = SEGMENT_HEADER.unpack_from(header.ljust(HEADER_SIZE, b"\0"))
+            if magic != SEGMENT_MAGIC or record_size != RECORD_SIZE or first_row != self.length:
+                if number == len(names) - 1 and len(header) < HEADER_SIZE:
+                    # Crashed while starting this segment
+                    os.remove(path)
+                    break
+                raise ValueError(f"{path} is not a segment of this log")
+            count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+            segment = Segment(path, first_row, count)
+            if number == len(names) - 1:
+                self._repair_tail(segment)
+            elif self._dangling(segment.records()) < count:
+                # Full segments were fsynced along with the dictionary, so this is not a crash
+                raise ValueError(f"{path} refers to values missing from dictionary.log")
+            self.segments.append(segment)
+            self._first_rows.append(first_row)
+            self.length += segment.count
+
+    def _dangling(self, records: np.ndarray) -> int:
+        """Position of the first record with a code missing from the dictionaries (len(records) if none)."""
+        first = len(records)
+        for name in DICTIONARY_COLUMNS:
+            bad = np.flatnonzero(records[name] >= len(self.dictionaries[name]))
+            if len(bad):
+                first = min(first, int(bad[0]))
+        return first
+
+    def _repair_tail(self, segment: Segment) -> None:
+        """Truncate the last segment at its first torn, corrupt or dangling record."""
+        valid = segment.count
+        if valid:
+            records = segment.records()
+            valid = self._dangling(records)
+            raw = records.view(np.uint8).reshape(-1, RECORD_SIZE)
+            checksums = records["checksum"]
+            for position in range(valid):
+                if zlib.crc32(raw[position, :RECORD_BODY.size]) != checksums[position]:
+                    valid = position
+                    break
+        size = HEADER_SIZE + valid * RECORD_SIZE
+        if os.path.getsize(segment.path) != size:
+            self.recovered["records"] += segment.count - valid
+            segment._records = None
+            os.truncate(segment.path, size)
+        segment.count = valid
+
+    def _build_index(self) -> None:
+        """Rebuild the per-experiment time indexes with one sort over the mapped columns."""
+        if not self.length:
+            return
+        experiments = self.codes("experiment_id")
+        timestamps = self.codes("recorded_at")
+        order = np.lexsort((timestamps, experiments))
+        experiments, timestamps = experiments[order], timestamps[order]
+        boundaries = np.flatnonzero(np.diff(experiments)) + 1
+        for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(order)]):
+            index = TimeIndex()
+            index.timestamps = array("q", timestamps[start:end].tobytes())
+            index.rows = array("q", order[start:end].astype(np.int64).tobytes())
+            self.experiment_index[int(experiments[start])] = index
+
+    def _start_segment(self) -> None:
+        if self._segment_fd is not None:
+            # The full segment is never written again; make it durable now
+            os.fsync(self._dictionary_fd)
+            os.fsync(self._segment_fd)
+            self._retired_fds.append(self._segment_fd)
+        path = self._path(f"{self.length:016d}.seg")
+        self._segment_fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_EXCL, 0o644)
+        os.write(self._segment_fd, SEGMENT_HEADER.pack(SEGMENT_MAGIC, 1, RECORD_SIZE, self.length).ljust(HEADER_SIZE, b"\0"))
+        os.fsync(self._segment_fd)
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.segments.append(Segment(path, self.length, 0))
+        self._first_rows.append(self.length)
+
+    def _encode(self, name: str, value: Optional[str], entries: bytearray) -> int:
+        dictionary = self.dictionaries[name]
+        if value is None:
+            return 0
+        code = dictionary.lookup(value)
+        if code is None:
+            code = dictionary.encode(value)
+            encoded = value.encode("utf-8")
+            entries += DICTIONARY_ENTRY.pack(DICTIONARY_COLUMNS.index(name), len(encoded), zlib.crc32(encoded))
+            entries += encoded
+        return code
+
+    def append(self, event: Dict[str, Any]) -> int:
+        """Append an event record (with "id" and "recorded_at") and return its row number."""
+        return self.append_many([event])[0]
+
+    def append_many(self, events: List[Dict[str, Any]]) -> List[int]:
+        """
+        Append event records with one write per file, returning their row numbers.
+
+        The records are readable immediately and durable after the next fsync().
+        """
+        rows: List[int] = []
+        entries, records, pending = bytearray(), bytearray(), []
+        for event in events:
+            if self.segments[-1].count + len(pending) >= self.segment_records:
+                rows += self._write(entries, records, pending)
+                entries, records, pending = bytearray(), bytearray(), []
+                self._start_segment()
+            codes = [self._encode(name, value, entries) for name, value in zip(STRING_COLUMNS, string_values(event))]
+
+            attributes = extra_fields(event)
+            event_id = event.get("id")
+            id_int = 0
+            if event_id is not None:
+                try:
+                    id_int = uuid.UUID(event_id).int
+                except (TypeError, ValueError):
+                    attributes["id"] = event_id
+            if event.get("metadata"):
+                attributes["metadata"] = event["metadata"]
+            codes.append(self._encode(
+                ATTRIBUTES_COLUMN,
+                json.dumps(attributes, sort_keys=True, default=str) if attributes else None,
+                entries
+            ))
+
+            recorded_at = event.get("recorded_at")
+            timestamp = to_micros(recorded_at) if recorded_at is not None else 0
+            body = RECORD_BODY.pack(id_int >> 64, id_int & 0xFFFFFFFFFFFFFFFF, timestamp, *codes)
+            records += body
+            records += zlib.crc32(body).to_bytes(4, "little")
+            pending.append((timestamp, codes[1]))
+        rows += self._write(entries, records, pending)
+        return rows
+
+    def _write(self, entries: bytearray, records: bytearray, pending: List[Tuple[int, int]]) -> List[int]:
+        # Dictionary entries go first, so a record only reaches the disk before
+        # the values it refers to if the disk reorders writes; recovery then
+        # truncates the dangling records
+        if entries:
+            os.write(self._dictionary_fd, entries)
+        if records:
+            os.write(self._segment_fd, records)
+        first = self.length
+        for offset, (timestamp, experiment_code) in enumerate(pending):
+            index = self.experiment_index.get(experiment_code)
+            if index is None:
+                index = self.experiment_index[experiment_code] = TimeIndex()
+            index.add(timestamp, first + offset)
+        self.length += len(pending)
+        self.segments[-1].count += len(pending)
+        return list(range(first, self.length))
+
+    def fsync(self) -> None:
+        """Flush every append so far to disk (blocking; run it in an executor from async code)."""
+        retired, self._retired_fds = self._retired_fds, []
+        for fd in retired:
+            os.close(fd)
+        os.fsync(self._dictionary_fd)
+        os.fsync(self._segment_fd)
+
+    def _locate(self, row: int) -> Tuple[Segment, int]:
+        segment = self.segments[bisect_right(self._first_rows, row) - 1]
+        return segment, row - segment.first_row
+
+    def _materialise(self, values: Tuple) -> Dict[str, Any]:
+        id_high, id_low, timestamp = values[:3]
+        codes = values[3:3 + len(DICTIONARY_COLUMNS)]
+        record = {"id": str(uuid.UUID(int=(id_high << 64) | id_low)), "recorded_at": from_micros(timestamp)}
+        for name, code in zip(STRING_COLUMNS, codes):
+            record[name] = self.dictionaries[name].values[code]
+        record["metadata"] = {}
+        if codes[-1]:
+            record.update(json.loads(self.dictionaries[ATTRIBUTES_COLUMN].values[codes[-1]]))
+        return record
+
+    def row(self, row: int) -> Dict[str, Any]:
+        """Materialise a row as an event dict."""
+        segment, offset = self._locate(row)
+        return self._materialise(segment.records()[offset].item())
+
+    def take(self, rows: List[int]) -> np.ndarray:
+        """Gather the raw records of many rows, in order, with one NumPy take per segment."""
+        numbers = np.asarray(rows, dtype=np.int64)
+        positions = np.searchsorted(np.asarray(self._first_rows, dtype=np.int64), numbers, side="right") - 1
+        taken = np.empty(len(numbers), dtype=RECORD_DTYPE)
+        for segment_number in np.unique(positions).tolist():
+            segment = self.segments[segment_number]
+            selected = positions == segment_number
+            taken[selected] = segment.records()[numbers[selected] - segment.first_row]
+        return taken
+
+    def materialise(self, records: np.ndarray) -> List[Dict[str, Any]]:
+        """Decode raw records (from take) into event dicts."""
+        return [self._materialise(values) for values in records.tolist()]
+
+    def rows(self, rows: List[int]) -> List[Dict[str, Any]]:
+        """Materialise many rows as event dicts."""
+        return self.materialise(self.take(rows))
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        if row < 0:
+            row += self.length
+        if not 0 <= row < self.length:
+            raise IndexError("event index out of range")
+        return self.row(row)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for segment in self.segments:
+            for values in segment.records().tolist():
+                yield self._materialise(values)
+
+    def iter_experiment(
+        self,
+        experiment_id: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        after: Optional[Tuple[int, int]] = None,
+        descending: bool = True
+    ) -> Iterator[Tuple[int, int]]:
+        """Yield (recorded_at micros, row) for an experiment's events in time order."""
+        code = self.lookup("experiment_id", experiment_id)
+        index = self.experiment_index.get(code) if code else None
+        if index is None:
+            return iter(())
+        return index.iter_rows(
+            to_micros(since) if since is not None else None,
+            to_micros(until) if until is not None else None,
+            after,
+            descending
+        )
+
+    def codes(self, name: str) -> np.ndarray:
+        """NumPy array of a column's raw values (dictionary codes, int64 micros, ...)."""
+        if not self.segments:
+            return np.empty(0, dtype=RECORD_DTYPE[name])
+        return np.concatenate([segment.records()[name] for segment in self.segments])
+
+    def lookup(self, name: str, value: Optional[str]) -> Optional[int]:
+        """Dictionary code of a string value, or None if it never occurred."""
+        return self.dictionaries[name].lookup(value)
+
+    def decode(self, name: str, code: int) -> Optional[str]:
+        return self.dictionaries[name].decode(code)
+
+    def nbytes(self) -> int:
+        """Approximate memory held outside the page cache, in bytes."""
+        total = sum(dictionary.nbytes() for dictionary in self.dictionaries.values())
+        total += sum(index.rows.itemsize * len(index) * 2 for index in self.experiment_index.values())
+        return total
+
+    def disk_bytes(self) -> int:
+        """Size of the segment and dictionary files."""
+        total = os.path.getsize(self._path("dictionary.log")) if os.path.exists(self._path("dictionary.log")) else 0
+        return total + sum(os.path.getsize(segment.path) for segment in self.segments)
+
+class GroupCommit:
+    """
+    Shares fsync calls between concurrent writers.
+
+    A writer appends, then awaits commit(). If no fsync is running one is
+    started; writers arriving while it runs wait for the next one, which
+    then covers all of them. Under load a single fsync acknowledges many
+    writes, and an idle writer still pays only one. `delay` optionally
+    holds each fsync back to gather more writers.
+    """
+
+    def __init__(self, sync: Callable[[], None], delay: float = 0.0):
+        self.sync = sync
+        self.delay = delay
+        self.commits = 0
+        self.fsyncs = 0
+        self._requested = 0
+        self._synced = 0
+        self._flushing: Optional[asyncio.Future] = None
+
+    async def commit(self) -> None:
+        """Return once everything written before the call is on disk."""
+        self.commits += 1
+        self._requested += 1
+        target = self._requested
+        while self._synced < target:
+            if self._flushing is None:
+                self._flushing = asyncio.ensure_future(self._flush())
+            await asyncio.shield(self._flushing)
+
+    async def _flush(self) -> None:
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            target = self._requested
+            await asyncio.get_running_loop().run_in_executor(None, self.sync)
+            self.fsyncs += 1
+            self._synced = target
+        finally:
+            self._flushing = None
@@ -0,0 +1,258 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.bitmap import RoaringBitmap
+
+# Fields of events and assignments that stats can be sliced by
+SEGMENT_DIMENSIONS = ("device_type", "geo_location")
+
+# A segment: dimension -> accepted values. Dimensions must all match; any one
+# of a dimension's values does. A list of segments matches what any segment matches
+Segment = Dict[str, List[str]]
+
+def parse_segment(text: str) -> Segment:
+    """
+    Parse a segment filter such as "device_type:mobile,geo_location:DE|AT".
+
+    Comma-separated terms must all match; `|` separates alternative values
+    of one dimension. A dimension given twice must match both terms.
+
+    Raises:
+        ValueError: If a term is malformed or names an unknown dimension
+    """
+    segment: Segment = {}
+    for term in text.split(","):
+        dimension, separator, values = term.strip().partition(":")
+        dimension = dimension.strip()
+        if not separator or dimension not in SEGMENT_DIMENSIONS:
+            raise ValueError(
+                f"Invalid segment term '{term.strip()}': expected dimension:value[|value...] "
+                f"with dimension one of {', '.join(SEGMENT_DIMENSIONS)}"
+            )
+        accepted = [value.strip() for value in values.split("|") if value.strip()]
+        if not accepted:
+            raise ValueError(f"Segment term '{term.strip()}' has no values")
+        if dimension in segment:
+            accepted = [value for value in segment[dimension] if value in accepted]
+        segment[dimension] = accepted
+    return segment
+
+def segment_where(segments: List[Segment], condition: Callable[[str, List[str]], str]) -> str:
+    """
+    SQL condition matching rows in any of the segments.
+
+    Args:
+        segments: Parsed segments
+        condition: Builds the condition for one dimension's accepted values,
+            binding them as a parameter in the backend's own style
+
+    Returns:
+        Condition text, e.g. "((device_type = ANY($2) AND geo_location = ANY($3)) OR (...))"
+    """
+    groups = []
+    for segment in segments:
+        terms = [condition(dimension, values) for dimension, values in segment.items()]
+        groups.append("(" + " AND ".join(terms) + ")" if terms else "TRUE")
+    return "(" + " OR ".join(groups) + ")"
+
+def _plain(value: Any) -> Optional[str]:
+    # Assignments may carry the DeviceType enum rather than its value
+    return getattr(value, "value", value)
+
+class ExperimentSegments:
+    """
+    Bitmap indexes of one experiment's events and assigned users.
+
+    Events are numbered in the order they are stored, and users in the order
+    they were first assigned. For each device type and location there is a
+    bitmap of the event ordinals and one of the user ordinals carrying it,
+    plus a bitmap of events per (variant, event_type) and of users per
+    variant. A segment query ORs the bitmaps of each dimension's values,
+    ANDs the dimensions and ORs the segments, then counts the result's
+    intersection with each variant's bitmaps; no event is visited.
+    """
+
+    def __init__(self):
+        self.event_count = 0
+        self.event_values: Dict[str, Dict[str, RoaringBitmap]] = {dimension: {} for dimension in SEGMENT_DIMENSIONS}
+        self.event_groups: Dict[Tuple[str, str], RoaringBitmap] = {}
+        self.user_ordinals: Dict[str, int] = {}
+        self.user_values: Dict[str, Dict[str, RoaringBitmap]] = {dimension: {} for dimension in SEGMENT_DIMENSIONS}
+        self.user_variants: Dict[str, RoaringBitmap] = {}
+
+    def add_event(self, event: Dict[str, Any]) -> None:
+        ordinal = self.event_count
+        self.event_count += 1
+        for dimension in SEGMENT_DIMENSIONS:
+            value = _plain(event.get(dimension))
+            if value is not None:
+                bitmap = self.event_values[dimension].get(value)
+                if bitmap is None:
+                    bitmap = self.event_values[dimension][value] = RoaringBitmap()
+                bitmap.add(ordinal)
+        group = (event["variant"], event["event_type"])
+        bitmap = self.event_groups.get(group)
+        if bitmap is None:
+            bitmap = self.event_groups[group] = RoaringBitmap()
+        bitmap.add(ordinal)
+
+    def add_assignment(self, assignment: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> None:
+        """Index a user's assignment, replacing their previous one if the assignment was overwritten."""
+        ordinal = self.user_ordinals.get(assignment["user_id"])
+        if ordinal is None:
+            ordinal = self.user_ordinals[assignment["user_id"]] = len(self.user_ordinals)
+        elif previous is not None:
+            self._index_user(ordinal, previous, remove=True)
+        self._index_user(ordinal, assignment)
+
+    def _index_user(self, ordinal: int, assignment: Dict[str, Any], remove: bool = False) -> None:
+        indexes = [(self.user_variants, assignment["variant"])]
+        indexes += [(self.user_values[dimension], _plain(assignment.get(dimension))) for dimension in SEGMENT_DIMENSIONS]
+        for bitmaps, value in indexes:
+            if value is None:
+                continue
+            bitmap = bitmaps.get(value)
+            if remove:
+                if bitmap is not None:
+                    bitmap.discard(ordinal)
+            else:
+                if bitmap is None:
+                    bitmap = bitmaps[value] = RoaringBitmap()
+                bitmap.add(ordinal)
+
+    @staticmethod
+    def _select(indexes: Dict[str, Dict[str, RoaringBitmap]], segments: List[Segment]) -> RoaringBitmap:
+        matched = []
+        for segment in segments:
+            terms = sorted(
+                (
+                    RoaringBitmap.union_all(indexes[dimension][value] for value in values if value in indexes[dimension])
+                    for dimension, values in segment.items()
+                ),
+                key=len
+            )
+            # Intersect from the smallest term, stopping once nothing is left
+            selected = terms[0]
+            for term in terms[1:]:
+                if not selected:
+                    break
+                selected = selected & term
+            matched.append(selected)
+        return matched[0] if len(matched) == 1 else RoaringBitmap.union_all(matched)
+
+    def counts(self, segments: List[Segment]) -> Tuple[Dict[str, int], Dict[str, Dict[str, int]]]:
+        """
+        Users per variant and events per variant and type, within the segments.
+
+        Returns:
+            (variant_distribution, event_counts) as summarize_stats takes them
+        """
+        users = self._select(self.user_values, segments)
+        variant_distribution = {}
+        for variant, bitmap in self.user_variants.items():
+            count = users.intersection_cardinality(bitmap)
+            if count:
+                variant_distribution[variant] = count
+        events = self._select(self.event_values, segments)
+        event_counts: Dict[str, Dict[str, int]] = {}
+        for (variant, event_type), bitmap in self.event_groups.items():
+            count = events.intersection_cardinality(bitmap)
+            if count:
+                event_counts.setdefault(variant, {})[event_type] = count
+        return variant_distribution, event_counts
+
+    def bitmaps(self) -> Iterator[RoaringBitmap]:
+        for by_value in list(self.event_values.values()) + list(self.user_values.values()):
+            yield from by_value.values()
+        yield from self.event_groups.values()
+        yield from self.user_variants.values()
+
+def _group_ordinals(codes: np.ndarray) -> Iterator[Tuple[int, np.ndarray]]:
+    """(code, sorted positions holding it) for each distinct code."""
+    order = np.argsort(codes, kind="stable")
+    ordered = codes[order]
+    boundaries = np.flatnonzero(np.diff(ordered)) + 1
+    for positions in np.split(order, boundaries):
+        if len(positions):
+            yield int(codes[positions[0]]), positions
+
+class SegmentIndex:
+    """
+    Per-experiment segment bitmaps (ExperimentSegments), maintained on write by MockDatabase.
+
+    Stats without segments come from the running counters; this index only
+    answers segment-filtered stats. rebuild() builds it from the raw event
+    columns and assignments in bulk, with each bitmap built from a sorted
+    array of ordinals rather than value by value.
+    """
+
+    def __init__(self):
+        self.experiments: Dict[str, ExperimentSegments] = {}
+
+    def _experiment(self, experiment_id: str) -> ExperimentSegments:
+        segments = self.experiments.get(experiment_id)
+        if segments is None:
+            segments = self.experiments[experiment_id] = ExperimentSegments()
+        return segments
+
+    def add_event(self, event: Dict[str, Any]) -> None:
+        self._experiment(event["experiment_id"]).add_event(event)
+
+    def add_assignment(self, assignment: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> None:
+        self._experiment(assignment["experiment_id"]).add_assignment(assignment, previous)
+
+    def counts(self, experiment_id: str, segments: List[Segment]) -> Tuple[Dict[str, int], Dict[str, Dict[str, int]]]:
+        experiment = self.experiments.get(experiment_id)
+        if experiment is None:
+            return {}, {}
+        return experiment.counts(segments)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the bitmaps, in bytes (user id ordinals not included)."""
+        return sum(bitmap.nbytes() for experiment in self.experiments.values() for bitmap in experiment.bitmaps())
+
+    @classmethod
+    def rebuild(cls, events, assignments: Iterable[Dict[str, Any]]) -> "SegmentIndex":
+        """
+        Build the index from an event store (ColumnarEventStore or SegmentEventLog) and assignment records.
+
+        Event ordinals follow row order and user ordinals the assignments'
+        order, matching what adding them one at a time would give.
+        """
+        index = cls()
+        if len(events):
+            experiment_codes = events.codes("experiment_id")
+            columns = {name: events.codes(name) for name in SEGMENT_DIMENSIONS + ("variant", "event_type")}
+            type_count = int(columns["event_type"].max()) + 1
+            for experiment_code, rows in _group_ordinals(experiment_codes):
+                experiment = index._experiment(events.decode("experiment_id", experiment_code))
+                experiment.event_count = len(rows)
+                for dimension in SEGMENT_DIMENSIONS:
+                    for code, ordinals in _group_ordinals(columns[dimension][rows]):
+                        if code:
+                            value = events.decode(dimension, code)
+                            experiment.event_values[dimension][value] = RoaringBitmap.from_sorted(ordinals)
+                groups = columns["variant"][rows].astype(np.int64) * type_count + columns["event_type"][rows]
+                for code, ordinals in _group_ordinals(groups):
+                    group = (events.decode("variant", code // type_count), events.decode("event_type", code % type_count))
+                    experiment.event_groups[group] = RoaringBitmap.from_sorted(ordinals)
+
+        # experiment_id -> index name -> value -> user ordinals
+        users: Dict[str, Dict[str, Dict[str, List[int]]]] = {}
+        for assignment in assignments:
+            experiment = index._experiment(assignment["experiment_id"])
+            ordinal = experiment.user_ordinals.setdefault(assignment["user_id"], len(experiment.user_ordinals))
+            by_index = users.setdefault(assignment["experiment_id"], {})
+            by_index.setdefault("variant", {}).setdefault(assignment["variant"], []).append(ordinal)
+            for dimension in SEGMENT_DIMENSIONS:
+                value = _plain(assignment.get(dimension))
+                if value is not None:
+                    by_index.setdefault(dimension, {}).setdefault(value, []).append(ordinal)
+        for experiment_id, by_index in users.items():
+            experiment = index.experiments[experiment_id]
+            for name, by_value in by_index.items():
+                bitmaps = experiment.user_variants if name == "variant" else experiment.user_values[name]
+                for value, ordinals in by_value.items():
+                    bitmaps[value] = RoaringBitmap.from_sorted(np.unique(ordinals))
+        return index
@@ -0,0 +1,691 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers fall back to SQLite's busy timeout
+    fcntl = None
+
+from app.utils.database import decode_cursor, default_experiments, encode_cursor, summarize_stats
+from app.utils.event_ids import generate_event_id
+from app.utils.hyperloglog import HyperLogLog, UserSketches, merge_serialized, sketch_rows
+from app.utils.rollups import DAY, HOUR, MINUTE, RollupRow, bucket_start
+from app.utils.segments import Segment, segment_where
+
+# Schema shipped with the repo, applied on connect (every statement is IF NOT EXISTS)
+SCHEMA_PATH = Path(__file__).resolve().parents[3] / "db" / "experiments_schema_sqlite.sql"
+
+UTC_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+EVENT_COLUMNS = [
+    "id", "recorded_at", "user_id", "experiment_id", "variant", "event_type",
+    "campaign_id", "ad_id", "device_type", "geo_location", "metadata"
+]
+
+# The primary key is the final duplicate check: a resent event id is skipped, not an error
+INSERT_EVENT_SQL = f"""
+    INSERT INTO experiment_events ({", ".join(EVENT_COLUMNS)})
+    VALUES ({", ".join("?" for _ in EVENT_COLUMNS)})
+    ON CONFLICT (id) DO NOTHING
+"""
+
+# Which of a batch's ids are already stored (one JSON array, read under the write lock)
+STORED_EVENT_IDS_SQL = "SELECT id FROM experiment_events WHERE id IN (SELECT value FROM json_each(?))"
+
+ADD_EVENT_COUNTS_SQL = """
+    INSERT INTO experiment_event_counts (experiment_id, variant, event_type, events)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (experiment_id, variant, event_type)
+    DO UPDATE SET events = events + excluded.events
+"""
+
+# A batch's sketch is merged into the stored one register by register
+ADD_USER_SKETCH_SQL = """
+    INSERT INTO experiment_user_sketches (experiment_id, variant, event_type, sketch)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (experiment_id, variant, event_type)
+    DO UPDATE SET sketch = hll_merge(sketch, excluded.sketch)
+"""
+
+ROLLUP_KEY = "experiment_id, bucket_seconds, bucket_start, variant, event_type, device_type, geo_location"
+
+ADD_ROLLUP_SQL = f"""
+    INSERT INTO experiment_event_rollups ({ROLLUP_KEY}, events)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT ({ROLLUP_KEY})
+    DO UPDATE SET events = events + excluded.events
+"""
+
+ROLLUPS_SQL = """
+    SELECT bucket_seconds, bucket_start, variant, event_type, device_type, geo_location, events
+    FROM experiment_event_rollups
+    WHERE experiment_id = ? AND bucket_seconds = ? AND bucket_start >= ? AND bucket_start < ?
+"""
+
+# Sum one width's buckets older than a cutoff into the next width, then drop them
+COMPACT_ROLLUPS_SQL = f"""
+    INSERT INTO experiment_event_rollups ({ROLLUP_KEY}, events)
+    SELECT experiment_id, :coarse, bucket_start / :coarse_micros * :coarse_micros,
+           variant, event_type, device_type, geo_location, sum(events)
+    FROM experiment_event_rollups
+    WHERE bucket_seconds = :fine AND bucket_start < :before
+    GROUP BY experiment_id, bucket_start / :coarse_micros, variant, event_type, device_type, geo_location
+    ON CONFLICT ({ROLLUP_KEY})
+    DO UPDATE SET events = events + excluded.events
+"""
+
+DELETE_ROLLUPS_SQL = "DELETE FROM experiment_event_rollups WHERE bucket_seconds = :fine AND bucket_start < :before"
+
+# Grouped by position so NULL and empty dimensions, stored alike as '', fall in one group
+RAW_ROLLUPS_SQL = f"""
+    SELECT experiment_id, {MINUTE}, recorded_at / {MINUTE * 1_000_000} * {MINUTE * 1_000_000},
+           variant, event_type, coalesce(device_type, ''), coalesce(geo_location, ''), count(*)
+    FROM experiment_events
+    GROUP BY 1, 3, 4, 5, 6, 7
+"""
+
+GET_ASSIGNMENT_SQL = """
+    SELECT user_id, experiment_id, variant, device_type, geo_location, assigned_at
+    FROM assignments WHERE experiment_id = ? AND user_id = ?
+"""
+
+# Experiment ids are passed as one JSON array so the statement text never changes
+GET_ASSIGNMENTS_SQL = """
+    SELECT user_id, experiment_id, variant, device_type, geo_location, assigned_at
+    FROM assignments WHERE user_id = ? AND experiment_id IN (SELECT value FROM json_each(?))
+"""
+
+SAVE_ASSIGNMENT_SQL = """
+    INSERT INTO assignments (experiment_id, user_id, variant, device_type, geo_location, assigned_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (experiment_id, user_id) DO NOTHING
+"""
+
+ADD_VARIANT_COUNT_SQL = """
+    INSERT INTO experiment_variant_counts (experiment_id, variant, users)
+    VALUES (?, ?, 1)
+    ON CONFLICT (experiment_id, variant)
+    DO UPDATE SET users = users + 1
+"""
+
+GET_EXPERIMENT_SQL = """
+    SELECT experiment_id, name, description, status, variants, start_date, end_date,
+           allocation_mode, exploration_floor, layer, layer_range, targeting
+    FROM experiments WHERE experiment_id = ?
+"""
+
+GET_EXPERIMENTS_SQL = """
+    SELECT experiment_id, name, description, status, variants, start_date, end_date,
+           allocation_mode, exploration_floor, layer, layer_range, targeting
+    FROM experiments ORDER BY experiment_id
+"""
+
+SEED_EXPERIMENT_SQL = """
+    INSERT INTO experiments (
+        experiment_id, name, description, status, variants, start_date, end_date,
+        allocation_mode, exploration_floor, layer, layer_range, targeting
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (experiment_id) DO NOTHING
+"""
+
+UPDATE_EXPERIMENT_VARIANTS_SQL = "UPDATE experiments SET variants = ? WHERE experiment_id = ?"
+
+LIST_EXPERIMENTS_SQL = "SELECT experiment_id FROM experiments ORDER BY experiment_id"
+
+EVENT_SELECT_SQL = f"SELECT {', '.join(EVENT_COLUMNS)} FROM experiment_events"
+
+VARIANT_COUNTS_SQL = "SELECT variant, users FROM experiment_variant_counts WHERE experiment_id = ?"
+
+EVENT_COUNTS_SQL = "SELECT variant, event_type, events FROM experiment_event_counts WHERE experiment_id = ?"
+
+# Segment-filtered stats: users from the assignments (keyed by experiment first),
+# events from the rollups, which carry device_type and geo_location, instead of the raw events
+SEGMENT_VARIANT_COUNTS_SQL = """
+    SELECT variant, count(*) AS users FROM assignments
+    WHERE experiment_id = ? AND {segments} GROUP BY variant
+"""
+
+SEGMENT_EVENT_COUNTS_SQL = """
+    SELECT variant, event_type, sum(events) AS events FROM experiment_event_rollups
+    WHERE experiment_id = ? AND {segments} GROUP BY variant, event_type
+"""
+
+USER_SKETCHES_SQL = "SELECT variant, event_type, sketch FROM experiment_user_sketches WHERE experiment_id = ?"
+
+RAW_USERS_SQL = "SELECT experiment_id, variant, event_type, user_id FROM experiment_events"
+
+RAW_VARIANT_COUNTS_SQL = """
+    SELECT experiment_id, variant, count(*) AS users FROM assignments GROUP BY experiment_id, variant
+"""
+
+RAW_EVENT_COUNTS_SQL = """
+    SELECT experiment_id, variant, event_type, count(*) AS events
+    FROM experiment_events GROUP BY experiment_id, variant, event_type
+"""
+
+def to_micros(value: datetime) -> int:
+    """Convert a datetime to UTC microseconds since the epoch; naive values are local time."""
+    return (value.astimezone(timezone.utc) - UTC_EPOCH) // timedelta(microseconds=1)
+
+def from_micros(value: Optional[int]) -> Optional[datetime]:
+    return UTC_EPOCH + timedelta(microseconds=value) if value is not None else None
+
+class SqliteDatabase:
+    """
+    SQLite backend with the same interface as MockDatabase.
+
+    A single database file in WAL mode is shared by every worker process on
+    the host, so assignments, events and stats stay consistent when the app
+    runs with several uvicorn workers, without a PostgreSQL server. Readers
+    never block the writer; writers are serialised by SQLite and wait up to
+    busy_timeout for the write lock. Each process uses one connection on a
+    dedicated thread so blocking SQLite calls stay off the event loop.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock_file = None
+        # Sidecar files whose flock this process holds, by role
+        self._role_files: Dict[str, Any] = {}
+
+    async def _run(self, function: Callable, *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def _write(self, function: Callable[[sqlite3.Connection], Any]) -> Any:
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+        # wait on busy_timeout instead of failing on a lock upgrade
+        conn = self.conn
+        if self._lock_file is not None:
+            # SQLite's busy handler polls with sleeps of up to 100ms; a blocking
+            # flock hands the write lock to the next process as soon as it is released
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = function(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        finally:
+            if self._lock_file is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _connect(self) -> None:
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL makes NORMAL durable against application crashes; only an OS crash can lose the last commits
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.create_function("hll_merge", 2, merge_serialized, deterministic=True)
+        self.conn = conn
+        if fcntl is not None:
+            self._lock_file = open(self.path + "-lock", "a")
+        conn.executescript(SCHEMA_PATH.read_text())
+        # Files created before experiments had layers or targeting lack the columns
+        # (SQLite has no ADD COLUMN IF NOT EXISTS)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(experiments)")}
+        for column in ("layer", "layer_range", "targeting"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE experiments ADD COLUMN {column} TEXT")
+
+        def seed(conn: sqlite3.Connection) -> None:
+            for experiment in default_experiments().values():
+                conn.execute(SEED_EXPERIMENT_SQL, (
+                    experiment["experiment_id"],
+                    experiment["name"],
+                    experiment["description"],
+                    experiment["status"],
+                    json.dumps(experiment["variants"]),
+                    to_micros(experiment["start_date"]) if experiment["start_date"] else None,
+                    to_micros(experiment["end_date"]) if experiment["end_date"] else None,
+                    experiment.get("allocation_mode", "static"),
+                    experiment.get("exploration_floor"),
+                    experiment.get("layer"),
+                    json.dumps(experiment["layer_range"]) if experiment.get("layer_range") else None,
+                    json.dumps(experiment["targeting"]) if experiment.get("targeting") else None,
+                ))
+
+        self._write(seed)
+
+    async def connect(self) -> None:
+        """Open the database file, apply the schema and seed the demo experiments."""
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        await self._run(self._connect)
+
+    async def close(self) -> None:
+        """Close the connection."""
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self.conn = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        for role_file in self._role_files.values():
+            role_file.close()
+        self._role_files = {}
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _event_row(self, event_data: Dict[str, Any], recorded_at: int) -> tuple:
+        # Events stamped before reaching the database (by the route or the write-behind buffer) keep their id and time
+        stamped_at = event_data.get("recorded_at")
+        return (
+            event_data.get("id") or generate_event_id(),
+            to_micros(stamped_at) if stamped_at is not None else recorded_at,
+            event_data["user_id"],
+            event_data["experiment_id"],
+            event_data["variant"],
+            event_data["event_type"],
+            event_data.get("campaign_id"),
+            event_data.get("ad_id"),
+            event_data.get("device_type"),
+            event_data.get("geo_location"),
+            json.dumps(event_data.get("metadata") or {}),
+        )
+
+    def _insert_rows(self, conn: sqlite3.Connection, rows: List[tuple]) -> List[bool]:
+        # Drop ids already stored or repeated in the batch, so only new events are counted
+        stored = {row[0] for row in conn.execute(STORED_EVENT_IDS_SQL, (json.dumps([row[0] for row in rows]),))}
+        inserted = []
+        new_rows = []
+        for row in rows:
+            is_new = row[0] not in stored
+            if is_new:
+                stored.add(row[0])
+                new_rows.append(row)
+            inserted.append(is_new)
+
+        # Aggregate the batch so the counters and rollups take one upsert per key
+        counts: Dict[tuple, int] = {}
+        rollups: Dict[tuple, int] = {}
+        for row in new_rows:
+            key = (row[3], row[4], row[5])
+            counts[key] = counts.get(key, 0) + 1
+            key = (row[3], MINUTE, row[1] // 60_000_000 * 60_000_000, row[4], row[5], row[8] or "", row[9] or "")
+            rollups[key] = rollups.get(key, 0) + 1
+        conn.executemany(INSERT_EVENT_SQL, new_rows)
+        conn.executemany(ADD_EVENT_COUNTS_SQL, [(*key, count) for key, count in counts.items()])
+        conn.executemany(ADD_ROLLUP_SQL, [(*key, count) for key, count in rollups.items()])
+        conn.executemany(ADD_USER_SKETCH_SQL, sketch_rows([(row[3], row[4], row[5], row[2]) for row in new_rows]))
+        return inserted
+
+    async def insert_event(self, event_data: Dict[str, Any]) -> Optional[str]:
+        """Insert an event record, returning its id, or None if its id is already stored."""
+        event_ids = await self.insert_events([event_data])
+        return event_ids[0]
+
+    async def insert_events(self, events: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Insert a batch of event records in one transaction, returning their ids in order.
+
+        Events that already carry an "id" or "recorded_at" keep them. An event
+        whose id is already stored, or repeats one earlier in the batch, is
+        not written again and gets None.
+        """
+        if not events:
+            return []
+        recorded_at = to_micros(datetime.now(timezone.utc))
+        rows = [self._event_row(event_data, recorded_at) for event_data in events]
+        inserted = await self._run(self._write, lambda conn: self._insert_rows(conn, rows))
+        return [row[0] if new else None for row, new in zip(rows, inserted)]
+
+    def _assignment_from_row(self, row: sqlite3.Row) -> Dict[str, Any]:
+        assignment = dict(row)
+        assignment["assigned_at"] = from_micros(assignment["assigned_at"])
+        return assignment
+
+    async def get_assignment(self, user_id: str, experiment_id: str) -> Optional[Dict[str, Any]]:
+        """Get existing assignment for user and experiment."""
+        def fetch() -> Optional[sqlite3.Row]:
+            return self.conn.execute(GET_ASSIGNMENT_SQL, (experiment_id, user_id)).fetchone()
+
+        row = await self._run(fetch)
+        return self._assignment_from_row(row) if row else None
+
+    async def save_assignment(self, assignment_data: Dict[str, Any]) -> None:
+        """Save a new assignment; an existing assignment for the user is kept."""
+        device_type = assignment_data.get("device_type")
+        assigned_at = assignment_data.get("assigned_at") or datetime.now(timezone.utc)
+        params = (
+            assignment_data["experiment_id"],
+            assignment_data["user_id"],
+            assignment_data["variant"],
+            getattr(device_type, "value", device_type),
+            assignment_data.get("geo_location"),
+            to_micros(assigned_at),
+        )
+
+        def save(conn: sqlite3.Connection) -> None:
+            # Count the user only if this worker's insert won
+            if conn.execute(SAVE_ASSIGNMENT_SQL, params).rowcount:
+                conn.execute(ADD_VARIANT_COUNT_SQL, (params[0], params[2]))
+
+        await self._run(self._write, save)
+
+    async def get_assignments(self, user_id: str, experiment_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get a user's existing assignments for several experiments in one query, keyed by experiment id."""
+        def fetch() -> List[sqlite3.Row]:
+            return self.conn.execute(GET_ASSIGNMENTS_SQL, (user_id, json.dumps(experiment_ids))).fetchall()
+
+        rows = await self._run(fetch)
+        return {row["experiment_id"]: self._assignment_from_row(row) for row in rows}
+
+    async def save_assignments(self, assignments: List[Dict[str, Any]]) -> None:
+        """Save several new assignments in one transaction; existing assignments are kept."""
+        rows = []
+        for assignment_data in assignments:
+            device_type = assignment_data.get("device_type")
+            assigned_at = assignment_data.get("assigned_at") or datetime.now(timezone.utc)
+            rows.append((
+                assignment_data["experiment_id"],
+                assignment_data["user_id"],
+                assignment_data["variant"],
+                getattr(device_type, "value", device_type),
+                assignment_data.get("geo_location"),
+                to_micros(assigned_at),
+            ))
+
+        def save(conn: sqlite3.Connection) -> None:
+            for params in rows:
+                if conn.execute(SAVE_ASSIGNMENT_SQL, params).rowcount:
+                    conn.execute(ADD_VARIANT_COUNT_SQL, (params[0], params[2]))
+
+        if rows:
+            await self._run(self._write, save)
+
+    async def get_experiment(self, experiment_id: str) -> Optional[Dict[str, Any]]:
+        """Get experiment configuration."""
+        def fetch() -> Optional[sqlite3.Row]:
+            return self.conn.execute(GET_EXPERIMENT_SQL, (experiment_id,)).fetchone()
+
+        row = await self._run(fetch)
+        return self._experiment_from_row(row) if row else None
+
+    async def get_experiments(self) -> List[Dict[str, Any]]:
+        """Get every experiment configuration."""
+        def fetch() -> List[sqlite3.Row]:
+            return self.conn.execute(GET_EXPERIMENTS_SQL).fetchall()
+
+        return [self._experiment_from_row(row) for row in await self._run(fetch)]
+
+    def _experiment_from_row(self, row: sqlite3.Row) -> Dict[str, Any]:
+        experiment = dict(row)
+        experiment["variants"] = json.loads(experiment["variants"])
+        experiment["start_date"] = from_micros(experiment["start_date"])
+        experiment["end_date"] = from_micros(experiment["end_date"])
+        experiment["layer_range"] = json.loads(experiment["layer_range"]) if experiment["layer_range"] else None
+        experiment["targeting"] = json.loads(experiment["targeting"]) if experiment["targeting"] else None
+        return experiment
+
+    async def list_experiments(self) -> List[str]:
+        """List experiment ids."""
+        def fetch() -> List[str]:
+            return [row["experiment_id"] for row in self.conn.execute(LIST_EXPERIMENTS_SQL)]
+
+        return await self._run(fetch)
+
+    async def update_experiment_variants(self, experiment_id: str, variants: Dict[str, float]) -> None:
+        """Replace an experiment's variant allocation."""
+        params = (json.dumps(variants), experiment_id)
+        await self._run(self._write, lambda conn: conn.execute(UPDATE_EXPERIMENT_VARIANTS_SQL, params))
+
+    async def try_lead(self, role: str) -> bool:
+        """
+        Claim a role that one worker process runs at a time.
+
+        The claim is a non-blocking flock on a sidecar file, held until close,
+        so the operating system releases it when the holding worker exits and
+        the next worker to ask takes over.
+
+        Returns:
+            True if this process holds the role
+        """
+        if fcntl is None or role in self._role_files:
+            return True
+        role_file = open(f"{self.path}-{role}", "a")
+        try:
+            fcntl.flock(role_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            role_file.close()
+            return False
+        self._role_files[role] = role_file
+        return True
+
+    def _event_from_row(self, row: sqlite3.Row) -> Dict[str, Any]:
+        event = dict(row)
+        event["recorded_at"] = from_micros(event["recorded_at"])
+        event["metadata"] = json.loads(event["metadata"]) if event["metadata"] else {}
+        return event
+
+    def _select_events(
+        self,
+        experiment_id: str,
+        since: Optional[datetime],
+        until: Optional[datetime],
+        event_types: Optional[List[str]],
+        after: Optional[tuple],
+        descending: bool,
+        limit: int
+    ) -> List[sqlite3.Row]:
+        conditions = ["experiment_id = ?"]
+        args: List[Any] = [experiment_id]
+        if since is not None:
+            conditions.append("recorded_at >= ?")
+            args.append(to_micros(since))
+        if until is not None:
+            conditions.append("recorded_at < ?")
+            args.append(to_micros(until))
+        if event_types is not None:
+            conditions.append(f"event_type IN ({', '.join('?' for _ in event_types)})")
+            args.extend(event_types)
+        if after is not None:
+            conditions.append("(recorded_at, id) < (?, ?)" if descending else "(recorded_at, id) > (?, ?)")
+            args.extend(after)
+        order = "DESC" if descending else "ASC"
+        sql = (
+            EVENT_SELECT_SQL
+            + " WHERE " + " AND ".join(conditions)
+            + f" ORDER BY recorded_at {order}, id {order} LIMIT ?"
+        )
+        args.append(limit)
+        return self.conn.execute(sql, args).fetchall()
+
+    async def get_experiment_events(self, experiment_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get the most recent events for an experiment, newest first."""
+        page = await self.query_experiment_events(experiment_id, limit)
+        return page["events"]
+
+    async def query_experiment_events(
+        self,
+        experiment_id: str,
+        limit: int = 100,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get a page of an experiment's events, newest first.
+
+        Keyset pagination on (recorded_at, id), served by the
+        (experiment_id, recorded_at, id) index.
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        after = None
+        if cursor:
+            parts = decode_cursor(cursor)
+            try:
+                after = (int(parts[0]), str(parts[1]))
+            except (IndexError, TypeError, ValueError):
+                raise ValueError("Invalid cursor")
+
+        rows = await self._run(self._select_events, experiment_id, since, until, None, after, True, limit + 1)
+        page = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit and page:
+            next_cursor = encode_cursor(page[-1]["recorded_at"], page[-1]["id"])
+        return {
+            "events": [self._event_from_row(row) for row in page],
+            "next_cursor": next_cursor
+        }
+
+    async def iter_experiment_events(
+        self,
+        experiment_id: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        event_types: Optional[List[str]] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream an experiment's events oldest first, batch_size rows per query.
+
+        Each batch resumes after the last (recorded_at, id) returned, so no read
+        transaction stays open while the consumer is slow.
+        """
+        after = None
+        while True:
+            rows = await self._run(
+                self._select_events, experiment_id, since, until, event_types, after, False, batch_size
+            )
+            for row in rows:
+                yield self._event_from_row(row)
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1]["recorded_at"], rows[-1]["id"])
+
+    async def get_experiment_stats(self, experiment_id: str, segments: Optional[List[Segment]] = None) -> Dict[str, Any]:
+        """
+        Get experiment statistics from the counter tables and user sketches.
+
+        With segments, users are counted from the assignments and events
+        summed from the rollups, both restricted to the segments; the
+        sketches cover whole variants, so distinct-user counts are left out.
+        """
+        variant_sql, event_sql, params = VARIANT_COUNTS_SQL, EVENT_COUNTS_SQL, [experiment_id]
+        if segments:
+            def condition(dimension: str, values: List[str]) -> str:
+                params.append(json.dumps(values))
+                return f"{dimension} IN (SELECT value FROM json_each(?))"
+
+            where = segment_where(segments, condition)
+            variant_sql = SEGMENT_VARIANT_COUNTS_SQL.format(segments=where)
+            event_sql = SEGMENT_EVENT_COUNTS_SQL.format(segments=where)
+
+        def fetch() -> tuple:
+            variant_rows = self.conn.execute(variant_sql, params).fetchall()
+            event_rows = self.conn.execute(event_sql, params).fetchall()
+            stored_sketches = None if segments else self.conn.execute(USER_SKETCHES_SQL, (experiment_id,)).fetchall()
+            return variant_rows, event_rows, stored_sketches
+
+        variant_rows, event_rows, stored_sketches = await self._run(fetch)
+        event_counts: Dict[str, Dict[str, int]] = {}
+        for row in event_rows:
+            event_counts.setdefault(row["variant"], {})[row["event_type"]] = row["events"]
+        user_sketches = None
+        if stored_sketches is not None:
+            user_sketches = {(row["variant"], row["event_type"]): HyperLogLog.from_bytes(row["sketch"]) for row in stored_sketches}
+        return summarize_stats(
+            experiment_id,
+            {row["variant"]: row["users"] for row in variant_rows if row["users"]},
+            event_counts,
+            user_sketches
+        )
+
+    async def get_event_rollups(self, experiment_id: str, since: int, until: int, resolution: int) -> List[RollupRow]:
+        """Rollup rows for an experiment overlapping [since, until) (epoch seconds aligned to resolution)."""
+        def fetch() -> List[RollupRow]:
+            rows = []
+            for width in (MINUTE, HOUR, DAY):
+                low = bucket_start(since, max(width, resolution))
+                for row in self.conn.execute(ROLLUPS_SQL, (experiment_id, width, low * 1_000_000, until * 1_000_000)):
+                    rows.append((
+                        row["bucket_seconds"], row["bucket_start"] // 1_000_000, row["variant"], row["event_type"],
+                        row["device_type"] or None, row["geo_location"] or None, row["events"]
+                    ))
+            return rows
+
+        return await self._run(fetch)
+
+    async def compact_rollups(self, minute_before: int, hour_before: int) -> Dict[str, int]:
+        """
+        Merge minute buckets older than minute_before into hours, and hour buckets
+        older than hour_before into days (epoch seconds).
+
+        Returns:
+            Number of minute and hour rollup rows merged
+        """
+        def compact(conn: sqlite3.Connection) -> Dict[str, int]:
+            merged = {}
+            for name, fine, coarse, before in (("minute", MINUTE, HOUR, minute_before), ("hour", HOUR, DAY, hour_before)):
+                params = {"fine": fine, "coarse": coarse, "coarse_micros": coarse * 1_000_000, "before": before * 1_000_000}
+                conn.execute(COMPACT_ROLLUPS_SQL, params)
+                merged[name] = conn.execute(DELETE_ROLLUPS_SQL, params).rowcount
+            return merged
+
+        return await self._run(self._write, compact)
+
+    async def rebuild_stats(self) -> bool:
+        """
+        Recompute the counter tables, rollups and user sketches from the raw assignments and events.
+
+        Rollups are rebuilt at minute resolution; the next compaction merges
+        the old buckets again.
+
+        Returns:
+            True if the incrementally maintained counters matched the raw tables
+        """
+        def rebuild(conn: sqlite3.Connection) -> bool:
+            # The write lock held by _write keeps other workers out during the rebuild
+            raw_variants = {tuple(row[:2]): row["users"] for row in conn.execute(RAW_VARIANT_COUNTS_SQL)}
+            raw_events = {tuple(row[:3]): row["events"] for row in conn.execute(RAW_EVENT_COUNTS_SQL)}
+            counted_variants = {
+                tuple(row[:2]): row["users"]
+                for row in conn.execute("SELECT experiment_id, variant, users FROM experiment_variant_counts WHERE users > 0")
+            }
+            counted_events = {
+                tuple(row[:3]): row["events"]
+                for row in conn.execute("SELECT experiment_id, variant, event_type, events FROM experiment_event_counts")
+            }
+
+            conn.execute("DELETE FROM experiment_variant_counts")
+            conn.execute("DELETE FROM experiment_event_counts")
+            conn.execute("INSERT INTO experiment_variant_counts (experiment_id, variant, users) " + RAW_VARIANT_COUNTS_SQL)
+            conn.execute(
+                "INSERT INTO experiment_event_counts (experiment_id, variant, event_type, events) " + RAW_EVENT_COUNTS_SQL
+            )
+            conn.execute("DELETE FROM experiment_event_rollups")
+            conn.execute(f"INSERT INTO experiment_event_rollups ({ROLLUP_KEY}, events) " + RAW_ROLLUPS_SQL)
+
+            raw_sketches = UserSketches()
+            for row in conn.execute(RAW_USERS_SQL):
+                raw_sketches.add_user(*row)
+            stored_sketches = {
+                tuple(row[:3]): HyperLogLog.from_bytes(row["sketch"])
+                for row in conn.execute("SELECT experiment_id, variant, event_type, sketch FROM experiment_user_sketches")
+            }
+            conn.execute("DELETE FROM experiment_user_sketches")
+            conn.executemany(
+                "INSERT INTO experiment_user_sketches (experiment_id, variant, event_type, sketch) VALUES (?, ?, ?, ?)",
+                [(*key, sketch.to_bytes()) for key, sketch in raw_sketches.items()]
+            )
+            return (
+                raw_variants == counted_variants and raw_events == counted_events
+                and dict(raw_sketches.items()) == stored_sketches
+            )
+
+        return await self._run(self._write, rebuild)
@@ -0,0 +1,245 @@
+import operator
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.models.schemas import AttributeOperator, AttributeRule, TargetingRules
+from app.utils.hash import compile_allocation
+
+# Location masks a TargetingIndex remembers before starting over
+GEO_MASK_CACHE_SIZE = 10000
+
+_MISSING = object()
+
+_COMPARISONS = {
+    AttributeOperator.GT: operator.gt,
+    AttributeOperator.GTE: operator.ge,
+    AttributeOperator.LT: operator.lt,
+    AttributeOperator.LTE: operator.le,
+}
+
+AttributeCheck = Callable[[Dict[str, Any]], bool]
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def compile_attribute_rule(rule: AttributeRule) -> AttributeCheck:
+    """
+    Turn one attribute predicate into a closure over the user's attributes.
+
+    Raises:
+        ValueError: If the value does not suit the operator
+    """
+    name, value, op = rule.attribute, rule.value, rule.operator
+    if op is AttributeOperator.EXISTS:
+        return lambda attributes: name in attributes
+    if op is AttributeOperator.EQ:
+        return lambda attributes: attributes.get(name, _MISSING) == value
+    if op is AttributeOperator.NE:
+        return lambda attributes: attributes.get(name, _MISSING) != value
+    if op in (AttributeOperator.IN, AttributeOperator.NOT_IN):
+        if not isinstance(value, list):
+            raise ValueError(f"Targeting rule on '{name}': '{op.value}' needs a list of values")
+        try:
+            values = frozenset(value)
+        except TypeError:
+            raise ValueError(f"Targeting rule on '{name}': '{op.value}' values must be strings, numbers or booleans")
+        admitted = op is AttributeOperator.IN
+
+        def check_membership(attributes: Dict[str, Any]) -> bool:
+            try:
+                return (attributes.get(name, _MISSING) in values) is admitted
+            except TypeError:
+                # An unhashable attribute value (a list or object) is in no set
+                return not admitted
+        return check_membership
+
+    if not _is_number(value):
+        raise ValueError(f"Targeting rule on '{name}': '{op.value}' needs a number")
+    compare = _COMPARISONS[op]
+
+    def check_number(attributes: Dict[str, Any]) -> bool:
+        actual = attributes.get(name)
+        return _is_number(actual) and compare(actual, value)
+    return check_number
+
+def _all_of(checks: List[AttributeCheck]) -> AttributeCheck:
+    if len(checks) == 1:
+        return checks[0]
+    checks = tuple(checks)
+    return lambda attributes: all(check(attributes) for check in checks)
+
+class CompiledTargeting:
+    """
+    An experiment's targeting rules, compiled once when its config is loaded.
+
+    Device and location rules become frozenset lookups and one str.startswith
+    over a tuple of prefixes, attribute predicates become closures with their
+    operands bound, and the rollout percentage becomes a bucket threshold on
+    a user hash of its own, independent of the variant hash, so admitted
+    users still split over the variants as configured. Every rule present
+    must match.
+    """
+    __slots__ = ("devices", "geo_locations", "geo_prefixes", "attribute_check", "rollout_allocation", "rollout_buckets")
+
+    def __init__(self, experiment_id: str, rules: TargetingRules):
+        self.devices = frozenset(device.value for device in rules.device_types) if rules.device_types is not None else None
+        if rules.geo_locations is not None or rules.geo_prefixes is not None:
+            self.geo_locations = frozenset(rules.geo_locations or ())
+            self.geo_prefixes = tuple(rules.geo_prefixes or ())
+        else:
+            self.geo_locations = None
+            self.geo_prefixes = ()
+        checks = [compile_attribute_rule(rule) for rule in rules.attributes]
+        self.attribute_check: Optional[AttributeCheck] = _all_of(checks) if checks else None
+        if rules.rollout is not None and rules.rollout < 100:
+            # The hashed message is f"{user_id}:{experiment_id}:rollout:{seed}"
+            self.rollout_allocation = compile_allocation(f"{experiment_id}:rollout", {"admitted": 100.0})
+            self.rollout_buckets = round(rules.rollout * 100)
+        else:
+            self.rollout_allocation = None
+            self.rollout_buckets = None
+
+    @property
+    def empty(self) -> bool:
+        return (self.devices is None and self.geo_locations is None
+                and self.attribute_check is None and self.rollout_allocation is None)
+
+    @property
+    def has_user_rules(self) -> bool:
+        """Whether the rules go beyond device and location (attributes or a rollout)."""
+        return self.attribute_check is not None or self.rollout_allocation is not None
+
+    def matches_audience(self, device_type: Optional[str], geo_location: Optional[str]) -> bool:
+        """Check the device and location rules."""
+        if self.devices is not None and device_type not in self.devices:
+            return False
+        if self.geo_locations is not None:
+            if geo_location is None:
+                return False
+            return geo_location in self.geo_locations or geo_location.startswith(self.geo_prefixes)
+        return True
+
+    def matches_attributes(self, attributes: Dict[str, Any]) -> bool:
+        return self.attribute_check is None or self.attribute_check(attributes)
+
+    def in_rollout(self, user_id: str) -> bool:
+        return self.rollout_allocation is None or self.rollout_allocation.bucket(user_id) < self.rollout_buckets
+
+    def matches(
+        self,
+        user_id: str,
+        device_type: Optional[str],
+        geo_location: Optional[str],
+        attributes: Optional[Dict[str, Any]]
+    ) -> bool:
+        """Check every rule for one user."""
+        return (
+            self.matches_audience(device_type, geo_location)
+            and self.matches_attributes(attributes or {})
+            and self.in_rollout(user_id)
+        )
+
+def compile_targeting(experiment_id: str, targeting: Optional[Dict[str, Any]]) -> Optional[CompiledTargeting]:
+    """
+    Validate and compile an experiment's targeting config.
+
+    Returns:
+        Compiled rules, or None if the experiment targets everyone
+
+    Raises:
+        ValueError: If the rules are invalid (pydantic.ValidationError is a ValueError)
+    """
+    if not targeting:
+        return None
+    compiled = CompiledTargeting(experiment_id, TargetingRules.model_validate(targeting))
+    return None if compiled.empty else compiled
+
+class TargetingIndex:
+    """
+    Bitsets over a snapshot's experiments for finding every experiment a user is targeted by.
+
+    Bit i stands for experiments[i]. Each device value maps to the mask of
+    experiments it is admitted to, computed up front; each location maps to
+    its mask on first use (exact matches, prefixes and experiments without a
+    location rule), then from a cache. ANDing the two masks rules out the
+    experiments aimed at other audiences without visiting them, so only the
+    remaining experiments with attribute or rollout rules run their closures.
+    """
+
+    def __init__(self, experiments: Sequence[Any]):
+        self.experiments = list(experiments)
+        device_any = 0
+        device_masks: Dict[str, int] = {}
+        geo_any = 0
+        geo_exact: Dict[str, int] = {}
+        geo_prefixes: Dict[str, int] = {}
+        user_rules = 0
+        # Per experiment (attribute check, rollout allocation, rollout threshold), for those with user rules
+        self._user_checks: List[Optional[tuple]] = [None] * len(self.experiments)
+        for index, experiment in enumerate(self.experiments):
+            bit = 1 << index
+            targeting = experiment.targeting
+            if targeting is None or targeting.devices is None:
+                device_any |= bit
+            else:
+                for device in targeting.devices:
+                    device_masks[device] = device_masks.get(device, 0) | bit
+            if targeting is None or targeting.geo_locations is None:
+                geo_any |= bit
+            else:
+                for geo_location in targeting.geo_locations:
+                    geo_exact[geo_location] = geo_exact.get(geo_location, 0) | bit
+                for prefix in targeting.geo_prefixes:
+                    geo_prefixes[prefix] = geo_prefixes.get(prefix, 0) | bit
+            if targeting is not None and targeting.has_user_rules:
+                user_rules |= bit
+                self._user_checks[index] = (
+                    targeting.attribute_check, targeting.rollout_allocation, targeting.rollout_buckets
+                )
+
+        self._device_any = device_any
+        self._device_masks = {device: mask | device_any for device, mask in device_masks.items()}
+        self._geo_any = geo_any
+        self._geo_exact = geo_exact
+        self._geo_prefixes = tuple(geo_prefixes.items())
+        self._geo_masks: Dict[Optional[str], int] = {}
+        self._user_rules = user_rules
+
+    def _geo_mask(self, geo_location: Optional[str]) -> int:
+        mask = self._geo_masks.get(geo_location)
+        if mask is None:
+            mask = self._geo_any
+            if geo_location is not None:
+                mask |= self._geo_exact.get(geo_location, 0)
+                for prefix, bits in self._geo_prefixes:
+                    if geo_location.startswith(prefix):
+                        mask |= bits
+            if len(self._geo_masks) >= GEO_MASK_CACHE_SIZE:
+                self._geo_masks.clear()
+            self._geo_masks[geo_location] = mask
+        return mask
+
+    def matching(
+        self,
+        user_id: str,
+        device_type: Optional[str],
+        geo_location: Optional[str],
+        attributes: Optional[Dict[str, Any]]
+    ) -> List[Any]:
+        """Experiments whose targeting admits the user, in index order."""
+        mask = self._device_masks.get(device_type, self._device_any) & self._geo_mask(geo_location)
+        attributes = attributes or {}
+        experiments = self.experiments
+        user_rules = self._user_rules
+        matched = []
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            index = bit.bit_length() - 1
+            if bit & user_rules:
+                attribute_check, rollout, rollout_buckets = self._user_checks[index]
+                if attribute_check is not None and not attribute_check(attributes):
+                    continue
+                if rollout is not None and rollout.bucket(user_id) >= rollout_buckets:
+                    continue
+            matched.append(experiments[index])
+        return matched
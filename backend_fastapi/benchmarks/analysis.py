@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark the variant analysis engine on hundreds of experiments in one call,
+and its array erfc against calling math.erfc per element.
+
+    python -m benchmarks.analysis [experiment_count]
+"""
+
+import math
+import random
+import sys
+import time
+
+import numpy as np
+
+from app.utils.analysis import _erfc, analyze_experiments
+
+def make_experiment(index: int, rng: random.Random) -> dict:
+    variant_count = rng.randint(2, 10)
+    names = ["control"] + [f"variant_{i}" for i in range(1, variant_count)]
+    users = [rng.randint(1_000, 200_000) for _ in names]
+    return {
+        "experiment_id": f"experiment_{index}",
+        "variants": names,
+        "control": "control",
+        "users": users,
+        "conversions": [int(n * rng.uniform(0.01, 0.08)) for n in users],
+        "impressions": [n * 3 for n in users],
+        "clicks": [int(n * rng.uniform(0.05, 0.2)) for n in users],
+    }
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rng = random.Random(7)
+    experiments = [make_experiment(i, rng) for i in range(count)]
+    variant_total = sum(len(experiment["variants"]) for experiment in experiments)
+    print(f"Analysing {count} experiments ({variant_total} variants)")
+
+    start = time.perf_counter()
+    batched = analyze_experiments(experiments)
+    batched_seconds = time.perf_counter() - start
+    print(f"  one call                {batched_seconds * 1000:>8.1f} ms")
+
+    start = time.perf_counter()
+    looped = [analyze_experiments([experiment])[0] for experiment in experiments]
+    looped_seconds = time.perf_counter() - start
+    print(f"  one call per experiment {looped_seconds * 1000:>8.1f} ms ({looped_seconds / batched_seconds:.1f}x slower)")
+
+    significant = sum(
+        1 for result in batched for variant in result["variants"] if variant["significant"]
+    )
+    print(f"  {significant} of {variant_total - count} treatments significant at 95%")
+
+    values = np.random.default_rng(7).uniform(0, 6, 1_000_000)
+    start = time.perf_counter()
+    np.frompyfunc(math.erfc, 1, 1)(values).astype(np.float64)
+    per_element = time.perf_counter() - start
+    start = time.perf_counter()
+    _erfc(values)
+    vectorised = time.perf_counter() - start
+    print(f"  erfc of 10^6 values: math.erfc per element {per_element * 1000:.1f} ms, array {vectorised * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
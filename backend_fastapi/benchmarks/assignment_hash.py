@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of get_variant_assignment for experiments with 2 to 100 variants.
+
+Compares the compiled allocation path against the original per-call
+implementation (tests/test_hash.py checks that both assign users identically).
+
+    python -m benchmarks.assignment_hash
+"""
+
+import hashlib
+import hmac
+import os
+import random
+import time
+from typing import Dict
+
+from app.utils.hash import compile_allocation, get_variant_assignment
+
+USERS = 20000
+VARIANT_COUNTS = [2, 5, 10, 25, 50, 100]
+
+def legacy_get_variant_assignment(user_id: str, experiment_id: str, variants: Dict[str, float]) -> str:
+    """The original implementation, timed as the baseline."""
+    salt = os.getenv("HMAC_SALT", "default-salt")
+    seed = os.getenv("HASH_SEED", "default-seed")
+    hash_input = f"{user_id}:{experiment_id}:{seed}"
+    hash_value = hmac.new(salt.encode('utf-8'), hash_input.encode('utf-8'), hashlib.sha256).hexdigest()
+    percentage = (int(hash_value[:8], 16) % 10000) / 100.0
+    cumulative = 0.0
+    variant_names = list(variants.keys())
+    for variant, allocation in variants.items():
+        cumulative += allocation
+        if percentage <= cumulative:
+            return variant
+    return variant_names[-1] if variant_names else "control"
+
+def make_variants(count: int, rng: random.Random) -> Dict[str, float]:
+    weights = [rng.random() for _ in range(count)]
+    total = sum(weights)
+    return {f"variant_{i}": round(w / total * 100, 2) for i, w in enumerate(weights)}
+
+def time_calls(func, user_ids, experiment_id, variants) -> float:
+    start = time.perf_counter()
+    for user_id in user_ids:
+        func(user_id, experiment_id, variants)
+    return len(user_ids) / (time.perf_counter() - start)
+
+def main():
+    rng = random.Random(42)
+    user_ids = [f"user_{i}" for i in range(USERS)]
+    print(f"{'variants':>8} {'original/s':>12} {'cached/s':>12} {'compiled/s':>12} {'speedup':>8}")
+    for count in VARIANT_COUNTS:
+        variants = make_variants(count, rng)
+        experiment_id = f"bench_{count}"
+        legacy = time_calls(legacy_get_variant_assignment, user_ids, experiment_id, variants)
+        cached = time_calls(get_variant_assignment, user_ids, experiment_id, variants)
+        # Callers holding the compiled table skip the config check entirely
+        allocation = compile_allocation(experiment_id, variants)
+        compiled = time_calls(lambda user_id, *_: allocation.assign(user_id), user_ids, experiment_id, variants)
+        print(f"{count:>8} {legacy:>12.0f} {cached:>12.0f} {compiled:>12.0f} {compiled / legacy:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
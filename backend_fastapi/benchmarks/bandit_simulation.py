@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Offline simulation of the Thompson-sampling bandit against a static split.
+
+New users arrive in rounds; each round is one BanditUpdater interval. Users are
+split by the current weights, convert at each variant's true rate, and the
+weights are recomputed from the accumulated counts with thompson_weights, as
+the background updater does. Assignments are sticky, so every user counts once.
+
+    python -m benchmarks.bandit_simulation [users_per_round] [rounds] [runs]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from app.utils.bandit import DEFAULT_EXPLORATION_FLOOR, thompson_weights
+
+# True conversion rates per scenario; the first variant is control
+SCENARIOS = {
+    "clear winner": [0.040, 0.050, 0.065],
+    "close call": [0.050, 0.052, 0.055],
+    "no difference": [0.050, 0.050, 0.050],
+}
+
+# A run has converged once the best variant holds this share of traffic
+CONVERGED_SHARE = 0.8
+
+def simulate(rates, users_per_round, rounds, floor, rng, bandit=True):
+    """Return (cumulative expected regret, first converged round or None, final weights)."""
+    rates = np.asarray(rates)
+    count = len(rates)
+    weights = np.full(count, 100.0 / count)
+    trials = np.zeros(count)
+    successes = np.zeros(count)
+    regret = 0.0
+    converged = None
+    best = rates.argmax()
+    for round_number in range(1, rounds + 1):
+        assigned = rng.multinomial(users_per_round, weights / weights.sum())
+        successes += rng.binomial(assigned, rates)
+        trials += assigned
+        regret += float(assigned @ (rates.max() - rates))
+        if bandit:
+            weights = thompson_weights(successes, trials, floor=floor, draws=10000, rng=rng)
+            if converged is None and weights[best] >= CONVERGED_SHARE * 100:
+                converged = round_number
+    return regret, converged, weights
+
+def main():
+    users_per_round = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    floor = DEFAULT_EXPLORATION_FLOOR
+    print(
+        f"{runs} runs of {rounds} rounds x {users_per_round} users, "
+        f"exploration floor {floor}%"
+    )
+
+    for name, rates in SCENARIOS.items():
+        rng = np.random.default_rng(42)
+        start = time.perf_counter()
+        bandit = [simulate(rates, users_per_round, rounds, floor, rng) for _ in range(runs)]
+        elapsed = time.perf_counter() - start
+        static = [simulate(rates, users_per_round, rounds, floor, rng, bandit=False) for _ in range(runs)]
+
+        bandit_regret = np.mean([result[0] for result in bandit])
+        static_regret = np.mean([result[0] for result in static])
+        converged = [result[1] for result in bandit if result[1] is not None]
+        final = np.mean([result[2] for result in bandit], axis=0)
+        print(f"\n{name}: true rates {rates}")
+        print(f"  regret (lost conversions)  bandit {bandit_regret:>8.1f}   static {static_regret:>8.1f}")
+        if len(set(rates)) == 1:
+            print("  no best variant to converge to")
+        elif converged:
+            print(
+                f"  converged ({CONVERGED_SHARE:.0%} to best) in {len(converged)}/{runs} runs, "
+                f"median round {int(np.median(converged))}"
+            )
+        else:
+            print(f"  never converged ({CONVERGED_SHARE:.0%} to best)")
+        print(f"  mean final weights {np.round(final, 1).tolist()}")
+        print(f"  update cost {elapsed / (runs * rounds) * 1000:.2f} ms per round")
+
+if __name__ == "__main__":
+    main()
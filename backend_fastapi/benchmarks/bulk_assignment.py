@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Benchmark bulk cohort assignment against looping over get_variant_assignment.
+
+tests/test_bulk_assignment.py checks that both give the same variants.
+
+    python -m benchmarks.bulk_assignment [user_count]
+"""
+
+import os
+import sys
+import time
+
+from app.utils.bulk_assignment import bulk_variant_assignment
+from app.utils.hash import get_variant_assignment
+
+EXPERIMENT_ID = "homepage_banner"
+VARIANTS = {"control": 50.0, "variant_a": 30.0, "variant_b": 20.0}
+
+def main():
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    user_ids = [f"user_{i}" for i in range(user_count)]
+    print(f"Assigning {user_count} users")
+
+    start = time.perf_counter()
+    for user_id in user_ids:
+        get_variant_assignment(user_id, EXPERIMENT_ID, VARIANTS)
+    loop_rate = user_count / (time.perf_counter() - start)
+    print(f"  per-user loop          {loop_rate:>12.0f} users/sec")
+
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        bulk_variant_assignment(EXPERIMENT_ID, VARIANTS, user_ids, workers=workers)
+        rate = user_count / (time.perf_counter() - start)
+        print(f"  bulk, {workers:>2} worker(s)     {rate:>12.0f} users/sec ({rate / loop_rate:.1f}x)")
+
+if __name__ == "__main__":
+    main()
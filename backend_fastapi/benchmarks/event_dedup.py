@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Measure the event dedup filter: false-positive rate, memory and claim cost.
+
+Fills a TimeSlicedBloomFilter with its capacity of event ids spread over
+the window (and then twice its capacity), probes it with ids never added
+and compares the measured false-positive rate with the target and with the
+filter's own estimate. Memory is compared with an exact set of the same
+keys, and claim/settle is timed one id at a time and in batches. The
+filter's guarantees are checked in tests/test_dedup.py.
+
+    python -m benchmarks.event_dedup [capacity]
+"""
+
+import sys
+import time
+import tracemalloc
+import uuid
+
+from app.utils.dedup import EventDeduplicator, TimeSlicedBloomFilter, dedup_key
+
+WINDOW = 3600.0
+PROBES = 200_000
+EXPERIMENT_ID = "homepage_banner"
+
+def make_keys(count: int) -> list:
+    return [dedup_key(EXPERIMENT_ID, str(uuid.uuid4())) for _ in range(count)]
+
+def false_positives(capacity: int, error_rate: float, load: float) -> None:
+    bloom = TimeSlicedBloomFilter(WINDOW, capacity, error_rate)
+    count = int(capacity * load)
+    keys = make_keys(count)
+    # Spread the adds over one window, in batches as the batch route would
+    step = 1000
+    for start in range(0, count, step):
+        bloom.add_many(keys[start:start + step], now=WINDOW * start / count)
+    missed = sum(not seen for seen in bloom.contains_many(keys[-min(count, PROBES):], now=WINDOW))
+    hits = sum(bloom.contains_many(make_keys(PROBES), now=WINDOW))
+    print(
+        f"  {load:>4.1f}x capacity  target {error_rate:.0e}  measured {hits / PROBES:.2e}"
+        f"  estimated {bloom.false_positive_rate():.2e}  missed {missed}"
+    )
+
+def memory(capacity: int, error_rate: float) -> None:
+    bloom = TimeSlicedBloomFilter(WINDOW, capacity, error_rate)
+    tracemalloc.start()
+    exact = set(make_keys(capacity))
+    exact_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"  filter {bloom.nbytes / 2**20:>7.1f} MiB ({bloom.hash_count} hashes)   exact set {exact_bytes / 2**20:>7.1f} MiB   for {len(exact):,} ids")
+
+def claim_cost(capacity: int) -> None:
+    keys = make_keys(100_000)
+    for label, size in (("one id per claim", 1), ("batches of 100", 100), ("batches of 1000", 1000)):
+        dedup = EventDeduplicator(TimeSlicedBloomFilter(WINDOW, capacity))
+        start = time.perf_counter()
+        for position in range(0, len(keys), size):
+            batch = keys[position:position + size]
+            dedup.settle(batch, dedup.claim(batch))
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<18} {elapsed / len(keys) * 1e6:>6.2f} us per event id")
+
+def main():
+    capacity = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"False positives (window {WINDOW:.0f}s, capacity {capacity:,}, {PROBES:,} unseen probes)")
+    for error_rate in (1e-3, 1e-4):
+        false_positives(capacity, error_rate, 1.0)
+        false_positives(capacity, error_rate, 2.0)
+    print("Memory")
+    memory(capacity, 1e-6)
+    print("Claim + settle")
+    claim_cost(capacity)
+
+if __name__ == "__main__":
+    main()
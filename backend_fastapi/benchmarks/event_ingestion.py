@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Compare event ingestion throughput of POST /api/events and POST /api/events/batch.
+
+Runs in-process against the ASGI app, so no server needs to be running.
+tests/test_event_ingestion.py checks what the batch endpoint stores.
+
+    python -m benchmarks.event_ingestion
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+
+from main import app
+from app.utils.database import MockDatabase, get_database
+
+TOTAL_EVENTS = 5000
+BATCH_SIZES = [100, 1000]
+
+def make_event(i: int) -> dict:
+    return {
+        "user_id": f"user_{i}",
+        "experiment_id": "homepage_banner",
+        "variant": "control" if i % 2 else "variant_a",
+        "event_type": "impression",
+        "campaign_id": "campaign_001",
+        "device_type": "mobile",
+    }
+
+def fresh_client() -> httpx.AsyncClient:
+    db = MockDatabase()
+    app.dependency_overrides[get_database] = lambda: db
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+async def bench_single() -> float:
+    async with fresh_client() as client:
+        start = time.perf_counter()
+        for i in range(TOTAL_EVENTS):
+            response = await client.post("/api/events", json=make_event(i))
+            response.raise_for_status()
+        return TOTAL_EVENTS / (time.perf_counter() - start)
+
+async def bench_batch(batch_size: int, ndjson: bool) -> float:
+    async with fresh_client() as client:
+        start = time.perf_counter()
+        for offset in range(0, TOTAL_EVENTS, batch_size):
+            events = [make_event(i) for i in range(offset, offset + batch_size)]
+            if ndjson:
+                body = "\n".join(json.dumps(e) for e in events)
+                response = await client.post(
+                    "/api/events/batch", content=body, headers={"Content-Type": "application/x-ndjson"}
+                )
+            else:
+                response = await client.post("/api/events/batch", json=events)
+            response.raise_for_status()
+        return TOTAL_EVENTS / (time.perf_counter() - start)
+
+async def main():
+    print(f"Ingesting {TOTAL_EVENTS} events per run")
+    single = await bench_single()
+    print(f"  single   /api/events              {single:>10.0f} events/sec")
+    for batch_size in BATCH_SIZES:
+        for ndjson in (False, True):
+            rate = await bench_batch(batch_size, ndjson)
+            label = "ndjson" if ndjson else "json  "
+            print(f"  batch={batch_size:<5} {label} /api/events/batch {rate:>10.0f} events/sec ({rate / single:.1f}x)")
+    app.dependency_overrides.clear()
+
+if __name__ == "__main__":
+    asyncio.run(main())
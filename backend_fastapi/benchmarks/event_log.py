@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Throughput of the on-disk event log (DATABASE_URL=eventlog:///dir).
+
+Inserts the same events into MockDatabase and EventLogDatabase (one event
+per call, concurrent writers sharing group commits, batches), then times
+reopening, stats rebuilds and an export over both stores. Crash recovery
+is covered by tests/test_event_log.py.
+
+    python -m benchmarks.event_log [event_count]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from app.utils.database import MockDatabase
+from app.utils.log_database import EventLogDatabase
+
+EXPERIMENT_ID = "homepage_banner"
+
+def make_events(count: int) -> list:
+    return [{
+        "user_id": f"user_{i % 9000}",
+        "experiment_id": EXPERIMENT_ID,
+        "variant": ("control", "variant_a", "variant_b")[i % 3],
+        "event_type": ("impression", "impression", "click", "impression", "conversion")[i % 5],
+        "device_type": "mobile",
+        "metadata": {"purchase_amount": 10.0} if i % 7 == 0 else {},
+    } for i in range(count)]
+
+async def open_log(directory: str, segment_records: int = 4096) -> EventLogDatabase:
+    db = EventLogDatabase(directory, segment_records=segment_records)
+    await db.connect()
+    return db
+
+async def timed(label: str, count: int, coroutine) -> float:
+    started = time.perf_counter()
+    await coroutine
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<50} {count / elapsed:>10,.0f} events/s")
+    return elapsed
+
+async def one_at_a_time(db, events) -> None:
+    for event in events:
+        await db.insert_event(event)
+
+async def concurrent(db, events, writers: int) -> None:
+    async def writer(start: int):
+        for event in events[start::writers]:
+            await db.insert_event(event)
+    await asyncio.gather(*(writer(start) for start in range(writers)))
+
+async def batches(db, events, size: int) -> None:
+    for start in range(0, len(events), size):
+        await db.insert_events(events[start:start + size])
+
+async def throughput(count: int) -> None:
+    events = make_events(count)
+    single = events[:min(count, 2000)]
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Writes ({count:,} events; one-at-a-time runs use {len(single):,})")
+        runs = [
+            ("one event per call", lambda db: one_at_a_time(db, single), len(single)),
+            ("one event per call, 64 concurrent writers", lambda db: concurrent(db, single, 64), len(single)),
+            ("batches of 100", lambda db: batches(db, events, 100), count),
+        ]
+        log = await open_log(os.path.join(directory, "log"), segment_records=1 << 20)
+        for label, run, n in runs:
+            await timed(f"memory   {label}", n, run(MockDatabase()))
+            await timed(f"eventlog {label}", n, run(log))
+        print(f"  (eventlog: {log.commit.commits:,} commits shared {log.commit.fsyncs:,} fsyncs)")
+        total = len(log.events)
+        memory = MockDatabase()
+        await memory.insert_events(events)
+        await log.close()
+
+        print(f"Reads ({total:,} events in the log, {count:,} in memory)")
+        started = time.perf_counter()
+        log = await open_log(os.path.join(directory, "log"), segment_records=1 << 20)
+        print(f"  {'eventlog reopen (recover, index, stats)':<50} {time.perf_counter() - started:>10.3f} s")
+        for name, db in (("memory  ", memory), ("eventlog", log)):
+            started = time.perf_counter()
+            await db.rebuild_stats()
+            print(f"  {name} {'stats rebuild':<41} {time.perf_counter() - started:>10.3f} s")
+        for name, db in (("memory  ", memory), ("eventlog", log)):
+            started = time.perf_counter()
+            exported = 0
+            async for _ in db.iter_experiment_events(EXPERIMENT_ID):
+                exported += 1
+            elapsed = time.perf_counter() - started
+            print(f"  {name} {'export':<41} {exported / elapsed:>10,.0f} events/s")
+        print(f"  eventlog on disk {log.events.disk_bytes() / count:.0f} bytes/event")
+        await log.close()
+
+if __name__ == "__main__":
+    asyncio.run(throughput(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Measure event id generation and the per-event cost from request to storage.
+
+Three parts:
+  - ids: uuid4 against time-ordered (UUIDv7) ids, one at a time and in bulk
+    (tests/test_event_ids.py checks they are unique and ascending).
+  - request path: turning a validated EventRequest into a stored event and
+    its response. The previous path built a dict, copied it into a merged
+    dict with a uuid4 id in insert_event, and answered with a separate
+    datetime.now(); the new one builds one EventRecord, stamps it, appends
+    it and answers with its own id and recorded_at. Reports CPU per event
+    and the bytes and memory blocks retained per queued event (what the
+    write-behind buffer holds).
+  - primary key locality: inserting into SQLite's `id TEXT PRIMARY KEY`
+    events table with random against time-ordered ids, in batches like the
+    buffer's flushes; the index file and its page cache are what random
+    ids spread writes across.
+
+    python -m benchmarks.event_record [sqlite_rows]
+"""
+
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from app.models.schemas import EventRequest, EventResponse
+from app.routes.events import build_event_data
+from app.utils.event_ids import generate_event_id, generate_event_ids
+from app.utils.event_store import ColumnarEventStore
+
+EVENTS = 100_000
+FLUSH_SIZE = 500
+
+def legacy_event_data(request: EventRequest) -> dict:
+    """The dict the route built before EventRecord."""
+    event_data = {
+        "user_id": request.user_id,
+        "experiment_id": request.experiment_id,
+        "variant": request.variant,
+        "event_type": request.event_type.value,
+        "campaign_id": request.campaign_id,
+        "ad_id": request.ad_id,
+        "device_type": request.device_type.value if request.device_type else None,
+        "geo_location": request.geo_location,
+        "metadata": request.metadata or {}
+    }
+    if request.event_id is not None:
+        event_data["id"] = str(request.event_id)
+    return event_data
+
+def legacy_stamp(event_data: dict) -> dict:
+    """insert_event's merged copy with a uuid4 id."""
+    return {"id": event_data.get("id") or str(uuid.uuid4()), "recorded_at": datetime.now(), **event_data}
+
+def legacy_path(request: EventRequest, store: ColumnarEventStore) -> EventResponse:
+    event = legacy_stamp(legacy_event_data(request))
+    store.append(event)
+    return EventResponse(
+        event_id=event["id"], user_id=request.user_id, experiment_id=request.experiment_id,
+        variant=request.variant, event_type=request.event_type, recorded_at=datetime.now(),
+        metadata=request.metadata
+    )
+
+def record_path(request: EventRequest, store: ColumnarEventStore) -> EventResponse:
+    record = build_event_data(request)
+    store.append(record)
+    return EventResponse(
+        event_id=record.id, user_id=request.user_id, experiment_id=request.experiment_id,
+        variant=request.variant, event_type=request.event_type, recorded_at=record.recorded_at,
+        metadata=request.metadata
+    )
+
+def make_requests(count: int) -> list:
+    return [
+        EventRequest(
+            user_id=f"user_{i % 50000}",
+            experiment_id=f"experiment_{i % 20}",
+            variant=("control", "variant_a")[i % 2],
+            event_type=("impression", "click", "conversion")[i % 3],
+            campaign_id=f"campaign_{i % 10}",
+            device_type=("mobile", "desktop", "tablet")[i % 3],
+            geo_location=("US", "DE", "IN")[i % 3]
+        )
+        for i in range(count)
+    ]
+
+def ids() -> None:
+    count = 200_000
+    print(f"Event ids ({count:,})")
+    for label, generate in (
+        ("uuid4", lambda: [str(uuid.uuid4()) for _ in range(count)]),
+        ("time-ordered, one at a time", lambda: [generate_event_id() for _ in range(count)]),
+        ("time-ordered, bulk of 500", lambda: [i for _ in range(count // FLUSH_SIZE) for i in generate_event_ids(FLUSH_SIZE)]),
+    ):
+        started = time.perf_counter()
+        generate()
+        elapsed = time.perf_counter() - started
+        print(f"  {label:<30} {elapsed / count * 1e9:>6.0f} ns per id   {count / elapsed:>12,.0f} ids/sec")
+
+def request_path(rounds: int = 3) -> None:
+    requests = make_requests(EVENTS)
+    paths = (("dict + uuid4 + merged copy", legacy_path), ("EventRecord + time-ordered id", record_path))
+    print(f"Request to stored event and response ({EVENTS:,} events, columnar store, best of {rounds})")
+    best = {label: float("inf") for label, _ in paths}
+    for _ in range(rounds):
+        # Alternate the paths so both see the same machine conditions
+        for label, path in paths:
+            store = ColumnarEventStore()
+            gc.collect()
+            started = time.process_time()
+            for request in requests:
+                path(request, store)
+            best[label] = min(best[label], time.process_time() - started)
+    for label, _ in paths:
+        print(f"  {label:<30} {best[label] / EVENTS * 1e6:>6.2f} us CPU per event")
+
+    # What a queued event holds until it is flushed
+    for label, build in (
+        ("dict + uuid4 + merged copy", lambda request: legacy_stamp(legacy_event_data(request))),
+        ("EventRecord + time-ordered id", build_event_data),
+    ):
+        gc.collect()
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        queued = [build(request) for request in requests]
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        blocks = sys.getallocatedblocks() - blocks
+        print(f"  queued {label:<23} {retained / len(queued):>6.0f} B and {blocks / len(queued):>4.1f} blocks retained per event")
+        del queued
+
+def primary_key_locality(rows: int) -> None:
+    print(f"SQLite `id TEXT PRIMARY KEY` inserts ({rows:,} rows in batches of {FLUSH_SIZE}, default page cache)")
+    for label, generate in (
+        ("uuid4", lambda count: [str(uuid.uuid4()) for _ in range(count)]),
+        ("time-ordered", generate_event_ids),
+    ):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.db")
+            conn = sqlite3.connect(path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE events (id TEXT PRIMARY KEY, user_id TEXT, recorded_at INTEGER)")
+            timings = []
+            for start in range(0, rows, FLUSH_SIZE):
+                batch = generate(FLUSH_SIZE)
+                started = time.perf_counter()
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO events (id, user_id, recorded_at) VALUES (?, ?, ?)",
+                        [(event_id, f"user_{start + i}", start + i) for i, event_id in enumerate(batch)]
+                    )
+                timings.append(time.perf_counter() - started)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.close()
+            size = os.path.getsize(path)
+        last = timings[-len(timings) // 10:]
+        print(
+            f"  {label:<14} {sum(timings) / rows * 1e6:>6.2f} us per row overall, "
+            f"{sum(last) / (len(last) * FLUSH_SIZE) * 1e6:>6.2f} us in the last tenth   file {size / 2**20:>6.1f} MiB"
+        )
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    ids()
+    request_path()
+    primary_key_locality(rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Report bytes per event for the columnar event store against the old list of dicts.
+
+Memory is measured with tracemalloc while each store holds the same events:
+    python -m benchmarks.event_store_memory [event_count]
+"""
+
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from app.utils.event_store import ColumnarEventStore
+from app.utils.event_ids import generate_event_id
+
+def make_events(count: int):
+    """Yield event records shaped like MockDatabase.insert_event builds them."""
+    start = datetime.now()
+    for i in range(count):
+        yield {
+            "id": generate_event_id(),
+            "recorded_at": start + timedelta(microseconds=i),
+            "user_id": f"user_{i % 50000}",
+            "experiment_id": f"experiment_{i % 20}",
+            "variant": ("control", "variant_a", "variant_b")[i % 3],
+            "event_type": ("impression", "impression", "click", "conversion")[i % 4],
+            "campaign_id": f"campaign_{i % 10}",
+            "ad_id": f"ad_{i % 100}",
+            "device_type": ("mobile", "desktop", "tablet")[i % 3],
+            "geo_location": ("US", "DE", "LK", "IN")[i % 4],
+            # Roughly one event in ten carries metadata, like conversions with order details
+            "metadata": {"purchase_amount": 99.99, "product_id": f"prod_{i % 500}"} if i % 10 == 0 else {},
+        }
+
+def measure(label: str, store, append, count: int) -> None:
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    for event in make_events(count):
+        append(event)
+    elapsed = time.perf_counter() - started
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    print(f"  {label:<22} {used / count:>8.1f} bytes/event   {count / elapsed:>10.0f} appends/sec")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    print(f"Storing {count} events")
+
+    events = []
+    measure("list of dicts", events, events.append, count)
+    del events
+
+    store = ColumnarEventStore()
+    measure("columnar store", store, store.append, count)
+    print(f"  columnar nbytes()      {store.nbytes() / count:>8.1f} bytes/event (self-reported)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Measure the peak memory and time of streaming exports as the event count grows.
+
+Fills a MockDatabase, then drains the NDJSON, CSV and gzip export streams
+while tracemalloc tracks the peak allocated on top of the stored events, and
+reports each format's peak growth from the smallest to the largest count
+(tests/test_export.py asserts it stays flat):
+    python -m benchmarks.export_memory
+"""
+
+import asyncio
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from app.utils.database import MockDatabase
+from app.utils.export import serialize_events
+from app.utils.event_ids import generate_event_id
+
+EVENT_COUNTS = [10_000, 100_000, 300_000]
+EXPERIMENT_ID = "homepage_banner"
+
+def populate(db: MockDatabase, count: int) -> None:
+    start = datetime.now()
+    for i in range(count):
+        db.events.append({
+            "id": generate_event_id(),
+            "recorded_at": start + timedelta(microseconds=i),
+            "user_id": f"user_{i}",
+            "experiment_id": EXPERIMENT_ID,
+            "variant": ("control", "variant_a")[i % 2],
+            "event_type": ("impression", "click", "conversion")[i % 3],
+            "device_type": "mobile",
+            "metadata": {"purchase_amount": 10.0} if i % 3 == 2 else {},
+        })
+
+async def drain(db: MockDatabase, export_format: str, compress: bool) -> int:
+    total = 0
+    async for chunk in serialize_events(db.iter_experiment_events(EXPERIMENT_ID), export_format, compress):
+        total += len(chunk)
+    return total
+
+async def main():
+    print(f"{'events':>10} {'format':>10} {'output MB':>10} {'peak KB':>9} {'seconds':>8}")
+    peaks = {}
+    for count in EVENT_COUNTS:
+        db = MockDatabase()
+        populate(db, count)
+        for export_format, compress in (("ndjson", False), ("csv", False), ("ndjson", True)):
+            tracemalloc.start()
+            started = time.perf_counter()
+            size = await drain(db, export_format, compress)
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            label = export_format + (".gz" if compress else "")
+            peaks.setdefault(label, []).append(peak)
+            print(f"{count:>10} {label:>10} {size / 1e6:>10.1f} {peak / 1024:>9.0f} {elapsed:>8.2f}")
+    for label, by_count in peaks.items():
+        print(f"{label:>10} peak x{by_count[-1] / by_count[0]:.2f} from {EVENT_COUNTS[0]} to {EVENT_COUNTS[-1]} events")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Compare requests/sec of the assignment and event routes with and without the fast path.
+
+Runs in-process against the ASGI app in three modes: response models (default),
+fast path with orjson, and fast path with MessagePack, interleaved over several
+rounds and keeping the best round. The response step on its own (FastAPI's
+serialize_response + JSONResponse versus the fast-path encoders) is timed
+separately, since per-request ASGI and client overhead is much larger.
+tests/test_fast_path.py checks that the fast-path bodies match the default ones.
+
+    python -m benchmarks.fast_path
+"""
+
+import asyncio
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from main import app
+from app.models.schemas import AssignmentResponse, BatchEventResponse
+from app.utils import fast_response
+from app.utils.cache import assignment_cache
+from app.utils.database import MockDatabase, get_database
+
+REQUESTS = 1000
+BATCH_SIZE = 1000
+ROUNDS = 5
+
+MODES = [
+    ("response models", False, "application/json"),
+    ("fast path json", True, "application/json"),
+    ("fast path msgpack", True, "application/msgpack"),
+]
+
+def make_event(i: int) -> dict:
+    return {
+        "user_id": f"user_{i}",
+        "experiment_id": "homepage_banner",
+        "variant": "control",
+        "event_type": "impression",
+        "metadata": {"page": "/home"},
+    }
+
+async def rate(client: httpx.AsyncClient, requests: int, make_request) -> float:
+    start = time.perf_counter()
+    for i in range(requests):
+        response = await make_request(i)
+        response.raise_for_status()
+    return requests / (time.perf_counter() - start)
+
+async def run_mode(enabled: bool, accept: str) -> dict:
+    fast_response.FAST_PATH_ENABLED = enabled
+    db = MockDatabase()
+    app.dependency_overrides[get_database] = lambda: db
+    assignment_cache.clear()
+    headers = {"Accept": accept}
+    batch = [make_event(i) for i in range(BATCH_SIZE)]
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def assign(i):
+            return await client.post("/api/assignment", headers=headers,
+                                     json={"user_id": f"user_{i % 100}", "experiment_id": "homepage_banner"})
+
+        async def track(i):
+            return await client.post("/api/events", headers=headers, json=make_event(i))
+
+        async def track_batch(i):
+            return await client.post("/api/events/batch", headers=headers, json=batch)
+
+        await rate(client, 100, assign)  # warm the assignment cache
+        return {
+            "assignment": await rate(client, REQUESTS, assign),
+            "event": await rate(client, REQUESTS, track),
+            "batch": await rate(client, REQUESTS // 100, track_batch) * BATCH_SIZE,
+        }
+
+def route_field(path: str):
+    return next(route.response_field for route in app.routes if getattr(route, "path", None) == path)
+
+async def bench_encoding() -> None:
+    """Time only the response step for an assignment and a 1000-item batch result."""
+    assignment = {
+        "user_id": "user_1", "experiment_id": "homepage_banner", "variant": "control",
+        "assigned_at": datetime.now(), "is_control": True,
+    }
+    batch = {
+        "accepted": BATCH_SIZE, "rejected": 0,
+        "results": [{"index": i, "accepted": True, "event_id": str(uuid.uuid4()), "error": None} for i in range(BATCH_SIZE)],
+    }
+    cases = [
+        ("assignment", "/api/assignment", lambda: AssignmentResponse(**assignment), assignment, 20000),
+        ("batch of 1000", "/api/events/batch", lambda: BatchEventResponse(**batch), batch, 50),
+    ]
+    print("response step only (us per response)")
+    print(f"  {'payload':<16} {'response models':>16} {'orjson':>10} {'msgpack':>10}")
+    for name, path, build_model, payload, number in cases:
+        field = route_field(path)
+
+        async def models():
+            content = await serialize_response(field=field, response_content=build_model())
+            return JSONResponse(content)
+
+        async def fast_json():
+            return fast_response.fast_response(payload, "json")
+
+        async def fast_msgpack():
+            return fast_response.fast_response(payload, "msgpack")
+
+        timings = []
+        for encode in (models, fast_json, fast_msgpack):
+            best = float("inf")
+            for _ in range(ROUNDS):
+                start = time.perf_counter()
+                for _ in range(number):
+                    await encode()
+                best = min(best, (time.perf_counter() - start) / number)
+            timings.append(best * 1e6)
+        print(
+            f"  {name:<16} {timings[0]:>16.1f} {timings[1]:>10.1f} {timings[2]:>10.1f}"
+            f"   ({timings[0] / timings[1]:.1f}x / {timings[0] / timings[2]:.1f}x faster)"
+        )
+
+async def main():
+    await bench_encoding()
+    print(f"end to end: {REQUESTS} single requests, batches of {BATCH_SIZE} events, best of {ROUNDS} rounds")
+    print(f"  {'mode':<20} {'assignment/s':>14} {'events/s':>10} {'batch events/s':>16}")
+    best = {name: {} for name, _, _ in MODES}
+    for _ in range(ROUNDS):
+        for name, enabled, accept in MODES:
+            for key, value in (await run_mode(enabled, accept)).items():
+                best[name][key] = max(best[name].get(key, 0), value)
+    baseline = best[MODES[0][0]]
+    for name, _, _ in MODES:
+        result = best[name]
+        print(
+            f"  {name:<20} {result['assignment']:>14.0f} {result['event']:>10.0f} {result['batch']:>16.0f}"
+            f"   ({result['assignment'] / baseline['assignment']:.2f}x / {result['event'] / baseline['event']:.2f}x"
+            f" / {result['batch'] / baseline['batch']:.2f}x)"
+        )
+    fast_response.FAST_PATH_ENABLED = False
+    app.dependency_overrides.clear()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Measure the distinct-user sketches: error bounds, merging, memory and insert cost.
+
+For set sizes from 10 to 10^6 users, fills many independent sketches (each
+with its own random user ids) and reports the estimates' bias, relative
+RMSE and worst error against the theoretical standard error
+1.04 / sqrt(2**precision), and how often they land within 2 and 3 standard
+errors. Then merges sketches of overlapping sets (as two worker processes
+would keep them) and reports their estimates. Memory is compared with an
+exact set of the user ids, and the cost added to MockDatabase.insert_event
+is timed. tests/test_hyperloglog.py asserts the documented bounds:
+    python -m benchmarks.hyperloglog [trials]
+"""
+
+import asyncio
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.utils.database import MockDatabase
+from app.utils.hyperloglog import DEFAULT_PRECISION, HyperLogLog, merge_serialized
+
+SIZES = [10, 100, 1_000, 10_000, 30_000, 100_000, 1_000_000]
+
+def errors(rng: np.random.Generator, size: int, trials: int, precision: int) -> np.ndarray:
+    result = []
+    for _ in range(trials):
+        sketch = HyperLogLog(precision)
+        # Random 64-bit values stand in for hashed user ids (the hash is uniform)
+        sketch.add_hashes(rng.integers(0, 2**64, size=size, dtype=np.uint64))
+        result.append(sketch.count() / size - 1)
+    return np.array(result)
+
+def error_bounds(trials: int, precision: int) -> None:
+    rng = np.random.default_rng(24)
+    standard_error = HyperLogLog(precision).standard_error
+    print(f"Error bounds, precision {precision} ({1 << precision:,} registers, standard error {standard_error:.2%}), {trials} sketches per size")
+    print("       users      bias      RMSE     worst   within 2se  within 3se")
+    for size in SIZES:
+        measured = errors(rng, size, trials, precision)
+        rmse = float(np.sqrt(np.mean(measured ** 2)))
+        within2 = float(np.mean(np.abs(measured) <= 2 * standard_error))
+        within3 = float(np.mean(np.abs(measured) <= 3 * standard_error))
+        print(
+            f"  {size:>10,}  {measured.mean():>+7.2%}  {rmse:>7.2%}  {np.abs(measured).max():>7.2%}"
+            f"  {within2:>10.0%}  {within3:>10.0%}"
+        )
+
+def merging(precision: int) -> None:
+    print("Merging (two workers' sketches of overlapping users)")
+    for size in (10_000, 1_000_000):
+        users = np.random.default_rng(size).integers(0, 2**64, size=size, dtype=np.uint64)
+        first, second, whole = HyperLogLog(precision), HyperLogLog(precision), HyperLogLog(precision)
+        # Each worker saw 60% of the users; 20% were seen by both
+        first.add_hashes(users[:size * 6 // 10])
+        second.add_hashes(users[size * 4 // 10:])
+        whole.add_hashes(users)
+        merged = HyperLogLog.from_bytes(merge_serialized(first.to_bytes(), second.to_bytes()))
+        print(
+            f"  {size:>10,} users  worker sketches {first.count():>10,} + {second.count():>10,}"
+            f"   merged {merged.count():>10,}   one sketch of all {whole.count():>10,}"
+        )
+
+def memory(precision: int) -> None:
+    print("Memory per (variant, event_type)")
+    for size in (1_000, 100_000, 1_000_000):
+        sketch = HyperLogLog(precision)
+        user_ids = [f"user_{i}" for i in range(size)]
+        sketch.add_many(user_ids)
+        tracemalloc.start()
+        exact = set(user_ids)
+        exact_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(
+            f"  {len(exact):>10,} users  sketch {sketch.nbytes / 1024:>6.0f} KiB in memory, "
+            f"{len(sketch.to_bytes()) / 1024:>6.1f} KiB serialized   exact set {exact_bytes / 2**20:>7.1f} MiB (set only)"
+        )
+
+async def insert_cost() -> None:
+    events = [
+        {"user_id": f"user_{i % 50_000}", "experiment_id": "homepage_banner",
+         "variant": ("control", "variant_a")[i % 2], "event_type": ("impression", "click", "conversion")[i % 3]}
+        for i in range(100_000)
+    ]
+    db = MockDatabase()
+    start = time.perf_counter()
+    for event in events:
+        await db.insert_event(event)
+    total = time.perf_counter() - start
+    sketches = db.user_sketches
+    start = time.perf_counter()
+    for event in events:
+        sketches.add(event)
+    added = time.perf_counter() - start
+    print("Insert cost")
+    print(f"  MockDatabase.insert_event  {total / len(events) * 1e6:>6.2f} us per event, of which the sketch update {added / len(events) * 1e6:.2f} us")
+
+async def main():
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    error_bounds(trials, DEFAULT_PRECISION)
+    merging(DEFAULT_PRECISION)
+    memory(DEFAULT_PRECISION)
+    await insert_cost()
+
+if __name__ == "__main__":
+    asyncio.run(main())
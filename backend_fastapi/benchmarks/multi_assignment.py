@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Compare assigning a page's 15 experiments with 15 /assignment calls and with
+one /assignments/{user_id} call.
+
+The page has 9 standalone experiments and two layers of 3 mutually exclusive
+experiments. Runs in-process against the ASGI app on the in-memory and event
+log backends, for new users (every assignment computed and saved) and for
+returning users (served from the assignment cache), and counts the database
+calls each way. tests/test_multi_assignment.py checks that both ways give
+the same variants.
+
+    python -m benchmarks.multi_assignment [users]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+import httpx
+
+from main import app
+from app.utils.cache import assignment_cache
+from app.utils.database import MockDatabase, get_database
+from app.utils.experiment_registry import DatabaseExperimentSource, ExperimentRegistry, get_experiment_registry
+from app.utils.log_database import EventLogDatabase
+
+def page_experiments() -> dict:
+    experiments = {}
+    for i in range(9):
+        experiments[f"page_test_{i}"] = {"variants": {"control": 50.0, "treatment": 50.0}}
+    for layer in ("checkout", "search"):
+        for i, layer_range in enumerate(([0.0, 40.0], [40.0, 70.0], [70.0, 100.0])):
+            experiments[f"{layer}_test_{i}"] = {
+                "variants": {"control": 34.0, "variant_a": 33.0, "variant_b": 33.0},
+                "layer": layer,
+                "layer_range": layer_range,
+            }
+    return {
+        experiment_id: {
+            "experiment_id": experiment_id,
+            "name": experiment_id,
+            "description": None,
+            "status": "active",
+            "start_date": datetime.now(),
+            "end_date": None,
+            "allocation_mode": "static",
+            **config,
+        }
+        for experiment_id, config in experiments.items()
+    }
+
+def count_calls(db, calls: Counter):
+    """Wrap the database's assignment methods to count calls."""
+    for name in ("get_assignment", "save_assignment", "get_assignments", "save_assignments"):
+        method = getattr(db, name)
+
+        async def counted(*args, _method=method, _name=name):
+            calls[_name] += 1
+            return await _method(*args)
+        setattr(db, name, counted)
+
+async def run(label: str, db, users: int) -> None:
+    experiments = page_experiments()
+    db.experiments = experiments
+    registry = ExperimentRegistry(DatabaseExperimentSource(db))
+    await registry.reload()
+    calls = Counter()
+    count_calls(db, calls)
+    app.dependency_overrides[get_database] = lambda: db
+    app.dependency_overrides[get_experiment_registry] = lambda: registry
+    experiment_ids = list(experiments)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def single(user_id: str) -> dict:
+            variants = {}
+            for experiment_id in experiment_ids:
+                response = await client.post("/api/assignment", json={"user_id": user_id, "experiment_id": experiment_id})
+                variants[experiment_id] = response.json()["variant"] if response.status_code == 200 else None
+            return variants
+
+        async def multi(user_id: str) -> dict:
+            response = await client.get(f"/api/assignments/{user_id}", params={"experiment_id": experiment_ids})
+            response.raise_for_status()
+            return {experiment_id: a["variant"] for experiment_id, a in response.json()["assignments"].items()}
+
+        print(f"{label} ({users} users x {len(experiment_ids)} experiments)")
+        for name, assign, prefix in (("15 x POST /assignment", single, "a"), ("1 x GET /assignments", multi, "b")):
+            for phase in ("new users", "returning users"):
+                calls.clear()
+                start = time.perf_counter()
+                for i in range(users):
+                    await assign(f"{prefix}{i}")
+                elapsed = time.perf_counter() - start
+                database = ", ".join(f"{calls[key] / users:.1f} {key}" for key in sorted(calls)) or "none"
+                print(f"  {name:<22} {phase:<16} {elapsed / users * 1000:>7.2f} ms/page   db calls/page: {database}")
+            assignment_cache.clear()
+
+    app.dependency_overrides.clear()
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    assignment_cache.clear()
+    await run("memory", MockDatabase(), users)
+    with tempfile.TemporaryDirectory() as directory:
+        db = EventLogDatabase(os.path.join(directory, "log"))
+        await db.connect()
+        assignment_cache.clear()
+        await run("eventlog (fsync per write)", db, users)
+        await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
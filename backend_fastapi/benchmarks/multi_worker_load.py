@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Load test the app under uvicorn with 1, 2 and 4 worker processes sharing a SQLite database.
+
+Each run starts a real server, drives it from several client processes for a
+fixed time (every iteration is one assignment plus one event) and reports
+requests per second. tests/test_shared_sqlite.py checks that workers sharing
+the file agree on assignments and stats.
+
+    python -m benchmarks.multi_worker_load [seconds] [client_processes]
+"""
+
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+WORKER_COUNTS = [1, 2, 4]
+PORT = 8765
+BASE_URL = f"http://127.0.0.1:{PORT}"
+EXPERIMENT_ID = "homepage_banner"
+
+# Users are drawn from a shared pool so the same user hits different workers
+USER_POOL = 20000
+
+def client(seconds: float, seed: int, results) -> None:
+    rng = random.Random(seed)
+    requests = 0
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    with httpx.Client(base_url=BASE_URL, timeout=30) as http:
+        while time.perf_counter() < deadline:
+            user_id = f"user_{rng.randrange(USER_POOL)}"
+            response = http.post("/api/assignment", json={"user_id": user_id, "experiment_id": EXPERIMENT_ID})
+            requests += 1
+            if response.status_code != 200:
+                errors += 1
+                continue
+            variant = response.json()["variant"]
+            response = http.post("/api/events", json={
+                "user_id": user_id, "experiment_id": EXPERIMENT_ID,
+                "variant": variant, "event_type": "impression"
+            })
+            requests += 1
+            if response.status_code != 200:
+                errors += 1
+    results.put((requests, errors))
+
+def wait_for_server(process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            if httpx.get(f"{BASE_URL}/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+def run(workers: int, seconds: float, clients: int, database_path: str) -> dict:
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{database_path}", "BANDIT_UPDATE_INTERVAL": "0"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=Path(__file__).resolve().parents[1],
+        env=env,
+    )
+    try:
+        wait_for_server(server)
+        # Let every worker finish startup before timing
+        time.sleep(1)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=client, args=(seconds, workers * 1000 + i, results))
+            for i in range(clients)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "requests_per_second": sum(outcome[0] for outcome in outcomes) / seconds,
+        "errors": sum(outcome[1] for outcome in outcomes),
+    }
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print(f"{clients} client processes for {seconds:.0f}s per run, {os.cpu_count()} CPUs")
+    if (os.cpu_count() or 1) < max(WORKER_COUNTS):
+        print("(workers and clients share fewer CPUs than there are workers, so scaling is capped)")
+    print(f"{'workers':>8}  {'req/s':>8}  {'scaling':>7}  {'errors':>6}")
+    baseline = None
+    for workers in WORKER_COUNTS:
+        with tempfile.TemporaryDirectory() as directory:
+            result = run(workers, seconds, clients, os.path.join(directory, "load.db"))
+        baseline = baseline or result["requests_per_second"]
+        print(
+            f"{workers:>8}  {result['requests_per_second']:>8.0f}  "
+            f"{result['requests_per_second'] / baseline:>6.2f}x  {result['errors']:>6}"
+        )
+
+if __name__ == "__main__":
+    main()
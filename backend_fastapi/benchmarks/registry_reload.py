@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Time experiment lookups and reloads through the registry.
+
+Experiment lookup + assignment through the registry vs the previous TTL
+cache + per-call allocation check, the time to reload N experiments when
+they changed and when they did not, and the database source's load of N
+configs (tests/test_experiment_registry.py checks assignment consistency
+under concurrent and file reloads):
+    python -m benchmarks.registry_reload
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from app.utils.cache import LRUCache
+from app.utils.experiment_registry import DatabaseExperimentSource, ExperimentRegistry
+from app.utils.hash import get_variant_assignment
+from app.utils.sqlite_database import SqliteDatabase
+
+USERS = [f"user_{i}" for i in range(200)]
+
+def page(version: str) -> list:
+    """Five experiments: three standalone and two sharing a layer; the split depends on the version."""
+    first = 50.0 if version == "a" else 20.0
+    boundary = 50.0 if version == "a" else 30.0
+    experiments = [
+        {"experiment_id": f"page_test_{i}", "variants": {"control": first, "treatment": 100.0 - first}}
+        for i in range(3)
+    ]
+    experiments.append({"experiment_id": "layer_test_0", "variants": {"control": 50.0, "treatment": 50.0},
+                        "layer": "checkout", "layer_range": [0.0, boundary]})
+    experiments.append({"experiment_id": "layer_test_1", "variants": {"control": 50.0, "treatment": 50.0},
+                        "layer": "checkout", "layer_range": [boundary, 100.0]})
+    return [
+        {"name": experiment["experiment_id"], "description": version, "status": "active", "start_date": None,
+         "end_date": None, "allocation_mode": "static", "layer": None, "layer_range": None, **experiment}
+        for experiment in experiments
+    ]
+
+def timed(count: int, function) -> float:
+    start = time.perf_counter()
+    for i in range(count):
+        function(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+def lookup_cost() -> None:
+    configs = {config["experiment_id"]: config for config in page("a")}
+    registry = ExperimentRegistry(source=None)
+    registry.install(configs.values())
+    cache = LRUCache(max_size=1000, ttl=30)
+    for experiment_id, config in configs.items():
+        cache.set(experiment_id, config)
+    experiment_id = "page_test_0"
+
+    def cached(i):
+        config = cache.get(experiment_id)
+        get_variant_assignment(USERS[i % len(USERS)], experiment_id, config["variants"])
+
+    def registered(i):
+        registry.get(experiment_id).assign(USERS[i % len(USERS)])
+
+    count = 200_000
+    print(f"  TTL cache + allocation check   {timed(count, cached):>6.2f} us per assignment")
+    print(f"  registry snapshot              {timed(count, registered):>6.2f} us per assignment")
+
+def reload_cost() -> None:
+    for size in (100, 1000, 10000):
+        configs = [
+            {"experiment_id": f"exp_{i}", "name": f"exp_{i}", "description": None, "status": "active",
+             "variants": {"control": 50.0, "treatment": 50.0}, "start_date": datetime.now(), "end_date": None,
+             "allocation_mode": "static"}
+            for i in range(size)
+        ]
+        registry = ExperimentRegistry(source=None)
+        start = time.perf_counter()
+        registry.install(configs)
+        full = time.perf_counter() - start
+        start = time.perf_counter()
+        registry.install(configs)
+        unchanged = time.perf_counter() - start
+        configs[0] = {**configs[0], "variants": {"control": 40.0, "treatment": 60.0}}
+        start = time.perf_counter()
+        registry.install(configs)
+        one_changed = time.perf_counter() - start
+        print(f"  {size:>6} experiments: build {full * 1000:>7.1f} ms   unchanged {unchanged * 1000:>6.1f} ms   one changed {one_changed * 1000:>6.1f} ms")
+
+async def source_load_cost() -> None:
+    # What the database source costs per poll on SQLite: one query per experiment vs one for all
+    with tempfile.TemporaryDirectory() as directory:
+        db = SqliteDatabase(os.path.join(directory, "experiments.db"))
+        await db.connect()
+        try:
+            for size in (100, 1000):
+                rows = [
+                    (f"exp_{i}", f"exp_{i}", "active", json.dumps({"control": 50.0, "treatment": 50.0}))
+                    for i in range(size)
+                ]
+                await db._run(db._write, lambda conn: conn.executemany(
+                    "INSERT OR IGNORE INTO experiments (experiment_id, name, status, variants) VALUES (?, ?, ?, ?)", rows
+                ))
+
+                async def one_by_one():
+                    return [await db.get_experiment(experiment_id) for experiment_id in await db.list_experiments()]
+
+                per_experiment = await timed_load(one_by_one)
+                bulk = await timed_load(DatabaseExperimentSource(db).load)
+                print(f"  {size:>6} experiments: one query each {per_experiment * 1000:>7.1f} ms   one query {bulk * 1000:>6.1f} ms")
+        finally:
+            await db.close()
+
+async def timed_load(load, count: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        await load()
+    return (time.perf_counter() - start) / count
+
+async def main():
+    print("Lookup + assignment")
+    lookup_cost()
+    print("Reload")
+    reload_cost()
+    print("Database source load (SQLite)")
+    await source_load_cost()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Segment-sliced experiment stats at 10^7 events: bitmap index vs rescanning.
+
+Fills a MockDatabase's event store with one experiment's events (3 variants,
+3 event types, 3 devices and 40 locations with a skewed distribution) and
+assigns 10^6 users, then builds the segment bitmaps in bulk, as
+rebuild_stats does. Reports the bitmaps' memory against the event store and
+against plain int32 ordinal lists, and the latency of segment queries (one
+value, AND, OR, and a two-segment AND/OR mix) answered by
+get_experiment_stats through the bitmaps vs a vectorised NumPy scan over the
+experiment's event and assignment columns. Also times keeping the bitmaps
+up to date on insert. tests/test_segments.py checks the counts.
+
+    python -m benchmarks.segment_stats [events]
+"""
+
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.utils.database import MockDatabase
+from app.utils.segments import SEGMENT_DIMENSIONS, SegmentIndex, parse_segment
+
+EXPERIMENT_ID = "segment_bench"
+USERS = 1_000_000
+VARIANTS = ["control", "variant_a", "variant_b"]
+EVENT_TYPES = ["impression", "click", "conversion"]
+DEVICES = ["mobile", "desktop", "tablet"]
+LOCATIONS = ["US", "DE", "GB", "FR", "AT", "CH", "NL", "ES", "IT", "CA"] + [f"C{i:02d}" for i in range(30)]
+# Zipf-like weights: a few large markets and a long tail
+LOCATION_WEIGHTS = [1 / (rank + 1) for rank in range(len(LOCATIONS))]
+
+QUERIES = [
+    ("device", ["device_type:mobile"]),
+    ("device AND geo", ["device_type:mobile,geo_location:DE"]),
+    ("geo OR geo OR geo", ["geo_location:DE|AT|CH"]),
+    ("(AND) OR (AND)", ["device_type:mobile,geo_location:DE|AT", "device_type:tablet,geo_location:C07|C12|C20"]),
+]
+
+def seed(db: MockDatabase, count: int) -> None:
+    rng = random.Random(23)
+    start = datetime(2024, 1, 1)
+    devices = rng.choices(DEVICES, weights=[6, 3, 1], k=count)
+    locations = rng.choices(LOCATIONS, weights=LOCATION_WEIGHTS, k=count)
+    variants = rng.choices(VARIANTS, k=count)
+    event_types = rng.choices(EVENT_TYPES, weights=[80, 15, 5], k=count)
+    for i in range(count):
+        db.events.append({
+            "user_id": f"user_{i % USERS}",
+            "experiment_id": EXPERIMENT_ID,
+            "variant": variants[i],
+            "event_type": event_types[i],
+            "device_type": devices[i],
+            "geo_location": locations[i],
+            "recorded_at": start + timedelta(seconds=i // 10),
+        })
+        if i and i % 1_000_000 == 0:
+            print(f"  ... {i:,} events")
+
+def assignments(codes: dict):
+    """Yield the users' assignments, recording their codes for the scan baseline."""
+    rng = random.Random(7)
+    values = {
+        "variant": [VARIANTS[i % 3] for i in range(USERS)],
+        "device_type": rng.choices(DEVICES, weights=[6, 3, 1], k=USERS),
+        "geo_location": rng.choices(LOCATIONS, weights=LOCATION_WEIGHTS, k=USERS),
+    }
+    for name, names in (("variant", VARIANTS), ("device_type", DEVICES), ("geo_location", LOCATIONS)):
+        position = {value: code for code, value in enumerate(names)}
+        codes[name] = np.array([position[value] for value in values[name]], dtype=np.int32)
+    for i in range(USERS):
+        yield {
+            "user_id": f"user_{i}",
+            "experiment_id": EXPERIMENT_ID,
+            "variant": values["variant"][i],
+            "device_type": values["device_type"][i],
+            "geo_location": values["geo_location"][i],
+        }
+
+def scan_counts(db: MockDatabase, columns: dict, user_codes: dict, segments: list) -> tuple:
+    """Counts by scanning every event and assignment column with NumPy masks."""
+    def matches(column_codes, encode) -> np.ndarray:
+        matched = np.zeros(len(next(iter(column_codes.values()))), dtype=bool)
+        for segment in segments:
+            mask = np.ones_like(matched)
+            for dimension, values in segment.items():
+                codes = [code for code in (encode(dimension, value) for value in values) if code is not None]
+                mask &= np.isin(column_codes[dimension], codes)
+            matched |= mask
+        return matched
+
+    events = db.events
+    event_mask = matches(columns, lambda dimension, value: events.lookup(dimension, value))
+    keys = columns["variant"][event_mask].astype(np.int64) * 1000 + columns["event_type"][event_mask]
+    groups, counts = np.unique(keys, return_counts=True)
+    event_counts = {}
+    for key, count in zip(groups.tolist(), counts.tolist()):
+        variant, event_type = events.decode("variant", key // 1000), events.decode("event_type", key % 1000)
+        event_counts.setdefault(variant, {})[event_type] = count
+
+    values = {"device_type": DEVICES, "geo_location": LOCATIONS}
+    user_mask = matches(
+        {dimension: user_codes[dimension] for dimension in SEGMENT_DIMENSIONS},
+        lambda dimension, value: values[dimension].index(value) if value in values[dimension] else None
+    )
+    per_variant = np.bincount(user_codes["variant"][user_mask], minlength=len(VARIANTS))
+    variant_distribution = {VARIANTS[i]: int(count) for i, count in enumerate(per_variant) if count}
+    return variant_distribution, event_counts
+
+def timed(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1000
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    db = MockDatabase()
+    print(f"Seeding {count:,} events and {USERS:,} users")
+    start = time.perf_counter()
+    seed(db, count)
+    print(f"  event store filled in {time.perf_counter() - start:.1f}s")
+
+    user_codes = {}
+    start = time.perf_counter()
+    db.segment_index = SegmentIndex.rebuild(db.events, assignments(user_codes))
+    print(f"  segment bitmaps built in bulk in {time.perf_counter() - start:.1f}s (including generating the assignments)")
+
+    index_bytes = db.segment_index.nbytes()
+    experiment = db.segment_index.experiments[EXPERIMENT_ID]
+    bitmaps = list(experiment.bitmaps())
+    ordinal_lists = 4 * sum(len(bitmap) for bitmap in bitmaps)
+    print("Memory")
+    print(f"  event store                      {db.events.nbytes() / 2**20:>9.1f} MiB")
+    print(f"  segment bitmaps ({len(bitmaps)} bitmaps)     {index_bytes / 2**20:>9.1f} MiB   "
+          f"({index_bytes * 8 / (count + USERS):.1f} bits per event and user)")
+    print(f"  same sets as int32 ordinal lists {ordinal_lists / 2**20:>9.1f} MiB")
+    print(f"  user id -> ordinal map           not included above ({len(experiment.user_ordinals):,} entries)")
+
+    columns = {
+        name: db.events.codes(name)
+        for name in ("variant", "event_type") + SEGMENT_DIMENSIONS
+    }
+    print("Latency (median)                    bitmaps      column scan")
+    for label, spec in QUERIES:
+        segments = [parse_segment(text) for text in spec]
+        stats = await db.get_experiment_stats(EXPERIMENT_ID, segments)
+        bitmap_ms = timed(lambda: db.segment_index.counts(EXPERIMENT_ID, segments), 9)
+        scan_ms = timed(lambda: scan_counts(db, columns, user_codes, segments), 3)
+        print(f"  {label:<20} {stats['total_users']:>9,} users  {bitmap_ms:>8.2f} ms  {scan_ms:>10.2f} ms  ({scan_ms / bitmap_ms:.0f}x)")
+
+    print("Incremental maintenance")
+    sample = [db.events.row(row) for row in range(min(count, 200_000))]
+    index = SegmentIndex()
+    start = time.perf_counter()
+    for event in sample:
+        index.add_event(event)
+    print(f"  add_event                        {(time.perf_counter() - start) / len(sample) * 1e6:>6.2f} us per event")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the assignment and event hot paths, with JSON results for comparing runs.
+
+Three groups:
+    micro    - hashing and allocation code called directly
+    routes   - every hot route through the ASGI app in-process (httpx, no server)
+    scaling  - stats and event queries against stores holding 10^4 .. 10^7 events
+
+    python -m benchmarks.suite                              # all groups, up to 10^6 events
+    python -m benchmarks.suite --group micro --group routes
+    python -m benchmarks.suite --max-events 10000000        # include the 10^7 store
+    python -m benchmarks.suite --database-url sqlite:////tmp/bench.db
+    python -m benchmarks.suite --compare benchmarks/results/<earlier run>.json --fail-on-regression
+
+Results are written to benchmarks/results/<UTC timestamp>.json unless --output is given.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from main import app
+from app.utils.bandit import thompson_weights
+from app.utils.bulk_assignment import _hash_chunk
+from app.utils.cache import assignment_cache
+from app.utils.database import MockDatabase, create_database, get_database
+from app.utils.hash import compile_allocation, get_variant_assignment, validate_experiment_config
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SCALING_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+EXPERIMENT_ID = "homepage_banner"
+EVENT_TYPES = ["impression", "impression", "impression", "click", "conversion"]
+
+class Suite:
+    """Collects timings; every result is reported as time per operation."""
+
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results: List[Dict[str, Any]] = []
+
+    def record(self, group: str, name: str, timings: List[float], number: int, **params: Any) -> None:
+        per_op = [timing / number for timing in timings]
+        median = statistics.median(per_op)
+        result = {
+            "group": group,
+            "name": name,
+            "params": params,
+            "number": number,
+            "repeat": len(timings),
+            "min_us": min(per_op) * 1e6,
+            "median_us": median * 1e6,
+            "ops_per_sec": 1 / median if median else None,
+        }
+        self.results.append(result)
+        label = name + "".join(f" {key}={value}" for key, value in params.items())
+        print(f"  {label:<52} {result['median_us']:>12.2f} us/op  {result['ops_per_sec']:>12.0f} ops/s")
+
+    def run(self, group: str, name: str, function: Callable[[], Any], number: int, **params: Any) -> None:
+        function()  # warm-up
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            timings.append(time.perf_counter() - start)
+        self.record(group, name, timings, number, **params)
+
+    async def run_async(
+        self, group: str, name: str, function: Callable[[], Awaitable[Any]], number: int, **params: Any
+    ) -> None:
+        await function()  # warm-up
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                await function()
+            timings.append(time.perf_counter() - start)
+        self.record(group, name, timings, number, **params)
+
+def result_key(result: Dict[str, Any]) -> str:
+    params = ",".join(f"{key}={value}" for key, value in sorted(result["params"].items()))
+    return f"{result['group']}/{result['name']}[{params}]"
+
+def make_variants(count: int) -> Dict[str, float]:
+    names = ["control"] + [f"variant_{i}" for i in range(1, count)]
+    share = round(100 / count, 2)
+    variants = {name: share for name in names}
+    variants["control"] = round(100 - share * (count - 1), 2)
+    return variants
+
+def make_event(i: int, rng: random.Random, experiment_id: str = EXPERIMENT_ID) -> Dict[str, Any]:
+    return {
+        "user_id": f"user_{rng.randrange(1_000_000)}",
+        "experiment_id": experiment_id,
+        "variant": rng.choice(("control", "variant_a", "variant_b")),
+        "event_type": rng.choice(EVENT_TYPES),
+        "campaign_id": f"campaign_{i % 20}",
+        "device_type": rng.choice(("desktop", "mobile", "tablet")),
+    }
+
+def bench_micro(suite: Suite) -> None:
+    print("micro")
+    user_ids = [f"user_{i}" for i in range(1000)]
+    ids = iter(range(10**9))
+    for count in (2, 10, 100):
+        variants = make_variants(count)
+        allocation = compile_allocation(EXPERIMENT_ID, variants)
+        suite.run("micro", "get_variant_assignment",
+                  lambda: get_variant_assignment(f"user_{next(ids)}", EXPERIMENT_ID, variants), 20000, variants=count)
+        suite.run("micro", "allocation.bucket", lambda: allocation.bucket(f"user_{next(ids)}"), 20000, variants=count)
+        suite.run("micro", "compile_allocation", lambda: compile_allocation(EXPERIMENT_ID, variants), 2000, variants=count)
+        suite.run("micro", "validate_experiment_config", lambda: validate_experiment_config(variants), 20000, variants=count)
+
+    allocation = compile_allocation(EXPERIMENT_ID, make_variants(3))
+    suite.run("micro", "bulk_hash_chunk",
+              lambda: _hash_chunk(allocation.key, allocation.message_suffix, user_ids), 50, users=len(user_ids))
+
+    rng = np.random.default_rng(0)
+    trials = [10_000, 10_000, 10_000]
+    successes = [400, 450, 520]
+    suite.run("micro", "thompson_weights", lambda: thompson_weights(successes, trials, draws=10000, rng=rng), 50, variants=3)
+
+async def seed_events(db, count: int, rng: random.Random, start: datetime) -> None:
+    """Insert count events, one second apart, in batches straight into the database."""
+    batch_size = 50_000
+    for offset in range(0, count, batch_size):
+        batch = []
+        for i in range(offset, min(offset + batch_size, count)):
+            event = make_event(i, rng)
+            event["recorded_at"] = start + timedelta(seconds=i)
+            batch.append(event)
+        await db.insert_events(batch)
+
+async def open_database(database_url: Optional[str]):
+    db = create_database(database_url) if database_url else MockDatabase()
+    await db.connect()
+    return db
+
+async def bench_routes(suite: Suite, database_url: Optional[str]) -> None:
+    print("routes")
+    db = await open_database(database_url)
+    app.dependency_overrides[get_database] = lambda: db
+    assignment_cache.clear()
+    rng = random.Random(1)
+    await seed_events(db, 10_000, rng, datetime.now() - timedelta(days=1))
+    ids = iter(range(10**9))
+
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            async def call(method: str, url: str, **kwargs: Any) -> None:
+                response = await client.request(method, url, **kwargs)
+                response.raise_for_status()
+
+            await suite.run_async("routes", "POST /api/assignment new user", lambda: call(
+                "POST", "/api/assignment", json={"user_id": f"new_{next(ids)}", "experiment_id": EXPERIMENT_ID}
+            ), 500)
+            await suite.run_async("routes", "POST /api/assignment returning user", lambda: call(
+                "POST", "/api/assignment", json={"user_id": "new_0", "experiment_id": EXPERIMENT_ID}
+            ), 500)
+            await suite.run_async("routes", "POST /api/events", lambda: call(
+                "POST", "/api/events", json=make_event(next(ids), rng)
+            ), 500)
+            batch = [make_event(i, rng) for i in range(100)]
+            await suite.run_async("routes", "POST /api/events/batch", lambda: call(
+                "POST", "/api/events/batch", json=batch
+            ), 50, events=len(batch))
+            await suite.run_async("routes", "POST /api/events/impression", lambda: call(
+                "POST", "/api/events/impression",
+                params={"user_id": f"user_{next(ids)}", "experiment_id": EXPERIMENT_ID, "variant": "control"}
+            ), 500)
+            await suite.run_async("routes", "GET /api/experiments/{id}", lambda: call(
+                "GET", f"/api/experiments/{EXPERIMENT_ID}"
+            ), 500)
+            await suite.run_async("routes", "GET /api/experiments/{id}/stats", lambda: call(
+                "GET", f"/api/experiments/{EXPERIMENT_ID}/stats"
+            ), 500)
+            await suite.run_async("routes", "GET /api/experiments/{id}/analysis", lambda: call(
+                "GET", f"/api/experiments/{EXPERIMENT_ID}/analysis"
+            ), 200)
+            await suite.run_async("routes", "GET /api/events/{id}", lambda: call(
+                "GET", f"/api/events/{EXPERIMENT_ID}", params={"limit": 100}
+            ), 200, limit=100)
+            await suite.run_async("routes", "GET /api/events/{id}/export", lambda: call(
+                "GET", f"/api/events/{EXPERIMENT_ID}/export"
+            ), 5, events=10_000)
+    finally:
+        app.dependency_overrides.clear()
+        await db.close()
+
+async def bench_scaling(suite: Suite, database_url: Optional[str], max_events: int) -> None:
+    """Grow one store through each size, so a --database-url should start out empty."""
+    print("scaling")
+    db = await open_database(database_url)
+    start = datetime(2024, 1, 1)
+    seeded = 0
+    for size in [size for size in SCALING_SIZES if size <= max_events]:
+        rng = random.Random(size)
+        seeding = time.perf_counter()
+        await seed_events(db, size - seeded, rng, start + timedelta(seconds=seeded))
+        seeded = size
+        print(f"  ({size} events, seeded in {time.perf_counter() - seeding:.1f}s)")
+        middle = start + timedelta(seconds=size // 2)
+        window = (middle, middle + timedelta(seconds=1000))
+
+        await suite.run_async("scaling", "get_experiment_stats",
+                              lambda: db.get_experiment_stats(EXPERIMENT_ID), 200, events=size)
+        await suite.run_async("scaling", "query_experiment_events latest",
+                              lambda: db.query_experiment_events(EXPERIMENT_ID, 100), 100, events=size)
+        await suite.run_async("scaling", "query_experiment_events time range",
+                              lambda: db.query_experiment_events(EXPERIMENT_ID, 100, *window), 100, events=size)
+
+        async def ten_pages() -> None:
+            cursor = None
+            for _ in range(10):
+                page = await db.query_experiment_events(EXPERIMENT_ID, 100, cursor=cursor)
+                cursor = page["next_cursor"]
+
+        await suite.run_async("scaling", "query_experiment_events 10 pages", ten_pages, 10, events=size)
+
+        async def scan_window() -> None:
+            async for _ in db.iter_experiment_events(EXPERIMENT_ID, *window):
+                pass
+
+        await suite.run_async("scaling", "iter_experiment_events 1000 event window", scan_window, 20, events=size)
+        await suite.run_async("scaling", "rebuild_stats", db.rebuild_stats, 1, events=size)
+    await db.close()
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    """Print the change against an earlier run and return the number of regressions."""
+    baseline = {result_key(result): result for result in json.loads(Path(baseline_path).read_text())["results"]}
+    regressions = 0
+    print(f"\ncompared with {baseline_path} (regression threshold {threshold:.0%})")
+    for result in results:
+        previous = baseline.get(result_key(result))
+        if previous is None:
+            continue
+        ratio = result["median_us"] / previous["median_us"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"  {result_key(result):<80} {ratio:>6.2f}x time{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--group", action="append", choices=["micro", "routes", "scaling"],
+                        help="Benchmark group to run (repeatable; default: all)")
+    parser.add_argument("--max-events", type=int, default=1_000_000, help="Largest store for scaling benchmarks")
+    parser.add_argument("--database-url", help="Benchmark this DATABASE_URL instead of the mock database")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repetitions per benchmark")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    args = parser.parse_args()
+    groups = args.group or ["micro", "routes", "scaling"]
+
+    suite = Suite(args.repeat)
+    if "micro" in groups:
+        bench_micro(suite)
+    if "routes" in groups:
+        asyncio.run(bench_routes(suite, args.database_url))
+    if "scaling" in groups:
+        asyncio.run(bench_scaling(suite, args.database_url, args.max_events))
+
+    timestamp = datetime.now(timezone.utc)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{timestamp:%Y%m%dT%H%M%SZ}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "meta": {
+            "timestamp": timestamp.isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": args.database_url or "mock",
+            "repeat": args.repeat,
+        },
+        "results": suite.results,
+    }, indent=2))
+    print(f"\nresults written to {output}")
+
+    if args.compare:
+        regressions = compare(suite.results, args.compare, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
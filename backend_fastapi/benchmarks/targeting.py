@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Time targeting with 1,000 active targeted experiments.
+
+Every experiment targets a random mix of devices, countries (exact codes or
+prefixes), user-attribute predicates and a rollout percentage. For a stream
+of users with random devices, locations and attributes, finds every
+experiment each user is targeted by and assigns them a variant:
+
+- interpreted: walk each experiment's targeting config per request
+- closures: each experiment's compiled rules (CompiledExperiment.admits)
+- bitset index: the snapshot's TargetingIndex, then closures only for the
+  experiments left that have attribute or rollout rules
+
+Then the same users go through POST /api/assignments/{user_id} in-process.
+tests/test_targeting.py checks that all three pick the same experiments.
+
+    python -m benchmarks.targeting [users]
+"""
+
+import asyncio
+import hashlib
+import hmac
+import operator
+import os
+import random
+import sys
+import time
+
+import httpx
+
+from main import app
+from app.utils.cache import assignment_cache
+from app.utils.database import MockDatabase, get_database
+from app.utils.experiment_registry import ExperimentRegistry, get_experiment_registry
+from app.utils.hash import BUCKET_COUNT
+
+EXPERIMENTS = 1000
+DEVICES = ["mobile", "tablet", "desktop"]
+COUNTRIES = ["US", "CA", "GB", "DE", "FR", "BR", "IN", "JP", "AU", "MX"]
+REGIONS = [f"{country}-{region}" for country in COUNTRIES for region in ("01", "02", "03", "04")]
+PLANS = ["free", "pro", "team", "enterprise"]
+
+def targeting_rules(rng: random.Random) -> dict:
+    rules = {}
+    if rng.random() < 0.7:
+        rules["device_types"] = rng.sample(DEVICES, rng.randint(1, 2))
+    if rng.random() < 0.6:
+        if rng.random() < 0.5:
+            rules["geo_prefixes"] = rng.sample(COUNTRIES, rng.randint(1, 3))
+        else:
+            rules["geo_locations"] = rng.sample(REGIONS, rng.randint(1, 8))
+    attributes = []
+    if rng.random() < 0.4:
+        attributes.append({"attribute": "plan", "operator": "in", "value": rng.sample(PLANS, 2)})
+    if rng.random() < 0.3:
+        attributes.append({"attribute": "account_age_days", "operator": rng.choice(["lt", "gte"]), "value": rng.randint(7, 365)})
+    if rng.random() < 0.1:
+        attributes.append({"attribute": "beta_opt_in", "operator": "eq", "value": True})
+    if attributes:
+        rules["attributes"] = attributes
+    if rng.random() < 0.5:
+        rules["rollout"] = float(rng.choice([5, 10, 25, 50]))
+    if not rules:
+        rules["rollout"] = 90.0
+    return rules
+
+def experiment_configs() -> list:
+    rng = random.Random(22)
+    return [
+        {"experiment_id": f"targeted_{i}", "name": f"targeted_{i}", "description": None, "status": "active",
+         "variants": {"control": 50.0, "treatment": 50.0}, "start_date": None, "end_date": None,
+         "allocation_mode": "static", "targeting": targeting_rules(rng)}
+        for i in range(EXPERIMENTS)
+    ]
+
+def users(count: int) -> list:
+    rng = random.Random(7)
+    result = []
+    for i in range(count):
+        attributes = {"plan": rng.choice(PLANS), "account_age_days": rng.randint(0, 1000)}
+        if rng.random() < 0.2:
+            attributes["beta_opt_in"] = True
+        result.append((f"user_{i}", rng.choice(DEVICES), rng.choice(REGIONS), attributes))
+    return result
+
+_INTERPRETED_OPERATORS = {
+    "eq": operator.eq, "ne": operator.ne, "gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le,
+}
+
+def interpreted_admits(config: dict, user_id: str, device_type: str, geo_location: str, attributes: dict) -> bool:
+    """Per-request evaluation of the raw targeting config, as the separate targeting service does it."""
+    rules = config.get("targeting") or {}
+    if "device_types" in rules and device_type not in rules["device_types"]:
+        return False
+    if "geo_locations" in rules or "geo_prefixes" in rules:
+        if geo_location not in rules.get("geo_locations", []) and \
+                not any(geo_location.startswith(prefix) for prefix in rules.get("geo_prefixes", [])):
+            return False
+    for rule in rules.get("attributes", []):
+        name, op, value = rule["attribute"], rule["operator"], rule["value"]
+        if op == "exists":
+            admitted = name in attributes
+        elif op in ("in", "not_in"):
+            admitted = (attributes.get(name) in value) == (op == "in") if name in attributes else op == "not_in"
+        elif name not in attributes:
+            admitted = op == "ne"
+        else:
+            admitted = _INTERPRETED_OPERATORS[op](attributes[name], value)
+        if not admitted:
+            return False
+    if "rollout" in rules:
+        message = f"{user_id}:{config['experiment_id']}:rollout:{os.getenv('HASH_SEED', 'default-seed')}"
+        digest = hmac.new(os.getenv("HMAC_SALT", "default-salt").encode(), message.encode(), hashlib.sha256).hexdigest()
+        if int(digest[:8], 16) % BUCKET_COUNT >= rules["rollout"] * 100:
+            return False
+    return True
+
+def in_process(registry: ExperimentRegistry, population: list) -> None:
+    snapshot = registry.snapshot
+    experiments = list(snapshot.experiments.values())
+    configs = [experiment.config for experiment in experiments]
+
+    def interpreted(user):
+        user_id, device, geo, attributes = user
+        return [config["experiment_id"] for config in configs if interpreted_admits(config, user_id, device, geo, attributes)]
+
+    def closures(user):
+        user_id, device, geo, attributes = user
+        return [experiment.experiment_id for experiment in experiments if experiment.admits(user_id, device, geo, attributes)]
+
+    def indexed(user):
+        return [experiment.experiment_id for experiment in snapshot.targeting.matching(*user)]
+
+    # The interpreted walk is slow; time it on a slice of the users
+    sample = population[:max(len(population) // 10, 1)]
+    matched = sum(len(indexed(user)) for user in population) / len(population)
+    print(f"  {EXPERIMENTS} active targeted experiments, {matched:.1f} targeting each user on average")
+
+    for name, select, people in (("interpreted", interpreted, sample), ("closures", closures, population),
+                                 ("bitset index", indexed, population)):
+        start = time.perf_counter()
+        for user in people:
+            select(user)
+        elapsed = time.perf_counter() - start
+        print(f"  {name:<14} targeting only   {len(people) / elapsed:>10,.0f} users/s   {elapsed / len(people) * 1e6:>8.1f} us/user")
+
+    start = time.perf_counter()
+    assigned = 0
+    for user in population:
+        for experiment in snapshot.targeting.matching(*user):
+            experiment.assign(user[0])
+            assigned += 1
+    elapsed = time.perf_counter() - start
+    print(f"  bitset index + variant hash    {assigned / elapsed:>10,.0f} assignments/s   {len(population) / elapsed:>8,.0f} users/s")
+
+async def through_app(registry: ExperimentRegistry, population: list) -> None:
+    db = MockDatabase()
+    app.dependency_overrides[get_database] = lambda: db
+    app.dependency_overrides[get_experiment_registry] = lambda: registry
+    assignment_cache.clear()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            assigned = 0
+            start = time.perf_counter()
+            for user_id, device, geo, attributes in population:
+                response = await client.post(f"/api/assignments/{user_id}",
+                                             json={"device_type": device, "geo_location": geo, "attributes": attributes})
+                response.raise_for_status()
+                assigned += len(response.json()["assignments"])
+            elapsed = time.perf_counter() - start
+    finally:
+        app.dependency_overrides.clear()
+        assignment_cache.clear()
+    print(f"  POST /api/assignments (new users) {assigned / elapsed:>8,.0f} assignments/s   {len(population) / elapsed:>6,.0f} requests/s")
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    registry = ExperimentRegistry(source=None)
+    start = time.perf_counter()
+    registry.install(experiment_configs())
+    print(f"Compiled {EXPERIMENTS} experiments and the targeting index in {(time.perf_counter() - start) * 1000:.1f} ms")
+    population = users(count)
+    print("In-process")
+    in_process(registry, population)
+    print("Through the app")
+    await through_app(registry, population[:max(count // 4, 1)])
+
+if __name__ == "__main__":
+    asyncio.run(main())
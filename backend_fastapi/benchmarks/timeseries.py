@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark time-series queries served from rollups against aggregating raw events.
+
+Spreads events over 120 days, compacts the rollups as the background
+compactor would, then times a daily series over the whole range and an
+hourly series over the last week, from rollups and by scanning the raw
+events (tests/test_rollups.py checks that the two agree):
+    python -m benchmarks.timeseries
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from app.utils.database import MockDatabase
+from app.utils.rollup_compactor import RollupCompactor
+from app.utils.rollups import DAY, HOUR, bucket_start, build_timeseries, epoch_seconds
+
+EVENT_COUNTS = [10_000, 100_000, 1_000_000]
+EXPERIMENT_ID = "homepage_banner"
+SPAN_DAYS = 120
+
+async def populate(db: MockDatabase, count: int, now: datetime) -> None:
+    step = timedelta(days=SPAN_DAYS) / count
+    batch = []
+    for i in range(count):
+        batch.append({
+            "user_id": f"user_{i % 50_000}",
+            "experiment_id": EXPERIMENT_ID,
+            "variant": ("control", "variant_a")[i % 2],
+            "event_type": ("impression", "impression", "click", "conversion")[i % 4],
+            "device_type": ("mobile", "desktop", "tablet")[i % 3],
+            "recorded_at": now - step * (count - i),
+        })
+        if len(batch) == 10_000:
+            await db.insert_events(batch)
+            batch = []
+    await db.insert_events(batch)
+
+async def from_rollups(db: MockDatabase, since: int, until: int, width: int) -> list:
+    rows = await db.get_event_rollups(EXPERIMENT_ID, since, until, width)
+    return build_timeseries(rows, width, ["variant", "event_type"])
+
+async def from_events(db: MockDatabase, since: int, until: int, width: int, cutoffs: tuple) -> list:
+    # Same points from the raw events; buckets the compactor widened are summed at their stored width
+    minute_before, hour_before = cutoffs
+    points = {}
+    async for event in db.iter_experiment_events(EXPERIMENT_ID):
+        seconds = epoch_seconds(event["recorded_at"])
+        if not since <= seconds < until:
+            continue
+        stored = DAY if seconds < hour_before else HOUR if seconds < minute_before else 60
+        bucket_width = max(width, stored)
+        key = (bucket_start(seconds, bucket_width), bucket_width, event["variant"], event["event_type"])
+        points[key] = points.get(key, 0) + 1
+    return [
+        {"bucket_start": start, "bucket_seconds": bucket_width, "variant": variant, "event_type": event_type, "events": events}
+        for (start, bucket_width, variant, event_type), events in sorted(points.items())
+    ]
+
+async def timed(query, *args) -> tuple:
+    start = time.perf_counter()
+    points = await query(*args)
+    return points, time.perf_counter() - start
+
+async def main():
+    print(f"{'events':>10} {'query':<22} {'rollup rows':>12} {'rollups ms':>11} {'raw scan ms':>12} {'speedup':>8}")
+    for count in EVENT_COUNTS:
+        db = MockDatabase()
+        now = datetime.now()
+        await populate(db, count, now)
+        compactor = RollupCompactor(db)
+        clock = now.timestamp()
+        await compactor.compact(clock)
+        cutoffs = (
+            bucket_start(clock - compactor.minute_retention, HOUR),
+            bucket_start(clock - compactor.hour_retention, DAY)
+        )
+        until = bucket_start(clock, DAY) + DAY
+        queries = [
+            ("daily, 120 days", until - (SPAN_DAYS + 1) * DAY, until, DAY),
+            ("hourly, last 7 days", bucket_start(clock, HOUR) - 7 * DAY, bucket_start(clock, HOUR) + HOUR, HOUR),
+        ]
+        for label, since, end, width in queries:
+            rows = len(await db.get_event_rollups(EXPERIMENT_ID, since, end, width))
+            _, rollup_seconds = await timed(from_rollups, db, since, end, width)
+            _, scan_seconds = await timed(from_events, db, since, end, width, cutoffs)
+            print(
+                f"{count:>10,} {label:<22} {rows:>12,} {rollup_seconds * 1000:>11.2f} "
+                f"{scan_seconds * 1000:>12.1f} {scan_seconds / rollup_seconds:>7.0f}x"
+            )
+
+if __name__ == "__main__":
+    asyncio.run(main())
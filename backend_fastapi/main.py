@@ -1,13 +1,26 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse, Response
 import os
+import time
 from dotenv import load_dotenv
 
+# Load environment variables before the app modules read them
+load_dotenv()
+
 from app.routes import experiments, events
+from app.utils.bandit import bandit_updater
+from app.utils.bulk_assignment import bulk_assignment_pool
+from app.utils.cache import cache_stats
+from app.utils.database import db
+from app.utils.dedup import event_deduplicator
+from app.utils.event_buffer import event_buffer
+from app.utils.experiment_registry import experiment_registry
+from app.utils.metrics import CONTENT_TYPE, MetricsMiddleware, registry, render_metrics
+from app.utils.profiler import ProfilerMiddleware, get_profile, profiling_enabled
+from app.utils.rollup_compactor import rollup_compactor
 
-# Load environment variables
-load_dotenv()
+STARTED_AT = time.time()
 
 # Create FastAPI app with metadata for Swagger
 app = FastAPI(
@@ -27,6 +40,75 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request timing for /metrics, and per-request profiling with an X-Profile: 1 header
+app.add_middleware(MetricsMiddleware)
+if profiling_enabled():
+    app.add_middleware(ProfilerMiddleware, interval=float(os.getenv("PROFILING_INTERVAL", 0.001)))
+
+def collect_component_metrics():
+    """Cache, registry, write-behind, dedup, bandit and rollup counters, read at scrape time."""
+    families = []
+    for cache_name, stats in cache_stats().items():
+        for key, kind in (("size", "gauge"), ("hits", "counter"), ("misses", "counter"), ("evictions", "counter")):
+            families.append((f"cache_{key}", kind, f"Cache {key}", [({"cache": cache_name}, stats[key])]))
+    registry_metrics = experiment_registry.metrics()
+    families.append(("experiment_registry_version", "gauge", "Version of the published experiment config snapshot",
+                     [({}, registry_metrics["version"])]))
+    families.append(("experiment_registry_reloads", "counter", "Experiment config reloads by outcome",
+                     [({"outcome": "ok"}, registry_metrics["reloads"]), ({"outcome": "failed"}, registry_metrics["failures"])]))
+    if event_buffer is not None:
+        buffer_metrics = event_buffer.metrics()
+        families.append(("event_buffer_queue_depth", "gauge", "Events waiting to be flushed",
+                         [({}, buffer_metrics["queue_depth"])]))
+        families.append(("event_buffer_events", "counter", "Buffered events by outcome",
+                         [({"outcome": outcome}, buffer_metrics[outcome]) for outcome in ("enqueued", "rejected", "flushed", "failed")]))
+    if event_deduplicator is not None:
+        dedup_metrics = event_deduplicator.metrics()
+        families.append(("event_dedup_events", "counter", "Events with a client event id by outcome",
+                         [({"outcome": outcome}, dedup_metrics[outcome]) for outcome in ("checked", "duplicates", "stored")]))
+        families.append(("event_dedup_false_positive_rate", "gauge", "Estimated chance a new event id is taken for a duplicate",
+                         [({}, dedup_metrics["estimated_false_positive_rate"])]))
+    if bandit_updater is not None:
+        families.append(("bandit_updates", "counter", "Bandit weight update rounds",
+                         [({}, bandit_updater.updates)]))
+    if rollup_compactor is not None:
+        families.append(("rollup_rows_compacted", "counter", "Rollup rows merged into coarser buckets by source width",
+                         [({"width": width}, count) for width, count in rollup_compactor.merged.items()]))
+    families.append(("process_uptime_seconds", "gauge", "Seconds since the app started",
+                     [({}, time.time() - STARTED_AT)]))
+    return families
+
+registry.register_collector(collect_component_metrics)
+
+# Open and close database connections with the app; experiment configs are
+# loaded before the first request, and buffered events are drained and the
+# background tasks stopped before the database closes. The bulk assignment
+# process pool lives as long as the app
+@app.on_event("startup")
+async def connect_database():
+    await db.connect()
+    await experiment_registry.reload()
+    await experiment_registry.start()
+    if event_buffer is not None:
+        await event_buffer.start()
+    if bandit_updater is not None:
+        await bandit_updater.start()
+    if rollup_compactor is not None:
+        await rollup_compactor.start()
+    bulk_assignment_pool.start()
+
+@app.on_event("shutdown")
+async def close_database():
+    bulk_assignment_pool.stop()
+    if rollup_compactor is not None:
+        await rollup_compactor.stop()
+    if bandit_updater is not None:
+        await bandit_updater.stop()
+    if event_buffer is not None:
+        await event_buffer.stop()
+    await experiment_registry.stop()
+    await db.close()
+
 # Include routers
 app.include_router(experiments.router, prefix="/api", tags=["experiments"])
 app.include_router(events.router, prefix="/api", tags=["events"])
@@ -39,9 +121,54 @@ async def root():
 # Health check
 @app.get("/health", tags=["health"])
 async def health_check():
-    return {"status": "healthy", "message": "A/B Testing API is running"}
+    health = {
+        "status": "healthy",
+        "message": "A/B Testing API is running",
+        "uptime_seconds": time.time() - STARTED_AT,
+        "caches": cache_stats(),
+        "experiment_registry": experiment_registry.metrics(),
+    }
+    if event_buffer is not None:
+        health["event_buffer"] = event_buffer.metrics()
+    if event_deduplicator is not None:
+        health["event_dedup"] = event_deduplicator.metrics()
+    if bandit_updater is not None:
+        health["bandit"] = bandit_updater.metrics()
+    if rollup_compactor is not None:
+        health["rollups"] = rollup_compactor.metrics()
+    return health
+
+# Prometheus scrape endpoint
+@app.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+async def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+# Collapsed stacks of a request profiled with X-Profile: 1 (PROFILING_ENABLED=true)
+@app.get("/debug/profiles/{profile_id}", tags=["health"], response_class=PlainTextResponse)
+async def profile(profile_id: str):
+    result = get_profile(profile_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    header = (
+        f"# {result['method']} {result['path']} {result['duration_seconds'] * 1000:.1f} ms, "
+        f"{result['samples']} samples every {result['interval_seconds'] * 1000:g} ms\n"
+    )
+    return PlainTextResponse(header + result["collapsed"])
 
 if __name__ == "__main__":
     import uvicorn
+    from app.utils.database import is_shared_database_url
+
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
+    workers = int(os.getenv("WORKERS", 1))
+    if workers > 1:
+        if os.getenv("DATABASE_URL", "").startswith("eventlog:///"):
+            raise SystemExit("eventlog:/// is a single-process store; use WORKERS=1 or a shared DATABASE_URL")
+        # Each worker is a separate process; the in-memory mock database would give
+        # every worker its own assignments and stats, so share a SQLite file instead
+        if not is_shared_database_url(os.getenv("DATABASE_URL", "demo-mode")):
+            os.environ["DATABASE_URL"] = "sqlite:///" + os.getenv("SQLITE_PATH", "ab_testing.db")
+            print(f"Using {os.environ['DATABASE_URL']} as shared state for {workers} workers")
+        uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
@@ -0,0 +1,13 @@
+import asyncio
+
+import pytest
+
+from app.utils.sqlite_database import SqliteDatabase
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """A SqliteDatabase on a fresh file, closed after the test."""
+    database = SqliteDatabase(str(tmp_path / "experiments.db"))
+    asyncio.run(database.connect())
+    yield database
+    asyncio.run(database.close())
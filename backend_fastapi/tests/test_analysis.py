@@ -0,0 +1,83 @@
+import asyncio
+import math
+import random
+from statistics import NormalDist
+
+import numpy as np
+import pytest
+
+from app.utils.analysis import _erfc, analyze_experiment, analyze_experiments
+from app.utils.database import MockDatabase
+from app.utils.segments import parse_segment
+
+def make_experiment(index: int, rng: random.Random) -> dict:
+    names = ["control"] + [f"variant_{i}" for i in range(1, rng.randint(2, 6))]
+    users = [rng.randint(1_000, 200_000) for _ in names]
+    return {
+        "experiment_id": f"experiment_{index}",
+        "variants": names,
+        "control": "control",
+        "users": users,
+        "conversions": [int(n * rng.uniform(0.01, 0.08)) for n in users],
+        "impressions": [n * 3 for n in users],
+        "clicks": [int(n * rng.uniform(0.05, 0.2)) for n in users],
+    }
+
+def test_erfc_matches_math_erfc():
+    x = np.concatenate([np.linspace(-6, 6, 2001), np.linspace(6, 26, 201)])
+    expected = np.array([math.erfc(value) for value in x])
+    assert np.all(np.abs(_erfc(x) - expected) <= 1.2e-7 * expected)
+    assert _erfc(np.array([np.inf]))[0] == 0.0
+    assert np.isnan(_erfc(np.array([np.nan]))[0])
+
+def test_z_test_against_control():
+    experiment = {
+        "experiment_id": "checkout", "variants": ["control", "treatment"], "control": "control",
+        "users": [10_000, 10_000], "conversions": [500, 600], "impressions": [0, 0], "clicks": [0, 0],
+    }
+    treatment = analyze_experiments([experiment])[0]["variants"][1]
+    pooled = 1100 / 20_000
+    z = (0.06 - 0.05) / math.sqrt(pooled * (1 - pooled) * 2 / 10_000)
+    assert math.isclose(treatment["z_score"], z)
+    assert math.isclose(treatment["p_value"], 2 * (1 - NormalDist().cdf(z)), rel_tol=1e-6)
+    assert math.isclose(treatment["lift"], 0.2)
+    assert treatment["significant"] is True
+    assert treatment["ctr"] is None
+
+def test_batched_analysis_matches_one_experiment_at_a_time():
+    rng = random.Random(7)
+    experiments = [make_experiment(i, rng) for i in range(50)]
+    assert analyze_experiments(experiments) == [analyze_experiments([experiment])[0] for experiment in experiments]
+
+def test_analysis_counts_distinct_converting_users():
+    # 100 active users per variant; 10 control and 20 treatment users convert twice each
+    db = MockDatabase()
+    experiment = {"experiment_id": "checkout", "variants": {"control": 50.0, "treatment": 50.0}}
+    events = []
+    for variant, converting in (("control", 10), ("treatment", 20)):
+        for i in range(100):
+            user_id = f"{variant}_{i}"
+            events.append({"user_id": user_id, "experiment_id": "checkout", "variant": variant,
+                           "event_type": "impression", "device_type": "mobile"})
+            if i < converting:
+                events += [{"user_id": user_id, "experiment_id": "checkout", "variant": variant,
+                            "event_type": "conversion", "device_type": "mobile"}] * 2
+
+    async def run() -> tuple:
+        await db.insert_events(events)
+        whole = await db.get_experiment_stats("checkout")
+        sliced = await db.get_experiment_stats("checkout", [parse_segment("device_type:mobile")])
+        return analyze_experiment(experiment, whole), analyze_experiment(experiment, sliced)
+
+    analysis, segmented = asyncio.run(run())
+    assert analysis["distinct_users"] is True
+    # HyperLogLog estimates: within a user or two of the exact counts
+    control, treatment = analysis["variants"]
+    assert [control["users"], control["conversions"]] == pytest.approx([100, 10], abs=2)
+    assert [treatment["users"], treatment["conversions"]] == pytest.approx([100, 20], abs=2)
+    assert control["conversion_rate"] == pytest.approx(0.1, rel=0.05)
+    assert treatment["conversion_rate"] == pytest.approx(0.2, rel=0.05)
+
+    # Segment-filtered stats have no sketches: conversion events over assigned users
+    assert segmented["distinct_users"] is False
+    assert [variant["conversions"] for variant in segmented["variants"]] == [20, 40]
@@ -0,0 +1,68 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.utils.bandit import BanditUpdater, thompson_weights
+from app.utils.experiment_registry import DatabaseExperimentSource, ExperimentRegistry
+from app.utils.sqlite_database import SqliteDatabase
+
+EXPERIMENT_ID = "cta_button_bandit"
+
+@pytest.mark.parametrize("seed", range(20))
+def test_weights_cover_every_bucket_and_keep_the_floor(seed):
+    rng = np.random.default_rng(seed)
+    count = int(rng.integers(2, 6))
+    trials = rng.integers(0, 5000, size=count)
+    successes = (trials * rng.uniform(0, 0.2, size=count)).astype(int)
+    floor = float(rng.choice([0.0, 1.0, 5.0, 10.0]))
+    weights = thompson_weights(successes, trials, floor=floor, draws=2000, rng=rng)
+    assert round(weights.sum(), 2) == 100.0
+    assert np.allclose(weights * 100, np.round(weights * 100))
+    assert weights.min() >= floor - 0.01
+
+def test_clear_winner_takes_most_traffic():
+    weights = thompson_weights([40, 50, 90], [1000, 1000, 1000], floor=5.0, rng=np.random.default_rng(1))
+    assert weights[2] > 85
+    assert weights[0] == pytest.approx(5.0, abs=0.5)
+
+def test_floor_is_capped_at_an_equal_split():
+    weights = thompson_weights([0, 100, 0], [1000, 1000, 1000], floor=60.0, rng=np.random.default_rng(1))
+    assert weights.tolist() == pytest.approx([33.33, 33.33, 33.34], abs=0.02)
+    assert thompson_weights([], []).size == 0
+
+def test_one_worker_updates_and_the_others_follow(tmp_path):
+    path = str(tmp_path / "shared.db")
+
+    async def run():
+        workers = [SqliteDatabase(path) for _ in range(2)]
+        for db in workers:
+            await db.connect()
+        registries = [ExperimentRegistry(DatabaseExperimentSource(db)) for db in workers]
+        updaters = [BanditUpdater(db, registry, seed=3) for db, registry in zip(workers, registries)]
+        try:
+            # get_started converts at 15%, the others at 5%
+            for i in range(3000):
+                variant = ("control", "buy_now", "get_started")[i % 3]
+                assignment = {"user_id": f"user_{i}", "experiment_id": EXPERIMENT_ID, "variant": variant}
+                await workers[0].save_assignment(assignment)
+                event_type = "conversion" if i % 100 < (15 if variant == "get_started" else 5) else "impression"
+                await workers[0].insert_event({**assignment, "event_type": event_type})
+
+            updated = [await updater.update_all() for updater in updaters]
+            assert [updater.leader for updater in updaters] == [True, False]
+            assert updated[1] == {}
+            variants = updated[0][EXPERIMENT_ID]
+            assert max(variants, key=variants.get) == "get_started"
+            # The follower picks the split up from the shared source
+            await registries[1].reload()
+            assert registries[1].snapshot.experiments[EXPERIMENT_ID].config["variants"] == variants
+
+            # The role passes on once the leader exits
+            await workers[0].close()
+            await updaters[1].update_all()
+            assert updaters[1].leader
+        finally:
+            await workers[1].close()
+
+    asyncio.run(run())
@@ -0,0 +1,42 @@
+import pytest
+
+from app.utils.bulk_assignment import bulk_variant_assignment
+from app.utils.hash import get_experiment_assignment
+from app.utils.targeting import compile_targeting
+
+USERS = [f"user_{i}" for i in range(5000)]
+
+EXPERIMENTS = [
+    {"experiment_id": "homepage_banner", "variants": {"control": 50.0, "variant_a": 30.0, "variant_b": 20.0}},
+    {"experiment_id": "short_split", "variants": {"a": 10.0, "b": 10.0}},
+    {"experiment_id": "checkout_layout", "variants": {"control": 50.0, "single_page": 50.0},
+     "layer": "checkout", "layer_range": [20.0, 70.0]},
+    {"experiment_id": "rolled_out", "variants": {"control": 50.0, "treatment": 50.0}, "targeting": {"rollout": 25.0}},
+    {"experiment_id": "layered_rollout", "variants": {"control": 50.0, "treatment": 50.0},
+     "layer": "search", "layer_range": [0.0, 40.0], "targeting": {"rollout": 60.0}},
+]
+
+def expected_assignments(experiment: dict) -> list:
+    targeting = compile_targeting(experiment["experiment_id"], experiment.get("targeting"))
+    return [
+        None if targeting is not None and not targeting.in_rollout(user_id) else get_experiment_assignment(user_id, experiment)
+        for user_id in USERS
+    ]
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("experiment", EXPERIMENTS, ids=lambda experiment: experiment["experiment_id"])
+def test_bulk_matches_the_single_user_path(experiment, workers):
+    targeting = compile_targeting(experiment["experiment_id"], experiment.get("targeting"))
+    assigned = bulk_variant_assignment(
+        experiment["experiment_id"],
+        experiment["variants"],
+        USERS,
+        # Small chunks so several are in flight at once
+        chunk_size=700,
+        workers=workers,
+        layer=experiment.get("layer"),
+        layer_range=experiment.get("layer_range"),
+        rollout=targeting.rollout_allocation if targeting is not None else None,
+        rollout_buckets=targeting.rollout_buckets if targeting is not None else None,
+    )
+    assert assigned == expected_assignments(experiment)
@@ -0,0 +1,68 @@
+import pytest
+
+from app.utils.dedup import EventDeduplicator, TimeSlicedBloomFilter, dedup_key
+
+WINDOW = 3600.0
+EXPERIMENT_ID = "homepage_banner"
+
+def make_keys(count: int, prefix: str = "event") -> list:
+    return [dedup_key(EXPERIMENT_ID, f"{prefix}_{i}") for i in range(count)]
+
+def fill(bloom: TimeSlicedBloomFilter, keys: list) -> None:
+    # Spread the adds over one window, in batches as the batch route would
+    step = 1000
+    for start in range(0, len(keys), step):
+        bloom.add_many(keys[start:start + step], now=WINDOW * start / len(keys))
+
+@pytest.mark.parametrize("error_rate", [1e-2, 1e-3])
+def test_false_positive_rate_at_capacity_is_near_target(error_rate):
+    capacity = 20_000
+    bloom = TimeSlicedBloomFilter(WINDOW, capacity, error_rate)
+    fill(bloom, make_keys(capacity))
+    probes = 100_000
+    measured = sum(bloom.contains_many(make_keys(probes, "unseen"), now=WINDOW)) / probes
+    assert measured <= error_rate * 1.5
+    # The filter's own estimate tracks what was measured
+    assert bloom.false_positive_rate() <= error_rate * 1.25
+    assert measured == pytest.approx(bloom.false_positive_rate(), rel=0.3)
+
+def test_every_added_key_is_seen_for_the_window():
+    bloom = TimeSlicedBloomFilter(WINDOW, 10_000, 1e-3)
+    keys = make_keys(20_000)
+    fill(bloom, keys)
+    assert all(bloom.contains_many(keys, now=WINDOW))
+    assert all(bloom.contains(key, now=WINDOW) for key in keys[::97])
+
+def test_keys_expire_after_the_window():
+    bloom = TimeSlicedBloomFilter(WINDOW, 1000, 1e-3)
+    keys = make_keys(1000)
+    bloom.add_many(keys, now=0.0)
+    assert all(bloom.contains_many(keys, now=WINDOW))
+    assert not any(bloom.contains_many(keys, now=WINDOW + bloom.slice_seconds))
+    assert bloom.false_positive_rate() == 0.0
+
+def test_scalar_and_batch_paths_agree():
+    bloom = TimeSlicedBloomFilter(WINDOW, 1000, 1e-2)
+    for key in make_keys(500):
+        bloom.add(key, now=10.0)
+    bloom.add_many(make_keys(500, "batch"), now=10.0)
+    probes = make_keys(500) + make_keys(500, "batch") + make_keys(2000, "unseen")
+    assert bloom.contains_many(probes, now=10.0) == [bloom.contains(key, now=10.0) for key in probes]
+
+def test_deduplicator_claims_each_key_once():
+    dedup = EventDeduplicator(TimeSlicedBloomFilter(WINDOW, 10_000))
+    keys = make_keys(100)
+    # Repeats within one batch and keys still in flight are duplicates
+    assert dedup.claim(keys + keys[:10]) == [True] * 100 + [False] * 10
+    assert dedup.claim(keys[:1]) == [False]
+    dedup.settle(keys, [True] * 100)
+    assert dedup.claim(keys) == [False] * 100
+    assert dedup.claim(keys[:1]) == [False]
+    assert dedup.metrics()["in_flight"] == 0
+
+def test_failed_write_releases_its_key():
+    dedup = EventDeduplicator(TimeSlicedBloomFilter(WINDOW, 10_000))
+    keys = make_keys(2)
+    assert dedup.claim(keys) == [True, True]
+    dedup.settle(keys, [True, False])
+    assert dedup.claim(keys) == [False, True]
@@ -0,0 +1,35 @@
+import uuid
+
+from app.utils import event_ids
+from app.utils.event_ids import COUNTER_LIMIT, EventIdGenerator
+
+def test_ids_are_unique_and_ascending():
+    generator = EventIdGenerator()
+    for generated in (
+        [generator.new_id() for _ in range(20_000)],
+        [i for _ in range(40) for i in generator.new_ids(500)],
+    ):
+        assert len(set(generated)) == len(generated)
+        assert generated == sorted(generated)
+
+def test_ids_are_version_7_uuids():
+    for event_id in EventIdGenerator().new_ids(100):
+        parsed = uuid.UUID(event_id)
+        assert str(parsed) == event_id
+        assert parsed.version == 7
+        assert parsed.variant == uuid.RFC_4122
+
+def test_counter_overflow_carries_into_the_timestamp(monkeypatch):
+    # A frozen clock makes every id fall in the same millisecond
+    monkeypatch.setattr(event_ids.time, "time_ns", lambda: 1_700_000_000_000 * 1_000_000)
+    generated = EventIdGenerator().new_ids(COUNTER_LIMIT * 2 + 10)
+    assert len(set(generated)) == len(generated)
+    assert generated == sorted(generated)
+
+def test_clock_stepping_back_keeps_ids_ascending(monkeypatch):
+    clock = iter([2_000, 2_000, 1_000, 1_000, 3_000])
+    monkeypatch.setattr(event_ids.time, "time_ns", lambda: next(clock) * 1_000_000)
+    generator = EventIdGenerator()
+    generated = [generator.new_id() for _ in range(5)]
+    assert generated == sorted(generated)
+    assert len(set(generated)) == 5
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+
+from main import app
+from app.utils.database import MockDatabase, get_database
+from app.utils.experiment_registry import DatabaseExperimentSource, ExperimentRegistry, get_experiment_registry
+
+def make_event(i: int, **fields) -> dict:
+    return {
+        "user_id": f"user_{i}",
+        "experiment_id": "homepage_banner",
+        "variant": "control" if i % 2 else "variant_a",
+        "event_type": "impression",
+        "campaign_id": "campaign_001",
+        "device_type": "mobile",
+        **fields,
+    }
+
+async def post_events(calls) -> MockDatabase:
+    """Run calls(client) against the app on a fresh MockDatabase."""
+    db = MockDatabase()
+    registry = ExperimentRegistry(DatabaseExperimentSource(db))
+    await registry.reload()
+    app.dependency_overrides[get_database] = lambda: db
+    app.dependency_overrides[get_experiment_registry] = lambda: registry
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            await calls(client)
+    finally:
+        app.dependency_overrides.clear()
+    return db
+
+@pytest.mark.parametrize("ndjson", [False, True], ids=["json", "ndjson"])
+def test_batch_stores_every_event(ndjson):
+    events = [make_event(i) for i in range(1000)]
+
+    async def calls(client):
+        if ndjson:
+            body = "\n".join(json.dumps(event) for event in events)
+            response = await client.post("/api/events/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+        else:
+            response = await client.post("/api/events/batch", json=events)
+        response.raise_for_status()
+        result = response.json()
+        assert (result["accepted"], result["rejected"], result["duplicates"]) == (1000, 0, 0)
+        assert [item["index"] for item in result["results"]] == list(range(1000))
+        assert len({item["event_id"] for item in result["results"]}) == 1000
+
+    db = asyncio.run(post_events(calls))
+    assert [event["user_id"] for event in db.events] == [event["user_id"] for event in events]
+
+def test_batch_rejects_bad_items_individually():
+    body = "\n".join([
+        json.dumps(make_event(0)),
+        "{not json",
+        json.dumps(make_event(2, event_type="unknown")),
+        json.dumps(make_event(3, experiment_id="no_such_experiment")),
+        json.dumps(make_event(4)),
+    ])
+
+    async def calls(client):
+        response = await client.post("/api/events/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+        response.raise_for_status()
+        result = response.json()
+        assert (result["accepted"], result["rejected"]) == (2, 3)
+        assert [item["accepted"] for item in result["results"]] == [True, False, False, False, True]
+        assert result["results"][1]["error"] == "Malformed JSON line"
+        assert result["results"][3]["error"] == "Experiment not found"
+
+    db = asyncio.run(post_events(calls))
+    assert [event["user_id"] for event in db.events] == ["user_0", "user_4"]
+
+def test_resent_event_ids_are_not_stored_twice():
+    event_ids = [str(uuid.uuid4()) for _ in range(3)]
+    events = [make_event(i, event_id=event_id) for i, event_id in enumerate(event_ids)]
+
+    async def calls(client):
+        # A repeat within the batch, then the whole batch resent
+        response = await client.post("/api/events/batch", json=events + events[:1])
+        assert response.json()["duplicates"] == 1
+        response = await client.post("/api/events/batch", json=events)
+        assert (response.json()["accepted"], response.json()["duplicates"]) == (3, 3)
+        response = await client.post("/api/events", json=events[0])
+        response.raise_for_status()
+
+    db = asyncio.run(post_events(calls))
+    assert sorted(event["id"] for event in db.events) == sorted(event_ids)
+
+def test_batch_rejects_malformed_bodies():
+    async def calls(client):
+        response = await client.post("/api/events/batch", json={"events": []})
+        assert response.status_code == 400
+        response = await client.post("/api/events/batch", content="[", headers={"Content-Type": "application/json"})
+        assert response.status_code == 400
+
+    asyncio.run(post_events(calls))
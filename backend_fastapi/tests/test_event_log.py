@@ -0,0 +1,145 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+import pytest
+
+from app.utils.log_database import EventLogDatabase
+from app.utils.segment_log import RECORD_SIZE
+
+EXPERIMENT_ID = "homepage_banner"
+
+def make_events(count: int, start: int = 0) -> list:
+    return [{
+        "user_id": f"user_{i % 9000}",
+        "experiment_id": EXPERIMENT_ID,
+        "variant": ("control", "variant_a", "variant_b")[i % 3],
+        "event_type": ("impression", "impression", "click", "impression", "conversion")[i % 5],
+        "device_type": "mobile",
+        "metadata": {"purchase_amount": 10.0} if i % 7 == 0 else {},
+    } for i in range(start, start + count)]
+
+async def open_log(directory: str) -> EventLogDatabase:
+    db = EventLogDatabase(directory, segment_records=4096)
+    await db.connect()
+    return db
+
+def last_segment(directory: str) -> str:
+    return os.path.join(directory, sorted(name for name in os.listdir(directory) if name.endswith(".seg"))[-1])
+
+def torn_record(directory: str) -> None:
+    with open(last_segment(directory), "ab") as file:
+        file.write(b"\x01" * (RECORD_SIZE // 2))
+
+def torn_dictionary_entry(directory: str) -> None:
+    with open(os.path.join(directory, "dictionary.log"), "ab") as file:
+        file.write(b"\x02\x40\x00\x00\x00partial")
+
+def corrupt_record(directory: str) -> None:
+    # Flip a byte in the 10th-from-last record: it and everything after it go
+    path = last_segment(directory)
+    with open(path, "r+b") as file:
+        file.seek(os.path.getsize(path) - 10 * RECORD_SIZE + 20)
+        byte = file.read(1)
+        file.seek(-1, os.SEEK_CUR)
+        file.write(bytes([byte[0] ^ 0xFF]))
+
+def lost_dictionary_tail(directory: str) -> None:
+    # The last new user_id's dictionary entry never hit the disk, so its first
+    # record (row 8999, in the active segment) and everything after it must go
+    path = os.path.join(directory, "dictionary.log")
+    with open(path, "rb") as file:
+        data = file.read()
+    os.truncate(path, data.rfind(b"user_8999") - 9)
+
+@pytest.mark.parametrize("damage, expected_length", [
+    (torn_record, 10_000),
+    (torn_dictionary_entry, 10_000),
+    (corrupt_record, 9_990),
+    (lost_dictionary_tail, 8_999),
+])
+def test_reopen_drops_only_the_damaged_tail(tmp_path, damage, expected_length):
+    directory = str(tmp_path)
+
+    async def run():
+        db = await open_log(directory)
+        await db.insert_events(make_events(10_000))
+        await db.save_assignment({"user_id": "user_1", "experiment_id": EXPERIMENT_ID, "variant": "control"})
+        await db.close()
+
+        damage(directory)
+        db = await open_log(directory)
+        assert len(db.events) == expected_length
+        assert await db.rebuild_stats()
+        stats = await db.get_experiment_stats(EXPERIMENT_ID)
+        assert sum(sum(by_type.values()) for by_type in stats["events_by_variant"].values()) == expected_length
+        assert stats["total_users"] == 1
+
+        # The repaired log accepts writes and reopens cleanly
+        await db.insert_events(make_events(10))
+        await db.close()
+        db = await open_log(directory)
+        assert len(db.events) == expected_length + 10
+        assert db.events.recovered["records"] == 0
+        await db.close()
+
+    asyncio.run(run())
+
+# Appends events from concurrent tasks, printing the acknowledged total after each write
+KILLED_WRITER = textwrap.dedent("""
+    import asyncio, sys
+    from app.utils.log_database import EventLogDatabase
+    from tests.test_event_log import make_events
+
+    async def run():
+        db = EventLogDatabase(sys.argv[1], segment_records=4096)
+        await db.connect()
+        acknowledged = 0
+
+        async def writer(task):
+            nonlocal acknowledged
+            for batch in range(100_000):
+                await db.insert_events(make_events(10, (task * 100_000 + batch) * 10))
+                acknowledged += 10
+                print(acknowledged, flush=True)
+
+        await asyncio.gather(*(writer(task) for task in range(8)))
+
+    asyncio.run(run())
+""")
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+def test_sigkill_keeps_every_acknowledged_write(tmp_path):
+    child = subprocess.Popen(
+        [sys.executable, "-c", KILLED_WRITER, str(tmp_path)],
+        cwd=Path(__file__).resolve().parents[1], stdout=subprocess.PIPE, text=True
+    )
+    acknowledged = 0
+    deadline = time.monotonic() + 1.0
+    for line in child.stdout:
+        acknowledged = int(line)
+        if time.monotonic() > deadline:
+            break
+    child.send_signal(signal.SIGKILL)
+    child.wait()
+    for line in child.stdout:
+        acknowledged = max(acknowledged, int(line))
+    assert acknowledged > 0
+
+    async def run():
+        db = await open_log(str(tmp_path))
+        length = len(db.events)
+        assert length >= acknowledged
+        assert await db.rebuild_stats()
+        exported = 0
+        async for _ in db.iter_experiment_events(EXPERIMENT_ID):
+            exported += 1
+        assert exported == length
+        await db.close()
+
+    asyncio.run(run())
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+
+import httpx
+
+from main import app
+from app.utils.database import MockDatabase
+from app.utils.experiment_registry import (
+    DatabaseExperimentSource,
+    ExperimentRegistry,
+    FileExperimentSource,
+    get_experiment_registry
+)
+from app.utils.hash import get_experiment_assignment
+
+USERS = [f"user_{i}" for i in range(200)]
+
+def page(version: str) -> list:
+    """Five experiments: three standalone and two sharing a layer; the split depends on the version."""
+    first = 50.0 if version == "a" else 20.0
+    boundary = 50.0 if version == "a" else 30.0
+    experiments = [
+        {"experiment_id": f"page_test_{i}", "variants": {"control": first, "treatment": 100.0 - first}}
+        for i in range(3)
+    ]
+    experiments.append({"experiment_id": "layer_test_0", "variants": {"control": 50.0, "treatment": 50.0},
+                        "layer": "checkout", "layer_range": [0.0, boundary]})
+    experiments.append({"experiment_id": "layer_test_1", "variants": {"control": 50.0, "treatment": 50.0},
+                        "layer": "checkout", "layer_range": [boundary, 100.0]})
+    return [
+        {"name": experiment["experiment_id"], "description": version, "status": "active", "start_date": None,
+         "end_date": None, "allocation_mode": "static", "layer": None, "layer_range": None, **experiment}
+        for experiment in experiments
+    ]
+
+def variants_for(user_id: str, version: str) -> tuple:
+    return tuple(get_experiment_assignment(user_id, config) for config in page(version))
+
+def test_assignment_is_consistent_under_concurrent_reload():
+    # A writer keeps republishing two versions while readers assign from whatever
+    # snapshot is current; every read must match one version for all experiments
+    registry = ExperimentRegistry(source=None)
+    registry.install(page("a"))
+    expected = {version: {user_id: variants_for(user_id, version) for user_id in USERS} for version in ("a", "b")}
+    assert expected["a"] != expected["b"]
+    stop = threading.Event()
+    reads = [0]
+    mixed = []
+
+    def writer():
+        version = "b"
+        while not stop.is_set():
+            registry.install(page(version))
+            version = "a" if version == "b" else "b"
+
+    def reader():
+        position = 0
+        while not stop.is_set():
+            user_id = USERS[position % len(USERS)]
+            position += 1
+            experiments = list(registry.snapshot.experiments.values())
+            variants = tuple(experiment.assign(user_id) for experiment in experiments)
+            version = experiments[0].config["description"]
+            if any(experiment.config["description"] != version for experiment in experiments) \
+                    or variants != expected[version][user_id]:
+                mixed.append((user_id, variants))
+            reads[0] += 1
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    try:
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        sys.setswitchinterval(switch_interval)
+    assert registry.snapshot.version > 1 and reads[0] > 0
+    assert not mixed
+
+def test_file_hot_reload_serves_one_version_per_request(tmp_path):
+    path = tmp_path / "experiments.json"
+
+    def write(version: str) -> None:
+        # Write then rename, as a deploy would, so a reload never sees half a file
+        temporary = tmp_path / "experiments.json.tmp"
+        temporary.write_text(json.dumps({"experiments": page(version)}))
+        temporary.replace(path)
+
+    async def run() -> None:
+        write("a")
+        registry = ExperimentRegistry(FileExperimentSource(str(path)), interval=0.01)
+        await registry.reload()
+        await registry.start()
+        app.dependency_overrides[get_experiment_registry] = lambda: registry
+        experiment_ids = [config["experiment_id"] for config in page("a")]
+        requests = 0
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                async def served_version() -> str:
+                    # A new user every time: assignments are sticky, so a returning
+                    # user keeps the variant of the version they first saw
+                    nonlocal requests
+                    user_id = f"file_user_{requests}"
+                    requests += 1
+                    response = await client.get(f"/api/assignments/{user_id}", params={"experiment_id": experiment_ids})
+                    response.raise_for_status()
+                    assignments = response.json()["assignments"]
+                    variants = tuple(assignments[experiment_id]["variant"] for experiment_id in experiment_ids)
+                    matches = [version for version in ("a", "b") if variants == variants_for(user_id, version)]
+                    assert matches, f"{user_id} got a mix of versions: {variants}"
+                    return matches[0] if len(matches) == 1 else ""
+
+                version = "a"
+                for _ in range(10):
+                    version = "b" if version == "a" else "a"
+                    write(version)
+                    for _ in range(20):
+                        await served_version()
+                # After a reload interval the last version written must be served
+                await asyncio.sleep(0.1)
+                served = {await served_version() for _ in USERS}
+                served.discard("")
+        finally:
+            app.dependency_overrides.clear()
+            await registry.stop()
+        assert served == {version}
+
+    asyncio.run(run())
+
+def test_database_source_loads_every_config_in_one_call():
+    class CountingDatabase(MockDatabase):
+        calls = 0
+
+        async def get_experiments(self):
+            CountingDatabase.calls += 1
+            return await super().get_experiments()
+
+        async def get_experiment(self, experiment_id):
+            raise AssertionError("configs are loaded one by one")
+
+    db = CountingDatabase()
+    configs = asyncio.run(DatabaseExperimentSource(db).load())
+    assert CountingDatabase.calls == 1
+    assert {config["experiment_id"] for config in configs} == set(db.experiments)
+
+def test_sqlite_get_experiments_matches_get_experiment(sqlite_db):
+    async def run() -> None:
+        configs = await sqlite_db.get_experiments()
+        assert [config["experiment_id"] for config in configs] == await sqlite_db.list_experiments()
+        for config in configs:
+            assert config == await sqlite_db.get_experiment(config["experiment_id"])
+
+    asyncio.run(run())
@@ -0,0 +1,82 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.utils.database import MockDatabase
+from app.utils.event_ids import generate_event_id
+from app.utils.export import serialize_events
+
+EXPERIMENT_ID = "homepage_banner"
+
+# Peak memory may grow this much while the event count grows tenfold;
+# memory that scaled with the events would grow close to 10x
+MAX_PEAK_GROWTH = 1.25
+
+def populate(db: MockDatabase, count: int) -> None:
+    start = datetime.now()
+    for i in range(count):
+        db.events.append({
+            "id": generate_event_id(),
+            "recorded_at": start + timedelta(microseconds=i),
+            "user_id": f"user_{i}",
+            "experiment_id": EXPERIMENT_ID,
+            "variant": ("control", "variant_a")[i % 2],
+            "event_type": ("impression", "click", "conversion")[i % 3],
+            "device_type": "mobile",
+            "metadata": {"purchase_amount": 10.0} if i % 3 == 2 else {},
+        })
+
+def export(db: MockDatabase, export_format: str, compress: bool = False) -> bytes:
+    async def collect() -> bytes:
+        chunks = []
+        async for chunk in serialize_events(db.iter_experiment_events(EXPERIMENT_ID), export_format, compress):
+            chunks.append(chunk if isinstance(chunk, bytes) else chunk.encode())
+        return b"".join(chunks)
+    return asyncio.run(collect())
+
+def drain(db: MockDatabase, export_format: str, compress: bool) -> int:
+    async def count() -> int:
+        total = 0
+        async for chunk in serialize_events(db.iter_experiment_events(EXPERIMENT_ID), export_format, compress):
+            total += len(chunk)
+        return total
+    return asyncio.run(count())
+
+@pytest.fixture(scope="module")
+def databases():
+    """Mock databases holding 5k and 50k events, shared by the memory tests."""
+    databases = {}
+    for count in (5_000, 50_000):
+        databases[count] = MockDatabase()
+        populate(databases[count], count)
+    return databases
+
+def peak_memory(db: MockDatabase, export_format: str, compress: bool) -> int:
+    tracemalloc.start()
+    try:
+        drain(db, export_format, compress)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+@pytest.mark.parametrize("export_format,compress", [("ndjson", False), ("csv", False), ("ndjson", True)])
+def test_export_peak_memory_is_flat(databases, export_format, compress):
+    small = peak_memory(databases[5_000], export_format, compress)
+    large = peak_memory(databases[50_000], export_format, compress)
+    assert large <= small * MAX_PEAK_GROWTH
+
+def test_export_formats_carry_every_event():
+    db = MockDatabase()
+    populate(db, 1000)
+    lines = export(db, "ndjson").splitlines()
+    assert len(lines) == 1000
+    assert {json.loads(line)["user_id"] for line in lines} == {f"user_{i}" for i in range(1000)}
+    assert gzip.decompress(export(db, "ndjson", compress=True)).splitlines() == lines
+    rows = list(csv.DictReader(io.StringIO(export(db, "csv").decode())))
+    assert len(rows) == 1000
@@ -0,0 +1,69 @@
+import asyncio
+
+import httpx
+import pytest
+
+from main import app
+from app.utils import fast_response
+from app.utils.cache import assignment_cache
+from app.utils.database import MockDatabase, get_database
+from app.utils.experiment_registry import DatabaseExperimentSource, ExperimentRegistry, get_experiment_registry
+
+pytest.importorskip("orjson")
+
+def make_event(i: int) -> dict:
+    return {
+        "user_id": f"user_{i}",
+        "experiment_id": "homepage_banner",
+        "variant": "control",
+        "event_type": "impression",
+        "metadata": {"page": "/home"},
+    }
+
+async def responses(headers: dict) -> tuple:
+    """An assignment, an event and a batch with one invalid item, on a fresh database."""
+    db = MockDatabase()
+    registry = ExperimentRegistry(DatabaseExperimentSource(db))
+    await registry.reload()
+    app.dependency_overrides[get_database] = lambda: db
+    app.dependency_overrides[get_experiment_registry] = lambda: registry
+    assignment_cache.clear()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", headers=headers) as client:
+            return (
+                await client.post("/api/assignment", json={"user_id": "parity", "experiment_id": "homepage_banner"}),
+                await client.post("/api/events", json=make_event(0)),
+                await client.post("/api/events/batch", json=[make_event(0), {"user_id": "x"}]),
+            )
+    finally:
+        app.dependency_overrides.clear()
+        assignment_cache.clear()
+
+def comparable(assignment: dict, event: dict, batch: dict) -> tuple:
+    # Ids and timestamps differ between runs
+    for body in (assignment, event):
+        for field in ("assigned_at", "recorded_at", "event_id"):
+            body.pop(field, None)
+    for result in batch["results"]:
+        result["event_id"] = result["event_id"] and "id"
+    return assignment, event, batch
+
+def test_fast_path_json_matches_the_response_models(monkeypatch):
+    monkeypatch.setattr(fast_response, "FAST_PATH_ENABLED", False)
+    default = asyncio.run(responses({}))
+    monkeypatch.setattr(fast_response, "FAST_PATH_ENABLED", True)
+    fast = asyncio.run(responses({}))
+    for response in default + fast:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+    assert comparable(*(response.json() for response in fast)) == comparable(*(response.json() for response in default))
+
+def test_fast_path_msgpack(monkeypatch):
+    msgpack = pytest.importorskip("msgpack")
+    monkeypatch.setattr(fast_response, "FAST_PATH_ENABLED", True)
+    json_bodies = [response.json() for response in asyncio.run(responses({}))]
+    packed = asyncio.run(responses({"Accept": "application/msgpack"}))
+    for response in packed:
+        assert response.headers["content-type"] == "application/msgpack"
+    bodies = [msgpack.unpackb(response.content) for response in packed]
+    assert comparable(*bodies) == comparable(*json_bodies)
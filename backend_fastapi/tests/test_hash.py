@@ -0,0 +1,55 @@
+import hashlib
+import hmac
+import os
+import random
+from typing import Dict
+
+import pytest
+
+from app.utils.hash import get_allocation, get_variant_assignment
+
+def reference_assignment(user_id: str, experiment_id: str, variants: Dict[str, float]) -> str:
+    """The original per-call implementation: walk the cumulative percentages."""
+    salt = os.getenv("HMAC_SALT", "default-salt")
+    seed = os.getenv("HASH_SEED", "default-seed")
+    hash_input = f"{user_id}:{experiment_id}:{seed}"
+    hash_value = hmac.new(salt.encode('utf-8'), hash_input.encode('utf-8'), hashlib.sha256).hexdigest()
+    percentage = (int(hash_value[:8], 16) % 10000) / 100.0
+    cumulative = 0.0
+    for variant, allocation in variants.items():
+        cumulative += allocation
+        if percentage <= cumulative:
+            return variant
+    return list(variants)[-1] if variants else "control"
+
+def random_variants(count: int, rng: random.Random) -> Dict[str, float]:
+    weights = [rng.random() for _ in range(count)]
+    total = sum(weights)
+    return {f"variant_{i}": round(w / total * 100, 2) for i, w in enumerate(weights)}
+
+AWKWARD = [
+    {"control": 50.0, "variant_a": 30.0, "variant_b": 20.0},
+    {"a": 33.33, "b": 33.33, "c": 33.34},
+    {"a": 0.0, "b": 100.0},
+    # Short of 100 and over 100
+    {"a": 10.0, "b": 10.0},
+    {"a": 70.0, "b": 70.0},
+    {"a": 0.01, "b": 0.01, "c": 99.98},
+]
+
+@pytest.mark.parametrize("variants", AWKWARD + [random_variants(n, random.Random(n)) for n in (2, 5, 10, 25, 50, 100)])
+def test_compiled_allocation_matches_the_reference(variants):
+    experiment_id = f"exp_{len(variants)}_{sum(variants.values()):.2f}"
+    for u in range(3000):
+        user_id = f"user_{u}"
+        assert get_variant_assignment(user_id, experiment_id, variants) == reference_assignment(user_id, experiment_id, variants), user_id
+
+def test_allocation_is_recompiled_when_the_split_changes():
+    first = get_allocation("recompiled", {"a": 50.0, "b": 50.0})
+    assert get_allocation("recompiled", {"a": 50.0, "b": 50.0}) is first
+    # Same weights in another order assign differently, so they need a new table
+    for variants in ({"b": 50.0, "a": 50.0}, {"a": 20.0, "b": 80.0}):
+        allocation = get_allocation("recompiled", variants)
+        assert allocation is not first and allocation.matches(variants)
+        for u in range(500):
+            assert allocation.assign(f"user_{u}") == reference_assignment(f"user_{u}", "recompiled", variants)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from app.utils.hyperloglog import DEFAULT_PRECISION, HyperLogLog, merge_serialized
+
+STANDARD_ERROR = HyperLogLog(DEFAULT_PRECISION).standard_error
+
+def relative_errors(size: int, trials: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    errors = []
+    for _ in range(trials):
+        sketch = HyperLogLog(DEFAULT_PRECISION)
+        # Random 64-bit values stand in for hashed user ids (the hash is uniform)
+        sketch.add_hashes(rng.integers(0, 2**64, size=size, dtype=np.uint64))
+        errors.append(sketch.count() / size - 1)
+    return np.array(errors)
+
+@pytest.mark.parametrize("size", [10, 100, 1_000, 10_000, 30_000, 100_000, 1_000_000])
+def test_error_bounds(size):
+    # The documented bounds, with the standard error about 0.8% at the default
+    # precision: |bias| under half a standard error (or half a user, for small
+    # sets whose estimates are off by whole users when two share a register),
+    # RMSE under 1.5 standard errors, and at least 90% of estimates within 2
+    # standard errors and 98% within 3
+    errors = relative_errors(size, trials=200, seed=size)
+    assert abs(errors.mean()) < max(STANDARD_ERROR / 2, 0.5 / size)
+    assert np.sqrt(np.mean(errors ** 2)) < 1.5 * STANDARD_ERROR
+    assert np.mean(np.abs(errors) <= 2 * STANDARD_ERROR) >= 0.90
+    assert np.mean(np.abs(errors) <= 3 * STANDARD_ERROR) >= 0.98
+
+def test_standard_error_is_under_one_percent():
+    assert STANDARD_ERROR == pytest.approx(1.04 / 2 ** (DEFAULT_PRECISION / 2))
+    assert STANDARD_ERROR < 0.01
+
+def test_merged_worker_sketches_equal_one_sketch_of_the_union():
+    users = np.random.default_rng(7).integers(0, 2**64, size=100_000, dtype=np.uint64)
+    first, second, whole = (HyperLogLog(DEFAULT_PRECISION) for _ in range(3))
+    # Each worker saw 60% of the users; 20% were seen by both
+    first.add_hashes(users[:60_000])
+    second.add_hashes(users[40_000:])
+    whole.add_hashes(users)
+    assert HyperLogLog.from_bytes(merge_serialized(first.to_bytes(), second.to_bytes())) == whole
+
+@pytest.mark.parametrize("size", [0, 10, 100_000])
+def test_serialization_round_trips(size):
+    sketch = HyperLogLog(DEFAULT_PRECISION)
+    sketch.add_many([f"user_{i}" for i in range(size)])
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+    assert restored == sketch
+    assert restored.count() == sketch.count()
+
+def test_repeated_users_are_counted_once():
+    sketch = HyperLogLog(DEFAULT_PRECISION)
+    sketch.add_many([f"user_{i % 100}" for i in range(10_000)])
+    assert sketch.count() == 100
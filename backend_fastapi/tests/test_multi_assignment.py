@@ -0,0 +1,104 @@
+import asyncio
+from collections import Counter
+from datetime import datetime
+
+import httpx
+
+from main import app
+from app.utils.cache import assignment_cache
+from app.utils.database import MockDatabase, get_database
+from app.utils.experiment_registry import DatabaseExperimentSource, ExperimentRegistry, get_experiment_registry
+from app.utils.hash import get_experiment_assignment
+
+USERS = 40
+
+def page_experiments() -> dict:
+    """9 standalone experiments and two layers of 3 mutually exclusive ones."""
+    experiments = {}
+    for i in range(9):
+        experiments[f"page_test_{i}"] = {"variants": {"control": 50.0, "treatment": 50.0}}
+    for layer in ("checkout", "search"):
+        for i, layer_range in enumerate(([0.0, 40.0], [40.0, 70.0], [70.0, 100.0])):
+            experiments[f"{layer}_test_{i}"] = {
+                "variants": {"control": 34.0, "variant_a": 33.0, "variant_b": 33.0},
+                "layer": layer,
+                "layer_range": layer_range,
+            }
+    return {
+        experiment_id: {
+            "experiment_id": experiment_id,
+            "name": experiment_id,
+            "description": None,
+            "status": "active",
+            "start_date": datetime.now(),
+            "end_date": None,
+            "allocation_mode": "static",
+            **config,
+        }
+        for experiment_id, config in experiments.items()
+    }
+
+def count_calls(db, calls: Counter) -> None:
+    for name in ("get_assignment", "save_assignment", "get_assignments", "save_assignments"):
+        method = getattr(db, name)
+
+        async def counted(*args, _method=method, _name=name):
+            calls[_name] += 1
+            return await _method(*args)
+        setattr(db, name, counted)
+
+def test_single_and_multi_assignment_agree():
+    experiments = page_experiments()
+    experiment_ids = list(experiments)
+    expected = {
+        prefix: [
+            {experiment_id: get_experiment_assignment(f"{prefix}{i}", experiment) for experiment_id, experiment in experiments.items()}
+            for i in range(USERS)
+        ]
+        for prefix in ("single_", "multi_")
+    }
+
+    async def run():
+        db = MockDatabase()
+        db.experiments = experiments
+        registry = ExperimentRegistry(DatabaseExperimentSource(db))
+        await registry.reload()
+        calls = Counter()
+        count_calls(db, calls)
+        assignment_cache.clear()
+        app.dependency_overrides[get_database] = lambda: db
+        app.dependency_overrides[get_experiment_registry] = lambda: registry
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                async def single(user_id: str) -> dict:
+                    variants = {}
+                    for experiment_id in experiment_ids:
+                        response = await client.post("/api/assignment", json={"user_id": user_id, "experiment_id": experiment_id})
+                        variants[experiment_id] = response.json()["variant"] if response.status_code == 200 else None
+                    return variants
+
+                async def multi(user_id: str) -> dict:
+                    response = await client.get(f"/api/assignments/{user_id}", params={"experiment_id": experiment_ids})
+                    response.raise_for_status()
+                    return {experiment_id: a["variant"] for experiment_id, a in response.json()["assignments"].items()}
+
+                for assign, prefix in ((single, "single_"), (multi, "multi_")):
+                    new_users = [await assign(f"{prefix}{i}") for i in range(USERS)]
+                    assert new_users == expected[prefix]
+                    if assign is multi:
+                        # One read and one write for a whole page
+                        assert calls == Counter(get_assignments=USERS, save_assignments=USERS)
+                    calls.clear()
+                    returning_users = [await assign(f"{prefix}{i}") for i in range(USERS)]
+                    assert returning_users == expected[prefix]
+                    assert not calls["save_assignment"] and not calls["save_assignments"]
+                    calls.clear()
+        finally:
+            app.dependency_overrides.clear()
+            assignment_cache.clear()
+
+        for variants in expected["multi_"]:
+            for layer in ("checkout", "search"):
+                assert sum(variants[f"{layer}_test_{i}"] is not None for i in range(3)) == 1
+
+    asyncio.run(run())
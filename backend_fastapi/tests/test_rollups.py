@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.utils.database import MockDatabase
+from app.utils.rollup_compactor import RollupCompactor
+from app.utils.rollups import DAY, HOUR, MINUTE, bucket_start, build_timeseries, epoch_seconds
+
+EXPERIMENT_ID = "homepage_banner"
+SPAN_DAYS = 120
+
+def make_events(count: int, now: datetime) -> list:
+    step = timedelta(days=SPAN_DAYS) / count
+    return [
+        {
+            "user_id": f"user_{i % 500}",
+            "experiment_id": EXPERIMENT_ID,
+            "variant": ("control", "variant_a")[i % 2],
+            "event_type": ("impression", "impression", "click", "conversion")[i % 4],
+            "device_type": ("mobile", "desktop", "tablet")[i % 3],
+            "geo_location": ("US", "", None)[i % 3],
+            "recorded_at": now - step * (count - i),
+        }
+        for i in range(count)
+    ]
+
+def scan_timeseries(events: list, since: int, until: int, width: int, cutoffs: tuple) -> list:
+    """The points rollups should give, from the raw events; buckets the compactor widened keep their stored width."""
+    minute_before, hour_before = cutoffs
+    points = {}
+    for event in events:
+        seconds = epoch_seconds(event["recorded_at"])
+        if not since <= seconds < until:
+            continue
+        stored = DAY if seconds < hour_before else HOUR if seconds < minute_before else MINUTE
+        bucket_width = max(width, stored)
+        key = (bucket_start(seconds, bucket_width), bucket_width, event["variant"], event["event_type"])
+        points[key] = points.get(key, 0) + 1
+    return [key + (events,) for key, events in sorted(points.items())]
+
+def comparable(points: list) -> list:
+    return [
+        (int(point["bucket_start"].timestamp()) if isinstance(point["bucket_start"], datetime) else point["bucket_start"],
+         point["bucket_seconds"], point["variant"], point["event_type"], point["events"])
+        for point in points
+    ]
+
+@pytest.fixture(params=["mock", "sqlite"])
+def database(request):
+    return MockDatabase() if request.param == "mock" else request.getfixturevalue("sqlite_db")
+
+def test_compacted_rollups_match_raw_events(database):
+    now = datetime.now()
+    events = make_events(5000, now)
+
+    async def run() -> None:
+        await database.insert_events([dict(event) for event in events])
+        compactor = RollupCompactor(database)
+        clock = now.timestamp()
+        await compactor.compact(clock)
+        cutoffs = (
+            bucket_start(clock - compactor.minute_retention, HOUR),
+            bucket_start(clock - compactor.hour_retention, DAY)
+        )
+        until = bucket_start(clock, DAY) + DAY
+        for since, end, width in (
+            (until - (SPAN_DAYS + 1) * DAY, until, DAY),
+            (bucket_start(clock, HOUR) - 7 * DAY, bucket_start(clock, HOUR) + HOUR, HOUR),
+        ):
+            rows = await database.get_event_rollups(EXPERIMENT_ID, since, end, width)
+            points = build_timeseries(rows, width, ["variant", "event_type"])
+            assert comparable(points) == scan_timeseries(events, since, end, width, cutoffs)
+
+    asyncio.run(run())
+
+def test_rebuild_merges_null_and_empty_dimensions(sqlite_db):
+    # A missing and an empty location share the '' rollup key; rebuilding must not split them
+    minute = datetime.fromtimestamp(bucket_start(datetime.now().timestamp(), MINUTE))
+    events = [
+        {"user_id": "user_1", "experiment_id": EXPERIMENT_ID, "variant": "control", "event_type": "click",
+         "geo_location": geo_location, "recorded_at": minute + timedelta(seconds=seconds)}
+        for seconds, geo_location in ((1, None), (2, ""))
+    ]
+
+    async def run() -> None:
+        await sqlite_db.insert_events(events)
+        assert await sqlite_db.rebuild_stats()
+        rows = await sqlite_db.get_event_rollups(EXPERIMENT_ID, int(minute.timestamp()), int(minute.timestamp()) + MINUTE, MINUTE)
+        assert [row[-1] for row in rows] == [2]
+
+    asyncio.run(run())
@@ -0,0 +1,122 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.utils.database import MockDatabase
+from app.utils.segments import parse_segment
+
+EXPERIMENT_ID = "segment_test"
+USERS = 300
+VARIANTS = ["control", "variant_a", "variant_b"]
+EVENT_TYPES = ["impression", "click", "conversion"]
+DEVICES = ["mobile", "desktop", "tablet", None]
+LOCATIONS = ["US", "DE", "AT", "CH", "GB", None]
+
+QUERIES = [
+    ["device_type:mobile"],
+    ["device_type:mobile,geo_location:DE"],
+    ["geo_location:DE|AT|CH"],
+    ["device_type:mobile,geo_location:DE|AT", "device_type:tablet,geo_location:US|GB"],
+    ["geo_location:DE|AT,geo_location:AT|CH"],
+    ["geo_location:FR"],
+]
+
+def make_data() -> tuple:
+    rng = random.Random(23)
+    start = datetime.now() - timedelta(hours=1)
+    events = [
+        {
+            "user_id": f"user_{rng.randrange(USERS)}",
+            "experiment_id": EXPERIMENT_ID,
+            "variant": rng.choice(VARIANTS),
+            "event_type": rng.choice(EVENT_TYPES),
+            "device_type": rng.choice(DEVICES),
+            "geo_location": rng.choice(LOCATIONS),
+            "recorded_at": start + timedelta(seconds=i),
+        }
+        for i in range(3000)
+    ]
+    assignments = [
+        {
+            "user_id": f"user_{i % USERS}",
+            "experiment_id": EXPERIMENT_ID,
+            "variant": VARIANTS[i % 3],
+            "device_type": rng.choice(DEVICES),
+            "geo_location": rng.choice(LOCATIONS),
+        }
+        # The last 50 assign users again with new segments
+        for i in range(USERS + 50)
+    ]
+    return events, assignments
+
+def reference_counts(events: list, assignments: list, segments: list) -> tuple:
+    """Counts from checking every event and each user's latest assignment."""
+    def matches(row: dict) -> bool:
+        return any(all(row.get(dimension) in values for dimension, values in segment.items()) for segment in segments)
+
+    latest = {assignment["user_id"]: assignment for assignment in assignments}
+    variant_distribution = {}
+    for assignment in latest.values():
+        if matches(assignment):
+            variant_distribution[assignment["variant"]] = variant_distribution.get(assignment["variant"], 0) + 1
+    event_counts = {}
+    for event in events:
+        if matches(event):
+            by_type = event_counts.setdefault(event["variant"], {})
+            by_type[event["event_type"]] = by_type.get(event["event_type"], 0) + 1
+    return variant_distribution, event_counts
+
+async def load(db, events: list, assignments: list) -> None:
+    await db.insert_events(events)
+    for assignment in assignments:
+        await db.save_assignment(assignment)
+
+async def segment_counts(db, segments: list) -> tuple:
+    stats = await db.get_experiment_stats(EXPERIMENT_ID, segments)
+    return stats["variant_distribution"], stats["events_by_variant"]
+
+@pytest.mark.parametrize("spec", QUERIES)
+def test_segment_stats_match_a_scan(spec, sqlite_db):
+    events, assignments = make_data()
+    assignments = assignments[:USERS]
+    segments = [parse_segment(text) for text in spec]
+    expected = reference_counts(events, assignments, segments)
+
+    async def run():
+        mock = MockDatabase()
+        await load(mock, events, assignments)
+        await load(sqlite_db, events, assignments)
+        results = {"bitmaps": await segment_counts(mock, segments), "sqlite": await segment_counts(sqlite_db, segments)}
+        # Bitmaps built in bulk must agree with the ones kept up to date on insert
+        await mock.rebuild_stats()
+        results["rebuilt bitmaps"] = await segment_counts(mock, segments)
+        return results
+
+    for name, counts in asyncio.run(run()).items():
+        assert counts == expected, name
+
+def test_overwritten_assignment_moves_the_user_between_segments():
+    # MockDatabase replaces an assignment saved again; its bitmaps must follow
+    events, assignments = make_data()
+
+    async def run():
+        mock = MockDatabase()
+        await load(mock, events, assignments)
+        for rebuilt in (False, True):
+            if rebuilt:
+                await mock.rebuild_stats()
+            for spec in QUERIES:
+                segments = [parse_segment(text) for text in spec]
+                assert await segment_counts(mock, segments) == reference_counts(events, assignments, segments), (spec, rebuilt)
+
+    asyncio.run(run())
+
+def test_parse_segment():
+    assert parse_segment("device_type:mobile, geo_location:DE|AT") == {"device_type": ["mobile"], "geo_location": ["DE", "AT"]}
+    # A dimension given twice must match both terms
+    assert parse_segment("geo_location:DE|AT,geo_location:AT|CH") == {"geo_location": ["AT"]}
+    for text in ("browser:chrome", "device_type", "device_type:|"):
+        with pytest.raises(ValueError):
+            parse_segment(text)
@@ -0,0 +1,69 @@
+import asyncio
+import itertools
+import random
+import sqlite3
+
+import httpx
+
+from main import app
+from app.utils.cache import assignment_cache
+from app.utils.database import get_database
+from app.utils.experiment_registry import DatabaseExperimentSource, ExperimentRegistry, get_experiment_registry
+from app.utils.sqlite_database import SqliteDatabase
+
+EXPERIMENT_ID = "homepage_banner"
+USERS = 200
+
+def test_workers_sharing_a_file_agree(tmp_path):
+    path = str(tmp_path / "shared.db")
+
+    async def run():
+        # One SqliteDatabase per worker process, all on the same file
+        workers = [SqliteDatabase(path) for _ in range(3)]
+        for db in workers:
+            await db.connect()
+        registry = ExperimentRegistry(DatabaseExperimentSource(workers[0]))
+        await registry.reload()
+        answering = itertools.cycle(workers)
+        app.dependency_overrides[get_database] = lambda: next(answering)
+        app.dependency_overrides[get_experiment_registry] = lambda: registry
+        rng = random.Random(13)
+        seen = {}
+        events = 0
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                async def visit(user_id: str) -> None:
+                    nonlocal events
+                    # Each worker has its own assignment cache
+                    assignment_cache.clear()
+                    response = await client.post("/api/assignment", json={"user_id": user_id, "experiment_id": EXPERIMENT_ID})
+                    response.raise_for_status()
+                    variant = response.json()["variant"]
+                    assert seen.setdefault(user_id, variant) == variant, user_id
+                    response = await client.post("/api/events", json={
+                        "user_id": user_id, "experiment_id": EXPERIMENT_ID, "variant": variant, "event_type": "impression"
+                    })
+                    response.raise_for_status()
+                    events += 1
+
+                # Users come back several times, to whichever worker is next
+                visits = [f"user_{rng.randrange(USERS)}" for _ in range(USERS * 4)]
+                for start in range(0, len(visits), 20):
+                    await asyncio.gather(*(visit(user_id) for user_id in visits[start:start + 20]))
+            stats = [await db.get_experiment_stats(EXPERIMENT_ID) for db in workers]
+        finally:
+            app.dependency_overrides.clear()
+            assignment_cache.clear()
+            for db in workers:
+                await db.close()
+        return seen, events, stats
+
+    seen, events, stats = asyncio.run(run())
+    with sqlite3.connect(path) as conn:
+        stored, distinct = conn.execute(
+            "SELECT count(*), count(DISTINCT user_id) FROM assignments WHERE experiment_id = ?", (EXPERIMENT_ID,)
+        ).fetchone()
+    assert stored == distinct == len(seen)
+    for worker_stats in stats:
+        assert worker_stats["total_users"] == len(seen)
+        assert sum(worker_stats["events_by_type"].values()) == events
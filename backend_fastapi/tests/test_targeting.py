@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import hmac
+import operator
+import os
+import random
+
+import httpx
+import pytest
+
+from main import app
+from app.utils.cache import assignment_cache
+from app.utils.database import MockDatabase, get_database
+from app.utils.experiment_registry import ExperimentRegistry, get_experiment_registry
+from app.utils.hash import BUCKET_COUNT
+
+EXPERIMENTS = 300
+DEVICES = ["mobile", "tablet", "desktop"]
+COUNTRIES = ["US", "CA", "GB", "DE", "FR", "BR", "IN", "JP", "AU", "MX"]
+REGIONS = [f"{country}-{region}" for country in COUNTRIES for region in ("01", "02", "03", "04")]
+PLANS = ["free", "pro", "team", "enterprise"]
+
+def targeting_rules(rng: random.Random) -> dict:
+    rules = {}
+    if rng.random() < 0.7:
+        rules["device_types"] = rng.sample(DEVICES, rng.randint(1, 2))
+    if rng.random() < 0.6:
+        if rng.random() < 0.5:
+            rules["geo_prefixes"] = rng.sample(COUNTRIES, rng.randint(1, 3))
+        else:
+            rules["geo_locations"] = rng.sample(REGIONS, rng.randint(1, 8))
+    attributes = []
+    if rng.random() < 0.4:
+        attributes.append({"attribute": "plan", "operator": rng.choice(["in", "not_in"]), "value": rng.sample(PLANS, 2)})
+    if rng.random() < 0.3:
+        attributes.append({"attribute": "account_age_days", "operator": rng.choice(["lt", "gte"]), "value": rng.randint(7, 365)})
+    if rng.random() < 0.1:
+        attributes.append({"attribute": "beta_opt_in", "operator": rng.choice(["eq", "ne", "exists"]), "value": True})
+    if attributes:
+        rules["attributes"] = attributes
+    if rng.random() < 0.5:
+        rules["rollout"] = float(rng.choice([5, 10, 25, 50]))
+    return rules
+
+def experiment_configs() -> list:
+    rng = random.Random(22)
+    return [
+        {"experiment_id": f"targeted_{i}", "name": f"targeted_{i}", "description": None, "status": "active",
+         "variants": {"control": 50.0, "treatment": 50.0}, "start_date": None, "end_date": None,
+         "allocation_mode": "static", "targeting": targeting_rules(rng)}
+        for i in range(EXPERIMENTS)
+    ]
+
+def users(count: int) -> list:
+    rng = random.Random(7)
+    result = []
+    for i in range(count):
+        attributes = {"plan": rng.choice(PLANS), "account_age_days": rng.randint(0, 1000)}
+        if rng.random() < 0.2:
+            attributes["beta_opt_in"] = True
+        if rng.random() < 0.1:
+            del attributes["plan"]
+        device = rng.choice(DEVICES + [None])
+        geo = rng.choice(REGIONS + [None])
+        result.append((f"user_{i}", device, geo, attributes))
+    return result
+
+_OPERATORS = {
+    "eq": operator.eq, "ne": operator.ne, "gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le,
+}
+
+def reference_admits(config: dict, user_id: str, device_type, geo_location, attributes: dict) -> bool:
+    """The targeting rules as documented, evaluated straight from the config."""
+    rules = config.get("targeting") or {}
+    if "device_types" in rules and device_type not in rules["device_types"]:
+        return False
+    if "geo_locations" in rules or "geo_prefixes" in rules:
+        if geo_location is None:
+            return False
+        if geo_location not in rules.get("geo_locations", []) and \
+                not any(geo_location.startswith(prefix) for prefix in rules.get("geo_prefixes", [])):
+            return False
+    for rule in rules.get("attributes", []):
+        name, op, value = rule["attribute"], rule["operator"], rule["value"]
+        if op == "exists":
+            admitted = name in attributes
+        elif op in ("in", "not_in"):
+            admitted = (attributes.get(name) in value) == (op == "in") if name in attributes else op == "not_in"
+        elif name not in attributes:
+            admitted = op == "ne"
+        else:
+            admitted = _OPERATORS[op](attributes[name], value)
+        if not admitted:
+            return False
+    if "rollout" in rules:
+        message = f"{user_id}:{config['experiment_id']}:rollout:{os.getenv('HASH_SEED', 'default-seed')}"
+        digest = hmac.new(os.getenv("HMAC_SALT", "default-salt").encode(), message.encode(), hashlib.sha256).hexdigest()
+        if int(digest[:8], 16) % BUCKET_COUNT >= rules["rollout"] * 100:
+            return False
+    return True
+
+@pytest.fixture(scope="module")
+def registry():
+    registry = ExperimentRegistry(source=None)
+    registry.install(experiment_configs())
+    return registry
+
+def test_compiled_rules_and_index_match_the_reference(registry):
+    snapshot = registry.snapshot
+    experiments = list(snapshot.experiments.values())
+    matched = 0
+    for user in users(500):
+        user_id, device, geo, attributes = user
+        expected = [experiment.experiment_id for experiment in experiments
+                    if reference_admits(experiment.config, user_id, device, geo, attributes)]
+        assert [experiment.experiment_id for experiment in experiments
+                if experiment.admits(user_id, device, geo, attributes)] == expected, user_id
+        assert [experiment.experiment_id for experiment in snapshot.targeting.matching(*user)] == expected, user_id
+        matched += len(expected)
+    # The rules neither admit nor turn away everyone
+    assert 0 < matched < 500 * EXPERIMENTS
+
+def test_route_assigns_only_targeted_experiments(registry):
+    population = users(60)
+
+    async def run():
+        db = MockDatabase()
+        app.dependency_overrides[get_database] = lambda: db
+        app.dependency_overrides[get_experiment_registry] = lambda: registry
+        assignment_cache.clear()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                for user_id, device, geo, attributes in population:
+                    response = await client.post(f"/api/assignments/{user_id}",
+                                                 json={"device_type": device, "geo_location": geo, "attributes": attributes})
+                    response.raise_for_status()
+                    expected = {experiment.experiment_id
+                                for experiment in registry.snapshot.targeting.matching(user_id, device, geo, attributes)}
+                    assert set(response.json()["assignments"]) == expected, user_id
+        finally:
+            app.dependency_overrides.clear()
+            assignment_cache.clear()
+
+    asyncio.run(run())
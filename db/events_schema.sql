@@ -22,3 +22,6 @@ CREATE TABLE IF NOT EXISTS events (
 CREATE INDEX idx_events_assignment ON events(assignment_id);
 CREATE INDEX idx_events_user ON events(user_id_hashed);
 CREATE INDEX idx_events_event_type ON events(event_type);
+
+-- time-ordered reads per assignment (experiment arm)
+CREATE INDEX IF NOT EXISTS idx_events_assignment_time ON events(assignment_id, timestamp_utc DESC);
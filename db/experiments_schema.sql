@@ -0,0 +1,104 @@
+-- tables for the FastAPI backend (backend_fastapi/app/utils/postgres_database.py)
+-- applied automatically on startup when DATABASE_URL points at PostgreSQL
+
+CREATE TABLE IF NOT EXISTS experiments (
+  experiment_id TEXT PRIMARY KEY,
+  name TEXT NOT NULL,
+  description TEXT,
+  status TEXT NOT NULL,
+  -- JSON (not JSONB) so variant order, which drives bucket allocation, is preserved
+  variants JSON NOT NULL,
+  start_date TIMESTAMP WITH TIME ZONE,
+  end_date TIMESTAMP WITH TIME ZONE
+);
+
+-- 'static' split or 'bandit' (weights recomputed by Thompson sampling)
+ALTER TABLE experiments ADD COLUMN IF NOT EXISTS allocation_mode TEXT NOT NULL DEFAULT 'static';
+ALTER TABLE experiments ADD COLUMN IF NOT EXISTS exploration_floor DOUBLE PRECISION;
+
+-- experiments sharing a layer are mutually exclusive; layer_range is the
+-- [start, end) percentage of the layer's traffic the experiment owns
+ALTER TABLE experiments ADD COLUMN IF NOT EXISTS layer TEXT;
+ALTER TABLE experiments ADD COLUMN IF NOT EXISTS layer_range JSON;
+
+-- audience rules (devices, locations, user attributes, rollout percentage)
+ALTER TABLE experiments ADD COLUMN IF NOT EXISTS targeting JSON;
+
+CREATE TABLE IF NOT EXISTS assignments (
+  experiment_id TEXT NOT NULL,
+  user_id TEXT NOT NULL,
+  variant TEXT NOT NULL,
+  device_type TEXT,
+  geo_location TEXT,
+  assigned_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  PRIMARY KEY (experiment_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS experiment_events (
+  id UUID PRIMARY KEY,
+  recorded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  user_id TEXT NOT NULL,
+  experiment_id TEXT NOT NULL,
+  variant TEXT NOT NULL,
+  event_type TEXT NOT NULL,
+  campaign_id TEXT,
+  ad_id TEXT,
+  device_type TEXT,
+  geo_location TEXT,
+  metadata JSON
+);
+
+-- running counters maintained on write so stats reads never scan the raw tables
+CREATE TABLE IF NOT EXISTS experiment_variant_counts (
+  experiment_id TEXT NOT NULL,
+  variant TEXT NOT NULL,
+  users BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (experiment_id, variant)
+);
+
+CREATE TABLE IF NOT EXISTS experiment_event_counts (
+  experiment_id TEXT NOT NULL,
+  variant TEXT NOT NULL,
+  event_type TEXT NOT NULL,
+  events BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (experiment_id, variant, event_type)
+);
+
+-- HyperLogLog sketches of the distinct users per variant and event type
+-- (app/utils/hyperloglog.py serialization), merged register-wise on write by
+-- the app under a row lock
+CREATE TABLE IF NOT EXISTS experiment_user_sketches (
+  experiment_id TEXT NOT NULL,
+  variant TEXT NOT NULL,
+  event_type TEXT NOT NULL,
+  sketch BYTEA NOT NULL,
+  PRIMARY KEY (experiment_id, variant, event_type)
+);
+
+-- event counts per time bucket for the timeseries endpoint: ingestion adds to
+-- minute buckets (bucket_seconds = 60) and compaction merges old minute buckets
+-- into hours and old hours into days. Missing device_type/geo_location are
+-- stored as '' so they can be part of the key
+CREATE TABLE IF NOT EXISTS experiment_event_rollups (
+  experiment_id TEXT NOT NULL,
+  bucket_seconds INTEGER NOT NULL,
+  bucket_start TIMESTAMPTZ NOT NULL,
+  variant TEXT NOT NULL,
+  event_type TEXT NOT NULL,
+  device_type TEXT NOT NULL DEFAULT '',
+  geo_location TEXT NOT NULL DEFAULT '',
+  events BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (experiment_id, bucket_seconds, bucket_start, variant, event_type, device_type, geo_location)
+);
+
+-- "latest N" and time-range reads per experiment, with (recorded_at, id) keyset pagination
+CREATE INDEX IF NOT EXISTS idx_experiment_events_experiment_time
+  ON experiment_events (experiment_id, recorded_at DESC, id DESC);
+
+-- event_type filtered reads per experiment
+CREATE INDEX IF NOT EXISTS idx_experiment_events_experiment_type_time
+  ON experiment_events (experiment_id, event_type, recorded_at);
+
+-- compaction selects every experiment's buckets of one width older than a cutoff
+CREATE INDEX IF NOT EXISTS idx_experiment_event_rollups_width_time
+  ON experiment_event_rollups (bucket_seconds, bucket_start);
@@ -0,0 +1,101 @@
+-- tables for the FastAPI backend's SQLite store (backend_fastapi/app/utils/sqlite_database.py)
+-- shared by every worker process on one host; applied automatically on startup
+-- timestamps are integer microseconds since the Unix epoch (UTC)
+
+CREATE TABLE IF NOT EXISTS experiments (
+  experiment_id TEXT PRIMARY KEY,
+  name TEXT NOT NULL,
+  description TEXT,
+  status TEXT NOT NULL,
+  -- JSON text so variant order, which drives bucket allocation, is preserved
+  variants TEXT NOT NULL,
+  start_date INTEGER,
+  end_date INTEGER,
+  allocation_mode TEXT NOT NULL DEFAULT 'static',
+  exploration_floor REAL,
+  -- experiments sharing a layer are mutually exclusive; layer_range is the
+  -- JSON [start, end) percentage of the layer's traffic the experiment owns
+  layer TEXT,
+  layer_range TEXT,
+  -- JSON audience rules (devices, locations, user attributes, rollout percentage)
+  targeting TEXT
+);
+
+CREATE TABLE IF NOT EXISTS assignments (
+  experiment_id TEXT NOT NULL,
+  user_id TEXT NOT NULL,
+  variant TEXT NOT NULL,
+  device_type TEXT,
+  geo_location TEXT,
+  assigned_at INTEGER NOT NULL,
+  PRIMARY KEY (experiment_id, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS experiment_events (
+  id TEXT PRIMARY KEY,
+  recorded_at INTEGER NOT NULL,
+  user_id TEXT NOT NULL,
+  experiment_id TEXT NOT NULL,
+  variant TEXT NOT NULL,
+  event_type TEXT NOT NULL,
+  campaign_id TEXT,
+  ad_id TEXT,
+  device_type TEXT,
+  geo_location TEXT,
+  metadata TEXT
+);
+
+-- running counters maintained on write so stats reads never scan the raw tables
+CREATE TABLE IF NOT EXISTS experiment_variant_counts (
+  experiment_id TEXT NOT NULL,
+  variant TEXT NOT NULL,
+  users INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (experiment_id, variant)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS experiment_event_counts (
+  experiment_id TEXT NOT NULL,
+  variant TEXT NOT NULL,
+  event_type TEXT NOT NULL,
+  events INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (experiment_id, variant, event_type)
+) WITHOUT ROWID;
+
+-- HyperLogLog sketches of the distinct users per variant and event type
+-- (app/utils/hyperloglog.py serialization), merged register-wise on write by
+-- the hll_merge function each connection registers
+CREATE TABLE IF NOT EXISTS experiment_user_sketches (
+  experiment_id TEXT NOT NULL,
+  variant TEXT NOT NULL,
+  event_type TEXT NOT NULL,
+  sketch BLOB NOT NULL,
+  PRIMARY KEY (experiment_id, variant, event_type)
+);
+
+-- event counts per time bucket for the timeseries endpoint: ingestion adds to
+-- minute buckets (bucket_seconds = 60) and compaction merges old minute buckets
+-- into hours and old hours into days. Missing device_type/geo_location are
+-- stored as '' so they can be part of the key
+CREATE TABLE IF NOT EXISTS experiment_event_rollups (
+  experiment_id TEXT NOT NULL,
+  bucket_seconds INTEGER NOT NULL,
+  bucket_start INTEGER NOT NULL,
+  variant TEXT NOT NULL,
+  event_type TEXT NOT NULL,
+  device_type TEXT NOT NULL DEFAULT '',
+  geo_location TEXT NOT NULL DEFAULT '',
+  events INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (experiment_id, bucket_seconds, bucket_start, variant, event_type, device_type, geo_location)
+) WITHOUT ROWID;
+
+-- time-ordered reads per experiment, with (recorded_at, id) keyset pagination
+CREATE INDEX IF NOT EXISTS idx_experiment_events_experiment_time
+  ON experiment_events (experiment_id, recorded_at, id);
+
+-- event_type filtered reads per experiment
+CREATE INDEX IF NOT EXISTS idx_experiment_events_experiment_type_time
+  ON experiment_events (experiment_id, event_type, recorded_at);
+
+-- compaction selects every experiment's buckets of one width older than a cutoff
+CREATE INDEX IF NOT EXISTS idx_experiment_event_rollups_width_time
+  ON experiment_event_rollups (bucket_seconds, bucket_start);
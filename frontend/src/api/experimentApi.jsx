@@ -11,15 +11,30 @@ export const getAssignment = async (payload) => {
   return data;
 };
 
+// Retries reuse the payload's event_id, so the server drops any copy that already landed
+const EVENT_RETRIES = 2;
+
 export const logEvent = async (payload) => {
-  const r = await fetch(`${API_BASE}/events`, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(payload),
-  });
-  if (!r.ok) {
-    const txt = await r.text();
-    console.error('log event failed', txt);
+  for (let attempt = 0; ; attempt += 1) {
+    let r = null;
+    try {
+      r = await fetch(`${API_BASE}/events`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload),
+      });
+    } catch (err) {
+      // Network failure: the event may or may not have been stored
+      if (attempt === EVENT_RETRIES) throw err;
+    }
+    if (r) {
+      if (r.ok) return r.json();
+      if ((r.status < 500 && r.status !== 429) || attempt === EVENT_RETRIES) {
+        const txt = await r.text();
+        console.error('log event failed', txt);
+        throw new Error('log event failed');
+      }
+    }
+    await new Promise((resolve) => setTimeout(resolve, 250 * 2 ** attempt));
   }
-  return r.json();
 };